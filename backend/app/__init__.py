@@ -1,7 +1,6 @@
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
-from flask_bcrypt import Bcrypt
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from .config import Config
@@ -9,7 +8,6 @@ from .config import Config
 # Inicializamos las extensiones
 db = SQLAlchemy()
 migrate = Migrate()
-bcrypt = Bcrypt()
 jwt = JWTManager()
 
 def create_app(config_class=Config):
@@ -23,15 +21,43 @@ def create_app(config_class=Config):
     # Vinculamos las extensiones con la app
     db.init_app(app)
     migrate.init_app(app, db)
-    bcrypt.init_app(app)
     jwt.init_app(app)
 
+    # Configuramos los servicios de la aplicación. La instrumentación de consultas va
+    # primero para que su after_request sea el último en ejecutarse y lo cuente todo
+    from .services.query_stats import QueryStats
+    QueryStats.init_app(app)
+    from .services.principal import PrincipalLoader
+    PrincipalLoader.init_app(app)
+    from .services.market_service import MarketService
+    MarketService.init_app(app)
+    from .services.password_hasher import PasswordHasher
+    PasswordHasher.init_app(app)
+    from .services.user_provisioning import UserProvisioning
+    UserProvisioning.init_app(app)
+    from .services.analytics import PortfolioAnalytics
+    PortfolioAnalytics.init_app(app)
+    from .services.missions import MissionEngine
+    MissionEngine.init_app(app)
+    from .services.leaderboard import Leaderboard
+    Leaderboard.init_app(app, db.session)
+
     # Importamos y registramos los Blueprints
     from .routes.auth import auth_bp
     from .routes.portfolio_routes import portfolio_bp
     from .routes.market_routes import market_bp
+    from .routes.league_routes import league_bp
+    from .routes.admin_routes import admin_bp
+    from .routes.mission_routes import mission_bp
     app.register_blueprint(market_bp)
     app.register_blueprint(auth_bp)
     app.register_blueprint(portfolio_bp)
+    app.register_blueprint(league_bp)
+    app.register_blueprint(admin_bp)
+    app.register_blueprint(mission_bp)
+
+    # Comandos de consola (ingesta de precios, etc.)
+    from .cli import register_commands
+    register_commands(app)
 
     return app
\ No newline at end of file
@@ -0,0 +1,141 @@
+import click
+from flask import current_app
+
+
+def register_commands(app):
+    """Registra los comandos de consola de la aplicación (`flask <comando>`)."""
+
+    @app.cli.command('ingest-prices')
+    @click.option('--once', is_flag=True, help='Ejecuta un único ciclo de ingesta y termina.')
+    @click.option('--interval', type=int, default=None, help='Segundos entre ciclos.')
+    def ingest_prices(once, interval):
+        """Actualiza periódicamente la tabla de snapshots de precios."""
+        from .services.price_ingestion import PriceIngestionWorker
+        worker = PriceIngestionWorker(current_app._get_current_object(), interval=interval)
+        if once:
+            click.echo(f"{worker.run_once()} tickers actualizados")
+            return
+        worker.run_forever()
+
+    @app.cli.command('refresh-symbols')
+    @click.option('--interval', type=int, default=None,
+                  help='Repite la descarga cada N segundos en lugar de ejecutarla una vez.')
+    def refresh_symbols(interval):
+        """Descarga el listado de símbolos de FMP y regenera el directorio local."""
+        import time
+        from .services.http_client import UpstreamError
+        from .services.market_service import MarketService
+        while True:
+            started = time.monotonic()
+            try:
+                click.echo(f"{MarketService.refresh_symbol_directory()} símbolos en el directorio")
+            except UpstreamError as e:
+                if not interval:
+                    raise click.ClickException(f"No se pudo descargar el listado de símbolos: {e}")
+                # Se conserva el directorio anterior y se reintenta en el siguiente ciclo
+                print(f"Error al actualizar el directorio de símbolos: {e}")
+            if not interval:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    @app.cli.command('revalue-portfolios')
+    @click.option('--interval', type=int, default=None,
+                  help='Repite la revalorización cada N segundos en lugar de ejecutarla una vez.')
+    def revalue_portfolios(interval):
+        """Revaloriza todas las carteras y guarda un snapshot de cada una."""
+        import time
+        from .services.revaluation import PortfolioRevaluation
+        while True:
+            started = time.monotonic()
+            count = PortfolioRevaluation.run()
+            click.echo(f"{count} carteras revalorizadas en {time.monotonic() - started:.2f}s")
+            if not interval:
+                return
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+
+    @app.cli.command('schedule-corporate-action')
+    @click.argument('ticker')
+    @click.argument('action_type', type=click.Choice(['split', 'dividend']))
+    @click.argument('value', type=str)
+    @click.option('--ex-date', type=click.DateTime(formats=['%Y-%m-%d']), required=True,
+                  help='Fecha ex (YYYY-MM-DD) en la que se aplica.')
+    def schedule_corporate_action(ticker, action_type, value, ex_date):
+        """Registra un split (VALUE = acciones nuevas por antigua) o un dividendo (VALUE = importe por acción)."""
+        from .models import CorporateActionType
+        from .services.corporate_actions import CorporateActionProcessor
+        kind = CorporateActionType[action_type.upper()]
+        option = 'ratio' if kind == CorporateActionType.SPLIT else 'amount'
+        try:
+            created = CorporateActionProcessor.schedule(ticker, kind, ex_date.date(), **{option: value})
+        except (ValueError, ArithmeticError) as e:
+            raise click.BadParameter(str(e))
+        click.echo("Acción registrada" if created else "La acción ya estaba registrada")
+
+    @app.cli.command('apply-corporate-actions')
+    @click.option('--until', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+                  help='Aplica las acciones con fecha ex hasta este día (hoy por defecto).')
+    def apply_corporate_actions(until):
+        """Aplica los splits y dividendos pendientes. Se puede relanzar: retoma los que falten."""
+        from .services.corporate_actions import CorporateActionProcessor
+        count = CorporateActionProcessor.run(until.date() if until else None)
+        click.echo(f"{count} acciones corporativas aplicadas")
+        if count and current_app.config['QUOTE_CACHE_BACKEND'] == 'memory':
+            click.echo("Aviso: con QUOTE_CACHE_BACKEND=memory la caché de cotizaciones es de cada proceso; "
+                       "reinicia los workers web para que no sirvan precios anteriores a un split.")
+
+    @app.cli.command('provision-users')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'fmt', type=click.Choice(['csv', 'ndjson']), default=None,
+                  help='Formato del fichero (por defecto, según la extensión).')
+    @click.option('--cash', type=str, default=None, help='Saldo inicial de las carteras.')
+    @click.option('--workers', type=int, default=None,
+                  help='Procesos para hashear las contraseñas (por defecto, uno por núcleo).')
+    @click.option('--chunk-size', type=int, default=None, help='Filas por bloque de inserción.')
+    def provision_users(path, fmt, cash, workers, chunk_size):
+        """Da de alta en bloque los usuarios de un CSV (username,email,password) o NDJSON."""
+        import os
+        from concurrent.futures import ProcessPoolExecutor
+        from .services.user_provisioning import UserProvisioning, ProvisioningError, read_rows
+        fmt = fmt or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+        with open(path, encoding='utf-8', newline='' if fmt == 'csv' else None) as stream, \
+                ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+            try:
+                report = UserProvisioning.run(read_rows(stream, fmt), cash_balance=cash, chunk_size=chunk_size,
+                                              max_rows=float('inf'), executor=executor)
+            except ProvisioningError as e:
+                raise click.BadParameter(str(e))
+        for failure in report['failed']:
+            click.echo(f"Línea {failure['line']} ({failure['username'] or '-'}): {failure['error']}", err=True)
+        click.echo(f"{report['created']} usuarios creados, {len(report['failed'])} filas con errores")
+
+    @app.cli.command('enqueue-rewards')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--reference', required=True,
+                  help='Identificador del reparto (p. ej. league:12:2026-W42); relanzarlo no duplica envíos.')
+    def enqueue_rewards(path, reference):
+        """Encola los envíos de $KRN de un CSV con cabecera user_id,address,amount (importe en KRN)."""
+        import csv
+        from .services.rewards import RewardQueue
+        with open(path, encoding='utf-8', newline='') as stream:
+            try:
+                created = RewardQueue.enqueue(reference, ((row['user_id'], row['address'], row['amount'])
+                                                          for row in csv.DictReader(stream)))
+            except (KeyError, ValueError) as e:
+                raise click.BadParameter(f"Fila no válida: {e}")
+        click.echo(f"{created} envíos encolados")
+
+    @app.cli.command('distribute-rewards')
+    @click.option('--once', is_flag=True, help='Ejecuta un único ciclo de reparto y termina.')
+    @click.option('--interval', type=float, default=None, help='Segundos entre ciclos.')
+    def distribute_rewards(once, interval):
+        """Envía los $KRN de la cola de recompensas desde la cuenta de tesorería."""
+        from .services.rewards import RewardDistributor
+        try:
+            distributor = RewardDistributor(current_app._get_current_object(), interval=interval)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        if once:
+            report = distributor.run_once()
+            click.echo(", ".join(f"{count} {name}" for name, count in report.items()))
+            return
+        distributor.run_forever()
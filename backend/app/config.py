@@ -8,9 +8,153 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Caché de cotizaciones (segundos / número de entradas / bytes)
+    # QUOTE_CACHE_BACKEND: 'memory' (por proceso), 'sqlite' (fichero compartido por los
+    # workers de la máquina) o 'redis' (compartida entre máquinas).
+    QUOTE_CACHE_BACKEND = os.environ.get('QUOTE_CACHE_BACKEND', 'memory')
+    QUOTE_CACHE_PATH = os.environ.get('QUOTE_CACHE_PATH')
+    QUOTE_CACHE_REDIS_URL = os.environ.get('QUOTE_CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    QUOTE_CACHE_KEY_PREFIX = os.environ.get('QUOTE_CACHE_KEY_PREFIX', 'kran:quote:')
+    QUOTE_CACHE_TTL = int(os.environ.get('QUOTE_CACHE_TTL', 15))
+    QUOTE_CACHE_STALE_TTL = int(os.environ.get('QUOTE_CACHE_STALE_TTL', 60))
+    QUOTE_CACHE_NEGATIVE_TTL = int(os.environ.get('QUOTE_CACHE_NEGATIVE_TTL', 5))
+    QUOTE_CACHE_RETAIN_TTL = int(os.environ.get('QUOTE_CACHE_RETAIN_TTL', 24 * 3600))
+    QUOTE_CACHE_MAX_ENTRIES = int(os.environ.get('QUOTE_CACHE_MAX_ENTRIES', 2048))
+    QUOTE_CACHE_MAX_BYTES = int(os.environ.get('QUOTE_CACHE_MAX_BYTES', 4 * 1024 * 1024))
+    QUOTE_BATCH_SIZE = int(os.environ.get('QUOTE_BATCH_SIZE', 50))
+    # Espera máxima de una petición por la consulta en curso de otra para el mismo ticker
+    QUOTE_SINGLEFLIGHT_TIMEOUT = float(os.environ.get('QUOTE_SINGLEFLIGHT_TIMEOUT', 5))
+    # Endpoint de cotizaciones múltiples (/api/market/quotes) y su motor asyncio
+    QUOTES_MAX_SYMBOLS = int(os.environ.get('QUOTES_MAX_SYMBOLS', 50))
+    QUOTES_ASYNC_CONCURRENCY = int(os.environ.get('QUOTES_ASYNC_CONCURRENCY', 4))
+    QUOTES_ASYNC_CHUNK_SIZE = int(os.environ.get('QUOTES_ASYNC_CHUNK_SIZE', 10))
+    QUOTES_ASYNC_TIMEOUT = float(os.environ.get('QUOTES_ASYNC_TIMEOUT', 8))
+
+    # Número máximo de órdenes en un lote de POST /api/portfolio/orders
+    ORDERS_MAX_BATCH = int(os.environ.get('ORDERS_MAX_BATCH', 50))
+
+    # Paginación del historial de transacciones (/api/portfolio/transactions)
+    TRANSACTIONS_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_PAGE_SIZE', 50))
+    TRANSACTIONS_MAX_PAGE_SIZE = int(os.environ.get('TRANSACTIONS_MAX_PAGE_SIZE', 200))
+
+    # Métricas de rendimiento (/api/portfolio/analytics): caché por cartera y tipo libre de riesgo anual
+    ANALYTICS_CACHE_TTL = int(os.environ.get('ANALYTICS_CACHE_TTL', 60))
+    ANALYTICS_CACHE_MAX_ENTRIES = int(os.environ.get('ANALYTICS_CACHE_MAX_ENTRIES', 1024))
+    ANALYTICS_RISK_FREE_RATE = float(os.environ.get('ANALYTICS_RISK_FREE_RATE', 0.0))
+
+    # Clasificación de las ligas (/api/leagues): 'memory' (una copia por proceso, que se
+    # recarga cada LEADERBOARD_REBUILD_INTERVAL segundos) o 'redis' (sorted sets compartidos)
+    LEADERBOARD_BACKEND = os.environ.get('LEADERBOARD_BACKEND', 'memory')
+    LEADERBOARD_REDIS_URL = os.environ.get('LEADERBOARD_REDIS_URL', 'redis://localhost:6379/0')
+    LEADERBOARD_KEY_PREFIX = os.environ.get('LEADERBOARD_KEY_PREFIX', 'kran:league:')
+    LEADERBOARD_REBUILD_INTERVAL = int(os.environ.get('LEADERBOARD_REBUILD_INTERVAL', 300))
+    LEADERBOARD_MAX_TOP = int(os.environ.get('LEADERBOARD_MAX_TOP', 100))
+
+    # Hash de contraseñas con bcrypt: coste (log2 de las rondas), procesos del pool (0 = en el
+    # hilo de la petición), peticiones que pueden esperar turno antes de responder 503 y espera máxima (s)
+    BCRYPT_LOG_ROUNDS = int(os.environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_MAX_PENDING = int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 16))
+    PASSWORD_HASH_TIMEOUT = float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10))
+
+    # Caché por proceso de la identidad (usuario y cartera) de las peticiones autenticadas
+    PRINCIPAL_CACHE_TTL = int(os.environ.get('PRINCIPAL_CACHE_TTL', 30))
+    PRINCIPAL_CACHE_MAX_ENTRIES = int(os.environ.get('PRINCIPAL_CACHE_MAX_ENTRIES', 4096))
+
+    # Misiones y logros: el progreso se acumula en memoria y se vuelca a la base de datos
+    # cada MISSIONS_CHECKPOINT_INTERVAL segundos o al acumular MISSIONS_CHECKPOINT_BATCH entradas
+    MISSIONS_CHECKPOINT_INTERVAL = float(os.environ.get('MISSIONS_CHECKPOINT_INTERVAL', 10))
+    MISSIONS_CHECKPOINT_BATCH = int(os.environ.get('MISSIONS_CHECKPOINT_BATCH', 500))
+
+    # Usuarios con acceso a /api/admin (separados por comas)
+    ADMIN_USERNAMES = [name for name in os.environ.get('ADMIN_USERNAMES', '').split(',') if name]
+
+    # Altas masivas de usuarios (flask provision-users y /api/admin/users/bulk): filas por
+    # bloque (una consulta de unicidad, un INSERT por tabla y un commit) y máximo por petición
+    PROVISIONING_CHUNK_SIZE = int(os.environ.get('PROVISIONING_CHUNK_SIZE', 500))
+    PROVISIONING_MAX_ROWS = int(os.environ.get('PROVISIONING_MAX_ROWS', 10000))
+    # Procesos propios de cada alta masiva por HTTP para hashear (no usa el pool del login)
+    PROVISIONING_HASH_WORKERS = int(os.environ.get('PROVISIONING_HASH_WORKERS', 1))
+
+    # Reparto de recompensas $KRN (flask distribute-rewards): nodo RPC, contrato KranToken y clave
+    # de la cuenta de tesorería que firma las transferencias (gas fijo por transferencia)
+    KRN_RPC_URL = os.environ.get('KRN_RPC_URL', 'http://127.0.0.1:8545')
+    KRN_TOKEN_ADDRESS = os.environ.get('KRN_TOKEN_ADDRESS')
+    KRN_TREASURY_PRIVATE_KEY = os.environ.get('KRN_TREASURY_PRIVATE_KEY')
+    KRN_DECIMALS = int(os.environ.get('KRN_DECIMALS', 18))
+    KRN_TRANSFER_GAS = int(os.environ.get('KRN_TRANSFER_GAS', 100000))
+    # Segundos entre ciclos, envíos firmados por ciclo, máximo sin confirmar, segundos sin
+    # minarse antes de reemitir la misma transacción e intentos si la transferencia revierte
+    REWARDS_INTERVAL = float(os.environ.get('REWARDS_INTERVAL', 5))
+    REWARDS_BATCH_SIZE = int(os.environ.get('REWARDS_BATCH_SIZE', 100))
+    REWARDS_MAX_IN_FLIGHT = int(os.environ.get('REWARDS_MAX_IN_FLIGHT', 500))
+    REWARDS_REBROADCAST_AFTER = int(os.environ.get('REWARDS_REBROADCAST_AFTER', 60))
+    REWARDS_MAX_ATTEMPTS = int(os.environ.get('REWARDS_MAX_ATTEMPTS', 3))
+    # Reemisiones sin minarse antes de sustituirla (mismo nonce) subiendo el gas un
+    # REWARDS_GAS_BUMP_PERCENT %, y máximo de sustituciones por transferencia
+    REWARDS_REPLACE_AFTER = int(os.environ.get('REWARDS_REPLACE_AFTER', 3))
+    REWARDS_GAS_BUMP_PERCENT = int(os.environ.get('REWARDS_GAS_BUMP_PERCENT', 15))
+    REWARDS_MAX_REPLACEMENTS = int(os.environ.get('REWARDS_MAX_REPLACEMENTS', 5))
+
+    # Instrumentación de consultas SQL por petición: cabeceras X-Query-Count / X-Query-Time-Ms
+    # (sin definir, solo en modo debug o de tests: revelan detalles internos a cualquier cliente)
+    # y aviso en el log de las peticiones con más de QUERY_STATS_WARN_COUNT consultas (0 = nunca)
+    QUERY_STATS_HEADERS = (os.environ['QUERY_STATS_HEADERS'].lower() == 'true'
+                           if 'QUERY_STATS_HEADERS' in os.environ else None)
+    QUERY_STATS_WARN_COUNT = int(os.environ.get('QUERY_STATS_WARN_COUNT', 25))
+
+    # Antigüedad máxima (s) de los precios de la valoración de una cartera antes de revalorizarla al leerla
+    VALUATION_MAX_AGE = int(os.environ.get('VALUATION_MAX_AGE', 60))
+
+    # Stream SSE de cotizaciones (/api/market/stream), en segundos
+    STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', 5))
+    STREAM_HEARTBEAT_INTERVAL = float(os.environ.get('STREAM_HEARTBEAT_INTERVAL', 15))
+    # Streams abiertos a la vez por proceso. Se sirven desde el proceso `stream` del
+    # Procfile (gevent, una greenlet por stream), que lo sube con la variable de entorno;
+    # en el proceso `web` cada stream ocuparía uno de sus hilos (--threads 64), así que
+    # allí solo se admiten unos pocos
+    STREAM_MAX_CLIENTS = int(os.environ.get('STREAM_MAX_CLIENTS', 8))
+
+    # Snapshots de precios e ingesta en segundo plano (segundos)
+    PRICE_SNAPSHOTS_ENABLED = os.environ.get('PRICE_SNAPSHOTS_ENABLED', 'true').lower() == 'true'
+    PRICE_SNAPSHOT_MAX_AGE = int(os.environ.get('PRICE_SNAPSHOT_MAX_AGE', 60))
+    PRICE_INGESTION_INTERVAL = int(os.environ.get('PRICE_INGESTION_INTERVAL', 15))
+    PRICE_RECENT_WINDOW = int(os.environ.get('PRICE_RECENT_WINDOW', 15 * 60))
+    PRICE_DEMAND_TOUCH_INTERVAL = int(os.environ.get('PRICE_DEMAND_TOUCH_INTERVAL', 60))
+
+    # Directorio local de símbolos para el buscador
+    SYMBOL_DIRECTORY_PATH = os.environ.get('SYMBOL_DIRECTORY_PATH')
+    SYMBOL_DIRECTORY_RELOAD_INTERVAL = int(os.environ.get('SYMBOL_DIRECTORY_RELOAD_INTERVAL', 60))
+    SYMBOL_DIRECTORY_EXCHANGES = os.environ.get('SYMBOL_DIRECTORY_EXCHANGES', 'NASDAQ,NYSE,AMEX').split(',')
+    # Caché (s) de las búsquedas en FMP mientras no hay directorio cargado
+    SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 3600))
+
+    # Histórico de precios OHLCV (columnas binarias mapeadas en memoria)
+    HISTORY_STORE_PATH = os.environ.get('HISTORY_STORE_PATH')
+    HISTORY_SYNC_INTERVAL = int(os.environ.get('HISTORY_SYNC_INTERVAL', 3600))
+    HISTORY_BACKFILL_DAYS = int(os.environ.get('HISTORY_BACKFILL_DAYS', 5 * 365))
+    # Tickers cuya última sincronización recuerda cada proceso (LRU)
+    HISTORY_SYNCED_MAX_ENTRIES = int(os.environ.get('HISTORY_SYNCED_MAX_ENTRIES', 10000))
+    HISTORY_MAX_POINTS = int(os.environ.get('HISTORY_MAX_POINTS', 2000))
+
+    # Cliente HTTP hacia FMP: pool de conexiones, reintentos y cortocircuito
+    UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 2))
+    UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 4))
+    UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', 2))
+    UPSTREAM_BACKOFF_BASE = float(os.environ.get('UPSTREAM_BACKOFF_BASE', 0.2))
+    UPSTREAM_BACKOFF_MAX = float(os.environ.get('UPSTREAM_BACKOFF_MAX', 2))
+    UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 10))
+    CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('CIRCUIT_FAILURE_THRESHOLD', 5))
+    CIRCUIT_RESET_TIMEOUT = float(os.environ.get('CIRCUIT_RESET_TIMEOUT', 30))
+
 class TestConfig(Config):
     TESTING = True
     # Usar una base de datos SQLite en memoria para que los tests sean rápidos y aislados
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     # Usar una clave secreta simple para los tests
-    SECRET_KEY = 'test-secret-key'
\ No newline at end of file
+    SECRET_KEY = 'test-secret-key'
+    JWT_SECRET_KEY = 'test-secret-key-for-testing'
+    # Hashes baratos y sin pool de procesos para que los tests sean rápidos
+    BCRYPT_LOG_ROUNDS = 4
+    PASSWORD_HASH_WORKERS = 0
+    PROVISIONING_HASH_WORKERS = 0
\ No newline at end of file
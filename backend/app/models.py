@@ -1,10 +1,46 @@
 import enum
-from datetime import datetime
+from datetime import datetime, timezone
 from . import db # Importamos la instancia db desde __init__.py
 
+
+def utcnow():
+    """Fecha y hora actual en UTC sin zona horaria, igual que CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
 class TransactionType(enum.Enum):
     BUY = 'BUY'
     SELL = 'SELL'
+    # Abono de un dividendo: `quantity` son las acciones en cartera y `price_per_share` el importe por acción
+    DIVIDEND = 'DIVIDEND'
+
+class OrderType(enum.Enum):
+    LIMIT = 'LIMIT'
+    STOP = 'STOP'
+    STOP_LIMIT = 'STOP_LIMIT'
+
+class OrderStatus(enum.Enum):
+    PENDING = 'PENDING'
+    # Orden stop-limit cuyo stop ya se ha alcanzado: espera como orden limitada
+    TRIGGERED = 'TRIGGERED'
+    FILLED = 'FILLED'
+    CANCELLED = 'CANCELLED'
+    REJECTED = 'REJECTED'
+
+class CorporateActionType(enum.Enum):
+    SPLIT = 'SPLIT'
+    DIVIDEND = 'DIVIDEND'
+
+class CorporateActionStatus(enum.Enum):
+    PENDING = 'PENDING'
+    APPLIED = 'APPLIED'
+
+class PayoutStatus(enum.Enum):
+    PENDING = 'PENDING'
+    # Transacción firmada y guardada (con su nonce); emitida, a falta del recibo
+    SUBMITTED = 'SUBMITTED'
+    CONFIRMED = 'CONFIRMED'
+    FAILED = 'FAILED'
 
 class User(db.Model):
     __tablename__ = 'users'
@@ -16,17 +52,29 @@ class User(db.Model):
     
     portfolio = db.relationship('Portfolio', back_populates='user', uselist=False, cascade="all, delete-orphan")
 
+def _starting_cash(context):
+    """Capital inicial de una cartera: el saldo de caja con el que se crea."""
+    cash_balance = context.get_current_parameters().get('cash_balance')
+    return 100000.00 if cash_balance is None else cash_balance
+
 class Portfolio(db.Model):
     __tablename__ = 'portfolios'
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), unique=True, nullable=False)
     cash_balance = db.Column(db.Numeric(19, 4), nullable=False, default=100000.00)
+    # Capital inicial, referencia de la rentabilidad total (misiones)
+    starting_cash = db.Column(db.Numeric(19, 4), nullable=False, default=_starting_cash)
+    # Versión para el control de concurrencia optimista; cada operación la incrementa
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
     created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
     updated_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now(), onupdate=db.func.now())
 
     user = db.relationship('User', back_populates='portfolio')
     holdings = db.relationship('Holding', back_populates='portfolio', cascade="all, delete-orphan")
     transactions = db.relationship('Transaction', back_populates='portfolio', cascade="all, delete-orphan")
+    valuation = db.relationship('PortfolioValuation', uselist=False, cascade="all, delete-orphan")
+
+    __mapper_args__ = {'version_id_col': version}
 
 class Holding(db.Model):
     __tablename__ = 'holdings'
@@ -35,6 +83,10 @@ class Holding(db.Model):
     ticker_symbol = db.Column(db.String(10), nullable=False)
     quantity = db.Column(db.Numeric(19, 4), nullable=False)
     average_purchase_price = db.Column(db.Numeric(19, 4), nullable=False)
+    # Valoración desnormalizada: último precio aplicado y valor de mercado resultante
+    last_price = db.Column(db.Numeric(19, 4))
+    market_value = db.Column(db.Numeric(19, 4))
+    priced_at = db.Column(db.DateTime(timezone=True))
 
     portfolio = db.relationship('Portfolio', back_populates='holdings')
     __table_args__ = (db.UniqueConstraint('portfolio_id', 'ticker_symbol', name='_portfolio_ticker_uc'),)
@@ -47,6 +99,155 @@ class Transaction(db.Model):
     type = db.Column(db.Enum(TransactionType), nullable=False)
     quantity = db.Column(db.Numeric(19, 4), nullable=False)
     price_per_share = db.Column(db.Numeric(19, 4), nullable=False)
-    transaction_date = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    # Se fija también desde Python (con microsegundos) para que el cursor del historial
+    # compare con el mismo formato y resolución con que se guarda
+    transaction_date = db.Column(db.DateTime(timezone=True), default=utcnow, server_default=db.func.now())
+
+    portfolio = db.relationship('Portfolio', back_populates='transactions')
+
+    __table_args__ = (
+        db.Index('ix_transactions_portfolio_date_id', 'portfolio_id', 'transaction_date', 'id'),
+        db.Index('ix_transactions_portfolio_ticker', 'portfolio_id', 'ticker_symbol'),
+    )
+
+class PriceSnapshot(db.Model):
+    """Última cotización conocida de cada ticker, mantenida por el proceso de ingesta de precios."""
+    __tablename__ = 'price_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker_symbol = db.Column(db.String(10), unique=True, nullable=False)
+    price = db.Column(db.Numeric(19, 4), nullable=False)
+    name = db.Column(db.String(255))
+    change_percentage = db.Column(db.Float)
+    volume = db.Column(db.BigInteger)
+    fetched_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True)
+    # Última vez que un usuario pidió este ticker (define el universo de la ingesta)
+    requested_at = db.Column(db.DateTime(timezone=True), index=True)
+
+class PortfolioValuation(db.Model):
+    """
+    Valoración desnormalizada de una cartera (modelo de lectura de GET /api/portfolio/).
+    Se actualiza de forma incremental con cada operación y con cada tick de precios.
+    """
+    __tablename__ = 'portfolio_valuations'
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), primary_key=True)
+    holdings_value = db.Column(db.Numeric(19, 4), nullable=False, default=0)
+    total_value = db.Column(db.Numeric(19, 4), nullable=False, default=0)
+    # Precio más antiguo de los aplicados a las posiciones de la cartera
+    priced_at = db.Column(db.DateTime(timezone=True))
+    updated_at = db.Column(db.DateTime(timezone=True), default=utcnow, onupdate=utcnow)
+
+class PortfolioSnapshot(db.Model):
+    """Valor de una cartera en un instante, generado por el trabajo de revalorización en bloque."""
+    __tablename__ = 'portfolio_snapshots'
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False)
+    taken_at = db.Column(db.DateTime(timezone=True), nullable=False)
+    cash_balance = db.Column(db.Numeric(19, 4), nullable=False)
+    holdings_value = db.Column(db.Numeric(19, 4), nullable=False)
+    total_value = db.Column(db.Numeric(19, 4), nullable=False)
+
+    __table_args__ = (db.Index('ix_portfolio_snapshots_portfolio_taken', 'portfolio_id', 'taken_at'),)
+
+class Order(db.Model):
+    """Orden límite, stop o stop-limit a la espera de que el precio alcance su disparador."""
+    __tablename__ = 'orders'
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), nullable=False, index=True)
+    ticker_symbol = db.Column(db.String(10), nullable=False)
+    side = db.Column(db.Enum(TransactionType), nullable=False)
+    order_type = db.Column(db.Enum(OrderType), nullable=False)
+    quantity = db.Column(db.Numeric(19, 4), nullable=False)
+    limit_price = db.Column(db.Numeric(19, 4))
+    stop_price = db.Column(db.Numeric(19, 4))
+    status = db.Column(db.Enum(OrderStatus), nullable=False, default=OrderStatus.PENDING)
+    fill_price = db.Column(db.Numeric(19, 4))
+    reject_reason = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    closed_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (db.Index('ix_orders_status_ticker', 'status', 'ticker_symbol'),)
+
+class CorporateAction(db.Model):
+    """
+    Split o dividendo de un ticker. `ratio` son las acciones nuevas por cada acción
+    antigua (2 en un split 2x1, 0.1 en un contrasplit 1x10) y `amount` el dividendo
+    por acción. Se aplica una sola vez, en su `ex_date` (ver `CorporateActionProcessor`).
+    """
+    __tablename__ = 'corporate_actions'
+    id = db.Column(db.Integer, primary_key=True)
+    ticker_symbol = db.Column(db.String(10), nullable=False)
+    action_type = db.Column(db.Enum(CorporateActionType), nullable=False)
+    ex_date = db.Column(db.Date, nullable=False)
+    ratio = db.Column(db.Numeric(19, 8))
+    amount = db.Column(db.Numeric(19, 4))
+    status = db.Column(db.Enum(CorporateActionStatus), nullable=False, default=CorporateActionStatus.PENDING)
+    holders = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    applied_at = db.Column(db.DateTime(timezone=True))
+
+    __table_args__ = (
+        db.UniqueConstraint('ticker_symbol', 'action_type', 'ex_date', name='uq_corporate_action'),
+        db.Index('ix_corporate_actions_status_ex_date', 'status', 'ex_date'),
+    )
+
+class League(db.Model):
+    """Liga en la que compiten sus miembros por el valor total de su cartera."""
+    __tablename__ = 'leagues'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(80), nullable=False)
+    created_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+class LeagueMember(db.Model):
+    __tablename__ = 'league_members'
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, index=True)
+    joined_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+
+class MissionProgress(db.Model):
+    """
+    Progreso acumulado de una cartera en una misión o logro. `period` identifica la
+    ventana de la misión: el día ('2026-10-18'), la semana ISO ('2026-W42') o 'all'.
+    """
+    __tablename__ = 'mission_progress'
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolios.id'), primary_key=True)
+    mission_key = db.Column(db.String(50), primary_key=True)
+    period = db.Column(db.String(10), primary_key=True)
+    progress = db.Column(db.Numeric(19, 6), nullable=False, default=0)
+    completed_at = db.Column(db.DateTime(timezone=True), nullable=True)
+    updated_at = db.Column(db.DateTime(timezone=True), nullable=False, default=utcnow)
+
+class Payout(db.Model):
+    """
+    Envío de $KRN de la cola de recompensas. `reference` identifica el reparto
+    ('league:12:2026-W42') y, con `user_id`, hace idempotente el encolado; `amount`
+    va en KRN. La transacción se firma y se guarda (`nonce`, `tx_hash`, `raw_tx`)
+    antes de emitirla, así que reemitirla tras un fallo no duplica el pago. Si se
+    sustituye por otra con más gas (mismo nonce), los hashes anteriores quedan en
+    `replaced_tx_hashes`, porque cualquiera de ellas puede acabar minada.
+    """
+    __tablename__ = 'payouts'
+    id = db.Column(db.Integer, primary_key=True)
+    reference = db.Column(db.String(100), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    recipient = db.Column(db.String(42), nullable=False)
+    amount = db.Column(db.Numeric(36, 18), nullable=False)
+    status = db.Column(db.Enum(PayoutStatus), nullable=False, default=PayoutStatus.PENDING)
+    sender = db.Column(db.String(42))
+    nonce = db.Column(db.Integer)
+    tx_hash = db.Column(db.String(66))
+    raw_tx = db.Column(db.Text)
+    gas_price = db.Column(db.BigInteger)
+    rebroadcasts = db.Column(db.Integer, nullable=False, default=0)
+    replaced_tx_hashes = db.Column(db.Text)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(255))
+    block_number = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime(timezone=True), server_default=db.func.now())
+    submitted_at = db.Column(db.DateTime(timezone=True))
+    confirmed_at = db.Column(db.DateTime(timezone=True))
 
-    portfolio = db.relationship('Portfolio', back_populates='transactions')
\ No newline at end of file
+    __table_args__ = (
+        db.UniqueConstraint('reference', 'user_id', name='uq_payout_reference_user'),
+        db.Index('ix_payouts_status_id', 'status', 'id'),
+    )
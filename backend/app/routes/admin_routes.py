@@ -0,0 +1,51 @@
+import io
+from functools import wraps
+from flask import Blueprint, request, jsonify, current_app
+from app.services.principal import PrincipalLoader, principal_required
+from app.services.user_provisioning import UserProvisioning, ProvisioningError, read_rows
+from app import db
+
+admin_bp = Blueprint('admin_bp', __name__, url_prefix='/api/admin')
+
+
+def admin_required(view):
+    """Exige un JWT válido de un usuario incluido en `ADMIN_USERNAMES`."""
+    @wraps(view)
+    @principal_required()
+    def wrapper(*args, **kwargs):
+        if PrincipalLoader.current().username not in current_app.config['ADMIN_USERNAMES']:
+            return jsonify({"msg": "Se requieren permisos de administrador"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/users/bulk', methods=['POST'])
+@admin_required
+def provision_users():
+    """
+    Alta masiva de usuarios. El cuerpo es un CSV con cabecera `username,email,password`
+    (Content-Type `text/csv`) o un NDJSON con un objeto por línea (`application/x-ndjson`),
+    y se lee en streaming. `cash_balance` (query string) fija el saldo inicial.
+    Las contraseñas se hashean en un pool propio de `PROVISIONING_HASH_WORKERS`
+    procesos, no en el del login. Devuelve el número de altas y los errores de cada fila.
+    """
+    mimetype = request.mimetype
+    if mimetype == 'text/csv':
+        fmt = 'csv'
+    elif mimetype in ('application/x-ndjson', 'application/jsonl'):
+        fmt = 'ndjson'
+    else:
+        return jsonify({"msg": "El cuerpo debe ser text/csv o application/x-ndjson"}), 415
+
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    try:
+        with UserProvisioning.hash_executor() as executor:
+            report = UserProvisioning.run(read_rows(stream, fmt), cash_balance=request.args.get('cash_balance'),
+                                          executor=executor)
+    except ProvisioningError as e:
+        db.session.rollback()
+        return jsonify({"msg": str(e)}), 400
+    except UnicodeDecodeError:
+        db.session.rollback()
+        return jsonify({"msg": "El cuerpo debe estar codificado en UTF-8"}), 400
+    return jsonify(report), 200
@@ -1,12 +1,19 @@
 from flask import request, jsonify, Blueprint
 from flask_jwt_extended import create_access_token
-from .. import db, bcrypt
+from .. import db
 from ..models import User, Portfolio
+from ..services.password_hasher import PasswordHasher, HasherBusyError
 
 # Creamos un Blueprint para las rutas de autenticación.
 # El url_prefix nos permite anteponer '/api/auth' a todas las rutas de este blueprint.
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
+
+@auth_bp.errorhandler(HasherBusyError)
+def hasher_busy(error):
+    """Con el pool de hash saturado se pide al cliente que reintente en lugar de encolar sin límite."""
+    return jsonify({"error": "Authentication service busy, please retry"}), 503, {'Retry-After': '1'}
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """
@@ -19,6 +26,9 @@ def register():
     if not data or not data.get('username') or not data.get('email') or not data.get('password'):
         return jsonify({"error": "Missing required fields"}), 400
 
+    if PasswordHasher.too_long(data.get('password')):
+        return jsonify({"error": f"Password too long (max {PasswordHasher.MAX_BYTES} bytes)"}), 400
+
     # Comprobar si el usuario o el email ya existen
     if User.query.filter_by(username=data.get('username')).first():
         return jsonify({"error": "Username already exists"}), 409 # 409 Conflict
@@ -26,8 +36,8 @@ def register():
     if User.query.filter_by(email=data.get('email')).first():
         return jsonify({"error": "Email already exists"}), 409
 
-    # Hashear la contraseña para no guardarla en texto plano
-    hashed_password = bcrypt.generate_password_hash(data.get('password')).decode('utf-8')
+    # Hashear la contraseña para no guardarla en texto plano (en el pool de PasswordHasher)
+    hashed_password = PasswordHasher.hash(data.get('password'))
 
     # Crear una nueva instancia de Usuario
     new_user = User(
@@ -62,10 +72,17 @@ def login():
     # 2. Buscar al usuario por su email
     user = User.query.filter_by(email=data.get('email')).first()
 
-    # 3. Verificar que el usuario existe y la contraseña es correcta
-    if not user or not bcrypt.check_password_hash(user.password_hash, data.get('password')):
+    # 3. Verificar que el usuario existe y la contraseña es correcta (una más larga de lo
+    # que admite bcrypt no puede ser la de nadie registrado)
+    if (not user or PasswordHasher.too_long(data.get('password'))
+            or not PasswordHasher.verify(user.password_hash, data.get('password'))):
         return jsonify({"error": "Invalid credentials"}), 401  # 401 Unauthorized
 
+    # Si el hash es de otro coste (o del formato antiguo de werkzeug) se rehace ahora que tenemos la contraseña
+    if PasswordHasher.needs_rehash(user.password_hash):
+        user.password_hash = PasswordHasher.hash(data.get('password'))
+        db.session.commit()
+
     # 4. Crear el token de acceso JWT
     access_token = create_access_token(identity=user.id)
 
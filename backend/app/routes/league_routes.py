@@ -0,0 +1,82 @@
+from flask import Blueprint, request, jsonify, current_app
+from sqlalchemy import select
+from app.models import User, League, LeagueMember
+from app.services.leaderboard import Leaderboard
+from app.services.principal import PrincipalLoader, principal_required
+from app import db
+
+league_bp = Blueprint('league_bp', __name__, url_prefix='/api/leagues')
+
+
+@league_bp.route('/', methods=['POST'])
+@principal_required()
+def create_league():
+    """Crea una liga; quien la crea pasa a ser su primer miembro."""
+    data = request.get_json() or {}
+    name = (data.get('name') or '').strip()
+    if not name or len(name) > 80:
+        return jsonify({"msg": "El nombre de la liga es obligatorio (máximo 80 caracteres)"}), 400
+
+    user_id = PrincipalLoader.current().user_id
+    league = League(name=name, created_by=user_id)
+    db.session.add(league)
+    db.session.flush()
+    db.session.add(LeagueMember(league_id=league.id, user_id=user_id))
+    db.session.commit()
+    return jsonify({'id': league.id, 'name': league.name}), 201
+
+
+@league_bp.route('/<int:league_id>/join', methods=['POST'])
+@principal_required()
+def join_league(league_id):
+    """Une al usuario a la liga y lo coloca en su clasificación."""
+    if db.session.get(League, league_id) is None:
+        return jsonify({"msg": "Liga no encontrada"}), 404
+
+    user_id = PrincipalLoader.current().user_id
+    if db.session.get(LeagueMember, (league_id, user_id)) is not None:
+        return jsonify({"msg": "Ya eres miembro de esta liga"}), 409
+    db.session.add(LeagueMember(league_id=league_id, user_id=user_id))
+    db.session.commit()
+    Leaderboard.refresh_members(db.session, league_id, [user_id])
+    return jsonify({"msg": "Te has unido a la liga"}), 201
+
+
+@league_bp.route('/<int:league_id>/top', methods=['GET'])
+@principal_required()
+def league_top(league_id):
+    """Los `n` primeros de la liga por valor total de cartera (10 por defecto, máximo 100)."""
+    if db.session.get(League, league_id) is None:
+        return jsonify({"msg": "Liga no encontrada"}), 404
+
+    count = request.args.get('n', 10, type=int)
+    count = max(1, min(count, current_app.config['LEADERBOARD_MAX_TOP']))
+    ranking = Leaderboard.top(db.session, league_id, count)
+    usernames = dict(db.session.execute(
+        select(User.id, User.username).where(User.id.in_([user_id for _, user_id, _ in ranking]))
+    ).all()) if ranking else {}
+
+    return jsonify({
+        'league_id': league_id,
+        'top': [{
+            'rank': position,
+            'user_id': user_id,
+            'username': usernames.get(user_id),
+            'total_value': round(value, 2),
+        } for position, user_id, value in ranking],
+    }), 200
+
+
+@league_bp.route('/<int:league_id>/me', methods=['GET'])
+@principal_required()
+def league_me(league_id):
+    """Posición del usuario en la liga, su valor total y el número de miembros."""
+    if db.session.get(League, league_id) is None:
+        return jsonify({"msg": "Liga no encontrada"}), 404
+
+    result = Leaderboard.rank(db.session, league_id, PrincipalLoader.current().user_id)
+    if result is None:
+        return jsonify({"msg": "No eres miembro de esta liga"}), 404
+    position, value, members = result
+    return jsonify({'league_id': league_id, 'rank': position, 'total_value': round(value, 2),
+                    'members': members}), 200
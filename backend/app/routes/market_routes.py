@@ -1,12 +1,15 @@
-from flask import Blueprint, jsonify
-from flask_jwt_extended import jwt_required
+import json
+from datetime import date, datetime, time, timezone
+from flask import Blueprint, Response, jsonify, request, current_app
 from app.services.market_service import MarketService
+from app.services.principal import principal_required
+from app.services.quote_stream import StreamFullError
 
 # Usamos un prefijo de URL para mantener las rutas organizadas
 market_bp = Blueprint('market_bp', __name__, url_prefix='/api/market')
 
 @market_bp.route('/quote/<string:ticker>', methods=['GET'])
-@jwt_required()
+@principal_required()
 def get_ticker_quote(ticker):
     """
     Proporciona la última cotización para un ticker de acción específico.
@@ -35,8 +38,172 @@ def get_ticker_quote(ticker):
     
     return jsonify({"msg": f"Ticker '{ticker}' no encontrado o error al obtener los datos."}), 404
 
+@market_bp.route('/quotes', methods=['GET'])
+@principal_required()
+def get_multiple_quotes():
+    """
+    Proporciona la última cotización de varios tickers en una sola petición.
+    ---
+    tags:
+      - Market
+    parameters:
+      - name: symbols
+        in: query
+        type: string
+        required: true
+        description: Lista de tickers separados por comas (ej. AAPL,MSFT,TSLA).
+    responses:
+      200:
+        description: Cotizaciones encontradas y errores por ticker (resultados parciales).
+      400:
+        description: Falta la lista de tickers o es demasiado larga.
+    """
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return jsonify({"msg": "El parámetro 'symbols' es obligatorio"}), 400
+
+    max_symbols = current_app.config['QUOTES_MAX_SYMBOLS']
+    if len(symbols) > max_symbols:
+        return jsonify({"msg": f"Se admiten como máximo {max_symbols} tickers por petición"}), 400
+
+    quotes, errors = MarketService.get_quotes_concurrently(symbols)
+    return jsonify({"quotes": quotes, "errors": errors})
+
+@market_bp.route('/stream', methods=['GET'])
+@principal_required(locations=['headers', 'query_string'])
+def stream_quotes():
+    """
+    Stream de cotizaciones (Server-Sent Events) para los tickers indicados.
+    Al conectar se envía la cotización actual de cada ticker y después solo los
+    cambios de precio. Como `EventSource` no permite cabeceras, el token se puede
+    pasar en el parámetro `jwt`.
+    ---
+    tags:
+      - Market
+    parameters:
+      - name: symbols
+        in: query
+        type: string
+        required: true
+        description: Lista de tickers separados por comas (ej. AAPL,MSFT,TSLA).
+    responses:
+      200:
+        description: Stream text/event-stream con eventos 'quotes' ({símbolo: cotización}).
+      400:
+        description: Falta la lista de tickers o es demasiado larga.
+      503:
+        description: El servidor ya tiene abiertos `STREAM_MAX_CLIENTS` streams; reintentar más tarde.
+    """
+    symbols = [s.strip().upper() for s in request.args.get('symbols', '').split(',') if s.strip()]
+    symbols = list(dict.fromkeys(symbols))
+    if not symbols:
+        return jsonify({"msg": "El parámetro 'symbols' es obligatorio"}), 400
+
+    max_symbols = current_app.config['QUOTES_MAX_SYMBOLS']
+    if len(symbols) > max_symbols:
+        return jsonify({"msg": f"Se admiten como máximo {max_symbols} tickers por petición"}), 400
+
+    heartbeat = current_app.config['STREAM_HEARTBEAT_INTERVAL']
+    try:
+        subscription = MarketService.subscribe_quotes(symbols)
+    except StreamFullError:
+        return jsonify({"msg": "Demasiados streams abiertos, inténtalo más tarde"}), 503, {'Retry-After': '30'}
+    try:
+        initial = {symbol: quote for symbol, quote in MarketService.get_quotes(symbols).items() if quote}
+    except Exception:
+        MarketService.unsubscribe_quotes(subscription)
+        raise
+
+    def events():
+        try:
+            yield f"event: quotes\ndata: {json.dumps(initial, default=str)}\n\n"
+            while not subscription.closed:
+                batch = subscription.next_batch(heartbeat)
+                if batch:
+                    yield f"event: quotes\ndata: {json.dumps(batch, default=str)}\n\n"
+                else:
+                    # Comentario SSE: mantiene viva la conexión y detecta clientes desconectados
+                    yield ": keep-alive\n\n"
+        finally:
+            MarketService.unsubscribe_quotes(subscription)
+
+    return Response(events(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@market_bp.route('/history/<string:ticker>', methods=['GET'])
+@principal_required()
+def get_ticker_history(ticker):
+    """
+    Histórico diario de un ticker, ya reducido al ancho del gráfico.
+    ---
+    tags:
+      - Market
+    parameters:
+      - name: ticker
+        in: path
+        type: string
+        required: true
+        description: El símbolo del ticker de la acción (ej. AAPL).
+      - name: from
+        in: query
+        type: string
+        required: false
+        description: Fecha inicial (YYYY-MM-DD).
+      - name: to
+        in: query
+        type: string
+        required: false
+        description: Fecha final (YYYY-MM-DD).
+      - name: points
+        in: query
+        type: integer
+        required: false
+        description: Número máximo de puntos a devolver (normalmente el ancho en píxeles del gráfico).
+      - name: method
+        in: query
+        type: string
+        required: false
+        description: "'ohlc' (velas agrupadas, por defecto) o 'lttb' (puntos para gráficos de línea)."
+    responses:
+      200:
+        description: Columnas t (segundos UTC), o, h, l, c y v, y el número total de barras del rango.
+      400:
+        description: Parámetros no válidos.
+      404:
+        description: No hay histórico para el ticker.
+    """
+    method = request.args.get('method', 'ohlc')
+    if method not in MarketService.HISTORY_DOWNSAMPLERS:
+        return jsonify({"msg": "El método debe ser 'ohlc' o 'lttb'"}), 400
+
+    bounds = {}
+    try:
+        for key, time_of_day in (('from', time.min), ('to', time.max)):
+            value = request.args.get(key)
+            if value:
+                day = datetime.combine(date.fromisoformat(value), time_of_day, tzinfo=timezone.utc)
+                bounds[key] = int(day.timestamp())
+    except ValueError:
+        return jsonify({"msg": "Las fechas deben tener el formato YYYY-MM-DD"}), 400
+
+    max_points = current_app.config['HISTORY_MAX_POINTS']
+    points = max(3, min(request.args.get('points', 500, type=int), max_points))
+
+    try:
+        history = MarketService.get_price_history(ticker, bounds.get('from'), bounds.get('to'),
+                                                  points=points, method=method)
+    except ValueError:
+        return jsonify({"msg": f"Ticker '{ticker}' no válido"}), 400
+
+    if not history:
+        return jsonify({"msg": f"No hay histórico para '{ticker}' en el rango pedido."}), 404
+
+    history.update(symbol=ticker.upper(), method=method)
+    return jsonify(history)
+
 @market_bp.route('/search/<string:query>', methods=['GET'])
-@jwt_required()
+@principal_required()
 def search_market_assets(query):
     """
     Busca activos (acciones) que coincidan con una cadena de consulta dada.
@@ -49,6 +216,21 @@ def search_market_assets(query):
         type: string
         required: true
         description: El término de búsqueda (ej. 'Apple').
+      - name: exchange
+        in: query
+        type: string
+        required: false
+        description: Filtra por mercado (ej. NASDAQ).
+      - name: currency
+        in: query
+        type: string
+        required: false
+        description: Filtra por divisa (ej. USD).
+      - name: limit
+        in: query
+        type: integer
+        required: false
+        description: Número máximo de resultados (por defecto 10, máximo 50).
     responses:
       200:
         description: Una lista de activos coincidentes.
@@ -56,5 +238,28 @@ def search_market_assets(query):
     if not query:
         return jsonify({"msg": "La consulta de búsqueda es obligatoria"}), 400
 
-    results = MarketService.search_assets(query)
-    return jsonify(results)
\ No newline at end of file
+    filters = {key: request.args[key] for key in ('exchange', 'currency') if request.args.get(key)}
+    limit = request.args.get('limit', type=int)
+    if limit is not None:
+        filters['limit'] = max(1, min(limit, 50))
+
+    results = MarketService.search_assets(query, **filters)
+    return jsonify(results)
+
+@market_bp.route('/health', methods=['GET'])
+def get_market_health():
+    """
+    Estado de la integración con el proveedor de mercado (cortocircuito y caché).
+    Pensado para sistemas de monitorización, por lo que no requiere autenticación.
+    ---
+    tags:
+      - Market
+    responses:
+      200:
+        description: El proveedor está operativo.
+      503:
+        description: El cortocircuito está abierto y se sirven datos cacheados.
+    """
+    status = MarketService.upstream_status()
+    status_code = 503 if status['circuit']['state'] == 'open' else 200
+    return jsonify(status), status_code
@@ -0,0 +1,15 @@
+from flask import Blueprint, jsonify
+from app.services.missions import MissionEngine
+from app.services.principal import PrincipalLoader, principal_required
+
+mission_bp = Blueprint('mission_bp', __name__, url_prefix='/api/missions')
+
+
+@mission_bp.route('/', methods=['GET'])
+@principal_required()
+def list_missions():
+    """Misiones y logros con el progreso del usuario en el periodo actual (día, semana o total)."""
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+    return jsonify({'missions': MissionEngine.progress(portfolio_id)}), 200
@@ -1,47 +1,56 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from app.models import User, Holding, Transaction
+from flask import Blueprint, request, jsonify, current_app
+from app.models import Holding, Order, OrderType, TransactionType
+from app.services.analytics import PortfolioAnalytics
 from app.services.market_service import MarketService
+from app.services.order_engine import OrderEngine
+from app.services.principal import PrincipalLoader, principal_required
+from app.services.trade_service import TradeService, TradeError
+from app.services.transaction_history import TransactionHistory, InvalidCursorError
+from app.services.valuation_service import ValuationService
 from app import db
-import datetime
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
 
 portfolio_bp = Blueprint('portfolio_bp', __name__, url_prefix='/api/portfolio')
 
 
 @portfolio_bp.route('/', methods=['GET'])
-@jwt_required()
+@principal_required()
 def get_portfolio():
-    user_id = get_jwt_identity()
-    user = User.query.get(user_id)
-    portfolio = user.portfolio
-
-    holdings_data = []
-    total_holdings_value = Decimal('0.0')
-
-    for holding in portfolio.holdings:
-        quote = MarketService.get_quote(holding.ticker_symbol)
-        current_price = Decimal(quote.get('price', 0)) if quote else holding.average_purchase_price
-        current_value = holding.quantity * current_price
-        total_holdings_value += current_value
-        holdings_data.append({
-            'ticker_symbol': holding.ticker_symbol,
-            'quantity': holding.quantity,
-            'average_purchase_price': float(holding.average_purchase_price),
-            'current_market_value': float(current_value)
-        })
-
-    total_portfolio_value = portfolio.cash_balance + total_holdings_value
+    """
+    Devuelve la cartera del usuario desde su valoración desnormalizada.
+    Solo si los precios aplicados son más antiguos que `VALUATION_MAX_AGE` se piden
+    cotizaciones (en bloque) y se revaloriza esta cartera antes de responder; la
+    revalorización de todos los titulares es cosa de la ingesta de precios.
+    """
+    user_id = PrincipalLoader.current().user_id
+    portfolio, valuation, holdings = ValuationService.read(user_id)
+    if portfolio is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+
+    if ValuationService.is_stale(valuation, current_app.config['VALUATION_MAX_AGE']):
+        quotes = MarketService.get_quotes([holding.ticker_symbol for holding in holdings])
+        ValuationService.reprice_portfolio(portfolio.id, quotes)
+        db.session.commit()
+        portfolio, valuation, holdings = ValuationService.read(user_id)
+
+    holdings_data = [{
+        'ticker_symbol': holding.ticker_symbol,
+        'quantity': holding.quantity,
+        'average_purchase_price': float(holding.average_purchase_price),
+        'current_market_value': float(ValuationService.holding_value(holding))
+    } for holding in holdings]
 
     return jsonify({
         'cash_balance': float(portfolio.cash_balance),
-        'total_portfolio_value': float(total_portfolio_value),
+        'total_portfolio_value': float(valuation.total_value),
+        'priced_at': valuation.priced_at.isoformat() if valuation.priced_at else None,
         'holdings': holdings_data
     })
 
 
 @portfolio_bp.route('/buy', methods=['POST'])
-@jwt_required()
+@principal_required()
 def buy_asset():
     """
     Permite a un usuario comprar una cantidad de un activo usando su saldo virtual.
@@ -50,7 +59,6 @@ def buy_asset():
     data = request.get_json()
     ticker = data.get('ticker', '').upper()
     quantity = data.get('quantity')
-    user_id = get_jwt_identity()
 
     if not all([ticker, quantity]):
         return jsonify({"msg": "El ticker y la cantidad son obligatorios"}), 400
@@ -62,57 +70,28 @@ def buy_asset():
     except (ValueError, TypeError):
         return jsonify({"msg": "La cantidad debe ser un número entero positivo"}), 400
 
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+
     # 1. Obtener cotización real desde el MarketService
-    quote = MarketService.get_quote(ticker)
+    quote = MarketService.get_quote(ticker, allow_stale=False)
     if not quote or 'price' not in quote:
         return jsonify({"msg": f"No se pudo obtener la cotización para el ticker '{ticker}'"}), 404
 
-    price = Decimal(quote['price'])
-    total_cost = price * quantity
-    user = User.query.get(user_id)
-    portfolio = user.portfolio
-
-    # 2. Validar fondos
-    if portfolio.cash_balance < total_cost:
-        return jsonify({"msg": "Fondos insuficientes para realizar la compra"}), 400
+    price = Decimal(str(quote['price']))
 
-    # 3. Ejecutar la transacción
-    portfolio.cash_balance -= total_cost
-    
-    holding = Holding.query.filter_by(portfolio_id=portfolio.id, ticker_symbol=ticker).first()
-    
-    if holding:
-        # Calcular el nuevo precio promedio ponderado
-        current_value = holding.quantity * holding.average_purchase_price
-        new_value = quantity * price
-        total_quantity = holding.quantity + quantity
-        holding.average_purchase_price = (current_value + new_value) / total_quantity
-        holding.quantity = total_quantity
-    else:
-        holding = Holding(
-            portfolio_id=portfolio.id, 
-            ticker_symbol=ticker, 
-            quantity=quantity,
-            average_purchase_price=price
-        )
-        db.session.add(holding)
-        
-    transaction = Transaction(
-        portfolio_id=portfolio.id,
-        ticker_symbol=ticker,
-        quantity=quantity,
-        price_per_share=price,
-        type='BUY' # Usar el enum
-    )
-    db.session.add(transaction)
-
-    db.session.commit()
+    # 2. Validar fondos y ejecutar la transacción de forma atómica
+    try:
+        TradeService.buy(portfolio_id, ticker, quantity, price)
+    except TradeError as e:
+        return jsonify({"msg": str(e)}), 400
 
     return jsonify({"msg": f"Compra de {quantity} acciones de {ticker} a ${price:.2f} realizada con éxito"}), 200
 
 
 @portfolio_bp.route('/sell', methods=['POST'])
-@jwt_required()
+@principal_required()
 def sell_asset():
     """
     Permite a un usuario vender una cantidad de un activo que posee.
@@ -121,7 +100,6 @@ def sell_asset():
     data = request.get_json()
     ticker = data.get('ticker', '').upper()
     quantity_to_sell = data.get('quantity')
-    user_id = get_jwt_identity()
 
     if not all([ticker, quantity_to_sell]):
         return jsonify({"msg": "El ticker y la cantidad son obligatorios"}), 400
@@ -133,39 +111,247 @@ def sell_asset():
     except (ValueError, TypeError):
         return jsonify({"msg": "La cantidad debe ser un número entero positivo"}), 400
 
-    user = User.query.get(user_id)
-    portfolio = user.portfolio
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
 
-    # 1. Validar tenencia del activo
-    holding = Holding.query.filter_by(portfolio_id=portfolio.id, ticker_symbol=ticker).first()
+    # 1. Validar tenencia del activo (la comprobación definitiva va dentro de la venta)
+    holding = Holding.query.filter_by(portfolio_id=portfolio_id, ticker_symbol=ticker).first()
     if not holding or holding.quantity < quantity_to_sell:
         return jsonify({"msg": "No tienes suficientes acciones para vender"}), 400
 
     # 2. Obtener cotización real desde el MarketService
-    quote = MarketService.get_quote(ticker)
+    quote = MarketService.get_quote(ticker, allow_stale=False)
     if not quote or 'price' not in quote:
         return jsonify({"msg": f"No se pudo obtener la cotización para el ticker '{ticker}'"}), 404
 
-    price = Decimal(quote['price'])
-    total_value = price * quantity_to_sell
+    price = Decimal(str(quote['price']))
 
-    # 3. Ejecutar la transacción
-    portfolio.cash_balance += total_value
-    holding.quantity -= quantity_to_sell
+    # 3. Ejecutar la transacción de forma atómica
+    try:
+        TradeService.sell(portfolio_id, ticker, quantity_to_sell, price)
+    except TradeError as e:
+        return jsonify({"msg": str(e)}), 400
 
-    if holding.quantity == 0:
-        db.session.delete(holding)
-    
-    # Registrar la transacción de venta
-    transaction = Transaction(
-        portfolio_id=portfolio.id,
-        ticker_symbol=ticker,
-        quantity=quantity_to_sell,
-        price_per_share=price,
-        type='SELL' # Usar el enum
-    )
-    db.session.add(transaction)
-    
+    return jsonify({"msg": f"Venta de {quantity_to_sell} acciones de {ticker} a ${price:.2f} realizada con éxito"}), 200
+
+@portfolio_bp.route('/orders', methods=['POST'])
+@principal_required()
+def submit_orders():
+    """
+    Ejecuta un lote de órdenes de compra y venta (p. ej. un rebalanceo) en una única
+    transacción. Todas las órdenes se valoran con una sola consulta de cotizaciones
+    y el saldo se valida contra el efecto neto del lote.
+    Espera un JSON {"orders": [{"ticker", "side": "buy" | "sell", "quantity"}, ...]}
+    y devuelve el resultado de cada orden.
+    """
+    data = request.get_json(silent=True) or {}
+    orders = data.get('orders')
+    if not isinstance(orders, list) or not orders:
+        return jsonify({"msg": "La lista de órdenes es obligatoria"}), 400
+
+    max_orders = current_app.config['ORDERS_MAX_BATCH']
+    if len(orders) > max_orders:
+        return jsonify({"msg": f"Se admiten como máximo {max_orders} órdenes por lote"}), 400
+
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+
+    # 1. Validar cada orden por separado
+    results = []
+    for order in orders:
+        order = order if isinstance(order, dict) else {}
+        ticker = str(order.get('ticker') or '').upper()
+        side = str(order.get('side') or '').lower()
+        result = {'ticker': ticker, 'side': side, 'quantity': order.get('quantity'), 'status': 'rejected'}
+        results.append(result)
+        try:
+            quantity = int(order.get('quantity'))
+            if quantity <= 0:
+                raise ValueError
+        except (ValueError, TypeError):
+            result['msg'] = "La cantidad debe ser un número entero positivo"
+            continue
+        if not ticker or side not in ('buy', 'sell'):
+            result['msg'] = "Cada orden necesita un ticker y un tipo ('buy' o 'sell')"
+            continue
+        result.update(quantity=quantity, status='pending')
+
+    # 2. Valorar todas las órdenes con una única consulta en bloque
+    pending = [result for result in results if result['status'] == 'pending']
+    quotes = MarketService.get_quotes([result['ticker'] for result in pending], allow_stale=False)
+    priced = []
+    for result in pending:
+        quote = quotes.get(result['ticker'])
+        if not quote or quote.get('price') is None:
+            result.update(status='rejected', msg=f"No se pudo obtener la cotización para el ticker '{result['ticker']}'")
+            continue
+        result['price'] = float(quote['price'])
+        priced.append(result)
+
+    # 3. Ejecutar en una única transacción
+    if priced:
+        try:
+            outcomes = TradeService.execute_orders(portfolio_id, priced)
+        except TradeError as e:
+            return jsonify({"msg": str(e)}), 400
+        for result, (accepted, msg) in zip(priced, outcomes):
+            result['status'] = 'executed' if accepted else 'rejected'
+            if msg:
+                result['msg'] = msg
+
+    executed = sum(1 for result in results if result['status'] == 'executed')
+    return jsonify({"executed": executed, "results": results}), 200
+
+
+def _order_to_dict(order):
+    return {
+        'id': order.id,
+        'ticker': order.ticker_symbol,
+        'side': order.side.value.lower(),
+        'type': order.order_type.value.lower(),
+        'quantity': float(order.quantity),
+        'limit_price': float(order.limit_price) if order.limit_price is not None else None,
+        'stop_price': float(order.stop_price) if order.stop_price is not None else None,
+        'status': order.status.value.lower(),
+        'fill_price': float(order.fill_price) if order.fill_price is not None else None,
+        'reject_reason': order.reject_reason,
+        'created_at': order.created_at.isoformat() if order.created_at else None,
+        'closed_at': order.closed_at.isoformat() if order.closed_at else None,
+    }
+
+
+@portfolio_bp.route('/pending-orders', methods=['GET'])
+@principal_required()
+def list_pending_orders():
+    """
+    Lista las órdenes límite/stop del usuario, de la más reciente a la más antigua.
+    Con ?status=open solo devuelve las que siguen a la espera.
+    """
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    query = Order.query.filter_by(portfolio_id=portfolio_id)
+    if request.args.get('status') == 'open':
+        query = query.filter(Order.status.in_(OrderEngine.OPEN_STATUSES))
+    orders = query.order_by(Order.id.desc()).all()
+    return jsonify([_order_to_dict(order) for order in orders]), 200
+
+
+@portfolio_bp.route('/pending-orders', methods=['POST'])
+@principal_required()
+def place_pending_order():
+    """
+    Crea una orden en espera que se ejecuta cuando el precio alcanza su disparador.
+    Espera un JSON {"ticker", "side": "buy" | "sell", "type": "limit" | "stop" | "stop_limit",
+    "quantity", "limit_price", "stop_price"}: las órdenes limit necesitan `limit_price`,
+    las stop `stop_price` y las stop_limit ambos.
+    """
+    data = request.get_json(silent=True) or {}
+    ticker = str(data.get('ticker') or '').upper()
+    side = str(data.get('side') or '').lower()
+    type_ = str(data.get('type') or '').upper()
+
+    if not ticker or side not in ('buy', 'sell') or type_ not in OrderType.__members__:
+        return jsonify({"msg": "La orden necesita un ticker, un lado ('buy' o 'sell') y un tipo ('limit', 'stop' o 'stop_limit')"}), 400
+    try:
+        quantity = int(data.get('quantity'))
+        if quantity <= 0:
+            raise ValueError
+    except (ValueError, TypeError):
+        return jsonify({"msg": "La cantidad debe ser un número entero positivo"}), 400
+
+    order_type = OrderType[type_]
+    prices = {}
+    needed = {
+        OrderType.LIMIT: ('limit_price',),
+        OrderType.STOP: ('stop_price',),
+        OrderType.STOP_LIMIT: ('stop_price', 'limit_price'),
+    }[order_type]
+    for field in needed:
+        try:
+            prices[field] = Decimal(str(data.get(field)))
+            if not prices[field].is_finite() or prices[field] <= 0:
+                raise ValueError
+        except (ValueError, ArithmeticError):
+            return jsonify({"msg": f"El campo '{field}' debe ser un precio positivo"}), 400
+
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+
+    order = OrderEngine.place(portfolio_id, ticker, TransactionType[side.upper()], order_type, quantity, **prices)
+    db.session.commit()
+    return jsonify(_order_to_dict(order)), 201
+
+
+@portfolio_bp.route('/pending-orders/<int:order_id>', methods=['DELETE'])
+@principal_required()
+def cancel_pending_order(order_id):
+    """Cancela una orden en espera del usuario."""
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if not OrderEngine.cancel(portfolio_id, order_id):
+        db.session.rollback()
+        return jsonify({"msg": "Orden no encontrada o ya cerrada"}), 404
     db.session.commit()
+    return jsonify({"msg": "Orden cancelada"}), 200
 
-    return jsonify({"msg": f"Venta de {quantity_to_sell} acciones de {ticker} a ${price:.2f} realizada con éxito"}), 200
\ No newline at end of file
+
+@portfolio_bp.route('/transactions', methods=['GET'])
+@principal_required()
+def list_transactions():
+    """
+    Historial de transacciones del usuario, de la más reciente a la más antigua,
+    paginado por cursor. Parámetros opcionales: `limit`, `cursor` (el `next_cursor`
+    de la página anterior), `ticker`, `type` ('buy', 'sell' o 'dividend') y `from`/`to`
+    (YYYY-MM-DD, ambos inclusive).
+    """
+    type_ = request.args.get('type', '').upper()
+    if type_ and type_ not in TransactionType.__members__:
+        return jsonify({"msg": "El tipo debe ser 'buy', 'sell' o 'dividend'"}), 400
+
+    bounds = {}
+    try:
+        for key, days in (('from', 0), ('to', 1)):
+            value = request.args.get(key)
+            if value:
+                bounds[key] = datetime.combine(date.fromisoformat(value) + timedelta(days=days), time.min)
+    except ValueError:
+        return jsonify({"msg": "Las fechas deben tener el formato YYYY-MM-DD"}), 400
+
+    config = current_app.config
+    limit = request.args.get('limit', config['TRANSACTIONS_PAGE_SIZE'], type=int)
+    limit = max(1, min(limit, config['TRANSACTIONS_MAX_PAGE_SIZE']))
+
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    try:
+        transactions, next_cursor = TransactionHistory.page(
+            portfolio_id, limit, cursor=request.args.get('cursor'), ticker=request.args.get('ticker'),
+            type_=TransactionType[type_] if type_ else None, start=bounds.get('from'), end=bounds.get('to'))
+    except InvalidCursorError as e:
+        return jsonify({"msg": str(e)}), 400
+
+    return jsonify({
+        'transactions': [{
+            'id': transaction.id,
+            'ticker': transaction.ticker_symbol,
+            'type': transaction.type.value.lower(),
+            'quantity': float(transaction.quantity),
+            'price_per_share': float(transaction.price_per_share),
+            'transaction_date': transaction.transaction_date.isoformat() if transaction.transaction_date else None,
+        } for transaction in transactions],
+        'next_cursor': next_cursor,
+    }), 200
+
+
+@portfolio_bp.route('/analytics', methods=['GET'])
+@principal_required()
+def get_analytics():
+    """
+    Métricas de rendimiento de la cartera del usuario: TWR, MWR (según la TIR),
+    máxima caída, volatilidad y ratio de Sharpe. Se sirven desde la caché de
+    `PortfolioAnalytics` mientras no haya operaciones nuevas.
+    """
+    portfolio_id = PrincipalLoader.current().portfolio_id
+    if portfolio_id is None:
+        return jsonify({"msg": "Cartera no encontrada"}), 404
+    return jsonify(PortfolioAnalytics.get(portfolio_id)), 200
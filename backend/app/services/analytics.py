@@ -0,0 +1,356 @@
+import threading
+import time
+from collections import OrderedDict
+import numpy as np
+from sqlalchemy import Float, cast, select
+from app import db
+from app.models import (Portfolio, Holding, Transaction, TransactionType, CorporateAction, CorporateActionType,
+                        CorporateActionStatus, utcnow)
+from app.services.market_service import MarketService
+
+DAY = 86400
+
+
+class _Replay:
+    """
+    Estado de la reconstrucción del libro de transacciones hasta el cierre de un día:
+    posiciones y precios al cierre, valor de la cartera invertida, serie de
+    rentabilidades diarias y flujos de caja (compras menos ventas) por día.
+    `settled_day` es el último día antes del primero en que a algún ticker con posición
+    le faltaba el cierre (None si no faltaba ninguno). Es inmutable: extenderlo
+    devuelve un estado nuevo.
+    """
+    __slots__ = ('last_tx_id', 'through_day', 'tickers', 'positions', 'prices', 'value',
+                 'returns', 'flow_days', 'flow_amounts', 'start_day', 'splits', 'settled_day')
+
+    def __init__(self, last_tx_id=0, through_day=None, tickers=(), positions=None, prices=None,
+                 value=0.0, returns=None, flow_days=None, flow_amounts=None, start_day=None, splits=(),
+                 settled_day=None):
+        self.last_tx_id = last_tx_id
+        self.through_day = through_day
+        self.tickers = tuple(tickers)
+        self.positions = positions if positions is not None else np.zeros(0)
+        self.prices = prices if prices is not None else np.zeros(0)
+        self.value = value
+        self.returns = returns if returns is not None else np.zeros(0)
+        self.flow_days = flow_days if flow_days is not None else np.zeros(0, dtype=np.int64)
+        self.flow_amounts = flow_amounts if flow_amounts is not None else np.zeros(0)
+        self.start_day = start_day
+        self.splits = splits
+        self.settled_day = settled_day
+
+
+class PortfolioAnalytics:
+    """
+    Métricas de rendimiento de una cartera: rentabilidad ponderada por tiempo (TWR) y
+    por dinero (MWR, a partir de la TIR de los flujos), máxima caída, volatilidad y ratio de Sharpe.
+
+    Se calculan sobre la parte invertida de la cartera: cada compra es una aportación
+    y cada venta una retirada, y el valor diario sale de reconstruir las posiciones a
+    partir del libro de transacciones y de los cierres diarios del histórico local
+    (con NumPy, en matrices día x ticker).
+
+    Para no repetir la reconstrucción completa en cada visita al dashboard:
+    - El estado reconstruido hasta el cierre de ayer se guarda por cartera y solo se
+      extiende con los días y transacciones nuevos (las de id mayor que la última
+      aplicada). El día en curso se añade al vuelo con el último precio de cada posición.
+      Si a algún ticker con posición le falta el cierre de un día (el histórico aún no
+      lo tiene), el estado se guarda solo hasta el día anterior y los siguientes se
+      rehacen en cada cálculo, hasta `CLOSE_GRACE_DAYS` días: así un cierre que llega
+      tarde se usa en lugar del precio anterior que lo sustituía.
+    - El resultado final se guarda `CACHE_TTL` segundos, ligado a la `version` de la
+      cartera (que incrementa cada operación), y `invalidate` lo descarta al operar.
+    Las cachés son del proceso y están acotadas a `CACHE_MAX_ENTRIES` carteras (LRU).
+    """
+    TRADING_DAYS = 252
+    CLOSE_GRACE_DAYS = 5
+    CACHE_TTL = 60
+    CACHE_MAX_ENTRIES = 1024
+    RISK_FREE_RATE = 0.0
+
+    _lock = threading.Lock()
+    _replays = OrderedDict()  # portfolio_id -> _Replay
+    _results = OrderedDict()  # portfolio_id -> (version, caduca en, métricas)
+
+    @classmethod
+    def init_app(cls, app):
+        cls.CACHE_TTL = app.config['ANALYTICS_CACHE_TTL']
+        cls.CACHE_MAX_ENTRIES = app.config['ANALYTICS_CACHE_MAX_ENTRIES']
+        cls.RISK_FREE_RATE = app.config['ANALYTICS_RISK_FREE_RATE']
+        cls.clear()
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._replays.clear()
+            cls._results.clear()
+
+    @classmethod
+    def invalidate(cls, portfolio_id):
+        """Descarta el resultado guardado de una cartera (tras una operación)."""
+        with cls._lock:
+            cls._results.pop(portfolio_id, None)
+
+    @classmethod
+    def get(cls, portfolio_id):
+        """Devuelve las métricas de la cartera (diccionario), usando la caché si es válida."""
+        version = db.session.execute(
+            select(Portfolio.version).where(Portfolio.id == portfolio_id)
+        ).scalar_one()
+        with cls._lock:
+            cached = cls._results.get(portfolio_id)
+            if cached and cached[0] == version and cached[1] > time.monotonic():
+                cls._results.move_to_end(portfolio_id)
+                return dict(cached[2], cached=True)
+            replay = cls._replays.get(portfolio_id)
+
+        today = cls._day(utcnow())
+        replay, pending = cls._catch_up(portfolio_id, replay, today - 1)
+        metrics = cls._metrics(portfolio_id, replay, pending, today)
+
+        with cls._lock:
+            cls._store(cls._replays, portfolio_id, replay)
+            cls._store(cls._results, portfolio_id, (version, time.monotonic() + cls.CACHE_TTL, metrics))
+        return dict(metrics, cached=False)
+
+    @classmethod
+    def _store(cls, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > cls.CACHE_MAX_ENTRIES:
+            cache.popitem(last=False)
+
+    @staticmethod
+    def _day(moment):
+        """Día (desde 1970-01-01) de una fecha u hora UTC sin zona horaria."""
+        return int(np.datetime64(moment.replace(tzinfo=None), 'D').astype(np.int64))
+
+    @classmethod
+    def _catch_up(cls, portfolio_id, replay, end_day):
+        """
+        Extiende el estado guardado con las transacciones y cierres hasta `end_day`.
+        Devuelve (estado nuevo, transacciones posteriores a `end_day`).
+        """
+        splits = cls._load_splits(portfolio_id)
+        rows = cls._load_transactions(portfolio_id, replay.last_tx_id if replay else 0, splits)
+        if replay is not None and (replay.splits != tuple(splits) or replay.through_day is not None and
+                                   any(row[1] <= replay.through_day for row in rows)):
+            # Un split nuevo cambia las cantidades ya reconstruidas, igual que una transacción
+            # con fecha anterior a lo reconstruido: se rehace desde el principio
+            replay, rows = None, cls._load_transactions(portfolio_id, 0, splits)
+        replay = replay or _Replay(splits=tuple(splits))
+        closed = [row for row in rows if row[1] <= end_day]
+        pending = [row for row in rows if row[1] > end_day]
+        advanced = cls._advance(replay, closed, end_day)
+        if advanced.settled_day is None:
+            return advanced, pending
+        keep_day = max(advanced.settled_day, end_day - cls.CLOSE_GRACE_DAYS)
+        if keep_day >= end_day:
+            return advanced, pending
+        # Faltan cierres de los últimos días: se guarda solo hasta el último día completo
+        settled = cls._advance(replay, [row for row in closed if row[1] <= keep_day], keep_day)
+        return settled, [row for row in closed if row[1] > keep_day] + pending
+
+    @staticmethod
+    def _load_splits(portfolio_id):
+        """Splits aplicados a tickers operados por la cartera, como (id, ticker, día, ratio)."""
+        operated = select(Transaction.ticker_symbol).where(Transaction.portfolio_id == portfolio_id).distinct()
+        rows = db.session.execute(
+            select(CorporateAction.id, CorporateAction.ticker_symbol, CorporateAction.ex_date,
+                   cast(CorporateAction.ratio, Float))
+            .where(CorporateAction.action_type == CorporateActionType.SPLIT,
+                   CorporateAction.status == CorporateActionStatus.APPLIED,
+                   CorporateAction.ticker_symbol.in_(operated))
+            .order_by(CorporateAction.id)
+        ).all()
+        return [(id_, ticker, int(np.datetime64(ex_date, 'D').astype(np.int64)), ratio)
+                for id_, ticker, ex_date, ratio in rows]
+
+    @staticmethod
+    def _load_transactions(portfolio_id, after_id, splits=()):
+        """
+        Transacciones de id mayor que `after_id` como (id, día, ticker, cantidad con signo,
+        precio de la operación o None, importe invertido con signo). Los dividendos no
+        mueven acciones y cuentan como una retirada. Las cantidades y precios anteriores a
+        cada split se expresan en acciones posteriores, como los cierres del histórico.
+        """
+        rows = db.session.execute(
+            select(Transaction.id, Transaction.transaction_date, Transaction.ticker_symbol, Transaction.type,
+                   cast(Transaction.quantity, Float), cast(Transaction.price_per_share, Float))
+            .where(Transaction.portfolio_id == portfolio_id, Transaction.id > after_id)
+            .order_by(Transaction.id)
+        ).all()
+        result = []
+        for id_, moment, ticker, type_, quantity, price in rows:
+            day = PortfolioAnalytics._day(moment)
+            amount = quantity * price
+            for _, split_ticker, split_day, ratio in splits:
+                if split_ticker == ticker and day < split_day:
+                    quantity, price = quantity * ratio, price / ratio
+            if type_ == TransactionType.BUY:
+                result.append((id_, day, ticker, quantity, price, amount))
+            elif type_ == TransactionType.SELL:
+                result.append((id_, day, ticker, -quantity, price, -amount))
+            else:
+                result.append((id_, day, ticker, 0.0, None, -amount))
+        return result
+
+    @classmethod
+    def _advance(cls, replay, rows, end_day, live_prices=None):
+        """
+        Reconstruye los días desde `replay.through_day` (excluido) hasta `end_day` con las
+        transacciones `rows` de esos días y devuelve el estado nuevo. `live_prices`
+        ({ticker: precio}) fija el precio del último día.
+        """
+        start_day = replay.start_day
+        if start_day is None:
+            if not rows:
+                return replay
+            start_day = min(row[1] for row in rows)
+        begin = replay.through_day + 1 if replay.through_day is not None else start_day
+        if begin > end_day:
+            return replay
+
+        tickers = list(replay.tickers)
+        for row in rows:
+            if row[2] not in tickers:
+                tickers.append(row[2])
+        width = len(tickers)
+        positions = np.zeros(width)
+        positions[:len(replay.positions)] = replay.positions
+        prices = np.full(width, np.nan)
+        prices[:len(replay.prices)] = replay.prices
+
+        # Eje de días: días con cierre de algún ticker, días con operaciones y el último día
+        closes = [MarketService.get_daily_closes(ticker, begin * DAY, end_day * DAY + DAY - 1) for ticker in tickers]
+        close_days = [times // DAY for times, _ in closes]
+        days = np.unique(np.concatenate(close_days + [np.array([row[1] for row in rows] + [end_day], dtype=np.int64)]))
+
+        # Precios: fila 0 = cierre anterior; después cierres, precio de operación en su defecto
+        grid = np.full((len(days) + 1, width), np.nan)
+        grid[0] = prices
+        for column, ((_, close), ticker_days) in enumerate(zip(closes, close_days)):
+            grid[1 + np.searchsorted(days, ticker_days), column] = close
+        quoted = ~np.isnan(grid[1:])
+        if rows:
+            trade_day = np.searchsorted(days, np.array([row[1] for row in rows], dtype=np.int64))
+            trade_ticker = np.array([tickers.index(row[2]) for row in rows], dtype=np.int64)
+            trade_quantity = np.array([row[3] for row in rows], dtype=np.float64)
+            trade_amount = np.array([row[5] for row in rows], dtype=np.float64)
+            trade_price = np.array([row[4] for row in rows], dtype=np.float64)  # None (dividendo) -> nan
+            traded = np.full_like(grid, np.nan)
+            priced = ~np.isnan(trade_price)
+            traded[1 + trade_day[priced], trade_ticker[priced]] = trade_price[priced]
+            grid = np.where(np.isnan(grid), traded, grid)
+        if live_prices:
+            for column, ticker in enumerate(tickers):
+                if live_prices.get(ticker) is not None:
+                    grid[-1, column] = live_prices[ticker]
+        # Rellena hacia delante cada columna con su último precio conocido
+        filled = np.where(np.isnan(grid), 0, np.arange(len(grid))[:, None])
+        grid = grid[np.maximum.accumulate(filled, axis=0), np.arange(width)]
+        grid = np.nan_to_num(grid[1:])
+
+        change = np.zeros((len(days), width))
+        bought = np.zeros(len(days))
+        sold = np.zeros(len(days))
+        if rows:
+            np.add.at(change, (trade_day, trade_ticker), trade_quantity)
+            np.add.at(bought, trade_day, np.clip(trade_amount, 0, None))
+            np.add.at(sold, trade_day, np.clip(-trade_amount, 0, None))
+        held = positions + np.cumsum(change, axis=0)
+        value = (held * grid).sum(axis=1)
+        missing = np.flatnonzero(((np.abs(held) > 1e-9) & ~quoted).any(axis=1))
+        settled_day = None
+        if len(missing):
+            settled_day = int(days[missing[0] - 1]) if missing[0] else begin - 1
+
+        # Rentabilidad diaria con los flujos al cierre (se opera al precio del día); el
+        # primer día con posición se mide contra lo comprado
+        previous = np.concatenate(([replay.value], value[:-1]))
+        base = np.where(previous > 1e-9, previous, bought)
+        invested = base > 1e-9
+        returns = (value + sold - bought - previous)[invested] / base[invested]
+
+        flows = bought - sold
+        moved = flows != 0
+        return _Replay(
+            last_tx_id=max([replay.last_tx_id] + [row[0] for row in rows]),
+            through_day=end_day, tickers=tickers, positions=held[-1], prices=grid[-1],
+            value=float(value[-1]), returns=np.concatenate((replay.returns, returns)),
+            flow_days=np.concatenate((replay.flow_days, days[moved])),
+            flow_amounts=np.concatenate((replay.flow_amounts, flows[moved])),
+            start_day=start_day, splits=replay.splits, settled_day=settled_day,
+        )
+
+    @classmethod
+    def _metrics(cls, portfolio_id, replay, rows, today):
+        """Añade el día en curso (operaciones `rows` y último precio) y calcula las métricas."""
+        live_prices = dict(db.session.execute(
+            select(Holding.ticker_symbol, cast(Holding.last_price, Float))
+            .where(Holding.portfolio_id == portfolio_id, Holding.last_price.isnot(None))
+        ).all())
+        current = cls._advance(replay, rows, today, live_prices)
+
+        returns = current.returns
+        metrics = {
+            'start_date': str(np.datetime64(current.start_day, 'D')) if current.start_day is not None else None,
+            'as_of': str(np.datetime64(today, 'D')),
+            'days': int(len(returns)),
+            'invested_value': round(current.value, 4),
+            'twr': None, 'twr_annualized': None, 'mwr': None, 'mwr_annualized': None,
+            'max_drawdown': None, 'volatility': None, 'sharpe_ratio': None,
+        }
+        if not len(returns):
+            return metrics
+
+        wealth = np.cumprod(1 + returns)
+        peaks = np.maximum.accumulate(np.concatenate(([1.0], wealth)))[1:]
+        metrics['twr'] = round(float(wealth[-1] - 1), 6)
+        if len(returns) >= cls.TRADING_DAYS:
+            metrics['twr_annualized'] = round(float(wealth[-1] ** (cls.TRADING_DAYS / len(returns)) - 1), 6)
+        metrics['max_drawdown'] = round(float(min((wealth / peaks - 1).min(), 0.0)), 6)
+
+        if len(returns) >= 2:
+            deviation = returns.std(ddof=1)
+            metrics['volatility'] = round(float(deviation * np.sqrt(cls.TRADING_DAYS)), 6)
+            if deviation > 0:
+                excess = returns.mean() - cls.RISK_FREE_RATE / cls.TRADING_DAYS
+                metrics['sharpe_ratio'] = round(float(excess / deviation * np.sqrt(cls.TRADING_DAYS)), 6)
+
+        # Flujos desde el punto de vista del inversor: compras negativas, ventas y valor final positivos
+        flow_days = np.concatenate((current.flow_days, [today]))
+        flow_amounts = np.concatenate((-current.flow_amounts, [current.value]))
+        daily = cls._irr(flow_days, flow_amounts)
+        if daily is not None:
+            span = int(flow_days.max() - flow_days.min())
+            metrics['mwr'] = round(float((1 + daily) ** span - 1), 6)
+            if span >= 365:
+                metrics['mwr_annualized'] = round(float((1 + daily) ** 365 - 1), 6)
+        return metrics
+
+    @staticmethod
+    def _irr(days, amounts, iterations=100):
+        """
+        Tasa diaria que anula el valor actual de los flujos (TIR), por bisección.
+        Devuelve None si los flujos no cambian de signo o caen todos el mismo día.
+        """
+        offsets = (days - days.min()).astype(np.float64)
+        if not offsets.any() or amounts.min() >= 0 or amounts.max() <= 0:
+            return None
+
+        def npv(rate):
+            return float((amounts * np.exp(-offsets * np.log1p(rate))).sum())
+
+        low, high = -0.5, 0.01
+        while npv(high) > 0 and high < 10:
+            high *= 2
+        if np.sign(npv(low)) == np.sign(npv(high)):
+            return None
+        for _ in range(iterations):
+            middle = (low + high) / 2
+            if np.sign(npv(middle)) == np.sign(npv(low)):
+                low = middle
+            else:
+                high = middle
+        return (low + high) / 2
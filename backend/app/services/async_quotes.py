@@ -0,0 +1,70 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+
+class AsyncQuoteEngine:
+    """
+    Motor asyncio para obtener muchas cotizaciones a la vez.
+
+    Reparte los tickers en bloques pequeños y los lanza en paralelo (como mucho
+    `concurrency` bloques a la vez), cada uno con su propio tiempo máximo. El trabajo
+    de cada bloque lo hace `fetch_chunk`, una función síncrona que se ejecuta en un
+    pool de hilos propio del motor y devuelve {símbolo: cotización | None | marca de
+    no disponible}. Al ser un pool propio, un bloque que agota su tiempo no retiene
+    la respuesta: el hilo termina por su cuenta y su resultado queda en la caché.
+    Un bloque que falla o tarda demasiado no impide devolver el resto.
+    """
+    NOT_FOUND = 'not_found'
+    UNAVAILABLE = 'unavailable'
+    TIMEOUT = 'timeout'
+
+    def __init__(self, fetch_chunk, unavailable, concurrency=4, chunk_size=10, timeout=8.0):
+        self.fetch_chunk = fetch_chunk
+        self.unavailable = unavailable
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix='quotes')
+
+    def close(self):
+        """Libera el pool de hilos sin esperar a los bloques que sigan en curso."""
+        self._executor.shutdown(wait=False)
+
+    def run(self, symbols):
+        """Punto de entrada síncrono (para las vistas de Flask). Devuelve (cotizaciones, errores)."""
+        if not symbols:
+            return {}, {}
+        return asyncio.run(self.fetch(symbols))
+
+    async def fetch(self, symbols):
+        semaphore = asyncio.Semaphore(self.concurrency)
+        chunks = [symbols[i:i + self.chunk_size] for i in range(0, len(symbols), self.chunk_size)]
+
+        loop = asyncio.get_running_loop()
+
+        async def fetch_one(chunk):
+            async with semaphore:
+                try:
+                    future = loop.run_in_executor(self._executor, self.fetch_chunk, chunk)
+                    result = await asyncio.wait_for(future, self.timeout)
+                    return chunk, result, None
+                except asyncio.TimeoutError:
+                    return chunk, None, self.TIMEOUT
+                except Exception:
+                    return chunk, None, self.UNAVAILABLE
+
+        quotes = {}
+        errors = {}
+        for chunk, result, error in await asyncio.gather(*(fetch_one(chunk) for chunk in chunks)):
+            for symbol in chunk:
+                if error:
+                    errors[symbol] = error
+                    continue
+                quote = result.get(symbol, self.unavailable)
+                if quote is self.unavailable:
+                    errors[symbol] = self.UNAVAILABLE
+                elif quote is None:
+                    errors[symbol] = self.NOT_FOUND
+                else:
+                    quotes[symbol] = quote
+        return quotes, errors
@@ -0,0 +1,295 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class CacheEntry:
+    """
+    Entrada de la caché de cotizaciones.
+    `value` puede ser None cuando se trata de una búsqueda fallida (caché negativa).
+    Los instantes son marcas de tiempo de reloj de pared (`time.time()`) para que
+    varios procesos puedan compartir la misma entrada.
+    """
+    __slots__ = ('value', 'fresh_until', 'stale_until')
+
+    def __init__(self, value, fresh_until, stale_until):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+    def dumps(self):
+        return json.dumps({'v': self.value, 'f': self.fresh_until, 's': self.stale_until}, default=str)
+
+    @classmethod
+    def loads(cls, raw):
+        data = json.loads(raw)
+        return cls(data['v'], data['f'], data['s'])
+
+
+class MemoryCacheBackend:
+    """
+    Almacenamiento en memoria del propio proceso.
+    Acotado por número de entradas y por bytes aproximados; al superarse se expulsan
+    las entradas menos usadas recientemente (LRU).
+    """
+    shared = False
+
+    def __init__(self, max_entries=2048, max_bytes=4 * 1024 * 1024, clock=time.time):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (raw, expire_at)
+        self._bytes = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            raw, expire_at = item
+            if expire_at is not None and self._clock() >= expire_at:
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+        return CacheEntry.loads(raw)
+
+    def set(self, key, entry, expire_at=None):
+        raw = entry.dumps()
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (raw, expire_at)
+            self._bytes += len(raw)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (old_raw, _) = self._entries.popitem(last=False)
+                self._bytes -= len(old_raw)
+                self._evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'evictions': self._evictions}
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def acquire_lock(self, key, ttl):
+        # Caché privada del proceso: la coordinación entre hilos ya la hace SingleFlight
+        return 'local'
+
+    def release_lock(self, key, token):
+        pass
+
+    def _remove(self, key):
+        item = self._entries.pop(key, None)
+        if item is not None:
+            self._bytes -= len(item[0])
+
+
+class SQLiteCacheBackend:
+    """
+    Caché compartida por todos los workers de una máquina mediante un fichero SQLite.
+    Usa WAL (lectores y escritor concurrentes) y mmap para que las lecturas salgan
+    directamente de la caché de páginas del sistema operativo.
+    Cada hilo mantiene su propia conexión.
+    """
+    shared = True
+    PRUNE_EVERY = 256
+
+    def __init__(self, path, max_entries=10000, mmap_size=64 * 1024 * 1024, clock=time.time):
+        self.path = path
+        self.max_entries = max_entries
+        self.mmap_size = mmap_size
+        self._clock = clock
+        self._local = threading.local()
+        self._writes = 0
+        self._evictions = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS quote_cache ('
+            ' key TEXT PRIMARY KEY,'
+            ' value TEXT NOT NULL,'
+            ' expire_at REAL,'
+            ' updated_at REAL NOT NULL)'
+        )
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS quote_locks (key TEXT PRIMARY KEY, expire_at REAL NOT NULL, token TEXT)'
+        )
+        columns = {row[1] for row in self._connection().execute('PRAGMA table_info(quote_locks)')}
+        if 'token' not in columns:
+            # Fichero creado por una versión anterior, sin dueño en los candados
+            self._connection().execute('ALTER TABLE quote_locks ADD COLUMN token TEXT')
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value, expire_at FROM quote_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[1] is not None and self._clock() >= row[1]:
+            return None
+        return CacheEntry.loads(row[0])
+
+    def set(self, key, entry, expire_at=None):
+        conn = self._connection()
+        conn.execute(
+            'INSERT INTO quote_cache (key, value, expire_at, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, '
+            'expire_at = excluded.expire_at, updated_at = excluded.updated_at',
+            (key, entry.dumps(), expire_at, self._clock())
+        )
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM quote_cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM quote_cache')
+
+    def prune(self):
+        """Borra las entradas expiradas y, si sigue habiendo demasiadas, las más antiguas."""
+        conn = self._connection()
+        conn.execute('DELETE FROM quote_cache WHERE expire_at IS NOT NULL AND expire_at <= ?', (self._clock(),))
+        cursor = conn.execute(
+            'DELETE FROM quote_cache WHERE key IN ('
+            ' SELECT key FROM quote_cache ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_entries,)
+        )
+        self._evictions += max(cursor.rowcount, 0)
+
+    def stats(self):
+        row = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(LENGTH(value)), 0) FROM quote_cache'
+        ).fetchone()
+        return {'entries': row[0], 'bytes': row[1], 'evictions': self._evictions}
+
+    def __contains__(self, key):
+        return self.get(key) is not None
+
+    def acquire_lock(self, key, ttl):
+        """
+        Candado entre procesos con caducidad, para que solo un worker consulte el proveedor.
+        Devuelve el token del dueño (para `release_lock`) o None si lo tiene otro.
+        """
+        conn = self._connection()
+        now = self._clock()
+        token = secrets.token_hex(16)
+        conn.execute('DELETE FROM quote_locks WHERE key = ? AND expire_at <= ?', (key, now))
+        cursor = conn.execute('INSERT OR IGNORE INTO quote_locks (key, expire_at, token) VALUES (?, ?, ?)',
+                              (key, now + ttl, token))
+        return token if cursor.rowcount == 1 else None
+
+    def release_lock(self, key, token):
+        # Solo lo borra su dueño: si el candado caducó y ya es de otro worker, no se toca
+        self._connection().execute('DELETE FROM quote_locks WHERE key = ? AND token = ?', (key, token))
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # isolation_level=None: autocommit, cada sentencia es su propia transacción
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(f'PRAGMA mmap_size={int(self.mmap_size)}')
+            self._local.conn = conn
+        return conn
+
+
+class RedisCacheBackend:
+    """
+    Caché compartida entre máquinas a través de cualquier servidor que hable el
+    protocolo de Redis (Redis, Valkey, KeyDB, Dragonfly...). La expiración la aplica
+    el propio servidor.
+    """
+    shared = True
+    RELEASE_SCRIPT = ("if redis.call('get', KEYS[1]) == ARGV[1] then "
+                      "return redis.call('del', KEYS[1]) else return 0 end")
+
+    def __init__(self, url=None, client=None, prefix='kran:quote:', clock=time.time):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("El backend 'redis' de la caché requiere el paquete 'redis'") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+        self._clock = clock
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+        if isinstance(raw, bytes):
+            raw = raw.decode('utf-8')
+        return CacheEntry.loads(raw)
+
+    def set(self, key, entry, expire_at=None):
+        ttl_ms = None
+        if expire_at is not None:
+            ttl_ms = max(1, int((expire_at - self._clock()) * 1000))
+        self.client.set(self.prefix + key, entry.dumps(), px=ttl_ms)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def stats(self):
+        # El servidor gestiona la memoria (maxmemory) y la expiración. Contar las claves
+        # exige recorrer todo el espacio con SCAN, y /api/market/health (público) llama
+        # aquí en cada comprobación: no se informa del tamaño
+        return {'entries': None, 'bytes': None, 'evictions': None}
+
+    def __contains__(self, key):
+        return self.client.exists(self.prefix + key) > 0
+
+    def acquire_lock(self, key, ttl):
+        """
+        Candado entre máquinas con SET NX PX; caduca solo si el worker muere. Devuelve
+        el token del dueño (para `release_lock`) o None si lo tiene otro.
+        """
+        token = secrets.token_hex(16)
+        acquired = self.client.set(f"{self.prefix}lock:{key}", token, nx=True, px=max(1, int(ttl * 1000)))
+        return token if acquired else None
+
+    def release_lock(self, key, token):
+        # Comparar y borrar en una sola operación: si el candado caducó y ya es de otro
+        # worker, no se toca
+        self.client.eval(self.RELEASE_SCRIPT, 1, f"{self.prefix}lock:{key}", token)
+
+
+def build_cache_backend(app):
+    """Crea el backend de la caché de cotizaciones indicado en `QUOTE_CACHE_BACKEND`."""
+    kind = app.config['QUOTE_CACHE_BACKEND']
+    if kind == 'memory':
+        return MemoryCacheBackend(
+            max_entries=app.config['QUOTE_CACHE_MAX_ENTRIES'],
+            max_bytes=app.config['QUOTE_CACHE_MAX_BYTES'],
+        )
+    if kind == 'sqlite':
+        path = app.config['QUOTE_CACHE_PATH'] or os.path.join(app.instance_path, 'quote_cache.db')
+        return SQLiteCacheBackend(path, max_entries=app.config['QUOTE_CACHE_MAX_ENTRIES'])
+    if kind == 'redis':
+        return RedisCacheBackend(url=app.config['QUOTE_CACHE_REDIS_URL'],
+                                 prefix=app.config['QUOTE_CACHE_KEY_PREFIX'])
+    raise ValueError(f"Backend de caché desconocido: {kind}")
@@ -0,0 +1,196 @@
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, literal, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import (Portfolio, Holding, Transaction, TransactionType, PortfolioValuation, PriceSnapshot,
+                        Order, OrderStatus, CorporateAction, CorporateActionType, CorporateActionStatus, utcnow)
+from app.services.db_utils import insert_for_dialect
+from app.services.market_service import MarketService
+from app.services.valuation_service import ValuationService
+
+
+class CorporateActionProcessor:
+    """
+    Aplica splits y dividendos a todos los titulares de un ticker con unas pocas
+    sentencias por acción, sin cargar posiciones en el ORM:
+
+    - Split: un UPDATE de `holdings` multiplica la cantidad por `ratio` y divide el
+      precio medio y el último precio (el valor de mercado no cambia). Las órdenes
+      abiertas del ticker se cancelan, como hacen los brokers, y tras el commit se
+      descarta su cotización en caché, que sigue en la escala anterior al split, y se
+      vacía su histórico local para descargarlo de nuevo ya ajustado por el proveedor
+      (si no, los cierres anteriores quedarían en la escala antigua junto a los nuevos).
+    - Dividendo: un UPDATE ... FROM abona a cada cartera acciones x importe, otro
+      ajusta su valoración y un INSERT ... SELECT registra las transacciones.
+
+    Cada acción se aplica en su propia transacción, que empieza marcándola como
+    aplicada (solo si seguía pendiente): si dos procesos compiten, solo uno la
+    aplica, y si el proceso se interrumpe, la acción queda pendiente para el
+    siguiente `run`. Las acciones se procesan por orden de `ex_date`.
+    """
+
+    @staticmethod
+    def schedule(ticker, action_type, ex_date, ratio=None, amount=None):
+        """
+        Registra una acción corporativa. Es idempotente: registrar dos veces la misma
+        (ticker, tipo, fecha) no la duplica. Hace commit. Devuelve True si es nueva.
+        """
+        ratio, amount = CorporateActionProcessor._positive(ratio), CorporateActionProcessor._positive(amount)
+        if action_type == CorporateActionType.SPLIT and ratio is None:
+            raise ValueError("Un split necesita un ratio positivo")
+        if action_type == CorporateActionType.DIVIDEND and amount is None:
+            raise ValueError("Un dividendo necesita un importe por acción positivo")
+
+        row = {'ticker_symbol': ticker.upper(), 'action_type': action_type, 'ex_date': ex_date,
+               'ratio': ratio, 'amount': amount, 'status': CorporateActionStatus.PENDING}
+        insert_ = insert_for_dialect()
+        if insert_ is None:
+            exists = CorporateAction.query.filter_by(ticker_symbol=row['ticker_symbol'], action_type=action_type,
+                                                     ex_date=ex_date).first()
+            if exists:
+                return False
+            db.session.add(CorporateAction(**row))
+            db.session.commit()
+            return True
+        result = db.session.execute(insert_(CorporateAction).values(row).on_conflict_do_nothing(
+            index_elements=['ticker_symbol', 'action_type', 'ex_date']))
+        db.session.commit()
+        return result.rowcount == 1
+
+    @staticmethod
+    def _positive(value):
+        """`value` como Decimal si es un número finito mayor que cero; si no, None."""
+        if value is None or value == '':
+            return None
+        try:
+            value = Decimal(str(value))
+        except (InvalidOperation, ValueError):
+            return None
+        return value if value.is_finite() and value > 0 else None
+
+    @staticmethod
+    def run(until=None):
+        """
+        Aplica las acciones pendientes con `ex_date` hasta `until` (hoy por defecto).
+        Si una falla se detiene, para no aplicar las posteriores fuera de orden.
+        Devuelve el número de acciones aplicadas.
+        """
+        until = until or utcnow().date()
+        pending = db.session.execute(
+            select(CorporateAction.id)
+            .where(CorporateAction.status == CorporateActionStatus.PENDING, CorporateAction.ex_date <= until)
+            .order_by(CorporateAction.ex_date, CorporateAction.id)
+        ).scalars().all()
+        db.session.commit()
+
+        applied = 0
+        for action_id in pending:
+            try:
+                action = CorporateActionProcessor._apply(action_id)
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print(f"Error al aplicar la acción corporativa {action_id}: {e}")
+                break
+            if action is not None:
+                applied += 1
+                if action.action_type == CorporateActionType.SPLIT:
+                    CorporateActionProcessor._forget_prices(action.ticker_symbol)
+        return applied
+
+    @staticmethod
+    def _forget_prices(ticker):
+        """Descarta la cotización en caché y el histórico guardado de un ticker tras un split."""
+        MarketService.invalidate_quote(ticker)
+        try:
+            MarketService.reset_history(ticker)
+        except OSError as e:
+            print(f"Error al vaciar el histórico de {ticker} tras el split: {e}")
+
+    @staticmethod
+    def _apply(action_id):
+        now = utcnow()
+        actions = CorporateAction.__table__
+        claimed = db.session.execute(
+            update(actions)
+            .where(actions.c.id == action_id, actions.c.status == CorporateActionStatus.PENDING)
+            .values(status=CorporateActionStatus.APPLIED, applied_at=now)
+        )
+        if claimed.rowcount != 1:
+            # Ya la ha aplicado otro proceso
+            return None
+        action = db.session.execute(select(actions).where(actions.c.id == action_id)).one()
+        if action.action_type == CorporateActionType.SPLIT:
+            holders = CorporateActionProcessor._apply_split(action.ticker_symbol, action.ratio, now)
+        else:
+            holders = CorporateActionProcessor._apply_dividend(action.ticker_symbol, action.amount, now)
+        db.session.execute(update(actions).where(actions.c.id == action_id).values(holders=holders))
+        return action
+
+    @staticmethod
+    def _lock_holders(ticker, cash_per_share=None):
+        """
+        Primer paso de cada acción: un UPDATE ... FROM sobre las carteras con el ticker
+        que incrementa su `version` (y abona el dividendo, si lo hay). Así los bloqueos
+        se toman en el mismo orden que en las operaciones: cartera y después posición.
+        """
+        portfolios = Portfolio.__table__
+        holdings = Holding.__table__
+        values = {'version': portfolios.c.version + 1}
+        if cash_per_share is not None:
+            values['cash_balance'] = portfolios.c.cash_balance + holdings.c.quantity * cash_per_share
+        return db.session.execute(
+            update(portfolios)
+            .where(portfolios.c.id == holdings.c.portfolio_id, holdings.c.ticker_symbol == ticker,
+                   holdings.c.quantity > 0)
+            .values(**values)
+        ).rowcount
+
+    @staticmethod
+    def _apply_split(ticker, ratio, now):
+        holders = CorporateActionProcessor._lock_holders(ticker)
+        holdings = Holding.__table__
+        db.session.execute(
+            update(holdings)
+            .where(holdings.c.ticker_symbol == ticker)
+            .values(quantity=holdings.c.quantity * ratio,
+                    average_purchase_price=holdings.c.average_purchase_price / ratio,
+                    last_price=holdings.c.last_price / ratio)
+        )
+        snapshots = PriceSnapshot.__table__
+        db.session.execute(
+            update(snapshots).where(snapshots.c.ticker_symbol == ticker).values(price=snapshots.c.price / ratio)
+        )
+        orders = Order.__table__
+        db.session.execute(
+            update(orders)
+            .where(orders.c.ticker_symbol == ticker,
+                   orders.c.status.in_([OrderStatus.PENDING, OrderStatus.TRIGGERED]))
+            .values(status=OrderStatus.CANCELLED, reject_reason="Cancelada por un split del valor", closed_at=now)
+        )
+        return holders
+
+    @staticmethod
+    def _apply_dividend(ticker, amount, now):
+        holders = CorporateActionProcessor._lock_holders(ticker, cash_per_share=amount)
+        holdings = Holding.__table__
+        valuations = PortfolioValuation.__table__
+        db.session.execute(
+            update(valuations)
+            .where(valuations.c.portfolio_id == holdings.c.portfolio_id, holdings.c.ticker_symbol == ticker,
+                   holdings.c.quantity > 0)
+            .values(total_value=valuations.c.total_value + holdings.c.quantity * amount, updated_at=now)
+        )
+        ValuationService.mark_changed(tickers=[ticker])
+        transactions = Transaction.__table__
+        db.session.execute(
+            insert(transactions).from_select(
+                ['portfolio_id', 'ticker_symbol', 'type', 'quantity', 'price_per_share', 'transaction_date'],
+                select(holdings.c.portfolio_id, holdings.c.ticker_symbol,
+                       literal(TransactionType.DIVIDEND, transactions.c.type.type),
+                       holdings.c.quantity, literal(amount, transactions.c.price_per_share.type),
+                       literal(now, transactions.c.transaction_date.type))
+                .where(holdings.c.ticker_symbol == ticker, holdings.c.quantity > 0)
+            )
+        )
+        return holders
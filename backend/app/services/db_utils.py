@@ -0,0 +1,16 @@
+from app import db
+
+
+def insert_for_dialect():
+    """
+    Devuelve la construcción `insert` del dialecto en uso si admite upsert
+    (`on_conflict_do_update`), o None si hay que hacerlo a mano.
+    """
+    name = db.session.get_bind().dialect.name
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
@@ -0,0 +1,69 @@
+import threading
+from collections import defaultdict
+from app.models import utcnow
+
+
+class TradeExecuted:
+    """Una compra o venta ejecutada y ya confirmada en la base de datos."""
+    __slots__ = ('portfolio_id', 'ticker', 'side', 'quantity', 'price', 'occurred_at')
+
+    def __init__(self, portfolio_id, ticker, side, quantity, price, occurred_at=None):
+        self.portfolio_id = portfolio_id
+        self.ticker = ticker
+        self.side = side  # 'buy' o 'sell'
+        self.quantity = quantity
+        self.price = price
+        self.occurred_at = occurred_at or utcnow()
+
+
+class PortfolioRevalued:
+    """Nueva valoración de una cartera tras aplicar un tick de precios."""
+    __slots__ = ('portfolio_id', 'total_value', 'starting_cash', 'occurred_at')
+
+    def __init__(self, portfolio_id, total_value, starting_cash, occurred_at=None):
+        self.portfolio_id = portfolio_id
+        self.total_value = total_value
+        self.starting_cash = starting_cash
+        self.occurred_at = occurred_at or utcnow()
+
+    @property
+    def total_return(self):
+        """Rentabilidad total sobre el capital inicial."""
+        return float(self.total_value) / float(self.starting_cash) - 1 if self.starting_cash else 0.0
+
+
+class EventBus:
+    """
+    Bus de eventos de dominio en el proceso. `publish` llama de forma síncrona a los
+    suscriptores del tipo de evento; se publica siempre después del commit, así que
+    un suscriptor que falla se registra en el log pero no deshace la operación.
+    """
+    _handlers = defaultdict(list)
+    _lock = threading.Lock()
+
+    @classmethod
+    def subscribe(cls, event_type, handler):
+        with cls._lock:
+            if handler not in cls._handlers[event_type]:
+                cls._handlers[event_type].append(handler)
+
+    @classmethod
+    def has_subscribers(cls, event_type):
+        """Permite no construir eventos (p. ej. consultas de valoraciones) que nadie escucha."""
+        return bool(cls._handlers.get(event_type))
+
+    @classmethod
+    def publish(cls, events):
+        """Entrega una lista de eventos a sus suscriptores, en orden."""
+        for event in events:
+            for handler in list(cls._handlers.get(type(event), ())):
+                try:
+                    handler(event)
+                except Exception as e:
+                    print(f"Error en el suscriptor {getattr(handler, '__qualname__', handler)} "
+                          f"de {type(event).__name__}: {e}")
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._handlers.clear()
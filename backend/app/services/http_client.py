@@ -0,0 +1,169 @@
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class UpstreamError(Exception):
+    """Error al comunicarse con un proveedor externo."""
+
+
+class CircuitOpenError(UpstreamError):
+    """El circuito está abierto: la llamada se rechaza sin contactar con el proveedor."""
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito clásico de tres estados:
+    - closed: las llamadas pasan con normalidad.
+    - open: tras `failure_threshold` fallos seguidos se rechazan las llamadas durante
+      `reset_timeout` segundos.
+    - half_open: pasado ese tiempo se deja pasar una llamada de prueba; si funciona el
+      circuito se cierra, si falla vuelve a abrirse.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold=5, reset_timeout=30, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._state = CircuitBreaker.CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probe_in_flight = False
+        self._stats = {'successes': 0, 'failures': 0, 'rejected': 0, 'opened': 0}
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def allow_request(self):
+        """Indica si se puede hacer una llamada ahora mismo."""
+        with self._lock:
+            state = self._current_state()
+            if state == CircuitBreaker.CLOSED:
+                return True
+            if state == CircuitBreaker.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self._stats['rejected'] += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._stats['successes'] += 1
+            self._failures = 0
+            self._state = CircuitBreaker.CLOSED
+            self._opened_at = None
+            self._probe_in_flight = False
+
+    def record_neutral(self):
+        """Una llamada que no dice nada de la salud del proveedor (p. ej. un 404): solo libera la prueba."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._stats['failures'] += 1
+            self._failures += 1
+            half_open = self._current_state() == CircuitBreaker.HALF_OPEN
+            if half_open or self._failures >= self.failure_threshold:
+                if self._state != CircuitBreaker.OPEN or half_open:
+                    self._stats['opened'] += 1
+                self._state = CircuitBreaker.OPEN
+                self._opened_at = self._clock()
+            self._probe_in_flight = False
+
+    def snapshot(self):
+        """Estado del circuito para monitorización."""
+        with self._lock:
+            state = self._current_state()
+            retry_in = None
+            if state == CircuitBreaker.OPEN:
+                retry_in = max(0.0, self._opened_at + self.reset_timeout - self._clock())
+            return dict(self._stats, state=state, consecutive_failures=self._failures,
+                        retry_in=retry_in)
+
+    def _current_state(self):
+        if self._state == CircuitBreaker.OPEN and self._clock() - self._opened_at >= self.reset_timeout:
+            return CircuitBreaker.HALF_OPEN
+        return self._state
+
+
+class UpstreamClient:
+    """
+    Cliente HTTP compartido para un proveedor externo.
+    Reutiliza conexiones (keep-alive) mediante una `requests.Session` con un pool
+    acotado, reintenta los errores transitorios con backoff exponencial y jitter, y
+    protege al proveedor con un `CircuitBreaker`. Una clave revocada o sin cuota
+    (401/403) o un cuerpo que no es JSON cuentan como fallo del circuito; los demás
+    4xx son errores de la petición concreta y no cuentan ni como fallo ni como éxito.
+    """
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    FAILURE_STATUS = {401, 403}
+
+    def __init__(self, base_url, timeout=(2, 5), max_retries=2, backoff_base=0.2,
+                 backoff_max=2.0, pool_size=10, breaker=None, sleep=time.sleep):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = breaker or CircuitBreaker()
+        self._sleep = sleep
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def get_json(self, path, params=None):
+        """
+        Hace un GET y devuelve el JSON decodificado.
+        Lanza `CircuitOpenError` si el circuito está abierto y `UpstreamError` si
+        la llamada falla tras agotar los reintentos.
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"Circuito abierto para {self.base_url}")
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        last_error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self._sleep(self._backoff(attempt))
+            try:
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                if response.status_code in self.RETRY_STATUS:
+                    last_error = UpstreamError(f"Respuesta {response.status_code} de {url}")
+                    continue
+                response.raise_for_status()
+                data = response.json()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                last_error = UpstreamError(f"Error de conexión con {url}: {e.__class__.__name__}")
+                continue
+            except requests.exceptions.HTTPError as e:
+                # 4xx: no tiene sentido reintentar
+                if response.status_code in self.FAILURE_STATUS:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_neutral()
+                raise UpstreamError(f"Respuesta {response.status_code} de {url}") from e
+            except (requests.exceptions.RequestException, ValueError) as e:
+                # JSON inválido u otro error no transitorio: tampoco se reintenta
+                self.breaker.record_failure()
+                raise UpstreamError(f"Respuesta inválida de {url}: {e.__class__.__name__}") from e
+
+            self.breaker.record_success()
+            return data
+
+        self.breaker.record_failure()
+        raise last_error
+
+    def _backoff(self, attempt):
+        # "Full jitter": espera aleatoria entre 0 y el backoff exponencial
+        ceiling = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+        return random.uniform(0, ceiling)
@@ -0,0 +1,343 @@
+import random
+import threading
+import time
+from sqlalchemy import event, func, or_, select
+from app.models import Portfolio, Holding, PortfolioValuation, LeagueMember
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels, tail=None):
+        self.key = key
+        self.next = [tail] * levels
+        # width[i]: cuántas posiciones del nivel 0 se avanzan al seguir next[i]
+        self.width = [1] * levels
+
+
+class IndexableSkipList:
+    """
+    Skip list ordenada con anchura en cada enlace (como los sorted sets de Redis):
+    insertar, borrar, obtener la posición de una clave y acceder por posición
+    cuestan O(log n) de media.
+    """
+    MAX_LEVEL = 32
+
+    def __init__(self, seed=None):
+        self._random = random.Random(seed)
+        self._tail = _Node(None, 0)
+        self._head = _Node(None, self.MAX_LEVEL, self._tail)
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def _chain(self, key):
+        """Último nodo con clave menor que `key` en cada nivel y su posición."""
+        chain = [None] * self.MAX_LEVEL
+        positions = [0] * self.MAX_LEVEL
+        node, position = self._head, 0
+        for level in reversed(range(self.MAX_LEVEL)):
+            following = node.next[level]
+            while following is not self._tail and following.key < key:
+                position += node.width[level]
+                node, following = following, following.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def insert(self, key):
+        chain, positions = self._chain(key)
+        levels = 1
+        while levels < self.MAX_LEVEL and self._random.random() < 0.5:
+            levels += 1
+        node = _Node(key, levels, self._tail)
+        position = positions[0] + 1  # posición (desde 1) del nodo nuevo
+        for level in range(levels):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            # El enlace anterior se parte en dos alrededor del nodo nuevo
+            node.width[level] = previous.width[level] - (position - 1 - positions[level])
+            previous.width[level] = position - positions[level]
+        for level in range(levels, self.MAX_LEVEL):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._chain(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), self.MAX_LEVEL):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def index(self, key):
+        """Posición (desde 0) de `key`; lanza KeyError si no está."""
+        chain, positions = self._chain(key)
+        node = chain[0].next[0]
+        if node is self._tail or node.key != key:
+            raise KeyError(key)
+        return positions[0]
+
+    def slice(self, start, count):
+        """Hasta `count` claves a partir de la posición `start` (desde 0)."""
+        if start >= self._size or count <= 0:
+            return []
+        node, remaining = self._head, start + 1
+        for level in reversed(range(self.MAX_LEVEL)):
+            while node.next[level] is not self._tail and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not self._tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class MemoryLeaderboardBackend:
+    """
+    Clasificaciones en memoria del proceso: una skip list por liga, ordenada por
+    (-valor, usuario), y un diccionario usuario -> valor para localizar su entrada.
+    """
+    shared = False
+
+    def __init__(self):
+        self._boards = {}  # liga -> (skip list, {usuario: valor}, cargada en)
+        self._lock = threading.Lock()
+
+    @property
+    def tracking(self):
+        return bool(self._boards)
+
+    def loaded_at(self, league_id):
+        board = self._boards.get(league_id)
+        return board[2] if board else None
+
+    def replace(self, league_id, entries):
+        ranking, scores = IndexableSkipList(), {}
+        for member, score in entries:
+            scores[member] = score
+            ranking.insert((-score, member))
+        with self._lock:
+            self._boards[league_id] = (ranking, scores, time.monotonic())
+
+    def update(self, league_id, entries):
+        with self._lock:
+            board = self._boards.get(league_id)
+            if board is None:
+                return
+            ranking, scores, _ = board
+            for member, score in entries:
+                previous = scores.get(member)
+                if previous == score:
+                    continue
+                if previous is not None:
+                    ranking.remove((-previous, member))
+                ranking.insert((-score, member))
+                scores[member] = score
+
+    def top(self, league_id, count):
+        with self._lock:
+            ranking = self._boards[league_id][0]
+            return [(member, -score) for score, member in ranking.slice(0, count)]
+
+    def rank(self, league_id, member):
+        """(posición desde 1, valor, número de miembros) o None si no está en la liga."""
+        with self._lock:
+            ranking, scores, _ = self._boards[league_id]
+            score = scores.get(member)
+            if score is None:
+                return None
+            return ranking.index((-score, member)) + 1, score, len(ranking)
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+
+class RedisLeaderboardBackend:
+    """
+    Clasificaciones compartidas en sorted sets de Redis (ZADD / ZREVRANGE / ZREVRANK,
+    todas O(log n)). Una clave auxiliar marca las ligas ya cargadas, aunque estén vacías.
+    """
+    shared = True
+    tracking = True
+
+    def __init__(self, url=None, client=None, prefix='kran:league:'):
+        if client is None:
+            try:
+                import redis
+            except ImportError as e:
+                raise RuntimeError("El backend 'redis' de las clasificaciones requiere el paquete 'redis'") from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.prefix = prefix
+
+    def _key(self, league_id):
+        return f"{self.prefix}{league_id}"
+
+    def loaded_at(self, league_id):
+        return 0.0 if self.client.exists(self._key(league_id) + ':loaded') else None
+
+    def replace(self, league_id, entries):
+        pipe = self.client.pipeline()
+        pipe.delete(self._key(league_id))
+        if entries:
+            pipe.zadd(self._key(league_id), {str(member): score for member, score in entries})
+        pipe.set(self._key(league_id) + ':loaded', '1')
+        pipe.execute()
+
+    def update(self, league_id, entries):
+        if entries and self.loaded_at(league_id) is not None:
+            self.client.zadd(self._key(league_id), {str(member): score for member, score in entries})
+
+    def top(self, league_id, count):
+        rows = self.client.zrevrange(self._key(league_id), 0, count - 1, withscores=True)
+        return [(int(member), score) for member, score in rows]
+
+    def rank(self, league_id, member):
+        pipe = self.client.pipeline()
+        pipe.zrevrank(self._key(league_id), str(member))
+        pipe.zscore(self._key(league_id), str(member))
+        pipe.zcard(self._key(league_id))
+        position, score, size = pipe.execute()
+        if position is None:
+            return None
+        return position + 1, score, size
+
+    def clear(self):
+        keys = list(self.client.scan_iter(match=self.prefix + '*'))
+        if keys:
+            self.client.delete(*keys)
+
+
+def build_leaderboard_backend(app):
+    """Crea el backend de clasificaciones indicado en `LEADERBOARD_BACKEND`."""
+    kind = app.config['LEADERBOARD_BACKEND']
+    if kind == 'memory':
+        return MemoryLeaderboardBackend()
+    if kind == 'redis':
+        return RedisLeaderboardBackend(url=app.config['LEADERBOARD_REDIS_URL'],
+                                       prefix=app.config['LEADERBOARD_KEY_PREFIX'])
+    raise ValueError(f"Backend de clasificaciones desconocido: {kind}")
+
+
+class Leaderboard:
+    """
+    Clasificación de cada liga por valor total de cartera.
+
+    Cada liga se carga entera desde la base de datos la primera vez que se consulta
+    (una consulta) y después se mantiene al día de forma incremental: `ValuationService`
+    apunta en la sesión qué carteras (o tickers) han cambiado de valor; justo antes del
+    commit se leen, en una consulta, los valores nuevos de los miembros de ligas
+    afectados y, tras el commit, se aplican a la estructura ordenada. Las consultas
+    de top-N y de posición de un usuario cuestan O(log n).
+
+    Con el backend en memoria cada proceso tiene su copia: para recoger los cambios
+    de otros procesos (p. ej. la ingesta de precios) las ligas se recargan cada
+    `REBUILD_INTERVAL` segundos. Con Redis la clasificación es compartida.
+    """
+    REBUILD_INTERVAL = 300
+
+    _backend = MemoryLeaderboardBackend()
+    _listening = False
+    _listen_lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app, session):
+        cls._backend = build_leaderboard_backend(app)
+        cls.REBUILD_INTERVAL = app.config['LEADERBOARD_REBUILD_INTERVAL']
+        with cls._listen_lock:
+            if not cls._listening:
+                event.listen(session, 'before_commit', cls._before_commit)
+                event.listen(session, 'after_commit', cls._after_commit)
+                event.listen(session, 'after_rollback', cls._after_rollback)
+                cls._listening = True
+
+    @classmethod
+    def clear(cls):
+        """Vacía las clasificaciones cargadas (se reconstruyen al consultarlas)."""
+        cls._backend.clear()
+
+    @classmethod
+    def top(cls, session, league_id, count):
+        """Los `count` primeros de la liga como [(posición, id de usuario, valor)]."""
+        cls._ensure_loaded(session, league_id)
+        return [(position, member, score)
+                for position, (member, score) in enumerate(cls._backend.top(league_id, count), 1)]
+
+    @classmethod
+    def rank(cls, session, league_id, user_id):
+        """(posición, valor, número de miembros) del usuario en la liga, o None."""
+        cls._ensure_loaded(session, league_id)
+        result = cls._backend.rank(league_id, user_id)
+        if result is None:
+            # Con el backend en memoria, quien se acaba de unir en otro proceso aún no
+            # está en la copia local: se busca en la base de datos antes de dar un 404
+            cls.refresh_members(session, league_id, [user_id])
+            result = cls._backend.rank(league_id, user_id)
+        return result
+
+    @classmethod
+    def refresh_members(cls, session, league_id, user_ids):
+        """Actualiza en la clasificación el valor de algunos miembros (p. ej. al unirse)."""
+        rows = session.execute(cls._members_query().where(
+            LeagueMember.league_id == league_id, LeagueMember.user_id.in_(user_ids))).all()
+        cls._backend.update(league_id, [(user_id, float(value)) for _, user_id, value in rows])
+
+    @classmethod
+    def _ensure_loaded(cls, session, league_id):
+        loaded_at = cls._backend.loaded_at(league_id)
+        stale = (not cls._backend.shared and loaded_at is not None
+                 and time.monotonic() - loaded_at > cls.REBUILD_INTERVAL)
+        if loaded_at is None or stale:
+            rows = session.execute(cls._members_query().where(LeagueMember.league_id == league_id)).all()
+            cls._backend.replace(league_id, [(user_id, float(value)) for _, user_id, value in rows])
+
+    @staticmethod
+    def _members_query():
+        # Miembros sin valoración todavía cuentan con su saldo inicial de caja
+        return (
+            select(LeagueMember.league_id, LeagueMember.user_id,
+                   func.coalesce(PortfolioValuation.total_value, Portfolio.cash_balance))
+            .join(Portfolio, Portfolio.user_id == LeagueMember.user_id)
+            .outerjoin(PortfolioValuation, PortfolioValuation.portfolio_id == Portfolio.id)
+        )
+
+    @classmethod
+    def _before_commit(cls, session):
+        changed = session.info.pop('valuations_changed', None)
+        if not changed or not cls._backend.tracking:
+            return
+        conditions = []
+        if changed['portfolios']:
+            conditions.append(Portfolio.id.in_(changed['portfolios']))
+        if changed['tickers']:
+            conditions.append(Portfolio.id.in_(
+                select(Holding.portfolio_id).where(Holding.ticker_symbol.in_(changed['tickers']))))
+        if conditions:
+            session.info['leaderboard_updates'] = session.execute(
+                cls._members_query().where(or_(*conditions))).all()
+
+    @classmethod
+    def _after_commit(cls, session):
+        rows = session.info.pop('leaderboard_updates', None)
+        if not rows:
+            return
+        by_league = {}
+        for league_id, user_id, value in rows:
+            by_league.setdefault(league_id, []).append((user_id, float(value)))
+        for league_id, entries in by_league.items():
+            cls._backend.update(league_id, entries)
+
+    @staticmethod
+    def _after_rollback(session):
+        session.info.pop('valuations_changed', None)
+        session.info.pop('leaderboard_updates', None)
@@ -1,6 +1,20 @@
 import os
-import requests
-from functools import lru_cache
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from flask import g, has_app_context, has_request_context
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.services.quote_cache import QuoteCache, CacheLookup
+from app.services.cache_backends import build_cache_backend
+from app.services.http_client import UpstreamClient, CircuitBreaker, UpstreamError
+from app.services.price_store import PriceStore
+from app.services.symbol_directory import SymbolDirectory
+from app.services.singleflight import SingleFlight
+from app.services.async_quotes import AsyncQuoteEngine
+from app.services.quote_stream import QuoteStreamHub
+from app.services.price_history import PriceHistoryStore, downsample_ohlc, downsample_lttb
 
 class MarketService:
     """
@@ -8,35 +22,607 @@ class MarketService:
     """
     BASE_URL = "https://financialmodelingprep.com/api/v3"
     API_KEY = os.getenv("FMP_API_KEY")
+    # Número máximo de tickers por petición al endpoint de cotizaciones
+    QUOTE_BATCH_SIZE = 50
+    # Marca que indica que el proveedor no ha respondido (distinto de "ticker no encontrado")
+    UNAVAILABLE = object()
+
+    # Caché de cotizaciones y cliente HTTP compartidos por todas las peticiones del proceso.
+    # El almacenamiento de la caché puede ser compartido entre workers (QUOTE_CACHE_BACKEND).
+    _cache = QuoteCache()
+    _client = UpstreamClient(BASE_URL)
+    _refreshing = set()
+    _refresh_lock = threading.Lock()
+
+    # Agrupación de peticiones concurrentes al proveedor (una consulta en curso por ticker)
+    _flight = SingleFlight()
+    SINGLEFLIGHT_TIMEOUT = 5.0
+    SHARED_POLL_INTERVAL = 0.05
+
+    # Motor asyncio para pedir en paralelo las cotizaciones de una lista de seguimiento
+    _engine = None
+
+    # Lectura de precios desde la tabla price_snapshots (mantenida por la ingesta)
+    SNAPSHOTS_ENABLED = True
+    SNAPSHOT_MAX_AGE = 60
+    DEMAND_TOUCH_INTERVAL = 60
+    _demand_touched = {}
+
+    # Directorio local de símbolos para el buscador
+    SYMBOL_DIRECTORY_EXCHANGES = ('NASDAQ', 'NYSE', 'AMEX')
+    SEARCH_CACHE_TTL = 3600
+    _directory = SymbolDirectory()
+
+    # Stream SSE: un único poller por proceso reparte los cambios entre los clientes
+    _stream = None
+
+    # Histórico OHLCV diario en columnas mapeadas en memoria
+    HISTORY_SYNC_INTERVAL = 3600
+    HISTORY_BACKFILL_DAYS = 5 * 365
+    HISTORY_DOWNSAMPLERS = {'ohlc': downsample_ohlc, 'lttb': downsample_lttb}
+    _history = None
+    _history_flight = SingleFlight()
+    HISTORY_SYNCED_MAX_ENTRIES = 10000
+    _history_synced = OrderedDict()  # ticker -> (instante de la sincronización, generación del almacén)
+    _history_lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        """Configura la caché de cotizaciones y el cliente HTTP a partir de la configuración de la app."""
+        cls._cache = QuoteCache(
+            ttl=app.config['QUOTE_CACHE_TTL'],
+            stale_ttl=app.config['QUOTE_CACHE_STALE_TTL'],
+            negative_ttl=app.config['QUOTE_CACHE_NEGATIVE_TTL'],
+            retain_ttl=app.config['QUOTE_CACHE_RETAIN_TTL'],
+            backend=build_cache_backend(app),
+        )
+        cls.QUOTE_BATCH_SIZE = app.config['QUOTE_BATCH_SIZE']
+        cls._flight = SingleFlight()
+        cls.SINGLEFLIGHT_TIMEOUT = app.config['QUOTE_SINGLEFLIGHT_TIMEOUT']
+        if cls._engine is not None:
+            # Cada init_app crea un motor nuevo: el pool de hilos del anterior no se reutiliza
+            cls._engine.close()
+        cls._engine = AsyncQuoteEngine(
+            lambda chunk: cls._refresh_quotes_raw(chunk),
+            unavailable=cls.UNAVAILABLE,
+            concurrency=app.config['QUOTES_ASYNC_CONCURRENCY'],
+            chunk_size=app.config['QUOTES_ASYNC_CHUNK_SIZE'],
+            timeout=app.config['QUOTES_ASYNC_TIMEOUT'],
+        )
+        cls.SNAPSHOTS_ENABLED = app.config['PRICE_SNAPSHOTS_ENABLED']
+        cls.SNAPSHOT_MAX_AGE = app.config['PRICE_SNAPSHOT_MAX_AGE']
+        cls.DEMAND_TOUCH_INTERVAL = app.config['PRICE_DEMAND_TOUCH_INTERVAL']
+        cls._demand_touched = {}
+        if cls._flush_price_demand not in app.after_request_funcs.get(None, []):
+            app.after_request(cls._flush_price_demand)
+        cls.SYMBOL_DIRECTORY_EXCHANGES = tuple(app.config['SYMBOL_DIRECTORY_EXCHANGES'])
+        cls.SEARCH_CACHE_TTL = app.config['SEARCH_CACHE_TTL']
+        cls._directory = SymbolDirectory(
+            app.config['SYMBOL_DIRECTORY_PATH'] or os.path.join(app.instance_path, 'symbols.json'),
+            reload_interval=app.config['SYMBOL_DIRECTORY_RELOAD_INTERVAL'],
+        )
+        cls._directory.load()
+        if cls._stream is not None:
+            cls._stream.close()
+        cls._stream = QuoteStreamHub(lambda symbols: cls._poll_stream(app, symbols),
+                                     interval=app.config['STREAM_POLL_INTERVAL'],
+                                     max_clients=app.config['STREAM_MAX_CLIENTS'])
+        cls._history = PriceHistoryStore(
+            app.config['HISTORY_STORE_PATH'] or os.path.join(app.instance_path, 'history'))
+        cls._history_flight = SingleFlight()
+        cls._history_synced = OrderedDict()
+        cls.HISTORY_SYNC_INTERVAL = app.config['HISTORY_SYNC_INTERVAL']
+        cls.HISTORY_BACKFILL_DAYS = app.config['HISTORY_BACKFILL_DAYS']
+        cls.HISTORY_SYNCED_MAX_ENTRIES = app.config['HISTORY_SYNCED_MAX_ENTRIES']
+        cls._client = UpstreamClient(
+            cls.BASE_URL,
+            timeout=(app.config['UPSTREAM_CONNECT_TIMEOUT'], app.config['UPSTREAM_READ_TIMEOUT']),
+            max_retries=app.config['UPSTREAM_MAX_RETRIES'],
+            backoff_base=app.config['UPSTREAM_BACKOFF_BASE'],
+            backoff_max=app.config['UPSTREAM_BACKOFF_MAX'],
+            pool_size=app.config['UPSTREAM_POOL_SIZE'],
+            breaker=CircuitBreaker(
+                failure_threshold=app.config['CIRCUIT_FAILURE_THRESHOLD'],
+                reset_timeout=app.config['CIRCUIT_RESET_TIMEOUT'],
+            ),
+        )
 
     @staticmethod
-    @lru_cache(maxsize=128)
-    def get_quote(ticker: str):
+    def get_quote(ticker: str, allow_stale: bool = True):
         """
         Obtiene la cotización en tiempo real para un ticker dado.
-        Cachea los resultados para evitar llamadas repetidas a la API para el mismo ticker.
+        Los resultados se cachean con un TTL corto. Si `allow_stale` es True, una
+        cotización caducada recientemente se sirve de inmediato mientras se revalida
+        en segundo plano; las operaciones de compra/venta deben pasar False para no
+        operar nunca con precios caducados.
+        """
+        symbol = ticker.upper()
+        MarketService._note_demand([symbol])
+        cached = MarketService._cache.lookup(symbol)
+
+        if cached.state == CacheLookup.FRESH:
+            return cached.value
+
+        snapshot = MarketService._read_snapshots([symbol], allow_stale).get(symbol)
+        if snapshot:
+            return snapshot
+
+        if cached.state == CacheLookup.STALE and allow_stale:
+            MarketService._revalidate_async(symbol)
+            return cached.value
+
+        quote = MarketService._refresh_quote(symbol, allow_stale)
+        MarketService._remember_fetched({symbol: quote})
+        return quote
+
+    @staticmethod
+    def get_quotes(tickers, allow_stale: bool = True):
+        """
+        Obtiene las cotizaciones de varios tickers a la vez.
+        Primero se sirven desde la caché y solo los tickers que faltan se piden al
+        proveedor, en bloques de `QUOTE_BATCH_SIZE` símbolos por petición.
+        Devuelve un diccionario {símbolo: cotización o None}.
+        """
+        def fetch_missing(missing):
+            return MarketService.refresh_quotes(missing, allow_stale)
+
+        return MarketService._resolve_quotes(tickers, allow_stale, fetch_missing)
+
+    @staticmethod
+    def get_quotes_concurrently(tickers):
+        """
+        Variante de `get_quotes` para listas de seguimiento: los tickers que no están
+        en caché ni en los snapshots se piden en paralelo con el motor asyncio.
+        Devuelve (cotizaciones, errores), donde los errores son por ticker
+        ('not_found', 'unavailable' o 'timeout'), para poder responder con
+        resultados parciales.
+        """
+        errors = {}
+
+        def fetch_missing(missing):
+            quotes, failed = MarketService._engine.run(missing)
+            for symbol, error in failed.items():
+                # Si el proveedor no responde se recurre al último valor conocido
+                last_known = MarketService._cache.peek(symbol) if error != AsyncQuoteEngine.NOT_FOUND else None
+                if last_known:
+                    quotes[symbol] = last_known
+                else:
+                    errors[symbol] = error
+            return quotes
+
+        quotes = MarketService._resolve_quotes(tickers, True, fetch_missing)
+        return {symbol: quote for symbol, quote in quotes.items() if quote}, errors
+
+    @staticmethod
+    def _resolve_quotes(tickers, allow_stale, fetch_missing):
+        """
+        Resuelve varias cotizaciones por niveles: caché fresca, snapshots de la base de
+        datos, caché caducada (si se permite, revalidando en segundo plano) y, para lo
+        que falte, `fetch_missing(símbolos)`.
+        """
+        symbols = list(dict.fromkeys(ticker.upper() for ticker in tickers))
+        MarketService._note_demand(symbols)
+        quotes = {}
+        not_fresh = {}
+
+        for symbol in symbols:
+            cached = MarketService._cache.lookup(symbol)
+            if cached.state == CacheLookup.FRESH:
+                quotes[symbol] = cached.value
+            else:
+                not_fresh[symbol] = cached
+
+        # Lo que no está fresco en la caché se busca primero en los snapshots de la base de datos
+        if not_fresh:
+            snapshots = MarketService._read_snapshots(list(not_fresh), allow_stale)
+            quotes.update(snapshots)
+            for symbol in snapshots:
+                del not_fresh[symbol]
+
+        missing = []
+        stale = []
+        for symbol, cached in not_fresh.items():
+            if cached.state == CacheLookup.STALE and allow_stale:
+                quotes[symbol] = cached.value
+                stale.append(symbol)
+            else:
+                missing.append(symbol)
+
+        if stale:
+            MarketService._revalidate_async(stale)
+        if missing:
+            fetched = fetch_missing(missing)
+            MarketService._remember_fetched(fetched)
+            quotes.update(fetched)
+        return quotes
+
+    @staticmethod
+    def cache_stats():
+        """Devuelve los contadores de la caché de cotizaciones."""
+        return MarketService._cache.stats()
+
+    @staticmethod
+    def upstream_status():
+        """Estado del circuito hacia FMP y de la caché, para monitorización."""
+        return {
+            'circuit': MarketService._client.breaker.snapshot(),
+            'cache': MarketService._cache.stats(),
+            'singleflight': MarketService._flight.stats(),
+            'stream': MarketService._stream.stats() if MarketService._stream else None,
+        }
+
+    @staticmethod
+    def subscribe_quotes(symbols):
+        """Suscribe un cliente del stream a los cambios de precio de varios tickers."""
+        return MarketService._stream.subscribe([symbol.upper() for symbol in symbols])
+
+    @staticmethod
+    def unsubscribe_quotes(subscription):
+        MarketService._stream.unsubscribe(subscription)
+
+    @staticmethod
+    def _poll_stream(app, symbols):
+        """Consulta del poller del stream: pasa por la caché y los snapshots como cualquier petición."""
+        with app.app_context():
+            return MarketService.get_quotes(symbols)
+
+    @staticmethod
+    def _read_snapshots(symbols, allow_stale=True):
+        """
+        Busca cotizaciones recientes en la tabla de snapshots y las guarda en la caché
+        con su hora de obtención (no se renueva su frescura). Con `allow_stale` False
+        solo valen los snapshots más recientes que el TTL de la caché, para que las
+        operaciones no se ejecuten con precios de hasta `SNAPSHOT_MAX_AGE` segundos.
+        Solo se usa dentro de un contexto de aplicación (con acceso a la base de datos).
+        """
+        if not MarketService.SNAPSHOTS_ENABLED or not has_app_context():
+            return {}
+        max_age = MarketService.SNAPSHOT_MAX_AGE
+        if not allow_stale:
+            max_age = min(max_age, MarketService._cache.ttl)
+        snapshots = PriceStore.get_quotes(symbols, max_age)
+        for symbol, quote in snapshots.items():
+            fetched_at = datetime.fromisoformat(quote['snapshotAt']).replace(tzinfo=timezone.utc).timestamp()
+            MarketService._cache.set(symbol, quote, fetched_at=fetched_at)
+        return snapshots
+
+    @staticmethod
+    def _note_demand(symbols):
+        """
+        Apunta los tickers pedidos en esta petición para marcarlos como "recientes"
+        en la base de datos, como mucho una vez cada `DEMAND_TOUCH_INTERVAL` segundos.
+        """
+        if not MarketService.SNAPSHOTS_ENABLED or not has_request_context():
+            return
+        now = time.monotonic()
+        due = [symbol for symbol in symbols
+               if now - MarketService._demand_touched.get(symbol, float('-inf')) >= MarketService.DEMAND_TOUCH_INTERVAL]
+        if due:
+            g.setdefault('price_demand', set()).update(due)
+            for symbol in due:
+                MarketService._demand_touched[symbol] = now
+
+    @staticmethod
+    def _remember_fetched(quotes):
+        """Apunta las cotizaciones obtenidas del proveedor para guardarlas como snapshots."""
+        if not MarketService.SNAPSHOTS_ENABLED or not has_request_context():
+            return
+        valid = {symbol: quote for symbol, quote in quotes.items() if quote}
+        if valid:
+            g.setdefault('price_fetched', {}).update(valid)
+
+    @staticmethod
+    def _flush_price_demand(response):
+        """
+        Al terminar la petición se guardan en bloque los snapshots obtenidos del
+        proveedor y se marcan los tickers pedidos, fuera del camino crítico del
+        handler. Las carteras con esos tickers las revaloriza la ingesta de precios:
+        una lectura no debe escribir en las posiciones de todos los titulares. Se
+        escribe en una conexión aparte para no hacer commit de la sesión de la petición.
+        """
+        fetched = g.pop('price_fetched', None)
+        demand = g.pop('price_demand', None)
+        if not fetched and not demand:
+            return response
+        try:
+            with db.engine.begin() as connection:
+                if fetched:
+                    PriceStore.upsert_quotes(fetched, requested=True, connection=connection)
+                if demand:
+                    PriceStore.touch(demand - set(fetched or ()), connection=connection)
+        except SQLAlchemyError as e:
+            print(f"Error al guardar los snapshots de precios: {e}")
+        return response
+
+    @staticmethod
+    def _refresh_quote(symbol: str, allow_stale: bool = True):
+        """Consulta una cotización al proveedor (ver `refresh_quotes`)."""
+        return MarketService.refresh_quotes([symbol], allow_stale)[symbol]
+
+    @staticmethod
+    def refresh_quotes(symbols, allow_stale: bool = True):
+        """
+        Consulta varias cotizaciones al proveedor, sin mirar antes la caché ni los
+        snapshots, y actualiza la caché. La usa la ingesta en segundo plano.
+
+        Las peticiones concurrentes se agrupan por ticker: solo hay una consulta en
+        curso por símbolo y el resto de llamadas espera su resultado, como mucho
+        `SINGLEFLIGHT_TIMEOUT` segundos. Si el proveedor no está disponible (o se agota
+        la espera) se devuelve el último valor conocido, solo cuando `allow_stale` lo
+        permite, y la caché no se toca.
+        """
+        results = MarketService._refresh_quotes_raw(symbols)
+        quotes = {}
+        for symbol in symbols:
+            quote = results.get(symbol, MarketService.UNAVAILABLE)
+            if quote is MarketService.UNAVAILABLE:
+                quote = MarketService._cache.peek(symbol) if allow_stale else None
+            quotes[symbol] = quote
+        return quotes
+
+    @staticmethod
+    def _refresh_quotes_raw(symbols):
+        """
+        Como `refresh_quotes`, pero sin sustituir nada: devuelve {símbolo: cotización,
+        None si el proveedor no lo conoce o `UNAVAILABLE` si no se pudo consultar}.
+        """
+        owned, waiting = MarketService._flight.claim(symbols)
+        results = {}
+        try:
+            if owned:
+                results.update(MarketService._fetch_owned(owned))
+        finally:
+            MarketService._flight.complete({symbol: results.get(symbol, MarketService.UNAVAILABLE)
+                                            for symbol in owned})
+
+        deadline = time.monotonic() + MarketService.SINGLEFLIGHT_TIMEOUT
+        for symbol, flight in waiting.items():
+            finished, quote = flight.wait(max(0.0, deadline - time.monotonic()))
+            results[symbol] = quote if finished else MarketService.UNAVAILABLE
+        return results
+
+    @staticmethod
+    def _fetch_owned(symbols):
+        """
+        Obtiene del proveedor los tickers que este hilo tiene reclamados.
+        Con un backend de caché compartido, además se coordina con los otros workers:
+        solo se consultan los tickers cuyo candado se consigue y para el resto se
+        espera a que otro worker deje la cotización en la caché.
+        """
+        cache = MarketService._cache
+        locked = symbols
+        others = []
+        tokens = {}
+        if cache.shared:
+            locked, others = [], []
+            for symbol in symbols:
+                token = cache.acquire_lock(symbol, MarketService.SINGLEFLIGHT_TIMEOUT)
+                if token:
+                    tokens[symbol] = token
+                    locked.append(symbol)
+                else:
+                    others.append(symbol)
+
+        results = {}
+        try:
+            batch_size = MarketService.QUOTE_BATCH_SIZE
+            for start in range(0, len(locked), batch_size):
+                chunk = locked[start:start + batch_size]
+                fetched = MarketService._fetch_quotes(chunk)
+                for symbol in chunk:
+                    if fetched is MarketService.UNAVAILABLE:
+                        results[symbol] = MarketService.UNAVAILABLE
+                        continue
+                    quote = fetched.get(symbol)
+                    if quote:
+                        cache.set(symbol, quote)
+                    else:
+                        cache.set_negative(symbol)
+                    results[symbol] = quote
+        finally:
+            for symbol, token in tokens.items():
+                cache.release_lock(symbol, token)
+
+        if others:
+            results.update(MarketService._await_shared(others))
+        return results
+
+    @staticmethod
+    def _await_shared(symbols):
+        """Espera a que otro worker publique en la caché compartida las cotizaciones pedidas."""
+        pending = set(symbols)
+        results = {}
+        deadline = time.monotonic() + MarketService.SINGLEFLIGHT_TIMEOUT
+        while pending:
+            for symbol in list(pending):
+                cached = MarketService._cache.lookup(symbol)
+                if cached.state == CacheLookup.FRESH:
+                    results[symbol] = cached.value
+                    pending.discard(symbol)
+            if not pending or time.monotonic() >= deadline:
+                break
+            time.sleep(MarketService.SHARED_POLL_INTERVAL)
+        for symbol in pending:
+            results[symbol] = MarketService.UNAVAILABLE
+        return results
+
+    @staticmethod
+    def _revalidate_async(symbols):
+        """
+        Lanza una revalidación en segundo plano de uno o varios tickers, evitando
+        revalidar a la vez un ticker que ya se está actualizando.
+        """
+        if isinstance(symbols, str):
+            symbols = [symbols]
+        with MarketService._refresh_lock:
+            pending = [symbol for symbol in symbols if symbol not in MarketService._refreshing]
+            if not pending:
+                return
+            MarketService._refreshing.update(pending)
+
+        def worker():
+            try:
+                MarketService.refresh_quotes(pending)
+            finally:
+                with MarketService._refresh_lock:
+                    MarketService._refreshing.difference_update(pending)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    @staticmethod
+    def _fetch_quotes(symbols):
+        """
+        Llamada directa a la API de FMP para varios tickers, sin caché.
+        Usa el endpoint de cotizaciones separado por comas y devuelve un diccionario
+        {símbolo: cotización} con los tickers que el proveedor haya reconocido, o
+        `UNAVAILABLE` si el proveedor no responde o el circuito está abierto.
         """
         if not MarketService.API_KEY:
             print("Aviso: FMP_API_KEY no está configurada. Usando datos de prueba para la cotización.")
-            return {"symbol": ticker.upper(), "price": 150.00, "name": "Activo de Prueba"}
+            return {symbol: {"symbol": symbol, "price": 150.00, "name": "Activo de Prueba"} for symbol in symbols}
 
         try:
-            url = f"{MarketService.BASE_URL}/quote/{ticker.upper()}?apikey={MarketService.API_KEY}"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            data = response.json()
-            if data:
-                return data[0]  # La API devuelve una lista con un elemento
-            return None
-        except requests.exceptions.RequestException as e:
-            print(f"Error al obtener la cotización para {ticker}: {e}")
+            data = MarketService._client.get_json(f"quote/{','.join(symbols)}",
+                                                  params={'apikey': MarketService.API_KEY})
+        except UpstreamError as e:
+            print(f"Error al obtener la cotización para {','.join(symbols)}: {e}")
+            return MarketService.UNAVAILABLE
+        return {item['symbol'].upper(): item for item in data or [] if item.get('symbol')}
+
+    @staticmethod
+    def get_price_history(ticker: str, start=None, end=None, points: int = 500, method: str = 'ohlc'):
+        """
+        Devuelve el histórico diario de un ticker entre `start` y `end` (segundos UTC),
+        reducido a `points` puntos como mucho con el método indicado ('ohlc' agrupa en
+        velas, 'lttb' selecciona barras para gráficos de línea).
+
+        Las barras salen del almacén local; antes de leer, si hace más de
+        `HISTORY_SYNC_INTERVAL` segundos que no se sincroniza el ticker, se piden a FMP
+        solo las barras posteriores a la última guardada. Devuelve un diccionario de
+        columnas {'t', 'o', 'h', 'l', 'c', 'v'} (listas) o None si no hay datos.
+        """
+        symbol = ticker.upper()
+        MarketService._sync_history(symbol)
+        columns = MarketService._history.read(symbol, start, end)
+        total = len(columns['t'])
+        if not total:
             return None
+        sampled = MarketService.HISTORY_DOWNSAMPLERS[method](columns, points)
+        result = {name: column.tolist() for name, column in sampled.items()}
+        result['total'] = total
+        return result
 
     @staticmethod
-    def search_assets(query: str):
+    def get_daily_closes(ticker: str, start=None, end=None):
+        """
+        Cierres diarios de un ticker entre `start` y `end` (segundos UTC), sin reducir,
+        como arrays de NumPy (instantes, cierres). Sincroniza el histórico igual que
+        `get_price_history`.
+        """
+        symbol = ticker.upper()
+        MarketService._sync_history(symbol)
+        columns = MarketService._history.read(symbol, start, end)
+        return columns['t'], columns['c']
+
+    @staticmethod
+    def invalidate_quote(ticker: str):
+        """
+        Descarta la cotización en caché de un ticker (p. ej. tras un split, cuyo precio
+        anterior no debe volver a servirse ni como último valor conocido). Solo llega a
+        los demás procesos si la caché es compartida (QUOTE_CACHE_BACKEND 'sqlite' o
+        'redis'); con 'memory' cada worker web conserva la suya hasta reiniciarse.
+        """
+        MarketService._cache.invalidate(ticker.upper())
+
+    @staticmethod
+    def reset_history(ticker: str):
+        """
+        Vacía el histórico guardado de un ticker para que la siguiente lectura lo vuelva
+        a descargar completo (p. ej. tras un split, que el proveedor aplica a las barras
+        pasadas). Los demás procesos lo detectan por el cambio de generación del almacén.
+        """
+        symbol = ticker.upper()
+        MarketService._history.truncate(symbol)
+        MarketService._history_synced.pop(symbol, None)
+
+    @staticmethod
+    def _sync_history(symbol):
+        """
+        Añade al almacén las barras nuevas de un ticker. Solo un hilo por ticker
+        sincroniza a la vez; los demás esperan a que termine (o leen lo que haya).
+        Se vuelve a sincronizar antes de `HISTORY_SYNC_INTERVAL` si otro proceso ha
+        reescrito la serie (ver `reset_history`).
+        """
+        now = time.monotonic()
+        synced_at, generation = MarketService._history_synced.get(symbol, (float('-inf'), None))
+        if (now - synced_at < MarketService.HISTORY_SYNC_INTERVAL
+                and generation == MarketService._history.generation(symbol)):
+            return
+        owned, waiting = MarketService._history_flight.claim([symbol])
+        if waiting:
+            waiting[symbol].wait(MarketService.SINGLEFLIGHT_TIMEOUT)
+            return
+
+        added = 0
+        try:
+            last = MarketService._history.last_timestamp(symbol)
+            if last is not None:
+                since = datetime.fromtimestamp(last, tz=timezone.utc).date()
+            else:
+                since = date.today() - timedelta(days=MarketService.HISTORY_BACKFILL_DAYS)
+            bars = MarketService._fetch_history(symbol, since)
+            if bars is not MarketService.UNAVAILABLE:
+                added = MarketService._history.append(symbol, bars)
+                generation = MarketService._history.generation(symbol)
+                with MarketService._history_lock:
+                    synced = MarketService._history_synced
+                    synced[symbol] = (now, generation)
+                    synced.move_to_end(symbol)
+                    while len(synced) > MarketService.HISTORY_SYNCED_MAX_ENTRIES:
+                        synced.popitem(last=False)
+        finally:
+            MarketService._history_flight.complete({symbol: added})
+
+    @staticmethod
+    def _fetch_history(symbol: str, since):
+        """
+        Llamada directa al endpoint de históricos diarios de FMP desde la fecha `since`
+        (incluida, para actualizar la barra del día en curso). Devuelve una lista de
+        barras {t, o, h, l, c, v} o `UNAVAILABLE` si el proveedor no responde.
+        """
+        if not MarketService.API_KEY:
+            print("Aviso: FMP_API_KEY no está configurada. No se descarga el histórico de precios.")
+            return MarketService.UNAVAILABLE
+
+        try:
+            data = MarketService._client.get_json(f"historical-price-full/{symbol}", params={
+                'from': since.isoformat(), 'apikey': MarketService.API_KEY,
+            })
+        except UpstreamError as e:
+            print(f"Error al obtener el histórico de {symbol}: {e}")
+            return MarketService.UNAVAILABLE
+
+        bars = []
+        for item in (data or {}).get('historical', []):
+            try:
+                day = datetime.strptime(item['date'], '%Y-%m-%d').replace(tzinfo=timezone.utc)
+            except (KeyError, ValueError):
+                continue
+            bars.append({'t': int(day.timestamp()), 'o': item.get('open'), 'h': item.get('high'),
+                         'l': item.get('low'), 'c': item.get('close'), 'v': item.get('volume')})
+        return bars
+
+    @staticmethod
+    def search_assets(query: str, exchange: str = None, currency: str = None, limit: int = 10):
         """
         Busca activos (acciones, ETFs, etc.) que coincidan con una consulta.
+        Se responde desde el directorio local de símbolos; solo si todavía no se ha
+        cargado ningún directorio se recurre al endpoint de búsqueda de FMP.
         """
+        MarketService._directory.maybe_reload()
+        if MarketService._directory.loaded:
+            return MarketService._directory.search(query, exchange=exchange, currency=currency, limit=limit)
+
         if not MarketService.API_KEY:
             print("Aviso: FMP_API_KEY no está configurada. Usando datos de prueba para la búsqueda.")
             return [
@@ -44,11 +630,35 @@ class MarketService:
                 {"symbol": "AMZN", "name": "Amazon.com, Inc.", "currency": "USD", "stockExchange": "NASDAQ"},
             ]
 
+        # Las respuestas del proveedor se guardan en la caché de cotizaciones (con una
+        # clave que no puede ser un ticker) para no repetir la llamada en cada tecla
+        key = f"search:{query.lower()}:{(exchange or '').upper()}:{limit}"
+        cached = MarketService._cache.lookup(key)
+        if cached.state == CacheLookup.FRESH:
+            return cached.value
         try:
-            url = f"{MarketService.BASE_URL}/search-ticker?query={query}&limit=10&exchange=NASDAQ,NYSE&apikey={MarketService.API_KEY}"
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
+            results = MarketService._client.get_json("search-ticker", params={
+                'query': query, 'limit': limit, 'exchange': exchange or 'NASDAQ,NYSE',
+                'apikey': MarketService.API_KEY,
+            })
+        except UpstreamError as e:
             print(f"Error al buscar activos con la consulta '{query}': {e}")
-            return []
\ No newline at end of file
+            return MarketService._cache.peek(key) or []
+        MarketService._cache.set(key, results or [], ttl=MarketService.SEARCH_CACHE_TTL)
+        return results or []
+
+    @staticmethod
+    def refresh_symbol_directory():
+        """
+        Descarga el listado completo de símbolos de FMP, lo guarda en el fichero del
+        directorio y lo recarga. Es la única llamada al proveedor relacionada con la
+        búsqueda. Devuelve el número de símbolos cargados.
+        """
+        if not MarketService.API_KEY:
+            raise RuntimeError("FMP_API_KEY no está configurada")
+        data = MarketService._client.get_json("stock/list", params={'apikey': MarketService.API_KEY})
+        exchanges = set(MarketService.SYMBOL_DIRECTORY_EXCHANGES)
+        records = [item for item in data or []
+                   if not exchanges or (item.get('exchangeShortName') or '').upper() in exchanges]
+        MarketService._directory.save(records)
+        return len(MarketService._directory)
@@ -0,0 +1,236 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import case, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import MissionProgress, utcnow
+from app.services.db_utils import insert_for_dialect
+from app.services.events import EventBus, TradeExecuted, PortfolioRevalued
+
+
+class Mission:
+    """
+    Regla de una misión o logro. `measure(evento)` devuelve lo que aporta el evento
+    (None si no cuenta); con `aggregate='sum'` las aportaciones se suman (contadores)
+    y con 'max' se guarda la mejor (umbrales). `period` es 'day', 'week' o None (logro).
+    """
+
+    def __init__(self, key, title, event_type, target, measure, aggregate='sum', period=None):
+        self.key = key
+        self.title = title
+        self.event_type = event_type
+        self.target = target
+        self.measure = measure
+        self.aggregate = aggregate
+        self.period = period
+
+    def period_key(self, moment):
+        if self.period == 'day':
+            return moment.date().isoformat()
+        if self.period == 'week':
+            year, week, _ = moment.isocalendar()
+            return f"{year}-W{week:02d}"
+        return 'all'
+
+
+MISSIONS = [
+    Mission('first_trade', "Haz tu primera operación", TradeExecuted, 1, lambda event: 1),
+    Mission('daily_3_trades', "Haz 3 operaciones hoy", TradeExecuted, 3, lambda event: 1, period='day'),
+    Mission('weekly_10_trades', "Haz 10 operaciones esta semana", TradeExecuted, 10, lambda event: 1,
+            period='week'),
+    Mission('return_5pct', "Consigue un 5% de rentabilidad", PortfolioRevalued, 0.05,
+            lambda event: event.total_return, aggregate='max'),
+    Mission('return_20pct', "Consigue un 20% de rentabilidad", PortfolioRevalued, 0.20,
+            lambda event: event.total_return, aggregate='max'),
+]
+
+
+class MissionEngine:
+    """
+    Motor de misiones y logros dirigido por eventos (`TradeExecuted`, `PortfolioRevalued`).
+
+    Cada evento solo evalúa las misiones de su tipo y acumula el resultado en memoria
+    por (cartera, misión, periodo): los contadores suman y los umbrales guardan el
+    máximo (y descartan los valores que no mejoran el último visto). Ese progreso
+    pendiente se vuelca a `mission_progress` en lote cuando hay `CHECKPOINT_BATCH`
+    entradas o han pasado `CHECKPOINT_INTERVAL` segundos, con un upsert que suma (o
+    toma el máximo) sobre lo guardado y marca `completed_at` al alcanzar el objetivo;
+    así varios procesos pueden contribuir a la vez sin leerse entre ellos. El volcado
+    va en su propia conexión y transacción: se lanza desde hooks de la petición y desde
+    el bus de eventos, y nunca debe hacer commit de la sesión de quien lo llama.
+    """
+    CHECKPOINT_INTERVAL = 10
+    CHECKPOINT_BATCH = 500
+    BEST_MAX_ENTRIES = 100000
+
+    _missions = {mission.key: mission for mission in MISSIONS}
+    _by_event = {}
+    _pending = {}  # (cartera, misión, periodo) -> suma o máximo sin volcar
+    _best = OrderedDict()  # (cartera, misión, periodo) -> mejor valor visto (misiones 'max')
+    _last_flush = 0.0
+    _lock = threading.Lock()
+    _app = None
+
+    @classmethod
+    def init_app(cls, app, missions=None):
+        cls.CHECKPOINT_INTERVAL = app.config['MISSIONS_CHECKPOINT_INTERVAL']
+        cls.CHECKPOINT_BATCH = app.config['MISSIONS_CHECKPOINT_BATCH']
+        cls._missions = {mission.key: mission for mission in (missions or MISSIONS)}
+        cls._by_event = {}
+        for mission in cls._missions.values():
+            cls._by_event.setdefault(mission.event_type, []).append(mission)
+        with cls._lock:
+            cls._pending = {}
+            cls._best.clear()
+            cls._last_flush = time.monotonic()
+        for event_type in (TradeExecuted, PortfolioRevalued):
+            EventBus.subscribe(event_type, cls.handle)
+        app.after_request(cls._after_request)
+        if cls._app is None:
+            atexit.register(cls._flush_at_exit)
+        cls._app = app
+
+    @classmethod
+    def missions(cls):
+        return list(cls._missions.values())
+
+    @classmethod
+    def handle(cls, event):
+        """Suscriptor del bus: acumula la aportación del evento a sus misiones."""
+        for mission in cls._by_event.get(type(event), ()):
+            value = mission.measure(event)
+            if value is None:
+                continue
+            key = (event.portfolio_id, mission.key, mission.period_key(event.occurred_at))
+            with cls._lock:
+                if mission.aggregate == 'sum':
+                    cls._pending[key] = cls._pending.get(key, 0) + value
+                else:
+                    if value <= cls._best.get(key, float('-inf')):
+                        continue
+                    cls._best[key] = value
+                    cls._best.move_to_end(key)
+                    while len(cls._best) > cls.BEST_MAX_ENTRIES:
+                        cls._best.popitem(last=False)
+                    cls._pending[key] = value
+        cls.flush_if_due()
+
+    @classmethod
+    def flush_if_due(cls):
+        if cls._pending and (len(cls._pending) >= cls.CHECKPOINT_BATCH
+                             or time.monotonic() - cls._last_flush >= cls.CHECKPOINT_INTERVAL):
+            cls.flush()
+
+    @classmethod
+    def flush(cls):
+        """Vuelca lo pendiente en una transacción aparte (sin tocar `db.session`). Devuelve las filas escritas."""
+        with cls._lock:
+            pending, cls._pending = cls._pending, {}
+            cls._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        now = utcnow()
+        rows = {'sum': [], 'max': []}
+        for (portfolio_id, key, period), value in pending.items():
+            mission = cls._missions.get(key)
+            if mission is None:
+                continue
+            rows[mission.aggregate].append({
+                'portfolio_id': portfolio_id, 'mission_key': key, 'period': period, 'progress': value,
+                'completed_at': now if value >= mission.target else None, 'updated_at': now,
+            })
+        try:
+            with db.engine.begin() as connection:
+                for aggregate, batch in rows.items():
+                    if batch:
+                        cls._upsert(connection, batch, aggregate)
+        except SQLAlchemyError as e:
+            print(f"Error al guardar el progreso de las misiones: {e}")
+            # Se devuelve lo pendiente para el siguiente intento, sin perder lo acumulado entretanto
+            with cls._lock:
+                for key, value in pending.items():
+                    mission = cls._missions[key[1]]
+                    current = cls._pending.get(key)
+                    if current is None:
+                        cls._pending[key] = value
+                    elif mission.aggregate == 'sum':
+                        cls._pending[key] = current + value
+                    else:
+                        cls._pending[key] = max(current, value)
+            return 0
+        return len(pending)
+
+    @classmethod
+    def _upsert(cls, connection, batch, aggregate):
+        table = MissionProgress.__table__
+        targets = case({key: mission.target for key, mission in cls._missions.items()},
+                       value=table.c.mission_key)
+        insert_ = insert_for_dialect()
+        if insert_ is None:
+            for row in batch:
+                merged = cls._merge(table.c.progress, row['progress'], aggregate)
+                updated = connection.execute(
+                    update(table)
+                    .where(table.c.portfolio_id == row['portfolio_id'], table.c.mission_key == row['mission_key'],
+                           table.c.period == row['period'])
+                    .values(progress=merged, updated_at=row['updated_at'],
+                            completed_at=func.coalesce(table.c.completed_at,
+                                                       case((merged >= targets, row['updated_at']))))
+                )
+                if updated.rowcount == 0:
+                    connection.execute(table.insert().values(row))
+            return
+        statement = insert_(table)
+        merged = cls._merge(table.c.progress, statement.excluded.progress, aggregate)
+        connection.execute(
+            statement.on_conflict_do_update(
+                index_elements=['portfolio_id', 'mission_key', 'period'],
+                set_={'progress': merged, 'updated_at': statement.excluded.updated_at,
+                      'completed_at': func.coalesce(table.c.completed_at,
+                                                    case((merged >= targets, statement.excluded.updated_at)))},
+            ),
+            batch,
+        )
+
+    @staticmethod
+    def _merge(stored, value, aggregate):
+        if aggregate == 'sum':
+            return stored + value
+        return case((value > stored, value), else_=stored)
+
+    @classmethod
+    def progress(cls, portfolio_id, moment=None):
+        """Estado de cada misión para la cartera en sus periodos actuales (vuelca antes lo pendiente)."""
+        cls.flush()
+        moment = moment or utcnow()
+        periods = {mission.key: mission.period_key(moment) for mission in cls._missions.values()}
+        stored = {row.mission_key: row for row in db.session.execute(
+            select(MissionProgress).where(MissionProgress.portfolio_id == portfolio_id,
+                                          MissionProgress.period.in_(set(periods.values())))
+        ).scalars() if periods.get(row.mission_key) == row.period}
+        result = []
+        for mission in cls._missions.values():
+            row = stored.get(mission.key)
+            result.append({
+                'key': mission.key,
+                'title': mission.title,
+                'period': mission.period,
+                'target': mission.target,
+                'progress': float(row.progress) if row else 0.0,
+                'completed': bool(row and row.completed_at),
+                'completed_at': row.completed_at.isoformat() if row and row.completed_at else None,
+            })
+        return result
+
+    @classmethod
+    def _after_request(cls, response):
+        cls.flush_if_due()
+        return response
+
+    @classmethod
+    def _flush_at_exit(cls):
+        if cls._pending and cls._app is not None:
+            with cls._app.app_context():
+                cls.flush()
@@ -0,0 +1,257 @@
+import bisect
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from sqlalchemy import select, update
+from app import db
+from app.models import Order, OrderStatus, OrderType, TransactionType, utcnow
+from app.services.trade_service import TradeService, TradeError
+
+
+class TriggerIndex:
+    """
+    Índice en memoria de las órdenes en espera, por ticker y ordenado por precio de
+    disparo. Cada ticker tiene dos listas ordenadas de (precio, id):
+
+    - FALLING: se disparan cuando el precio baja hasta el disparador o por debajo
+      (compra limitada, venta stop). Con un precio p se disparan las de disparador >= p.
+    - RISING: se disparan cuando el precio sube hasta el disparador o por encima
+      (venta limitada, compra stop). Se disparan las de disparador <= p.
+
+    Así, ante un precio nuevo, las órdenes disparadas son un rango contiguo que se
+    localiza con una búsqueda binaria, sin recorrer todas las órdenes abiertas.
+    """
+    FALLING = 'falling'
+    RISING = 'rising'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._books = {}    # ticker -> {FALLING: [(precio, id)], RISING: [(precio, id)]}
+        self._entries = {}  # id -> (ticker, dirección, precio)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, order_id):
+        return order_id in self._entries
+
+    def add(self, order_id, ticker, direction, trigger):
+        with self._lock:
+            self._remove(order_id)
+            book = self._books.setdefault(ticker, {self.FALLING: [], self.RISING: []})
+            bisect.insort(book[direction], (trigger, order_id))
+            self._entries[order_id] = (ticker, direction, trigger)
+
+    def remove(self, order_id):
+        with self._lock:
+            self._remove(order_id)
+
+    def clear(self):
+        with self._lock:
+            self._books.clear()
+            self._entries.clear()
+
+    def pop_triggered(self, ticker, price):
+        """Saca del índice y devuelve los ids de las órdenes del ticker que dispara `price`."""
+        return [order_id for order_id, _, _, _ in self.take_triggered(ticker, price)]
+
+    def take_triggered(self, ticker, price):
+        """Como `pop_triggered`, pero devuelve las entradas (id, ticker, dirección, precio) para poder reponerlas."""
+        with self._lock:
+            book = self._books.get(ticker)
+            if not book:
+                return []
+            falling = book[self.FALLING]
+            start = bisect.bisect_left(falling, (price,))
+            fired = falling[start:]
+            del falling[start:]
+
+            rising = book[self.RISING]
+            # (precio, inf) queda detrás de todas las entradas con ese mismo precio
+            end = bisect.bisect_right(rising, (price, float('inf')))
+            fired += rising[:end]
+            del rising[:end]
+
+            entries = [(order_id,) + self._entries.pop(order_id) for _, order_id in fired]
+            if not falling and not rising:
+                del self._books[ticker]
+            return entries
+
+    def _remove(self, order_id):
+        entry = self._entries.pop(order_id, None)
+        if entry is None:
+            return
+        ticker, direction, trigger = entry
+        entries = self._books[ticker][direction]
+        position = bisect.bisect_left(entries, (trigger, order_id))
+        if position < len(entries) and entries[position] == (trigger, order_id):
+            del entries[position]
+
+
+class OrderEngine:
+    """
+    Motor de órdenes límite, stop y stop-limit.
+
+    Las órdenes se guardan en la tabla `orders` y se indexan en memoria por ticker y
+    precio de disparo (`TriggerIndex`). El motor vive en el proceso de ingesta de
+    precios: con cada tick localiza las órdenes disparadas, las agrupa por cartera y
+    las ejecuta en lotes con `TradeService.execute_orders`, que cierra cada orden en
+    la misma transacción que la operación. Al arrancar (primer `sync`) el índice se
+    reconstruye desde la base de datos; después solo se añaden las órdenes nuevas.
+    """
+    OPEN_STATUSES = (OrderStatus.PENDING, OrderStatus.TRIGGERED)
+    # Margen (s) con el que cada `sync` vuelve a leer las órdenes creadas antes de la anterior
+    SYNC_OVERLAP = 300
+
+    _index = TriggerIndex()
+    _last_sync_at = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def place(portfolio_id, ticker, side, order_type, quantity, limit_price=None, stop_price=None):
+        """Crea una orden en espera. No hace commit; el índice la recoge en el siguiente `sync`."""
+        order = Order(portfolio_id=portfolio_id, ticker_symbol=ticker.upper(), side=side,
+                      order_type=order_type, quantity=Decimal(quantity),
+                      limit_price=limit_price, stop_price=stop_price, status=OrderStatus.PENDING)
+        db.session.add(order)
+        return order
+
+    @staticmethod
+    def cancel(portfolio_id, order_id):
+        """Cancela una orden abierta de la cartera. Devuelve False si no existe o ya está cerrada."""
+        orders = Order.__table__
+        result = db.session.execute(
+            update(orders)
+            .where(orders.c.id == order_id, orders.c.portfolio_id == portfolio_id,
+                   orders.c.status.in_(OrderEngine.OPEN_STATUSES))
+            .values(status=OrderStatus.CANCELLED, closed_at=utcnow())
+        )
+        OrderEngine._index.remove(order_id)
+        return result.rowcount == 1
+
+    @staticmethod
+    def sync():
+        """
+        Pone el índice al día: la primera vez lo reconstruye con todas las órdenes
+        abiertas; después añade las creadas desde la sincronización anterior menos
+        `SYNC_OVERLAP` segundos, saltando las que ya están indexadas. Los ids se asignan
+        al insertar pero se confirman en cualquier orden, así que no basta con leer los
+        ids mayores que el último visto. Las canceladas se descartan al disparar (se
+        vuelve a comprobar su estado).
+        """
+        with OrderEngine._lock:
+            started = utcnow()
+            query = select(Order).where(Order.status.in_(OrderEngine.OPEN_STATUSES)).order_by(Order.id)
+            if OrderEngine._last_sync_at is None:
+                OrderEngine._index.clear()
+            else:
+                query = query.where(
+                    Order.created_at >= OrderEngine._last_sync_at - timedelta(seconds=OrderEngine.SYNC_OVERLAP))
+            added = 0
+            for order in db.session.execute(query).scalars():
+                if order.id in OrderEngine._index:
+                    continue
+                OrderEngine._index_order(order)
+                added += 1
+            OrderEngine._last_sync_at = started
+            return added
+
+    @staticmethod
+    def reset():
+        """Olvida el índice; el siguiente `sync` lo reconstruye desde la base de datos."""
+        with OrderEngine._lock:
+            OrderEngine._index.clear()
+            OrderEngine._last_sync_at = None
+
+    @staticmethod
+    def on_prices(quotes):
+        """
+        Procesa un tick de precios {símbolo: cotización}: ejecuta las órdenes disparadas
+        y devuelve el número de órdenes ejecutadas. Si la ejecución falla, las órdenes
+        disparadas vuelven al índice (siguen abiertas en la base de datos) y se propaga
+        el error.
+        """
+        prices = {symbol: Decimal(str(quote['price'])) for symbol, quote in quotes.items()
+                  if quote and quote.get('price') is not None}
+        fired = []
+        for symbol, price in prices.items():
+            fired.extend(OrderEngine._index.take_triggered(symbol, price))
+        if not fired:
+            return 0
+        try:
+            return OrderEngine._execute_fired([order_id for order_id, _, _, _ in fired], prices)
+        except Exception:
+            db.session.rollback()
+            # Las que ya se cerraron se descartan al volver a disparar; las stop-limit
+            # reindexadas como limitadas ya están en el índice y no se tocan
+            for order_id, ticker, direction, trigger in fired:
+                if order_id not in OrderEngine._index:
+                    OrderEngine._index.add(order_id, ticker, direction, trigger)
+            raise
+
+    @staticmethod
+    def _execute_fired(fired, prices):
+        orders = db.session.execute(
+            select(Order).where(Order.id.in_(fired), Order.status.in_(OrderEngine.OPEN_STATUSES))
+        ).scalars().all()
+
+        by_portfolio = {}
+        for order in orders:
+            price = prices[order.ticker_symbol]
+            if order.order_type == OrderType.STOP_LIMIT and order.status == OrderStatus.PENDING:
+                # Se ha alcanzado el stop: pasa a ser una orden limitada
+                order.status = OrderStatus.TRIGGERED
+                if not OrderEngine._limit_reached(order, price):
+                    OrderEngine._index_order(order)
+                    continue
+            by_portfolio.setdefault(order.portfolio_id, []).append({
+                'order_id': order.id, 'ticker': order.ticker_symbol, 'quantity': order.quantity,
+                'side': 'buy' if order.side == TransactionType.BUY else 'sell', 'price': price,
+            })
+        db.session.commit()
+
+        executed = 0
+        for portfolio_id, batch in by_portfolio.items():
+            executed += OrderEngine._execute_batch(portfolio_id, batch)
+        return executed
+
+    @staticmethod
+    def _execute_batch(portfolio_id, batch):
+        try:
+            results = TradeService.execute_orders(portfolio_id, batch)
+            return sum(1 for accepted, _ in results if accepted)
+        except TradeError as e:
+            if len(batch) == 1:
+                OrderEngine._reject(batch[0]['order_id'], str(e))
+                return 0
+        # El lote completo no cabe en el saldo: se ejecutan las órdenes una a una
+        return sum(OrderEngine._execute_batch(portfolio_id, [order]) for order in batch)
+
+    @staticmethod
+    def _reject(order_id, reason):
+        orders = Order.__table__
+        db.session.execute(
+            update(orders)
+            .where(orders.c.id == order_id, orders.c.status.in_(OrderEngine.OPEN_STATUSES))
+            .values(status=OrderStatus.REJECTED, reject_reason=reason, closed_at=utcnow())
+        )
+        db.session.commit()
+
+    @staticmethod
+    def _index_order(order):
+        ticker = order.ticker_symbol
+        buy = order.side == TransactionType.BUY
+        use_limit = order.order_type == OrderType.LIMIT or order.status == OrderStatus.TRIGGERED
+        if use_limit:
+            direction = TriggerIndex.FALLING if buy else TriggerIndex.RISING
+            trigger = order.limit_price
+        else:
+            direction = TriggerIndex.RISING if buy else TriggerIndex.FALLING
+            trigger = order.stop_price
+        OrderEngine._index.add(order.id, ticker, direction, Decimal(trigger))
+
+    @staticmethod
+    def _limit_reached(order, price):
+        if order.side == TransactionType.BUY:
+            return price <= order.limit_price
+        return price >= order.limit_price
@@ -0,0 +1,135 @@
+import threading
+from itertools import repeat
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+import bcrypt
+from werkzeug.security import check_password_hash
+
+
+class HasherBusyError(RuntimeError):
+    """No hay hueco para calcular un hash: demasiadas peticiones esperando."""
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _verify(stored_hash, password):
+    if stored_hash.startswith('$2'):
+        return bcrypt.checkpw(password.encode('utf-8'), stored_hash.encode('utf-8'))
+    # Hashes antiguos de werkzeug (pbkdf2/scrypt): se aceptan y se migran a bcrypt al iniciar sesión
+    return check_password_hash(stored_hash, password)
+
+
+class PasswordHasher:
+    """
+    Hash y verificación de contraseñas con bcrypt fuera del hilo de la petición.
+
+    Cada hash son cientos de milisegundos de CPU: se calculan en un pool de
+    `PASSWORD_HASH_WORKERS` procesos (0 = en el propio hilo, para los tests) y, como
+    mucho, `PASSWORD_HASH_MAX_PENDING` peticiones más esperan su turno; el resto recibe
+    `HasherBusyError` (un 503) en lugar de acaparar los workers de la aplicación. El
+    coste se configura con `BCRYPT_LOG_ROUNDS` y los hashes con otro coste (o con el
+    formato antiguo de werkzeug) se rehacen al iniciar sesión (`needs_rehash`).
+    """
+    ROUNDS = 12
+    # bcrypt solo admite contraseñas de hasta 72 bytes
+    MAX_BYTES = 72
+    WORKERS = 2
+    MAX_PENDING = 16
+    TIMEOUT = 10.0
+
+    _executor = None
+    _slots = threading.BoundedSemaphore(WORKERS + MAX_PENDING)
+    _lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        cls.shutdown()
+        cls.ROUNDS = app.config['BCRYPT_LOG_ROUNDS']
+        cls.WORKERS = app.config['PASSWORD_HASH_WORKERS']
+        cls.MAX_PENDING = app.config['PASSWORD_HASH_MAX_PENDING']
+        cls.TIMEOUT = app.config['PASSWORD_HASH_TIMEOUT']
+        cls._slots = threading.BoundedSemaphore(max(cls.WORKERS, 1) + cls.MAX_PENDING)
+
+    @classmethod
+    def too_long(cls, password):
+        """bcrypt (5.0 en adelante) rechaza con ValueError las contraseñas de más de `MAX_BYTES` bytes."""
+        return len(password.encode('utf-8')) > cls.MAX_BYTES
+
+    @classmethod
+    def hash(cls, password):
+        return cls._run(_hash, password, cls.ROUNDS)
+
+    @classmethod
+    def hash_many(cls, passwords, executor=None):
+        """
+        Hashea un lote de contraseñas repartiéndolas entre los procesos de `executor`
+        (sin él, en el hilo que llama). Pensado para altas masivas: nunca usa el pool
+        del login, así que no deja a los inicios de sesión esperando detrás del lote.
+        """
+        if executor is None:
+            return [_hash(password, cls.ROUNDS) for password in passwords]
+        workers = getattr(executor, '_max_workers', 1)
+        chunksize = max(1, len(passwords) // (workers * 4))
+        return list(executor.map(_hash, passwords, repeat(cls.ROUNDS), chunksize=chunksize))
+
+    @classmethod
+    def verify(cls, stored_hash, password):
+        return cls._run(_verify, stored_hash, password)
+
+    @classmethod
+    def needs_rehash(cls, stored_hash):
+        """Indica si el hash no es de bcrypt o tiene un coste distinto del configurado."""
+        if not stored_hash.startswith('$2'):
+            return True
+        try:
+            return int(stored_hash.split('$')[2]) != cls.ROUNDS
+        except (IndexError, ValueError):
+            return True
+
+    @classmethod
+    def shutdown(cls):
+        with cls._lock:
+            executor, cls._executor = cls._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @classmethod
+    def _run(cls, function, *args):
+        slots = cls._slots
+        if not slots.acquire(blocking=False):
+            raise HasherBusyError("Demasiadas peticiones de autenticación en curso")
+        try:
+            executor = cls._get_executor()
+            if executor is None:
+                return function(*args)
+            future = executor.submit(function, *args)
+        except BaseException as e:
+            slots.release()
+            if isinstance(e, BrokenProcessPool):
+                cls.shutdown()
+                raise HasherBusyError("El pool de hash de contraseñas no está disponible") from e
+            raise
+        # El hueco se libera cuando el trabajo termina (o se cancela), no cuando la
+        # petición deja de esperar: así la cola del pool nunca pasa del límite
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=cls.TIMEOUT)
+        except FutureTimeoutError as e:
+            future.cancel()
+            raise HasherBusyError("El cálculo del hash ha superado el tiempo de espera") from e
+        except BrokenProcessPool as e:
+            # Un proceso del pool ha muerto: se recrea en la siguiente petición
+            cls.shutdown()
+            raise HasherBusyError("El pool de hash de contraseñas no está disponible") from e
+
+    @classmethod
+    def _get_executor(cls):
+        # El pool se crea al primer uso, ya en el proceso worker (no antes del fork)
+        if cls.WORKERS <= 0:
+            return None
+        with cls._lock:
+            if cls._executor is None:
+                cls._executor = ProcessPoolExecutor(max_workers=cls.WORKERS)
+            return cls._executor
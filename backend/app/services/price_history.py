@@ -0,0 +1,254 @@
+import os
+import re
+import threading
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo se coordinan los hilos del proceso
+    fcntl = None
+
+
+class PriceHistoryStore:
+    """
+    Histórico de precios OHLCV guardado en columnas binarias, una carpeta por ticker:
+
+        <root>/AAPL/t.bin  (int64, segundos UTC)
+        <root>/AAPL/o.bin, h.bin, l.bin, c.bin, v.bin  (float64)
+
+    Las barras están ordenadas por tiempo y solo se añaden al final, así que leer un
+    rango es una búsqueda binaria sobre `t` y un corte de cada columna. Las lecturas
+    usan `np.memmap`: los datos salen de la caché de páginas del sistema operativo,
+    compartida por todos los workers, sin copiarlos ni parsearlos.
+
+    Cuando el proveedor ajusta barras pasadas (un split, una corrección), `replace`
+    reescribe la serie completa y `truncate` la vacía para volver a descargarla. Las
+    columnas nuevas se escriben aparte y sustituyen a las anteriores con un rename:
+    las lecturas en curso siguen sobre los ficheros antiguos, que nunca se recortan.
+    """
+    COLUMNS = (('t', np.int64), ('o', np.float64), ('h', np.float64),
+               ('l', np.float64), ('c', np.float64), ('v', np.float64))
+    SYMBOL_PATTERN = re.compile(r'^[A-Z0-9.\-^=]{1,15}$')
+
+    def __init__(self, root):
+        self.root = root
+        self._locks = {}
+        self._locks_guard = threading.Lock()
+
+    def read(self, ticker, start=None, end=None):
+        """
+        Devuelve un diccionario de columnas {'t', 'o', 'h', 'l', 'c', 'v'} con las barras
+        cuyo instante está en [start, end]. Las columnas son vistas de solo lectura
+        sobre el fichero mapeado.
+        """
+        directory = self._directory(ticker)
+        length = self._length(directory)
+        if not length:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in self.COLUMNS}
+
+        columns = {name: np.memmap(self._path(directory, name), dtype=dtype, mode='r', shape=(length,))
+                   for name, dtype in self.COLUMNS}
+        times = columns['t']
+        lo = 0 if start is None else int(np.searchsorted(times, start, side='left'))
+        hi = length if end is None else int(np.searchsorted(times, end, side='right'))
+        return {name: column[lo:hi] for name, column in columns.items()}
+
+    def last_timestamp(self, ticker):
+        """Instante de la última barra guardada, o None si no hay histórico."""
+        directory = self._directory(ticker)
+        length = self._length(directory)
+        if not length:
+            return None
+        itemsize = np.dtype(np.int64).itemsize
+        with open(self._path(directory, 't'), 'rb') as f:
+            f.seek((length - 1) * itemsize)
+            return int(np.frombuffer(f.read(itemsize), dtype=np.int64)[0])
+
+    def append(self, ticker, bars):
+        """
+        Añade barras nuevas (diccionarios con t, o, h, l, c, v) al final del histórico.
+        Se ignoran las anteriores a la última guardada y, si llega de nuevo la última
+        (la barra del día en curso), se sobrescribe. Devuelve el número de barras añadidas.
+        """
+        if not bars:
+            return 0
+        directory = self._directory(ticker)
+        os.makedirs(directory, exist_ok=True)
+
+        with self._lock(ticker), self._file_lock(directory):
+            length = self._repair(directory)
+            last = self.last_timestamp(ticker) if length else None
+
+            incoming = {int(bar['t']): bar for bar in bars}
+            if last is not None and last in incoming:
+                self._overwrite_last(directory, length, incoming[last])
+            rows = sorted((t, bar) for t, bar in incoming.items() if last is None or t > last)
+            if not rows:
+                return 0
+
+            for name, dtype in self.COLUMNS:
+                values = np.fromiter((t if name == 't' else float(bar.get(name) or 0) for t, bar in rows),
+                                     dtype=dtype, count=len(rows))
+                with open(self._path(directory, name), 'ab') as f:
+                    f.write(values.tobytes())
+            return len(rows)
+
+    def replace(self, ticker, bars):
+        """
+        Sustituye todo el histórico de un ticker por `bars` (diccionarios con t, o, h, l,
+        c, v). Devuelve el número de barras guardadas.
+        """
+        directory = self._directory(ticker)
+        os.makedirs(directory, exist_ok=True)
+        rows = sorted({int(bar['t']): bar for bar in bars}.items())
+
+        with self._lock(ticker), self._file_lock(directory):
+            for name, dtype in self.COLUMNS:
+                values = np.fromiter((t if name == 't' else float(bar.get(name) or 0) for t, bar in rows),
+                                     dtype=dtype, count=len(rows))
+                with open(self._path(directory, name) + '.tmp', 'wb') as f:
+                    f.write(values.tobytes())
+            for name, _ in self.COLUMNS:
+                path = self._path(directory, name)
+                os.replace(path + '.tmp', path)
+            return len(rows)
+
+    def truncate(self, ticker):
+        """Vacía el histórico de un ticker; la siguiente sincronización lo descarga de nuevo."""
+        self.replace(ticker, [])
+
+    def generation(self, ticker):
+        """
+        Identifica la versión de la serie guardada: cambia con `replace` y `truncate`
+        (en cualquier proceso), no al añadir barras. None si no hay histórico.
+        """
+        try:
+            return os.stat(self._path(self._directory(ticker), 't')).st_ino
+        except FileNotFoundError:
+            return None
+
+    def count(self, ticker):
+        return self._length(self._directory(ticker))
+
+    # --- Métodos internos ---
+
+    def _directory(self, ticker):
+        symbol = (ticker or '').upper()
+        if not self.SYMBOL_PATTERN.match(symbol):
+            raise ValueError(f"Ticker no válido: {ticker!r}")
+        return os.path.join(self.root, symbol)
+
+    @staticmethod
+    def _path(directory, name):
+        return os.path.join(directory, f"{name}.bin")
+
+    def _length(self, directory):
+        # Si una escritura se interrumpió a medias, las columnas pueden tener longitudes
+        # distintas: solo cuentan las barras completas.
+        lengths = []
+        for name, dtype in self.COLUMNS:
+            path = self._path(directory, name)
+            if not os.path.exists(path):
+                return 0
+            lengths.append(os.path.getsize(path) // np.dtype(dtype).itemsize)
+        return min(lengths)
+
+    def _repair(self, directory):
+        """Recorta las columnas a la última barra completa antes de escribir."""
+        length = self._length(directory)
+        for name, dtype in self.COLUMNS:
+            path = self._path(directory, name)
+            size = length * np.dtype(dtype).itemsize
+            if os.path.exists(path) and os.path.getsize(path) != size:
+                os.truncate(path, size)
+        return length
+
+    def _overwrite_last(self, directory, length, bar):
+        for name, dtype in self.COLUMNS[1:]:
+            with open(self._path(directory, name), 'r+b') as f:
+                f.seek((length - 1) * np.dtype(dtype).itemsize)
+                f.write(np.array([float(bar.get(name) or 0)], dtype=dtype).tobytes())
+
+    def _lock(self, ticker):
+        with self._locks_guard:
+            return self._locks.setdefault(ticker.upper(), threading.Lock())
+
+    def _file_lock(self, directory):
+        return _FileLock(os.path.join(directory, '.lock'))
+
+
+class _FileLock:
+    """Candado entre procesos sobre un fichero (flock); no hace nada donde no existe."""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            self._file = open(self.path, 'a')
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+def downsample_ohlc(columns, points):
+    """
+    Agrupa las barras en `points` cubos consecutivos y resume cada cubo como una vela:
+    apertura de la primera barra, máximo, mínimo, cierre de la última y volumen total.
+    Conserva los extremos de cada intervalo, que es lo que se ve en un gráfico de velas.
+    """
+    length = len(columns['t'])
+    if points <= 0 or length <= points:
+        return {name: np.asarray(column) for name, column in columns.items()}
+
+    starts = np.linspace(0, length, points, endpoint=False).astype(np.int64)
+    ends = np.append(starts[1:], length) - 1
+    return {
+        't': np.asarray(columns['t'])[starts],
+        'o': np.asarray(columns['o'])[starts],
+        'h': np.maximum.reduceat(columns['h'], starts),
+        'l': np.minimum.reduceat(columns['l'], starts),
+        'c': np.asarray(columns['c'])[ends],
+        'v': np.add.reduceat(columns['v'], starts),
+    }
+
+
+def downsample_lttb(columns, points):
+    """
+    Largest-Triangle-Three-Buckets sobre el cierre: elige en cada cubo la barra que
+    forma el triángulo de mayor área con la elegida antes y la media del cubo
+    siguiente. Mantiene la forma visual de la serie con `points` puntos para
+    gráficos de línea. Devuelve las barras elegidas completas.
+    """
+    length = len(columns['t'])
+    if points < 3 or length <= points:
+        return {name: np.asarray(column) for name, column in columns.items()}
+
+    x = np.asarray(columns['t'], dtype=np.float64)
+    y = np.asarray(columns['c'], dtype=np.float64)
+    # Los extremos siempre se conservan; el resto se reparte en points - 2 cubos
+    edges = np.linspace(1, length - 1, points - 1).astype(np.int64)
+    selected = np.empty(points, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = length - 1
+
+    previous = 0
+    for i in range(points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_x = x[edges[i + 1]:edges[i + 2]].mean()
+            next_y = y[edges[i + 1]:edges[i + 2]].mean()
+        else:
+            next_x, next_y = x[-1], y[-1]
+        areas = np.abs((x[previous] - next_x) * (y[lo:hi] - y[previous]) -
+                       (x[previous] - x[lo:hi]) * (next_y - y[previous]))
+        previous = lo + int(np.argmax(areas))
+        selected[i + 1] = previous
+
+    return {name: np.asarray(column)[selected] for name, column in columns.items()}
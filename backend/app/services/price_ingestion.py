@@ -0,0 +1,87 @@
+import threading
+import time
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.services.events import EventBus, PortfolioRevalued
+from app.services.market_service import MarketService
+from app.services.order_engine import OrderEngine
+from app.services.price_store import PriceStore
+from app.services.valuation_service import ValuationService
+
+
+class PriceIngestionWorker:
+    """
+    Trabajo en segundo plano que mantiene actualizada la tabla `price_snapshots`.
+
+    En cada ciclo calcula el universo de tickers vivos (posiciones abiertas más los
+    pedidos recientemente), los consulta en bloque al proveedor y hace un upsert de
+    todos los snapshots en una sola sentencia; con los mismos precios revaloriza las
+    carteras que tienen esos tickers (publicando `PortfolioRevalued` para las misiones)
+    y dispara las órdenes límite/stop en espera (este proceso es el único consumidor
+    del motor de órdenes). Así las peticiones de los usuarios leen los
+    precios de la base de datos o de la caché y no esperan a FMP.
+    """
+
+    def __init__(self, app, interval=None, recent_window=None):
+        self.app = app
+        self.interval = interval or app.config['PRICE_INGESTION_INTERVAL']
+        self.recent_window = recent_window or app.config['PRICE_RECENT_WINDOW']
+        self._stop = threading.Event()
+        self._thread = None
+
+    def universe(self):
+        with self.app.app_context():
+            return PriceStore.universe(self.recent_window)
+
+    def run_once(self):
+        """Ejecuta un ciclo de ingesta. Devuelve el número de snapshots actualizados."""
+        with self.app.app_context():
+            symbols = PriceStore.universe(self.recent_window)
+            if not symbols:
+                return 0
+            quotes = MarketService.refresh_quotes(symbols, allow_stale=False)
+            try:
+                count = PriceStore.upsert_quotes(quotes)
+                ValuationService.apply_prices(quotes)
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print(f"Error al guardar los snapshots de precios: {e}")
+                return 0
+            if EventBus.has_subscribers(PortfolioRevalued):
+                try:
+                    EventBus.publish([PortfolioRevalued(*row) for row in ValuationService.revalued(list(quotes))])
+                except SQLAlchemyError as e:
+                    db.session.rollback()
+                    print(f"Error al publicar las revalorizaciones: {e}")
+            try:
+                OrderEngine.sync()
+                OrderEngine.on_prices(quotes)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print(f"Error al procesar las órdenes en espera: {e}")
+            return count
+
+    def run_forever(self):
+        """Bucle principal: un ciclo cada `interval` segundos, sin acumular retrasos."""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                count = self.run_once()
+                print(f"Ingesta de precios: {count} tickers actualizados")
+            except Exception as e:  # El bucle no debe morir por un ciclo fallido
+                print(f"Error en la ingesta de precios: {e}")
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(0.0, self.interval - elapsed))
+
+    def start(self):
+        """Arranca el bucle en un hilo demonio."""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run_forever, name='price-ingestion', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from decimal import Decimal
+from sqlalchemy import select, update, union
+from app import db
+from app.models import PriceSnapshot, Holding, Order, OrderStatus, utcnow
+from app.services.db_utils import insert_for_dialect
+
+
+class PriceStore:
+    """
+    Acceso a la tabla `price_snapshots`: lecturas en bloque para el camino de las
+    peticiones y escrituras en bloque (upsert) para la ingesta de precios.
+    """
+
+    @staticmethod
+    def get_quotes(symbols, max_age):
+        """
+        Devuelve {símbolo: cotización} para los tickers con un snapshot de menos de
+        `max_age` segundos, con una única consulta.
+        """
+        if not symbols:
+            return {}
+        cutoff = utcnow() - timedelta(seconds=max_age)
+        rows = db.session.execute(
+            select(PriceSnapshot).where(
+                PriceSnapshot.ticker_symbol.in_(symbols),
+                PriceSnapshot.fetched_at >= cutoff,
+            )
+        ).scalars()
+        return {row.ticker_symbol: PriceStore._to_quote(row) for row in rows}
+
+    @staticmethod
+    def upsert_quotes(quotes, requested=False, connection=None):
+        """
+        Inserta o actualiza en bloque los snapshots de las cotizaciones recibidas.
+        Si `requested` es True también se marca el ticker como pedido recientemente.
+        Usa `connection` si se indica (si no, `db.session`). No hace commit.
+        """
+        executor = connection if connection is not None else db.session
+        now = utcnow()
+        rows = []
+        for symbol, quote in quotes.items():
+            if not quote or quote.get('price') is None:
+                continue
+            row = {
+                'ticker_symbol': symbol,
+                'price': Decimal(str(quote['price'])),
+                'name': quote.get('name'),
+                'change_percentage': quote.get('changesPercentage'),
+                'volume': quote.get('volume'),
+                'fetched_at': now,
+                'requested_at': now if requested else None,
+            }
+            rows.append(row)
+        if not rows:
+            return 0
+
+        insert = insert_for_dialect()
+        if insert is None:
+            # Dialecto sin soporte de upsert: se hace fila a fila (UPDATE y, si no existía, INSERT)
+            table = PriceSnapshot.__table__
+            for row in rows:
+                values = {key: value for key, value in row.items()
+                          if key != 'ticker_symbol' and (key != 'requested_at' or requested)}
+                updated = executor.execute(
+                    update(table).where(table.c.ticker_symbol == row['ticker_symbol']).values(values))
+                if updated.rowcount == 0:
+                    executor.execute(table.insert().values(row))
+            return len(rows)
+
+        updated = ['price', 'name', 'change_percentage', 'volume', 'fetched_at']
+        stmt = insert(PriceSnapshot).values(rows)
+        set_ = {column: getattr(stmt.excluded, column) for column in updated}
+        if requested:
+            set_['requested_at'] = stmt.excluded.requested_at
+        stmt = stmt.on_conflict_do_update(index_elements=['ticker_symbol'], set_=set_)
+        executor.execute(stmt)
+        return len(rows)
+
+    @staticmethod
+    def touch(symbols, connection=None):
+        """Marca los tickers como pedidos ahora mismo. Usa `connection` si se indica. No hace commit."""
+        if not symbols:
+            return
+        (connection if connection is not None else db.session).execute(
+            update(PriceSnapshot)
+            .where(PriceSnapshot.ticker_symbol.in_(list(symbols)))
+            .values(requested_at=utcnow())
+        )
+
+    @staticmethod
+    def universe(recent_window):
+        """
+        Universo de tickers vivos: los que tiene algún usuario en cartera, los de las
+        órdenes en espera y los pedidos en los últimos `recent_window` segundos.
+        """
+        cutoff = utcnow() - timedelta(seconds=recent_window)
+        held = select(Holding.ticker_symbol).distinct()
+        ordered = select(Order.ticker_symbol).where(
+            Order.status.in_([OrderStatus.PENDING, OrderStatus.TRIGGERED])).distinct()
+        recent = select(PriceSnapshot.ticker_symbol).where(PriceSnapshot.requested_at >= cutoff)
+        return sorted(symbol.upper() for symbol in db.session.execute(union(held, ordered, recent)).scalars())
+
+    @staticmethod
+    def _to_quote(row):
+        return {
+            'symbol': row.ticker_symbol,
+            'price': float(row.price),
+            'name': row.name,
+            'changesPercentage': row.change_percentage,
+            'volume': row.volume,
+            'snapshotAt': row.fetched_at.isoformat(),
+        }
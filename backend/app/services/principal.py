@@ -0,0 +1,125 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import g, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import select
+from app import db
+from app.models import User, Portfolio
+
+
+class Principal:
+    """
+    Identidad del usuario autenticado en la petición: su id, nombre, la id de su
+    cartera (None si no tiene) y el saldo de caja en el momento de cargarla, que
+    puede tener hasta `PrincipalLoader.CACHE_TTL` segundos.
+    """
+    __slots__ = ('user_id', 'username', 'portfolio_id', 'cash_balance')
+
+    def __init__(self, user_id, username, portfolio_id, cash_balance):
+        self.user_id = user_id
+        self.username = username
+        self.portfolio_id = portfolio_id
+        self.cash_balance = cash_balance
+
+
+class PrincipalLoader:
+    """
+    Resuelve la identidad del JWT a un `Principal` con una sola consulta (usuario y
+    cartera unidos) y la guarda en `g` para el resto de la petición. Entre peticiones
+    se cachea `CACHE_TTL` segundos por usuario (LRU de `CACHE_MAX_ENTRIES`), así que
+    las rutas protegidas no tocan la base de datos para saber quién llama.
+    Las operaciones invalidan la entrada de su cartera (`invalidate_portfolio`); en
+    otros procesos el saldo cacheado caduca con el TTL.
+    """
+    CACHE_TTL = 30
+    CACHE_MAX_ENTRIES = 4096
+
+    _lock = threading.Lock()
+    _cache = OrderedDict()  # user_id -> (caduca en, Principal)
+    _by_portfolio = {}  # portfolio_id -> user_id
+
+    @classmethod
+    def init_app(cls, app):
+        cls.CACHE_TTL = app.config['PRINCIPAL_CACHE_TTL']
+        cls.CACHE_MAX_ENTRIES = app.config['PRINCIPAL_CACHE_MAX_ENTRIES']
+        cls.clear()
+        app.teardown_request(cls._end_request)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            cls._cache.clear()
+            cls._by_portfolio.clear()
+
+    @classmethod
+    def current(cls):
+        """Principal de la petición en curso (requiere un JWT verificado); None si el usuario no existe."""
+        if 'principal' not in g:
+            g.principal = cls.load(int(get_jwt_identity()))
+        return g.principal
+
+    @classmethod
+    def load(cls, user_id):
+        with cls._lock:
+            cached = cls._cache.get(user_id)
+            if cached and cached[0] > time.monotonic():
+                cls._cache.move_to_end(user_id)
+                return cached[1]
+
+        row = db.session.execute(
+            select(User.id, User.username, Portfolio.id, Portfolio.cash_balance)
+            .outerjoin(Portfolio, Portfolio.user_id == User.id)
+            .where(User.id == user_id)
+        ).first()
+        if row is None:
+            # Los usuarios inexistentes no se cachean: así un alta posterior se ve al momento
+            return None
+        principal = Principal(*row)
+
+        with cls._lock:
+            cls._cache[user_id] = (time.monotonic() + cls.CACHE_TTL, principal)
+            cls._cache.move_to_end(user_id)
+            if principal.portfolio_id is not None:
+                cls._by_portfolio[principal.portfolio_id] = user_id
+            while len(cls._cache) > cls.CACHE_MAX_ENTRIES:
+                _, (_, evicted) = cls._cache.popitem(last=False)
+                cls._by_portfolio.pop(evicted.portfolio_id, None)
+        return principal
+
+    @staticmethod
+    def _end_request(exc):
+        # `g` sobrevive a la petición si el contexto de la app ya estaba abierto (tests, CLI)
+        g.pop('principal', None)
+
+    @classmethod
+    def invalidate(cls, user_id):
+        with cls._lock:
+            cached = cls._cache.pop(user_id, None)
+            if cached:
+                cls._by_portfolio.pop(cached[1].portfolio_id, None)
+
+    @classmethod
+    def invalidate_portfolio(cls, portfolio_id):
+        """Descarta el principal del dueño de la cartera (tras una operación que cambia su saldo)."""
+        with cls._lock:
+            user_id = cls._by_portfolio.pop(portfolio_id, None)
+            if user_id is not None:
+                cls._cache.pop(user_id, None)
+
+
+def principal_required(**jwt_options):
+    """
+    Como `jwt_required`, pero además carga el `Principal` de la petición (ver
+    `PrincipalLoader.current`) y responde 401 si el usuario del token ya no existe.
+    """
+    def decorator(view):
+        @wraps(view)
+        @jwt_required(**jwt_options)
+        def wrapper(*args, **kwargs):
+            if PrincipalLoader.current() is None:
+                return jsonify({"msg": "Usuario no encontrado"}), 401
+            return view(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,124 @@
+import threading
+import time
+from contextlib import contextmanager
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Un bloque de código ha ejecutado más consultas SQL de las permitidas."""
+
+
+class QueryCounter:
+    """Número de consultas SQL, tiempo total en base de datos y, opcionalmente, las sentencias."""
+
+    def __init__(self, record=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if record else None
+
+    def add(self, statement, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        if self.statements is not None:
+            self.statements.append(statement)
+
+
+class QueryStats:
+    """
+    Instrumentación de las consultas SQL con los eventos del motor de SQLAlchemy.
+
+    Cada sentencia ejecutada se suma a todos los contadores activos en el hilo: el de
+    la petición en curso (que se devuelve en las cabeceras `X-Query-Count` y
+    `X-Query-Time-Ms` y se registra si supera `QUERY_STATS_WARN_COUNT`) y los que se
+    abran con `track` o `budget`, que los tests usan para fijar el número máximo de
+    consultas de una ruta y detectar patrones N+1.
+    """
+    HEADERS = True
+    WARN_COUNT = 25
+
+    _local = threading.local()
+    _listening = False
+    _listen_lock = threading.Lock()
+
+    @classmethod
+    def init_app(cls, app):
+        headers = app.config['QUERY_STATS_HEADERS']
+        cls.HEADERS = (app.debug or app.testing) if headers is None else headers
+        cls.WARN_COUNT = app.config['QUERY_STATS_WARN_COUNT']
+        with cls._listen_lock:
+            if not cls._listening:
+                # Se escucha en la clase Engine: sirve para cualquier motor que cree la app
+                event.listen(Engine, 'before_cursor_execute', cls._before_cursor_execute)
+                event.listen(Engine, 'after_cursor_execute', cls._after_cursor_execute)
+                cls._listening = True
+        app.before_request(cls._start_request)
+        app.after_request(cls._finish_request)
+        app.teardown_request(cls._end_request)
+
+    @classmethod
+    @contextmanager
+    def track(cls, record=False):
+        """Cuenta las consultas ejecutadas en este hilo dentro del bloque `with`."""
+        counter = QueryCounter(record)
+        cls._counters().append(counter)
+        try:
+            yield counter
+        finally:
+            cls._counters().remove(counter)
+
+    @classmethod
+    @contextmanager
+    def budget(cls, max_queries):
+        """
+        Como `track`, pero lanza `QueryBudgetExceeded` (con las sentencias ejecutadas)
+        si el bloque hace más de `max_queries` consultas.
+        """
+        with cls.track(record=True) as counter:
+            yield counter
+        if counter.count > max_queries:
+            listing = '\n'.join(f"  {number}. {statement}" for number, statement in enumerate(counter.statements, 1))
+            raise QueryBudgetExceeded(
+                f"Se ejecutaron {counter.count} consultas SQL (máximo {max_queries}):\n{listing}")
+
+    @classmethod
+    def _counters(cls):
+        counters = getattr(cls._local, 'counters', None)
+        if counters is None:
+            counters = cls._local.counters = []
+        return counters
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @classmethod
+    def _after_cursor_execute(cls, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_started'].pop()
+        for counter in cls._counters():
+            counter.add(statement, elapsed)
+
+    @classmethod
+    def _start_request(cls):
+        g.query_counter = QueryCounter()
+        cls._counters().append(g.query_counter)
+
+    @classmethod
+    def _finish_request(cls, response):
+        counter = g.get('query_counter')
+        if counter is None:
+            return response
+        elapsed_ms = counter.duration * 1000
+        if cls.HEADERS:
+            response.headers['X-Query-Count'] = str(counter.count)
+            response.headers['X-Query-Time-Ms'] = f"{elapsed_ms:.1f}"
+        if cls.WARN_COUNT and counter.count > cls.WARN_COUNT:
+            print(f"Aviso: {request.method} {request.path} ejecutó {counter.count} consultas SQL ({elapsed_ms:.1f} ms)")
+        return response
+
+    @classmethod
+    def _end_request(cls, exc):
+        counter = g.pop('query_counter', None)
+        if counter is not None and counter in cls._counters():
+            cls._counters().remove(counter)
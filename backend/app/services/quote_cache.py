@@ -0,0 +1,133 @@
+import threading
+import time
+from app.services.cache_backends import CacheEntry, MemoryCacheBackend
+
+
+class CacheLookup:
+    """Resultado de una consulta a la caché: estado ('fresh', 'stale' o 'miss') y valor."""
+    FRESH = 'fresh'
+    STALE = 'stale'
+    MISS = 'miss'
+
+    __slots__ = ('state', 'value')
+
+    def __init__(self, state, value=None):
+        self.state = state
+        self.value = value
+
+    @property
+    def hit(self):
+        return self.state != CacheLookup.MISS
+
+
+class QuoteCache:
+    """
+    Caché de cotizaciones con TTL por entrada, stale-while-revalidate y caché negativa.
+
+    - Una entrada es "fresca" durante `ttl` segundos.
+    - Después pasa a estar "caducada" (stale) durante `stale_ttl` segundos más: se puede
+      servir mientras se revalida en segundo plano.
+    - Las búsquedas fallidas se guardan con `negative_ttl` (mucho más corto) y nunca se
+      sirven como caducadas.
+    - Las entradas expiradas se conservan como "último valor conocido" durante
+      `retain_ttl` segundos para poder servirlas si el proveedor está caído.
+
+    El almacenamiento se delega en un backend (ver `cache_backends`): en memoria del
+    proceso por defecto, o compartido entre workers (SQLite) o entre máquinas (Redis).
+    Los contadores de aciertos y fallos son locales a cada proceso.
+    """
+
+    def __init__(self, ttl=15, stale_ttl=60, negative_ttl=5, max_entries=2048,
+                 max_bytes=4 * 1024 * 1024, retain_ttl=24 * 3600, backend=None, clock=time.time):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.retain_ttl = retain_ttl
+        self.backend = backend or MemoryCacheBackend(max_entries, max_bytes, clock=clock)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'stale_hits': 0, 'negative_hits': 0, 'misses': 0, 'expirations': 0}
+
+    def lookup(self, key):
+        """Busca una clave y devuelve un `CacheLookup` con su estado."""
+        entry = self.backend.get(key)
+        now = self._clock()
+
+        if entry is None:
+            self._count('misses')
+            return CacheLookup(CacheLookup.MISS)
+
+        if now < entry.fresh_until:
+            self._count('hits' if entry.value is not None else 'negative_hits')
+            return CacheLookup(CacheLookup.FRESH, entry.value)
+
+        if now < entry.stale_until:
+            self._count('stale_hits')
+            return CacheLookup(CacheLookup.STALE, entry.value)
+
+        # La entrada ha expirado por completo. No se borra: se conserva como último
+        # valor conocido (ver `peek`) hasta que se reemplace o expire `retain_ttl`.
+        self._count('expirations', 'misses')
+        return CacheLookup(CacheLookup.MISS)
+
+    def peek(self, key):
+        """
+        Devuelve el último valor válido conocido para una clave, aunque haya expirado.
+        Se usa para seguir sirviendo datos cuando el proveedor no está disponible.
+        """
+        entry = self.backend.get(key)
+        return entry.value if entry is not None else None
+
+    def get(self, key):
+        """Devuelve el valor si la entrada está fresca, o None en caso contrario."""
+        result = self.lookup(key)
+        return result.value if result.state == CacheLookup.FRESH else None
+
+    def set(self, key, value, ttl=None, fetched_at=None):
+        """
+        Guarda una cotización válida. `fetched_at` (segundos de época) es cuándo se
+        obtuvo si no es ahora: la frescura se cuenta desde ese momento.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = self._clock() if fetched_at is None else fetched_at
+        stale_until = now + ttl + self.stale_ttl
+        self.backend.set(key, CacheEntry(value, now + ttl, stale_until), stale_until + self.retain_ttl)
+
+    def set_negative(self, key):
+        """Guarda una búsqueda fallida durante `negative_ttl` segundos."""
+        fresh_until = self._clock() + self.negative_ttl
+        self.backend.set(key, CacheEntry(None, fresh_until, fresh_until), fresh_until)
+
+    def invalidate(self, key):
+        self.backend.delete(key)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        """Contadores de aciertos, fallos y expulsiones, junto con el tamaño actual."""
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update(self.backend.stats())
+        stats['backend'] = type(self.backend).__name__
+        return stats
+
+    def __contains__(self, key):
+        return key in self.backend
+
+    @property
+    def shared(self):
+        """Indica si el almacenamiento es compartido con otros procesos."""
+        return self.backend.shared
+
+    def acquire_lock(self, key, ttl):
+        """Devuelve un token que identifica al dueño del candado, o None si lo tiene otro."""
+        return self.backend.acquire_lock(key, ttl)
+
+    def release_lock(self, key, token):
+        self.backend.release_lock(key, token)
+
+    def _count(self, *names):
+        with self._lock:
+            for name in names:
+                self._stats[name] += 1
@@ -0,0 +1,165 @@
+import threading
+import time
+
+
+class Subscription:
+    """
+    Un cliente conectado al stream. Los cambios de precio se acumulan en `pending`
+    agrupados por ticker: si el cliente lee más despacio de lo que llegan, solo se
+    conserva la última cotización de cada ticker (conflación). Así la memoria por
+    cliente está acotada por el número de tickers suscritos y un cliente lento nunca
+    frena al poller ni a los demás clientes.
+    """
+
+    def __init__(self, symbols):
+        self.symbols = frozenset(symbols)
+        self.pending = {}
+        self.dropped = 0
+        self.closed = False
+        self._cond = threading.Condition()
+
+    def push(self, quotes):
+        with self._cond:
+            for symbol, quote in quotes.items():
+                if symbol in self.pending:
+                    self.dropped += 1
+                self.pending[symbol] = quote
+            self._cond.notify()
+
+    def next_batch(self, timeout):
+        """Espera hasta `timeout` segundos y devuelve los cambios pendientes ({} si no hay)."""
+        with self._cond:
+            if not self.pending and not self.closed:
+                self._cond.wait(timeout)
+            batch, self.pending = self.pending, {}
+            return batch
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify()
+
+
+class StreamFullError(RuntimeError):
+    """El proceso ya tiene abiertos `max_clients` streams."""
+
+
+class QuoteStreamHub:
+    """
+    Reparte las cotizaciones entre los clientes del stream SSE.
+
+    Hay un único poller por proceso que, cada `interval` segundos, pide de una vez
+    las cotizaciones de todos los tickers con algún suscriptor y envía a cada
+    suscripción solo los tickers cuyo precio ha cambiado. El registro de
+    suscripciones está indexado por ticker, de modo que el coste de un ciclo depende
+    de los tickers distintos y de los cambios, no del número de clientes conectados.
+    El poller arranca con el primer suscriptor y se detiene cuando no queda ninguno.
+    Cada stream abierto ocupa un hilo del servidor (o una greenlet, en el proceso
+    `stream` con gevent) durante toda la conexión, así que se admiten como mucho
+    `max_clients` a la vez (`StreamFullError` para el resto) y siempre quedan hilos
+    libres para las demás peticiones.
+    """
+
+    def __init__(self, fetch_quotes, interval=5.0, max_clients=None):
+        self.fetch_quotes = fetch_quotes
+        self.interval = interval
+        self.max_clients = max_clients
+        self._lock = threading.Lock()
+        self._clients = set()
+        self._by_symbol = {}  # símbolo -> set(Subscription)
+        self._last = {}       # símbolo -> última cotización publicada
+        self._thread = None
+        self._stopped = threading.Event()
+        self._stats = {'polls': 0, 'published': 0}
+
+    def subscribe(self, symbols):
+        subscription = Subscription(symbols)
+        with self._lock:
+            if self.max_clients is not None and len(self._clients) >= self.max_clients:
+                raise StreamFullError(f"Se ha alcanzado el máximo de {self.max_clients} streams abiertos")
+            self._clients.add(subscription)
+            for symbol in subscription.symbols:
+                self._by_symbol.setdefault(symbol, set()).add(subscription)
+            known = {symbol: self._last[symbol] for symbol in subscription.symbols if symbol in self._last}
+            self._ensure_poller()
+        if known:
+            subscription.push(known)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            self._clients.discard(subscription)
+            for symbol in subscription.symbols:
+                subscribers = self._by_symbol.get(symbol)
+                if subscribers is None:
+                    continue
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._by_symbol[symbol]
+                    self._last.pop(symbol, None)
+
+    def poll_once(self):
+        """Un ciclo del poller: consulta los tickers suscritos y publica los cambios."""
+        with self._lock:
+            symbols = list(self._by_symbol)
+        if not symbols:
+            return 0
+
+        quotes = self.fetch_quotes(symbols)
+        changes = {}
+        with self._lock:
+            self._stats['polls'] += 1
+            for symbol, quote in quotes.items():
+                if not quote or symbol not in self._by_symbol:
+                    continue
+                previous = self._last.get(symbol)
+                if previous is None or previous.get('price') != quote.get('price'):
+                    self._last[symbol] = quote
+                    changes[symbol] = quote
+
+            deliveries = {}
+            for symbol, quote in changes.items():
+                for subscription in self._by_symbol[symbol]:
+                    deliveries.setdefault(subscription, {})[symbol] = quote
+            self._stats['published'] += len(changes)
+
+        for subscription, delta in deliveries.items():
+            subscription.push(delta)
+        return len(changes)
+
+    def close(self):
+        """Detiene el poller y cierra los streams abiertos (al sustituir el hub por otro)."""
+        self._stopped.set()
+        with self._lock:
+            clients = list(self._clients)
+        for subscription in clients:
+            self.unsubscribe(subscription)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, symbols=len(self._by_symbol), clients=len(self._clients),
+                        max_clients=self.max_clients)
+
+    def _ensure_poller(self):
+        if self._stopped.is_set():
+            return
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='quote-stream-poller', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._by_symbol:
+                    self._thread = None
+                    return
+            started = time.monotonic()
+            try:
+                self.poll_once()
+            except Exception as e:
+                print(f"Error en el poller del stream de cotizaciones: {e}")
+            if self._stopped.wait(max(0.0, self.interval - (time.monotonic() - started))):
+                with self._lock:
+                    self._thread = None
+                return
@@ -0,0 +1,114 @@
+import numpy as np
+from sqlalchemy import Float, cast, insert, select
+from app import db
+from app.models import Portfolio, Holding, PriceSnapshot, PortfolioSnapshot, utcnow
+
+
+class PortfolioRevaluation:
+    """
+    Revalorización en bloque de todas las carteras.
+
+    En lugar de valorar cartera a cartera con el ORM, carga la caja y las posiciones en
+    columnas con una sola consulta, las cruza con un vector de precios (uno por ticker) y suma
+    el valor de cada cartera en una pasada vectorizada de NumPy. Los resultados se
+    insertan en `portfolio_snapshots` en bloques, que alimentan el gráfico de
+    rendimiento del dashboard.
+    """
+    INSERT_CHUNK = 10000
+
+    @staticmethod
+    def run(prices=None, taken_at=None):
+        """
+        Revaloriza todas las carteras y guarda un snapshot de cada una. `prices` permite
+        indicar precios {símbolo: precio}; para el resto se usa el último snapshot de
+        precios, el último precio aplicado a la posición o, en su defecto, el precio
+        medio de compra. Hace commit. Devuelve el número de snapshots insertados.
+        """
+        taken_at = taken_at or utcnow()
+        portfolio_ids, cash, holdings = PortfolioRevaluation._load_positions()
+        if not len(portfolio_ids):
+            return 0
+
+        holdings_value = PortfolioRevaluation.compute_holdings_value(portfolio_ids, holdings, prices)
+        totals = cash + holdings_value
+
+        rows = [{
+            'portfolio_id': int(portfolio_id),
+            'taken_at': taken_at,
+            'cash_balance': round(float(cash_balance), 4),
+            'holdings_value': round(float(value), 4),
+            'total_value': round(float(total), 4),
+        } for portfolio_id, cash_balance, value, total in zip(portfolio_ids, cash, holdings_value, totals)]
+
+        for start in range(0, len(rows), PortfolioRevaluation.INSERT_CHUNK):
+            db.session.connection().execute(insert(PortfolioSnapshot.__table__),
+                                            rows[start:start + PortfolioRevaluation.INSERT_CHUNK])
+        db.session.commit()
+        return len(rows)
+
+    @staticmethod
+    def compute_holdings_value(portfolio_ids, holdings, prices=None):
+        """
+        Valor de las posiciones de cada cartera de `portfolio_ids` (array ordenado),
+        como array de float64 alineado con él. `holdings` son tuplas (cartera, ticker,
+        cantidad, precio medio, último precio); las de carteras que no están en
+        `portfolio_ids` se ignoran.
+        """
+        if not holdings:
+            return np.zeros(len(portfolio_ids))
+
+        owner, tickers, quantity, average_price, last_price = zip(*holdings)
+        owner = np.fromiter(owner, dtype=np.int64, count=len(holdings))
+        quantity = np.fromiter(quantity, dtype=np.float64, count=len(holdings))
+        fallback = np.array(last_price, dtype=np.float64)  # None -> nan
+        fallback = np.where(np.isnan(fallback), np.fromiter(average_price, dtype=np.float64), fallback)
+
+        # Cada posición apunta a su ticker dentro del vector de precios
+        codes = {}
+        ticker_index = np.fromiter((codes.setdefault(ticker, len(codes)) for ticker in tickers),
+                                   dtype=np.int64, count=len(holdings))
+        known = PortfolioRevaluation._load_prices(list(codes), prices)
+        price_vector = np.array([known.get(symbol, np.nan) for symbol in codes], dtype=np.float64)
+        holding_prices = price_vector[ticker_index]
+        holding_prices = np.where(np.isnan(holding_prices), fallback, holding_prices)
+
+        positions = np.minimum(np.searchsorted(portfolio_ids, owner), len(portfolio_ids) - 1)
+        owned = portfolio_ids[positions] == owner
+        return np.bincount(positions[owned], weights=(quantity * holding_prices)[owned],
+                           minlength=len(portfolio_ids))
+
+    @staticmethod
+    def _load_positions():
+        """
+        Caja y posiciones de todas las carteras con una sola consulta (carteras unidas a
+        sus posiciones), para que ambas salgan de la misma foto de la base de datos: una
+        operación confirmada entre dos lecturas contaría su importe dos veces.
+        Devuelve (ids ordenados, caja alineada con ellos, tuplas de posiciones).
+        """
+        # Consulta en columnas por el núcleo de SQLAlchemy (sin objetos ORM ni Decimal)
+        rows = db.session.connection().execute(
+            select(Portfolio.id, cast(Portfolio.cash_balance, Float), Holding.ticker_symbol,
+                   cast(Holding.quantity, Float), cast(Holding.average_purchase_price, Float),
+                   cast(Holding.last_price, Float))
+            .outerjoin(Holding, Holding.portfolio_id == Portfolio.id)
+            .order_by(Portfolio.id)
+        ).all()
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0), []
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        cash = np.fromiter((row[1] for row in rows), dtype=np.float64, count=len(rows))
+        portfolio_ids, first = np.unique(ids, return_index=True)
+        holdings = [(row[0],) + tuple(row[2:]) for row in rows if row[2] is not None]
+        return portfolio_ids, cash[first], holdings
+
+    @staticmethod
+    def _load_prices(symbols, prices=None):
+        known = {}
+        rows = db.session.execute(
+            select(PriceSnapshot.ticker_symbol, PriceSnapshot.price)
+            .where(PriceSnapshot.ticker_symbol.in_(symbols))
+        ).all()
+        known.update((symbol, float(price)) for symbol, price in rows)
+        if prices:
+            known.update((symbol.upper(), float(price)) for symbol, price in prices.items() if price is not None)
+        return known
@@ -0,0 +1,375 @@
+import re
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from app.models import Payout, PayoutStatus, utcnow
+from app.services.db_utils import insert_for_dialect
+
+ADDRESS_PATTERN = re.compile(r'^0x[0-9a-fA-F]{40}$')
+
+# Solo hace falta `transfer` del ERC-20 (KranToken.sol) para firmar los envíos
+ERC20_TRANSFER_ABI = [{
+    'type': 'function', 'name': 'transfer', 'stateMutability': 'nonpayable',
+    'inputs': [{'name': 'to', 'type': 'address'}, {'name': 'value', 'type': 'uint256'}],
+    'outputs': [{'name': '', 'type': 'bool'}],
+}]
+
+
+class RewardQueue:
+    """Cola persistente de envíos de $KRN (tabla `payouts`)."""
+
+    @staticmethod
+    def enqueue(reference, entries):
+        """
+        Encola los envíos de un reparto: `entries` son tuplas (user_id, dirección, importe
+        en KRN). Es idempotente por (reference, user_id): relanzar el mismo reparto no
+        duplica pagos. Hace commit y devuelve el número de envíos nuevos.
+        """
+        reference = str(reference or '').strip()
+        if not reference or len(reference) > 100:
+            raise ValueError("La referencia del reparto es obligatoria (máximo 100 caracteres)")
+        rows = {}
+        for user_id, recipient, amount in entries:
+            recipient = str(recipient or '').strip()
+            if not ADDRESS_PATTERN.match(recipient):
+                raise ValueError(f"Dirección no válida para el usuario {user_id}: {recipient!r}")
+            try:
+                amount = Decimal(str(amount))
+            except InvalidOperation:
+                raise ValueError(f"Importe no válido para el usuario {user_id}: {amount!r}")
+            if not amount.is_finite() or amount <= 0:
+                raise ValueError(f"El importe del usuario {user_id} debe ser positivo")
+            rows[int(user_id)] = {'reference': reference, 'user_id': int(user_id), 'recipient': recipient,
+                                  'amount': amount, 'status': PayoutStatus.PENDING, 'attempts': 0}
+        if not rows:
+            return 0
+
+        table = Payout.__table__
+        insert_ = insert_for_dialect()
+        if insert_ is None:
+            existing = set(db.session.execute(
+                select(table.c.user_id).where(table.c.reference == reference, table.c.user_id.in_(list(rows)))
+            ).scalars())
+            new_rows = [row for user_id, row in rows.items() if user_id not in existing]
+            if new_rows:
+                db.session.execute(insert(table), new_rows)
+            db.session.commit()
+            return len(new_rows)
+        created = db.session.execute(
+            insert_(table).on_conflict_do_nothing(index_elements=['reference', 'user_id'])
+            .returning(table.c.id),
+            list(rows.values()),
+        ).all()
+        db.session.commit()
+        return len(created)
+
+    @staticmethod
+    def summary():
+        """Número de envíos por estado."""
+        counts = dict(db.session.execute(select(Payout.status, func.count()).group_by(Payout.status)).all())
+        return {status.value: counts.get(status, 0) for status in PayoutStatus}
+
+
+class KrnTokenClient:
+    """
+    Cliente del contrato KranToken con la cuenta de la tesorería: firma las
+    transferencias en local (con el nonce que se le indica), las emite sin esperar
+    a que se minen y consulta sus recibos.
+    """
+
+    def __init__(self, rpc_url, token_address, private_key, gas=100000, timeout=10):
+        try:
+            from web3 import Web3
+        except ImportError as e:
+            raise RuntimeError("El reparto de recompensas requiere el paquete 'web3'") from e
+        if not token_address or not private_key:
+            raise RuntimeError("Faltan KRN_TOKEN_ADDRESS o KRN_TREASURY_PRIVATE_KEY")
+        self._Web3 = Web3
+        self._web3 = Web3(Web3.HTTPProvider(rpc_url, request_kwargs={'timeout': timeout}))
+        self._account = self._web3.eth.account.from_key(private_key)
+        self._token = self._web3.eth.contract(address=Web3.to_checksum_address(token_address),
+                                              abi=ERC20_TRANSFER_ABI)
+        self._chain_id = None
+        self.gas = gas
+        self.address = self._account.address
+
+    def pending_nonce(self):
+        return self._web3.eth.get_transaction_count(self.address, 'pending')
+
+    def mined_nonce(self):
+        """Nonce siguiente al de la última transacción minada de la tesorería."""
+        return self._web3.eth.get_transaction_count(self.address, 'latest')
+
+    def gas_price(self):
+        return self._web3.eth.gas_price
+
+    def sign_transfer(self, nonce, recipient, units, gas_price):
+        """Firma `transfer(recipient, units)`. Devuelve (hash, transacción en crudo en hex)."""
+        if self._chain_id is None:
+            self._chain_id = self._web3.eth.chain_id
+        transaction = self._token.functions.transfer(self._Web3.to_checksum_address(recipient), units) \
+            .build_transaction({'from': self.address, 'nonce': nonce, 'gas': self.gas,
+                                'gasPrice': gas_price, 'chainId': self._chain_id})
+        signed = self._account.sign_transaction(transaction)
+        raw = getattr(signed, 'raw_transaction', None) or signed.rawTransaction
+        return self._Web3.to_hex(signed.hash), self._Web3.to_hex(raw)
+
+    def broadcast(self, raw_tx):
+        """Emite una transacción firmada; que el nodo ya la conozca (o ya esté minada) no es un error."""
+        try:
+            self._web3.eth.send_raw_transaction(raw_tx)
+        except Exception as e:
+            message = str(e).lower()
+            if 'known' in message or 'nonce too low' in message:
+                return
+            raise
+
+    def receipt(self, tx_hash):
+        """(status, bloque) del recibo de la transacción, o None si aún no se ha minado."""
+        from web3.exceptions import TransactionNotFound
+        try:
+            receipt = self._web3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+        return receipt['status'], receipt['blockNumber']
+
+
+class RewardDistributor:
+    """
+    Worker que vacía la cola de `payouts` enviando $KRN desde la tesorería.
+
+    Los nonces se asignan en local: se leen de la cadena (y de los envíos ya firmados)
+    una sola vez al arrancar y después se incrementan en memoria, así que en cada
+    ciclo se firman hasta `batch_size` transferencias seguidas, se guardan con su
+    nonce y su hash (commit) y solo entonces se emiten todas sin esperar recibos.
+    Los recibos se consultan en los ciclos siguientes: las confirmadas se cierran,
+    las revertidas vuelven a la cola con un nonce nuevo (hasta `max_attempts`) y las
+    que siguen sin minar pasados `rebroadcast_after` segundos se reemiten con la
+    misma transacción firmada, por lo que un reintento nunca paga dos veces.
+
+    Una transacción con poco gas puede no minarse nunca y bloquear todos los nonces
+    siguientes: tras `replace_after` reemisiones se sustituye por la misma
+    transferencia con el mismo nonce y un `gas_bump` % más de gas (hasta
+    `max_replacements` veces). Como puede minarse cualquiera de las versiones, se
+    buscan los recibos de todas. Si la cadena ya ha minado el nonce y no es con
+    ninguna de ellas (el nodo la descartó y otra transacción lo usó), el envío no se
+    ha pagado y vuelve a la cola, o queda como fallido agotados los intentos.
+    Debe haber un único distribuidor por cuenta de tesorería.
+    """
+
+    def __init__(self, app, client=None, interval=None, batch_size=None, max_in_flight=None,
+                 rebroadcast_after=None, max_attempts=None, replace_after=None, gas_bump=None,
+                 max_replacements=None):
+        self.app = app
+        config = app.config
+        self.client = client or KrnTokenClient(config['KRN_RPC_URL'], config['KRN_TOKEN_ADDRESS'],
+                                               config['KRN_TREASURY_PRIVATE_KEY'], gas=config['KRN_TRANSFER_GAS'])
+        self.interval = interval or config['REWARDS_INTERVAL']
+        self.batch_size = batch_size or config['REWARDS_BATCH_SIZE']
+        self.max_in_flight = max_in_flight or config['REWARDS_MAX_IN_FLIGHT']
+        self.rebroadcast_after = config['REWARDS_REBROADCAST_AFTER'] if rebroadcast_after is None \
+            else rebroadcast_after
+        self.max_attempts = max_attempts or config['REWARDS_MAX_ATTEMPTS']
+        self.replace_after = config['REWARDS_REPLACE_AFTER'] if replace_after is None else replace_after
+        self.gas_bump = config['REWARDS_GAS_BUMP_PERCENT'] if gas_bump is None else gas_bump
+        self.max_replacements = config['REWARDS_MAX_REPLACEMENTS'] if max_replacements is None \
+            else max_replacements
+        self.unit = Decimal(10) ** config['KRN_DECIMALS']
+        self._next_nonce = None
+        self._stop = threading.Event()
+
+    def run_once(self):
+        """Ejecuta un ciclo: recibos primero y después un lote nuevo. Devuelve los contadores del ciclo."""
+        with self.app.app_context():
+            report = {'confirmed': 0, 'requeued': 0, 'failed': 0, 'rebroadcast': 0, 'replaced': 0,
+                      'submitted': 0}
+            try:
+                self._track_receipts(report)
+                self._submit_pending(report)
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                print(f"Error al procesar la cola de recompensas: {e}")
+            return report
+
+    def _next_nonces(self):
+        if self._next_nonce is None:
+            last_signed = db.session.execute(
+                select(func.max(Payout.nonce)).where(Payout.sender == self.client.address,
+                                                     Payout.status.in_([PayoutStatus.SUBMITTED,
+                                                                        PayoutStatus.CONFIRMED]))
+            ).scalar()
+            # Un envío firmado que no llegó al nodo conserva su nonce: se reemitirá
+            self._next_nonce = max(self.client.pending_nonce(), 0 if last_signed is None else last_signed + 1)
+        return self._next_nonce
+
+    def _track_receipts(self, report):
+        in_flight = db.session.execute(
+            select(Payout).where(Payout.status == PayoutStatus.SUBMITTED).order_by(Payout.nonce)
+        ).scalars().all()
+        if not in_flight:
+            return
+        try:
+            # Se lee antes que los recibos: un nonce minado sin recibo de ninguna de
+            # nuestras versiones lo ha consumido otra transacción
+            mined_nonce = self.client.mined_nonce()
+        except Exception as e:
+            print(f"Error al consultar el nonce de la tesorería: {e}")
+            mined_nonce = None
+        now = utcnow()
+        stale = now - timedelta(seconds=self.rebroadcast_after)
+        resend = []
+        for payout in in_flight:
+            try:
+                tx_hash, receipt = self._find_receipt(payout)
+            except Exception as e:
+                print(f"Error al consultar el recibo de {payout.tx_hash}: {e}")
+                continue
+            if receipt is None:
+                if (mined_nonce is not None and payout.sender == self.client.address
+                        and payout.nonce < mined_nonce):
+                    self._release(payout, f"Nonce {payout.nonce} used by another transaction", report)
+                elif payout.submitted_at <= stale:
+                    self._prepare_resend(payout, report)
+                    payout.submitted_at = now
+                    resend.append((payout.id, payout.raw_tx))
+                continue
+            status, block_number = receipt
+            payout.tx_hash = tx_hash
+            if status == 1:
+                payout.status = PayoutStatus.CONFIRMED
+                payout.block_number = block_number
+                payout.confirmed_at = now
+                payout.last_error = None
+                report['confirmed'] += 1
+            else:
+                # La transacción revertida consumió su nonce sin pagar
+                self._release(payout, f"Transaction reverted in block {block_number}", report, block_number)
+        # Las sustituciones se guardan antes de emitirlas, como los envíos nuevos
+        db.session.commit()
+        report['rebroadcast'] += self._broadcast(resend)
+
+    def _find_receipt(self, payout):
+        """(hash, recibo) de la versión minada del envío, o (hash vigente, None) si no hay ninguna."""
+        for tx_hash in [payout.tx_hash, *(payout.replaced_tx_hashes or '').split()]:
+            receipt = self.client.receipt(tx_hash)
+            if receipt is not None:
+                return tx_hash, receipt
+        return payout.tx_hash, None
+
+    def _release(self, payout, error, report, block_number=None):
+        """
+        El nonce del envío se ha consumido sin pagarlo: vuelve a la cola para firmarse
+        con otro o, agotados los intentos, queda como fallido.
+        """
+        payout.last_error = error
+        if payout.attempts < self.max_attempts:
+            payout.status = PayoutStatus.PENDING
+            payout.nonce = payout.tx_hash = payout.raw_tx = payout.sender = None
+            payout.gas_price = payout.replaced_tx_hashes = None
+            payout.rebroadcasts = 0
+            report['requeued'] += 1
+        else:
+            payout.status = PayoutStatus.FAILED
+            payout.block_number = block_number
+            report['failed'] += 1
+
+    def _prepare_resend(self, payout, report):
+        """Deja en `raw_tx` la transacción a reemitir: la misma o, si no se mina, una sustituta con más gas."""
+        replaced = (payout.replaced_tx_hashes or '').split()
+        payout.last_error = None
+        if payout.rebroadcasts < self.replace_after:
+            payout.rebroadcasts += 1
+            return
+        if len(replaced) >= self.max_replacements:
+            payout.last_error = f"Not mined after {len(replaced)} gas price replacements"
+            return
+        try:
+            gas_price = max(self.client.gas_price(), (payout.gas_price or 0) * (100 + self.gas_bump) // 100 + 1)
+            units = int((payout.amount * self.unit).to_integral_value())
+            tx_hash, raw_tx = self.client.sign_transfer(payout.nonce, payout.recipient, units, gas_price)
+        except Exception as e:
+            print(f"Error al firmar la sustitución del envío {payout.id}: {e}")
+            return
+        payout.replaced_tx_hashes = ' '.join(replaced + [payout.tx_hash])
+        payout.tx_hash = tx_hash
+        payout.raw_tx = raw_tx
+        payout.gas_price = gas_price
+        payout.rebroadcasts = 0
+        report['replaced'] += 1
+
+    def _broadcast(self, signed):
+        """Emite las transacciones [(id del envío, transacción en crudo)] ya guardadas; devuelve las emitidas."""
+        errors = []
+        for payout_id, raw_tx in signed:
+            try:
+                self.client.broadcast(raw_tx)
+            except Exception as e:
+                errors.append({'id': payout_id, 'last_error': str(e)[:255]})
+        if errors:
+            print(f"{len(errors)} envíos sin emitir; se reemitirán en {self.rebroadcast_after}s")
+            db.session.execute(update(Payout), errors)
+            db.session.commit()
+        return len(signed) - len(errors)
+
+    def _submit_pending(self, report):
+        in_flight = db.session.execute(
+            select(func.count()).select_from(Payout).where(Payout.status == PayoutStatus.SUBMITTED)
+        ).scalar()
+        capacity = min(self.batch_size, self.max_in_flight - in_flight)
+        if capacity <= 0:
+            return
+        pending = db.session.execute(
+            select(Payout).where(Payout.status == PayoutStatus.PENDING).order_by(Payout.id).limit(capacity)
+        ).scalars().all()
+        if not pending:
+            return
+
+        nonce = self._next_nonces()
+        gas_price = self.client.gas_price()
+        now = utcnow()
+        signed = []
+        for payout in pending:
+            units = int((payout.amount * self.unit).to_integral_value())
+            try:
+                tx_hash, raw_tx = self.client.sign_transfer(nonce, payout.recipient, units, gas_price)
+            except Exception as e:
+                print(f"Error al firmar el envío {payout.id}: {e}")
+                break
+            payout.status = PayoutStatus.SUBMITTED
+            payout.sender = self.client.address
+            payout.nonce = nonce
+            payout.tx_hash = tx_hash
+            payout.raw_tx = raw_tx
+            payout.gas_price = gas_price
+            payout.rebroadcasts = 0
+            payout.attempts += 1
+            payout.submitted_at = now
+            # Se copian antes del commit, que expira los objetos
+            signed.append((payout.id, raw_tx))
+            nonce += 1
+        # Se guardan antes de emitirlas: si el proceso cae entre medias, se reemiten las mismas
+        db.session.commit()
+        self._next_nonce = nonce
+
+        self._broadcast(signed)
+        report['submitted'] += len(signed)
+
+    def run_forever(self):
+        """Bucle principal: un ciclo cada `interval` segundos, sin acumular retrasos."""
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                report = self.run_once()
+                if any(report.values()):
+                    print("Recompensas: " + ", ".join(f"{count} {name}" for name, count in report.items()))
+            except Exception as e:  # El bucle no debe morir por un ciclo fallido
+                print(f"Error en el reparto de recompensas: {e}")
+            elapsed = time.monotonic() - started
+            self._stop.wait(max(0.0, self.interval - elapsed))
+
+    def stop(self):
+        self._stop.set()
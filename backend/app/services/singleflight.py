@@ -0,0 +1,63 @@
+import threading
+
+
+class Flight:
+    """Una llamada en curso: los que esperan se bloquean en `event` hasta que hay resultado."""
+    __slots__ = ('event', 'result')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+
+    def wait(self, timeout):
+        """Devuelve (terminada, resultado)."""
+        finished = self.event.wait(timeout)
+        return finished, self.result
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes por clave: para cada clave solo hay una llamada en
+    curso y el resto de hilos espera su resultado en lugar de repetirla.
+
+    Está pensado para peticiones en bloque: `claim` reparte un conjunto de claves
+    entre las que pasan a ser "nuestras" (hay que obtenerlas y publicar el resultado
+    con `complete`) y las que ya está obteniendo otro hilo (basta con esperar).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'leaders': 0, 'coalesced': 0}
+
+    def claim(self, keys):
+        owned = []
+        waiting = {}
+        with self._lock:
+            for key in keys:
+                flight = self._flights.get(key)
+                if flight is None:
+                    self._flights[key] = Flight()
+                    owned.append(key)
+                else:
+                    waiting[key] = flight
+            self._stats['leaders'] += len(owned)
+            self._stats['coalesced'] += len(waiting)
+        return owned, waiting
+
+    def complete(self, results):
+        """Publica el resultado de las claves reclamadas y despierta a los que esperan."""
+        with self._lock:
+            flights = [(key, self._flights.pop(key, None)) for key in results]
+        for key, flight in flights:
+            if flight is not None:
+                flight.result = results[key]
+                flight.event.set()
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._flights)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, in_flight=len(self._flights))
@@ -0,0 +1,269 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+
+
+class TrieNode:
+    __slots__ = ('children', 'ids')
+
+    def __init__(self):
+        self.children = {}
+        self.ids = []
+
+
+class PrefixTrie:
+    """
+    Trie de prefijos. Las búsquedas recorren el subárbol en anchura, de modo que las
+    claves más cortas (las coincidencias más exactas) aparecen primero.
+    """
+
+    def __init__(self):
+        self.root = TrieNode()
+
+    def insert(self, key, record_id):
+        node = self.root
+        for char in key:
+            node = node.children.setdefault(char, TrieNode())
+        node.ids.append(record_id)
+
+    def search(self, prefix, max_results):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+
+        found = []
+        seen = set()
+        queue = deque([node])
+        while queue and len(found) < max_results:
+            current = queue.popleft()
+            for record_id in current.ids:
+                if record_id not in seen:
+                    seen.add(record_id)
+                    found.append(record_id)
+            # Orden alfabético entre hermanos para que el resultado sea determinista
+            queue.extend(current.children[char] for char in sorted(current.children))
+        return found
+
+
+class SymbolIndex:
+    """Índices inmutables construidos a partir de una carga del directorio."""
+    __slots__ = ('records', 'symbol_trie', 'name_trie', 'trigrams', 'trigram_counts')
+
+    def __init__(self, records, symbol_trie, name_trie, trigrams, trigram_counts):
+        self.records = records
+        self.symbol_trie = symbol_trie
+        self.name_trie = name_trie
+        self.trigrams = trigrams
+        self.trigram_counts = trigram_counts
+
+
+class SymbolDirectory:
+    """
+    Directorio local de símbolos cargado en bloque desde un fichero JSON.
+
+    Construye en memoria un trie de prefijos (sobre el símbolo y cada palabra del
+    nombre) y un índice de trigramas para búsquedas aproximadas, de forma que el
+    buscador del explorador se responde sin llamar al proveedor. El fichero se
+    regenera periódicamente (`flask refresh-symbols`) y cada proceso lo recarga
+    cuando detecta que ha cambiado.
+    """
+    # Niveles de ranking: cuanto menor, mejor
+    EXACT, SYMBOL_PREFIX, NAME_PREFIX, FUZZY = range(4)
+    FUZZY_THRESHOLD = 0.5
+    CANDIDATES_PER_RESULT = 20
+    MIN_COMMON_POSTINGS = 1000
+
+    def __init__(self, path=None, reload_interval=60):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._loaded_mtime = None
+        self._last_check = float('-inf')
+        self._build([])
+
+    def __len__(self):
+        return len(self._index.records)
+
+    @property
+    def loaded(self):
+        return bool(self._index.records)
+
+    # --- Carga ---
+
+    def load(self, records=None):
+        """
+        Carga el directorio a partir de una lista de registros o, si no se indica,
+        del fichero configurado. Los índices se construyen aparte y se sustituyen de
+        golpe, así que las búsquedas en curso nunca ven un índice a medias.
+        """
+        mtime = None
+        if records is None:
+            if not self.path or not os.path.exists(self.path):
+                return False
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                records = json.load(f)
+        self._build(records)
+        self._loaded_mtime = mtime
+        return True
+
+    def maybe_reload(self):
+        """Recarga el fichero si ha cambiado (como mucho una comprobación cada `reload_interval` s)."""
+        now = time.monotonic()
+        if now - self._last_check < self.reload_interval:
+            return False
+        with self._lock:
+            if now - self._last_check < self.reload_interval:
+                return False
+            self._last_check = now
+            if not self.path or not os.path.exists(self.path):
+                return False
+            if os.path.getmtime(self.path) == self._loaded_mtime:
+                return False
+            return self.load()
+
+    def save(self, records):
+        """Escribe el fichero de forma atómica y carga los nuevos registros."""
+        records = [self._normalize(record) for record in records]
+        records = [record for record in records if record]
+        tmp_path = f"{self.path}.tmp"
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(records, f)
+        os.replace(tmp_path, self.path)
+        return self.load()
+
+    # --- Búsqueda ---
+
+    def search(self, query, exchange=None, currency=None, limit=10):
+        """
+        Busca símbolos por prefijo del ticker, prefijo de cualquier palabra del nombre
+        o, si no hay suficientes, por similitud de trigramas. Devuelve registros con
+        el mismo formato que el endpoint `search-ticker` de FMP.
+        """
+        text = self._clean(query)
+        if not text:
+            return []
+        # Se toma una referencia al índice actual: una recarga concurrente no nos afecta
+        index = self._index
+        records = index.records
+        exchange = exchange.upper() if exchange else None
+        currency = currency.upper() if currency else None
+
+        def accepted(record_id):
+            record = records[record_id]
+            return ((not exchange or record['exchangeShortName'] == exchange) and
+                    (not currency or record['currency'] == currency))
+
+        candidates = self.CANDIDATES_PER_RESULT * limit
+        ranked = {}
+
+        def consider(record_id, rank):
+            if record_id not in ranked and accepted(record_id):
+                ranked[record_id] = rank
+
+        symbol_query = text.replace(' ', '')
+        for record_id in index.symbol_trie.search(symbol_query, candidates):
+            exact = records[record_id]['symbol'] == symbol_query
+            consider(record_id, self.EXACT if exact else self.SYMBOL_PREFIX)
+
+        for record_id in self._name_prefix_matches(index, text, candidates):
+            consider(record_id, self.NAME_PREFIX)
+
+        if len(ranked) < limit:
+            for record_id in self._fuzzy_matches(index, text, candidates):
+                consider(record_id, self.FUZZY)
+
+        ordered = sorted(ranked, key=lambda rid: (ranked[rid], len(records[rid]['symbol']), records[rid]['symbol']))
+        return [self._public(records[record_id]) for record_id in ordered[:limit]]
+
+    # --- Métodos internos ---
+
+    def _build(self, records):
+        normalized = [self._normalize(record) for record in records]
+        normalized = [record for record in normalized if record]
+        symbol_trie = PrefixTrie()
+        name_trie = PrefixTrie()
+        trigrams = {}
+        trigram_counts = []
+
+        for record_id, record in enumerate(normalized):
+            symbol_trie.insert(record['symbol'], record_id)
+            name = self._clean(record['name'])
+            for word in set(name.split()):
+                name_trie.insert(word, record_id)
+            record_trigrams = self._trigrams(record['symbol']) | self._trigrams(name)
+            trigram_counts.append(len(record_trigrams))
+            for trigram in record_trigrams:
+                trigrams.setdefault(trigram, []).append(record_id)
+
+        # Sustitución atómica de los índices
+        self._index = SymbolIndex(normalized, symbol_trie, name_trie, trigrams, trigram_counts)
+
+    @staticmethod
+    def _name_prefix_matches(index, text, max_results):
+        words = text.split()
+        # Todas las palabras de la consulta deben ser prefijo de alguna palabra del nombre
+        if len(words) == 1:
+            return index.name_trie.search(words[0], max_results)
+        matches = None
+        for word in words:
+            ids = set(index.name_trie.search(word, max_results * 10))
+            matches = ids if matches is None else matches & ids
+            if not matches:
+                return []
+        return sorted(matches)[:max_results]
+
+    def _fuzzy_matches(self, index, text, max_results):
+        if len(text) < 3:
+            return []
+        query_trigrams = self._trigrams(text)
+        # Los trigramas muy frecuentes ("INC", " CO"...) apenas discriminan y son los
+        # más caros de recorrer: se cuentan en el denominador pero no se recorren.
+        max_postings = max(self.MIN_COMMON_POSTINGS, len(index.records) // 20)
+        overlap = Counter()
+        for trigram in query_trigrams:
+            postings = index.trigrams.get(trigram, ())
+            if len(postings) <= max_postings:
+                overlap.update(postings)
+
+        scored = []
+        for record_id, shared in overlap.items():
+            # Coeficiente de solapamiento: los nombres largos no penalizan una consulta corta
+            score = shared / min(len(query_trigrams), index.trigram_counts[record_id])
+            if score >= self.FUZZY_THRESHOLD:
+                scored.append((-score, index.trigram_counts[record_id], record_id))
+        scored.sort()
+        return [record_id for _, _, record_id in scored[:max_results]]
+
+    @staticmethod
+    def _trigrams(text):
+        padded = f"  {text} "
+        return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+    @staticmethod
+    def _clean(text):
+        return re.sub(r'[^a-z0-9.\- ]+', ' ', (text or '').lower()).strip().upper()
+
+    @staticmethod
+    def _normalize(record):
+        symbol = (record.get('symbol') or '').strip().upper()
+        if not symbol:
+            return None
+        exchange = record.get('exchangeShortName') or record.get('stockExchange') or record.get('exchange')
+        return {
+            'symbol': symbol,
+            'name': record.get('name') or '',
+            'currency': (record.get('currency') or '').upper() or None,
+            'exchangeShortName': (exchange or '').upper() or None,
+            'stockExchange': record.get('stockExchange') or record.get('exchange') or exchange,
+        }
+
+    @staticmethod
+    def _public(record):
+        return dict(record)
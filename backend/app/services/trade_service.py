@@ -0,0 +1,341 @@
+from decimal import Decimal
+from sqlalchemy import bindparam, delete, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import Portfolio, Holding, Transaction, TransactionType, Order, OrderStatus, utcnow
+from app.services.analytics import PortfolioAnalytics
+from app.services.db_utils import insert_for_dialect
+from app.services.events import EventBus, TradeExecuted
+from app.services.principal import PrincipalLoader
+from app.services.valuation_service import ValuationService
+
+
+class TradeError(Exception):
+    """Operación rechazada por las reglas de negocio; el mensaje es apto para el usuario."""
+
+
+class InsufficientFundsError(TradeError):
+    def __init__(self):
+        super().__init__("Fondos insuficientes para realizar la compra")
+
+
+class InsufficientSharesError(TradeError):
+    def __init__(self):
+        super().__init__("No tienes suficientes acciones para vender")
+
+
+class TradeService:
+    """
+    Ejecución de órdenes de compra y venta con sentencias SQL atómicas.
+
+    El saldo y la cantidad nunca se leen, modifican en Python y se vuelven a escribir:
+    cada comprobación va dentro del propio UPDATE (`... WHERE cash_balance >= :coste`)
+    y la posición se actualiza con un upsert, de modo que las órdenes concurrentes del
+    mismo usuario no pierden actualizaciones ni necesitan reintentos. La primera
+    sentencia de cada operación actualiza la fila de la cartera (y su `version`), lo
+    que además ordena los bloqueos: cartera y después posición. Tras el commit se
+    publica un `TradeExecuted` por operación ejecutada (misiones y logros).
+    """
+
+    @staticmethod
+    def buy(portfolio_id, ticker, quantity, price):
+        """Compra `quantity` acciones a `price`. Hace commit; lanza `TradeError` si se rechaza."""
+        cost = TradeService._execute(TradeService._buy, portfolio_id, ticker.upper(),
+                                     Decimal(quantity), Decimal(str(price)))
+        EventBus.publish([TradeExecuted(portfolio_id, ticker.upper(), 'buy', Decimal(quantity), Decimal(str(price)))])
+        return cost
+
+    @staticmethod
+    def sell(portfolio_id, ticker, quantity, price):
+        """Vende `quantity` acciones a `price`. Hace commit; lanza `TradeError` si se rechaza."""
+        proceeds = TradeService._execute(TradeService._sell, portfolio_id, ticker.upper(),
+                                         Decimal(quantity), Decimal(str(price)))
+        EventBus.publish([TradeExecuted(portfolio_id, ticker.upper(), 'sell', Decimal(quantity), Decimal(str(price)))])
+        return proceeds
+
+    @staticmethod
+    def execute_orders(portfolio_id, orders):
+        """
+        Ejecuta una lista de órdenes ya valoradas ({'ticker', 'side', 'quantity', 'price'}
+        y, si vienen de una orden en espera, 'order_id') en una única transacción. Cada
+        venta se valida contra la posición previa al lote más lo comprado y menos lo
+        vendido por las órdenes anteriores del mismo lote, y el saldo contra el efecto
+        neto de todas las órdenes aceptadas.
+        Devuelve una lista con (aceptada, mensaje) por orden; lanza
+        `InsufficientFundsError` (sin ejecutar nada) si el saldo no cubre el neto.
+        """
+        results = TradeService._execute(TradeService._execute_orders, portfolio_id, orders)
+        EventBus.publish([TradeExecuted(portfolio_id, order['ticker'], order['side'], Decimal(order['quantity']),
+                                        Decimal(str(order['price'])))
+                          for order, (accepted, _) in zip(orders, results) if accepted])
+        return results
+
+    @staticmethod
+    def _execute(operation, portfolio_id, *args):
+        # Se cierra la transacción de lectura que pudiera haber abierta (p. ej. la de la
+        # consulta de la cotización) para que la operación empiece directamente escribiendo.
+        # Es un rollback y no un commit: la operación nunca confirma cambios del llamador.
+        db.session.rollback()
+        try:
+            result = operation(portfolio_id, *args)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        # Los objetos cargados antes en la sesión no reflejan las sentencias anteriores
+        db.session.expire_all()
+        PortfolioAnalytics.invalidate(portfolio_id)
+        PrincipalLoader.invalidate_portfolio(portfolio_id)
+        return result
+
+    @staticmethod
+    def _execute_orders(portfolio_id, orders):
+        portfolios = Portfolio.__table__
+        holdings = Holding.__table__
+        # Bloquea la cartera antes de leer: las demás operaciones sobre ella esperan
+        db.session.execute(
+            update(portfolios).where(portfolios.c.id == portfolio_id).values(version=portfolios.c.version + 1)
+        )
+        tickers = sorted({order['ticker'] for order in orders})
+        held = {row.ticker_symbol: row for row in db.session.execute(
+            select(Holding.ticker_symbol, Holding.quantity,
+                   func.coalesce(Holding.market_value, Holding.quantity * Holding.average_purchase_price)
+                   .label('value'))
+            .where(Holding.portfolio_id == portfolio_id, Holding.ticker_symbol.in_(tickers))
+        )}
+
+        results = []
+        sold = {}
+        bought = {}
+        last_price = {}
+        net_cost = Decimal('0')
+        for order in orders:
+            ticker, quantity, price = order['ticker'], Decimal(order['quantity']), Decimal(str(order['price']))
+            if order['side'] == 'sell':
+                available = ((held[ticker].quantity if ticker in held else Decimal('0'))
+                             + bought.get(ticker, (Decimal('0'),))[0] - sold.get(ticker, 0))
+                if available < quantity:
+                    results.append((False, str(InsufficientSharesError())))
+                    continue
+                sold[ticker] = sold.get(ticker, Decimal('0')) + quantity
+                net_cost -= quantity * price
+            else:
+                quantity_so_far, cost_so_far = bought.get(ticker, (Decimal('0'), Decimal('0')))
+                bought[ticker] = (quantity_so_far + quantity, cost_so_far + quantity * price)
+                net_cost += quantity * price
+            last_price[ticker] = price
+            results.append((True, None))
+
+        TradeService._settle_orders(orders, results)
+        accepted = [order for order, (ok, _) in zip(orders, results) if ok]
+        if not accepted:
+            return results
+
+        debited = db.session.execute(
+            update(portfolios)
+            .where(portfolios.c.id == portfolio_id, portfolios.c.cash_balance >= net_cost)
+            .values(cash_balance=portfolios.c.cash_balance - net_cost)
+        )
+        if debited.rowcount != 1:
+            raise InsufficientFundsError()
+
+        now = utcnow()
+        # Las compras se aplican antes que las ventas: una venta puede usar acciones
+        # compradas en el mismo lote
+        if bought:
+            TradeService._upsert_holdings(portfolio_id, [(ticker, quantity, cost / quantity)
+                                                         for ticker, (quantity, cost) in bought.items()])
+        if sold:
+            db.session.execute(
+                update(holdings)
+                .where(holdings.c.portfolio_id == portfolio_id, holdings.c.ticker_symbol == bindparam('b_ticker'))
+                .values(quantity=holdings.c.quantity - bindparam('b_quantity')),
+                [{'b_ticker': ticker, 'b_quantity': quantity} for ticker, quantity in sold.items()],
+            )
+            db.session.execute(
+                delete(holdings)
+                .where(holdings.c.portfolio_id == portfolio_id, holdings.c.ticker_symbol.in_(list(sold)),
+                       holdings.c.quantity <= 0)
+            )
+        touched = list(last_price)
+        db.session.execute(
+            update(holdings)
+            .where(holdings.c.portfolio_id == portfolio_id, holdings.c.ticker_symbol == bindparam('b_ticker'))
+            .values(last_price=bindparam('b_price'), market_value=holdings.c.quantity * bindparam('b_price'),
+                    priced_at=now),
+            [{'b_ticker': ticker, 'b_price': last_price[ticker]} for ticker in touched],
+        )
+
+        db.session.execute(insert(Transaction.__table__), [{
+            'portfolio_id': portfolio_id, 'ticker_symbol': order['ticker'],
+            'type': TransactionType.SELL if order['side'] == 'sell' else TransactionType.BUY,
+            'quantity': Decimal(order['quantity']), 'price_per_share': Decimal(str(order['price'])),
+        } for order in accepted])
+
+        value_before = sum((held[ticker].value for ticker in touched if ticker in held), Decimal('0'))
+        value_after = Decimal('0')
+        for ticker in touched:
+            quantity_after = ((held[ticker].quantity if ticker in held else Decimal('0'))
+                              - sold.get(ticker, 0) + bought.get(ticker, (Decimal('0'),))[0])
+            value_after += quantity_after * last_price[ticker]
+        ValuationService.apply_trade(portfolio_id, value_before, value_after, -net_cost)
+        return results
+
+    @staticmethod
+    def _settle_orders(orders, results):
+        """
+        Cierra, en la misma transacción que la operación, las órdenes en espera del lote
+        (las que llevan 'order_id'): ejecutadas con su precio o rechazadas con el motivo.
+        """
+        settled = [{'b_id': order['order_id'],
+                    'b_status': OrderStatus.FILLED if accepted else OrderStatus.REJECTED,
+                    'b_price': Decimal(str(order['price'])) if accepted else None,
+                    'b_reason': msg}
+                   for order, (accepted, msg) in zip(orders, results) if order.get('order_id')]
+        if not settled:
+            return
+        orders_table = Order.__table__
+        result = db.session.execute(
+            update(orders_table)
+            .where(orders_table.c.id == bindparam('b_id'),
+                   # IN expandido no admite executemany
+                   or_(orders_table.c.status == OrderStatus.PENDING,
+                       orders_table.c.status == OrderStatus.TRIGGERED))
+            .values(status=bindparam('b_status'), fill_price=bindparam('b_price'),
+                    reject_reason=bindparam('b_reason'), closed_at=utcnow()),
+            settled,
+        )
+        if result.rowcount != len(settled):
+            # Otra transacción ya cerró alguna de estas órdenes: no se ejecuta dos veces
+            raise TradeError("Alguna de las órdenes ya se había procesado")
+
+    @staticmethod
+    def _buy(portfolio_id, ticker, quantity, price):
+        cost = quantity * price
+        portfolios = Portfolio.__table__
+        debited = db.session.execute(
+            update(portfolios)
+            .where(portfolios.c.id == portfolio_id, portfolios.c.cash_balance >= cost)
+            .values(cash_balance=portfolios.c.cash_balance - cost, version=portfolios.c.version + 1)
+        )
+        if debited.rowcount != 1:
+            raise InsufficientFundsError()
+
+        before = TradeService._holding_state(portfolio_id, ticker)
+        TradeService._upsert_holdings(portfolio_id, [(ticker, quantity, price)])
+        TradeService._record(portfolio_id, ticker, TransactionType.BUY, quantity, price)
+
+        value_before = before[2] if before else Decimal('0')
+        quantity_after = (before[0] if before else Decimal('0')) + quantity
+        ValuationService.apply_trade(portfolio_id, value_before, quantity_after * price, -cost)
+        return cost
+
+    @staticmethod
+    def _sell(portfolio_id, ticker, quantity, price):
+        proceeds = quantity * price
+        portfolios = Portfolio.__table__
+        holdings = Holding.__table__
+        db.session.execute(
+            update(portfolios)
+            .where(portfolios.c.id == portfolio_id)
+            .values(cash_balance=portfolios.c.cash_balance + proceeds, version=portfolios.c.version + 1)
+        )
+
+        before = TradeService._holding_state(portfolio_id, ticker)
+        now = utcnow()
+        remaining = holdings.c.quantity - quantity
+        debited = db.session.execute(
+            update(holdings)
+            .where(holdings.c.portfolio_id == portfolio_id, holdings.c.ticker_symbol == ticker,
+                   holdings.c.quantity >= quantity)
+            .values(quantity=remaining, last_price=price, market_value=remaining * price, priced_at=now)
+        )
+        if debited.rowcount != 1:
+            raise InsufficientSharesError()
+        db.session.execute(
+            delete(holdings)
+            .where(holdings.c.portfolio_id == portfolio_id, holdings.c.ticker_symbol == ticker,
+                   holdings.c.quantity <= 0)
+        )
+        TradeService._record(portfolio_id, ticker, TransactionType.SELL, quantity, price)
+
+        ValuationService.apply_trade(portfolio_id, before[2], (before[0] - quantity) * price, proceeds)
+        return proceeds
+
+    @staticmethod
+    def _holding_state(portfolio_id, ticker):
+        """(cantidad, precio medio, valor de mercado) de la posición, o None si no existe."""
+        return db.session.execute(
+            select(Holding.quantity, Holding.average_purchase_price,
+                   func.coalesce(Holding.market_value, Holding.quantity * Holding.average_purchase_price))
+            .where(Holding.portfolio_id == portfolio_id, Holding.ticker_symbol == ticker)
+        ).first()
+
+    @staticmethod
+    def _upsert_holdings(portfolio_id, purchases):
+        """
+        Crea las posiciones compradas o les suma la cantidad y recalcula el precio medio,
+        todo en una sentencia. `purchases` es una lista de (ticker, cantidad, precio) con
+        un solo elemento por ticker.
+        """
+        holdings = Holding.__table__
+        now = utcnow()
+        rows = [{'portfolio_id': portfolio_id, 'ticker_symbol': ticker, 'quantity': quantity,
+                 'average_purchase_price': price, 'last_price': price,
+                 'market_value': quantity * price, 'priced_at': now}
+                for ticker, quantity, price in purchases]
+
+        dialect_insert = insert_for_dialect()
+        if dialect_insert is not None:
+            stmt = dialect_insert(holdings).values(rows)
+            new = stmt.excluded
+            total_quantity = holdings.c.quantity + new.quantity
+            db.session.execute(stmt.on_conflict_do_update(
+                index_elements=['portfolio_id', 'ticker_symbol'],
+                set_={
+                    'average_purchase_price': (holdings.c.quantity * holdings.c.average_purchase_price
+                                               + new.quantity * new.average_purchase_price) / total_quantity,
+                    'quantity': total_quantity,
+                    'last_price': new.last_price,
+                    'market_value': total_quantity * new.last_price,
+                    'priced_at': new.priced_at,
+                },
+            ))
+            return
+
+        # Dialecto sin upsert: UPDATE y, si no existía, INSERT (con un reintento si otra
+        # transacción la crea a la vez)
+        for row in rows:
+            TradeService._upsert_holding_row(row)
+
+    @staticmethod
+    def _upsert_holding_row(row):
+        holdings = Holding.__table__
+        quantity, price = row['quantity'], row['last_price']
+        total_quantity = holdings.c.quantity + quantity
+        for _ in range(2):
+            updated = db.session.execute(
+                update(holdings)
+                .where(holdings.c.portfolio_id == row['portfolio_id'],
+                       holdings.c.ticker_symbol == row['ticker_symbol'])
+                .values(average_purchase_price=(holdings.c.quantity * holdings.c.average_purchase_price
+                                                + quantity * price) / total_quantity,
+                        quantity=total_quantity, last_price=price,
+                        market_value=total_quantity * price, priced_at=row['priced_at'])
+            )
+            if updated.rowcount:
+                return
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(insert(holdings).values(**row))
+                return
+            except IntegrityError:
+                continue
+        raise TradeError("No se pudo actualizar la posición")
+
+    @staticmethod
+    def _record(portfolio_id, ticker, type_, quantity, price):
+        db.session.execute(insert(Transaction.__table__).values(
+            portfolio_id=portfolio_id, ticker_symbol=ticker, type=type_,
+            quantity=quantity, price_per_share=price,
+        ))
@@ -0,0 +1,65 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import select, tuple_
+from app import db
+from app.models import Transaction
+
+
+class InvalidCursorError(ValueError):
+    """El cursor de paginación recibido no es válido."""
+
+
+class TransactionHistory:
+    """
+    Lectura paginada del historial de transacciones de una cartera.
+
+    Usa paginación por clave (keyset) sobre (`transaction_date`, `id`), de la más
+    reciente a la más antigua: cada página continúa justo detrás de la última fila
+    de la anterior con `WHERE (fecha, id) < (:fecha, :id)`, que el índice
+    `ix_transactions_portfolio_date_id` resuelve sin recorrer las filas ya servidas.
+    El coste de una página no depende de lo lejos que esté en el historial.
+    """
+
+    @staticmethod
+    def page(portfolio_id, limit, cursor=None, ticker=None, type_=None, start=None, end=None):
+        """
+        Devuelve (transacciones, cursor de la página siguiente o None). `start` y `end`
+        acotan `transaction_date` (inclusive y exclusivo, respectivamente).
+        """
+        query = select(Transaction).where(Transaction.portfolio_id == portfolio_id)
+        if ticker:
+            query = query.where(Transaction.ticker_symbol == ticker.upper())
+        if type_:
+            query = query.where(Transaction.type == type_)
+        if start:
+            query = query.where(Transaction.transaction_date >= start)
+        if end:
+            query = query.where(Transaction.transaction_date < end)
+        if cursor:
+            last_date, last_id = TransactionHistory.decode_cursor(cursor)
+            query = query.where(tuple_(Transaction.transaction_date, Transaction.id) < (last_date, last_id))
+
+        # Se pide una fila de más para saber si hay página siguiente sin un COUNT
+        rows = db.session.execute(
+            query.order_by(Transaction.transaction_date.desc(), Transaction.id.desc()).limit(limit + 1)
+        ).scalars().all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = TransactionHistory.encode_cursor(rows[-1])
+        return rows, next_cursor
+
+    @staticmethod
+    def encode_cursor(transaction):
+        payload = json.dumps([transaction.transaction_date.isoformat(), transaction.id])
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            last_date, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            return datetime.fromisoformat(last_date), int(last_id)
+        except (ValueError, TypeError) as e:
+            raise InvalidCursorError("Cursor de paginación no válido") from e
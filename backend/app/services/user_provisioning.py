@@ -0,0 +1,196 @@
+import csv
+import json
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from app import db
+from app.models import User, Portfolio
+from app.services.password_hasher import PasswordHasher
+
+
+class ProvisioningError(ValueError):
+    """El lote de usuarios no se puede procesar (formato o saldo inicial no válidos)."""
+
+
+def read_rows(stream, fmt):
+    """
+    Lee usuarios de un fichero de texto CSV (con cabecera) o NDJSON, fila a fila.
+    Genera (número de línea, dict o None, error o None).
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == 'ndjson':
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                yield line_number, None, "Invalid JSON"
+                continue
+            if not isinstance(row, dict):
+                yield line_number, None, "Each line must be a JSON object"
+                continue
+            yield line_number, row, None
+    else:
+        raise ProvisioningError(f"Formato desconocido: {fmt} (usa 'csv' o 'ndjson')")
+
+
+class UserProvisioning:
+    """
+    Alta masiva de usuarios (torneos, grupos de alumnos) leyendo el lote en streaming.
+
+    Las filas se procesan por bloques de `chunk_size`: la unicidad de nombre y email
+    se comprueba contra el propio lote (conjuntos en memoria) y contra la base de
+    datos con una consulta por bloque; las contraseñas se hashean en paralelo en un
+    pool de procesos propio (no el del login, ver `hash_executor`) y usuarios y carteras se insertan con un INSERT múltiple
+    por tabla y un commit por bloque. Una fila inválida se anota en el informe y no
+    detiene el resto del lote.
+    """
+    CHUNK_SIZE = 500
+    MAX_ROWS = 10000
+    HASH_WORKERS = 1
+
+    @classmethod
+    def init_app(cls, app):
+        cls.CHUNK_SIZE = app.config['PROVISIONING_CHUNK_SIZE']
+        cls.MAX_ROWS = app.config['PROVISIONING_MAX_ROWS']
+        cls.HASH_WORKERS = app.config['PROVISIONING_HASH_WORKERS']
+
+    @classmethod
+    def hash_executor(cls, workers=None):
+        """
+        Pool de procesos dedicado a un lote (`with UserProvisioning.hash_executor() as executor`),
+        de `PROVISIONING_HASH_WORKERS` procesos; con 0 las contraseñas se hashean en el hilo que llama.
+        """
+        workers = cls.HASH_WORKERS if workers is None else workers
+        if workers <= 0:
+            return nullcontext(None)
+        return ProcessPoolExecutor(max_workers=workers)
+
+    @classmethod
+    def run(cls, rows, cash_balance=None, chunk_size=None, max_rows=None, executor=None):
+        """
+        Da de alta las filas de `rows` (ver `read_rows`). `cash_balance` es el saldo
+        inicial de las carteras (el del modelo si es None). Devuelve el informe
+        {'created': n, 'failed': [{'line', 'username', 'error'}]}.
+        """
+        if cash_balance is not None:
+            try:
+                cash_balance = Decimal(str(cash_balance))
+            except InvalidOperation:
+                raise ProvisioningError("El saldo inicial debe ser un número")
+            if not cash_balance.is_finite():
+                raise ProvisioningError("El saldo inicial debe ser un número")
+            if cash_balance < 0:
+                raise ProvisioningError("El saldo inicial no puede ser negativo")
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        max_rows = max_rows or cls.MAX_ROWS
+
+        report = {'created': 0, 'failed': []}
+        seen_usernames, seen_emails = set(), set()
+        chunk = []
+        for count, (line_number, row, error) in enumerate(rows, 1):
+            if count > max_rows:
+                # Los bloques anteriores ya están guardados: se informa y se deja de leer
+                report['failed'].append({'line': line_number, 'username': None,
+                                         'error': f"Row limit ({max_rows}) reached, remaining rows not processed"})
+                break
+            username = str((row or {}).get('username') or '').strip()
+            if error is None:
+                error = cls._validate(row)
+            if error is None:
+                email = str(row['email']).strip()
+                if username in seen_usernames:
+                    error = "Username duplicated in batch"
+                elif email in seen_emails:
+                    error = "Email duplicated in batch"
+                else:
+                    seen_usernames.add(username)
+                    seen_emails.add(email)
+                    chunk.append({'line': line_number, 'username': username, 'email': email,
+                                  'password': str(row['password'])})
+            if error is not None:
+                report['failed'].append({'line': line_number, 'username': username or None, 'error': error})
+            if len(chunk) >= chunk_size:
+                cls._provision_chunk(chunk, cash_balance, report, executor)
+                chunk = []
+        if chunk:
+            cls._provision_chunk(chunk, cash_balance, report, executor)
+        report['failed'].sort(key=lambda failure: failure['line'])
+        return report
+
+    @staticmethod
+    def _validate(row):
+        if not row.get('username') or not row.get('email') or not row.get('password'):
+            return "Missing required fields"
+        if len(str(row['username']).strip()) > 50:
+            return "Username too long"
+        if PasswordHasher.too_long(str(row['password'])):
+            return f"Password too long (max {PasswordHasher.MAX_BYTES} bytes)"
+        email = str(row['email']).strip()
+        if len(email) > 255 or '@' not in email:
+            return "Invalid email"
+        return None
+
+    @classmethod
+    def _provision_chunk(cls, chunk, cash_balance, report, executor):
+        usernames = [entry['username'] for entry in chunk]
+        emails = [entry['email'] for entry in chunk]
+        taken = db.session.execute(
+            select(User.username, User.email).where(or_(User.username.in_(usernames), User.email.in_(emails)))
+        ).all()
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+
+        valid = []
+        for entry in chunk:
+            if entry['username'] in taken_usernames:
+                report['failed'].append({'line': entry['line'], 'username': entry['username'],
+                                         'error': "Username already exists"})
+            elif entry['email'] in taken_emails:
+                report['failed'].append({'line': entry['line'], 'username': entry['username'],
+                                         'error': "Email already exists"})
+            else:
+                valid.append(entry)
+        if not valid:
+            return
+
+        hashes = PasswordHasher.hash_many([entry.pop('password') for entry in valid], executor)
+        for entry, password_hash in zip(valid, hashes):
+            entry['password_hash'] = password_hash
+        try:
+            cls._insert(valid, cash_balance)
+            db.session.commit()
+            report['created'] += len(valid)
+        except IntegrityError:
+            # Alguien ha registrado uno de estos usuarios entre la comprobación y el
+            # INSERT: se repite el bloque fila a fila para aislar las que chocan
+            db.session.rollback()
+            for entry in valid:
+                try:
+                    cls._insert([entry], cash_balance)
+                    db.session.commit()
+                    report['created'] += 1
+                except IntegrityError:
+                    db.session.rollback()
+                    report['failed'].append({'line': entry['line'], 'username': entry['username'],
+                                             'error': "Username or email already exists"})
+
+    @staticmethod
+    def _insert(entries, cash_balance):
+        users = User.__table__
+        created = db.session.execute(
+            insert(users).returning(users.c.id, sort_by_parameter_order=True),
+            [{'username': entry['username'], 'email': entry['email'], 'password_hash': entry['password_hash']}
+             for entry in entries],
+        ).scalars().all()
+        portfolios = [{'user_id': user_id} for user_id in created]
+        if cash_balance is not None:
+            for portfolio in portfolios:
+                portfolio['cash_balance'] = cash_balance
+        db.session.execute(insert(Portfolio.__table__), portfolios)
@@ -0,0 +1,180 @@
+from datetime import timedelta
+from decimal import Decimal
+from sqlalchemy import bindparam, case, func, insert, literal, select, update
+from app import db
+from app.models import Portfolio, Holding, PortfolioValuation, utcnow
+
+
+class ValuationService:
+    """
+    Mantiene el modelo de lectura de las carteras: el valor de mercado de cada
+    posición (columnas `last_price`, `market_value` y `priced_at` de `holdings`) y la
+    valoración total de cada cartera (`portfolio_valuations`).
+
+    - Las operaciones de compra/venta (ver `TradeService`) revalorizan su posición al
+      precio de la operación y aplican a la cartera solo la diferencia.
+    - Los ticks de precios de la ingesta revalorizan en bloque todas las posiciones del
+      ticker y recalculan, con una sentencia, las carteras afectadas.
+    - Una lectura con precios caducados solo revaloriza la cartera de quien lee
+      (`reprice_portfolio`), sin escribir en las posiciones de otros usuarios.
+    Ningún método hace commit. Las carteras y tickers revalorizados se apuntan en
+    `db.session.info` (ver `mark_changed`) para que la clasificación de las ligas
+    (`Leaderboard`) se actualice al hacer commit.
+    """
+
+    @staticmethod
+    def read(user_id):
+        """
+        Lee la cartera de un usuario con su valoración y sus posiciones.
+        Devuelve (cartera, valoración o None, posiciones).
+        """
+        row = db.session.execute(
+            select(Portfolio, PortfolioValuation)
+            .outerjoin(PortfolioValuation, PortfolioValuation.portfolio_id == Portfolio.id)
+            .where(Portfolio.user_id == user_id)
+        ).first()
+        if row is None:
+            return None, None, []
+        portfolio, valuation = row
+        holdings = db.session.execute(
+            select(Holding).where(Holding.portfolio_id == portfolio.id).order_by(Holding.ticker_symbol)
+        ).scalars().all()
+        return portfolio, valuation, holdings
+
+    @staticmethod
+    def is_stale(valuation, max_age):
+        """Indica si la valoración no existe o sus precios tienen más de `max_age` segundos."""
+        if valuation is None or valuation.priced_at is None:
+            return True
+        return valuation.priced_at.replace(tzinfo=None) < utcnow() - timedelta(seconds=max_age)
+
+    @staticmethod
+    def holding_value(holding):
+        """Valor de mercado guardado de una posición; sin precio aplicado, a precio de compra."""
+        if holding.market_value is not None:
+            return holding.market_value
+        return holding.quantity * holding.average_purchase_price
+
+    @staticmethod
+    def apply_trade(portfolio_id, value_before, value_after, cash_delta):
+        """
+        Actualiza la valoración tras una compra o venta sumando solo la diferencia del
+        valor de la posición operada (antes y después, al precio de la operación) y el
+        movimiento de caja.
+        """
+        delta = value_after - value_before
+        ValuationService.mark_changed(portfolio_ids=[portfolio_id])
+        result = db.session.execute(
+            update(PortfolioValuation)
+            .where(PortfolioValuation.portfolio_id == portfolio_id)
+            .values(holdings_value=PortfolioValuation.holdings_value + delta,
+                    total_value=PortfolioValuation.total_value + delta + cash_delta,
+                    updated_at=utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        if result.rowcount == 0:
+            # Cartera sin valoración todavía: se construye desde cero
+            ValuationService.recompute([portfolio_id])
+
+    @staticmethod
+    def apply_prices(quotes):
+        """
+        Aplica un tick de precios ({símbolo: cotización}) a todas las posiciones de esos
+        tickers con una sola sentencia UPDATE y recalcula las carteras afectadas.
+        Devuelve el número de tickers aplicados.
+        """
+        now = utcnow()
+        params = [{'b_symbol': symbol, 'b_price': Decimal(str(quote['price']))}
+                  for symbol, quote in quotes.items() if quote and quote.get('price') is not None]
+        if not params:
+            return 0
+
+        ValuationService.mark_changed(tickers=[param['b_symbol'] for param in params])
+        holdings = Holding.__table__
+        db.session.execute(
+            update(holdings)
+            .where(holdings.c.ticker_symbol == bindparam('b_symbol'))
+            .values(last_price=bindparam('b_price'),
+                    market_value=holdings.c.quantity * bindparam('b_price'),
+                    priced_at=now),
+            params,
+        )
+        affected = select(Holding.portfolio_id).where(
+            Holding.ticker_symbol.in_([param['b_symbol'] for param in params]))
+        ValuationService.recompute(affected)
+        return len(params)
+
+    @staticmethod
+    def reprice_portfolio(portfolio_id, quotes):
+        """
+        Aplica las cotizaciones ({símbolo: cotización}) solo a las posiciones de una
+        cartera y la recalcula. Las posiciones sin cotización conservan su precio pero
+        se marcan como revisadas ahora (`priced_at`), para que la cartera no se vuelva
+        a considerar caducada en cada lectura hasta pasado `VALUATION_MAX_AGE`.
+        """
+        prices = {symbol: Decimal(str(quote['price'])) for symbol, quote in quotes.items()
+                  if quote and quote.get('price') is not None}
+        holdings = Holding.__table__
+        values = {'priced_at': utcnow()}
+        if prices:
+            price = case(prices, value=holdings.c.ticker_symbol, else_=holdings.c.last_price)
+            values.update(last_price=price,
+                          market_value=case((holdings.c.ticker_symbol.in_(list(prices)), holdings.c.quantity * price),
+                                            else_=holdings.c.market_value))
+        db.session.execute(update(holdings).where(holdings.c.portfolio_id == portfolio_id).values(**values))
+        ValuationService.recompute([portfolio_id])
+
+    @staticmethod
+    def recompute(portfolio_ids):
+        """
+        Recalcula por completo la valoración de las carteras indicadas (lista de ids o
+        subconsulta) a partir de sus posiciones, creando las que falten.
+        """
+        now = utcnow()
+        if isinstance(portfolio_ids, (list, tuple, set)):
+            ValuationService.mark_changed(portfolio_ids=portfolio_ids)
+        valuations = PortfolioValuation.__table__
+        missing = select(Portfolio.id, literal(0), Portfolio.cash_balance, literal(now)).where(
+            Portfolio.id.in_(portfolio_ids),
+            ~select(PortfolioValuation.portfolio_id)
+            .where(PortfolioValuation.portfolio_id == Portfolio.id).exists(),
+        )
+        db.session.execute(
+            insert(valuations).from_select(['portfolio_id', 'holdings_value', 'total_value', 'updated_at'], missing)
+        )
+
+        holdings_value = (
+            select(func.coalesce(func.sum(func.coalesce(
+                Holding.market_value, Holding.quantity * Holding.average_purchase_price)), 0))
+            .where(Holding.portfolio_id == valuations.c.portfolio_id)
+            .scalar_subquery()
+        )
+        cash = select(Portfolio.cash_balance).where(Portfolio.id == valuations.c.portfolio_id).scalar_subquery()
+        oldest_price = (
+            select(func.coalesce(func.min(Holding.priced_at), now))
+            .where(Holding.portfolio_id == valuations.c.portfolio_id)
+            .scalar_subquery()
+        )
+        db.session.execute(
+            update(valuations)
+            .where(valuations.c.portfolio_id.in_(portfolio_ids))
+            .values(holdings_value=holdings_value, total_value=cash + holdings_value,
+                    priced_at=oldest_price, updated_at=now)
+        )
+
+    @staticmethod
+    def revalued(tickers):
+        """(cartera, valor total, capital inicial) de las carteras con alguno de esos tickers."""
+        return db.session.execute(
+            select(PortfolioValuation.portfolio_id, PortfolioValuation.total_value, Portfolio.starting_cash)
+            .join(Portfolio, Portfolio.id == PortfolioValuation.portfolio_id)
+            .where(PortfolioValuation.portfolio_id.in_(
+                select(Holding.portfolio_id).where(Holding.ticker_symbol.in_(tickers))))
+        ).all()
+
+    @staticmethod
+    def mark_changed(portfolio_ids=(), tickers=()):
+        """Apunta en la sesión las carteras (o las carteras con esos tickers) cuyo valor ha cambiado."""
+        changed = db.session.info.setdefault('valuations_changed', {'portfolios': set(), 'tickers': set()})
+        changed['portfolios'].update(portfolio_ids)
+        changed['tickers'].update(tickers)
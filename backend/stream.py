@@ -0,0 +1,11 @@
+# Proceso `stream` del Procfile: sirve /api/market/stream con workers de gevent, donde
+# cada stream abierto es una greenlet y no un hilo, así que los streams inactivos casi
+# no cuestan nada ni ocupan los hilos del proceso `web`.
+from psycogreen.gevent import patch_psycopg
+
+# psycopg2 no coopera con gevent por sí solo: sin esto, cada consulta bloquearía el worker
+patch_psycopg()
+
+from app import create_app  # noqa: E402
+
+app = create_app()
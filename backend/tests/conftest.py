@@ -1,8 +1,10 @@
 import pytest
 from decimal import Decimal
+from flask_jwt_extended import create_access_token
 from app import create_app, db
+from app.config import TestConfig
 from app.models import User, Portfolio
-from werkzeug.security import generate_password_hash
+from app.services.password_hasher import PasswordHasher
 
 @pytest.fixture(scope='function')
 def test_app():
@@ -10,13 +12,9 @@ def test_app():
     Crea y configura una nueva instancia de la aplicación para los tests.
     Se ejecuta una vez por cada función de test.
     """
-    app = create_app()
-    app.config.update({
-        "TESTING": True,
-        # Usa una base de datos SQLite en memoria para los tests
-        "SQLALCHEMY_DATABASE_URI": "sqlite:///:memory:",
-        "JWT_SECRET_KEY": "test-secret-key-for-testing"
-    })
+    # La configuración de test (SQLite en memoria, hashes baratos) se aplica al crear la
+    # app: cambiarla después no afecta a las extensiones ya inicializadas
+    app = create_app(TestConfig)
 
     with app.app_context():
         db.create_all()
@@ -36,12 +34,11 @@ def test_user(test_app):
     Esto asegura que cada test comience con un estado limpio.
     """
     with test_app.app_context():
-        # Se genera el hash de la contraseña directamente para evitar
-        # posibles problemas con el método set_password en ciertos entornos.
-        user = User( 
+        # El hash se genera con el mismo servicio que usa el login (bcrypt)
+        user = User(
             username='testuser',
             email='test@example.com',
-            password_hash=generate_password_hash('password123')
+            password_hash=PasswordHasher.hash('password123')
         )
         # Se crea y asigna el portafolio explícitamente para asegurar que existe
         # antes de que los tests lo usen.
@@ -49,4 +46,21 @@ def test_user(test_app):
         db.session.add(user)
         db.session.commit()
 
-        yield user
\ No newline at end of file
+        yield user
+
+@pytest.fixture
+def auth_headers(test_app):
+    """Cabeceras con un token de acceso para un usuario: `client.get(..., headers=auth_headers(user.id))`."""
+    def headers(user_id):
+        access_token = create_access_token(identity=str(user_id))
+        return {'Authorization': f'Bearer {access_token}'}
+    return headers
+
+@pytest.fixture
+def query_budget():
+    """
+    Limita las consultas SQL de un bloque: `with query_budget(5): client.get(...)`.
+    El test falla (mostrando las sentencias) si el bloque ejecuta más de las indicadas.
+    """
+    from app.services.query_stats import QueryStats
+    return QueryStats.budget
@@ -0,0 +1,148 @@
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+
+from app import db
+from app.models import Holding, Transaction, TransactionType, utcnow
+from app.services.analytics import PortfolioAnalytics, DAY
+from app.services.market_service import MarketService
+from app.services.trade_service import TradeService
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    PortfolioAnalytics.clear()
+    yield
+    PortfolioAnalytics.clear()
+
+
+def days_ago(days):
+    return datetime.combine(utcnow().date() - timedelta(days=days), time(15, 0))
+
+
+def fake_closes(series):
+    """Sustituye el histórico: {ticker: {días atrás: cierre}}."""
+    def closes(ticker, start=None, end=None):
+        bars = sorted((int(days_ago(ago).timestamp()) // DAY * DAY, close)
+                      for ago, close in series.get(ticker, {}).items())
+        bars = [(t, c) for t, c in bars if (start is None or t >= start) and (end is None or t <= end)]
+        return (np.array([t for t, _ in bars], dtype=np.int64), np.array([c for _, c in bars], dtype=np.float64))
+    return closes
+
+
+def record(portfolio_id, ticker, type_, quantity, price, moment):
+    db.session.add(Transaction(portfolio_id=portfolio_id, ticker_symbol=ticker, type=type_,
+                               quantity=Decimal(quantity), price_per_share=Decimal(price),
+                               transaction_date=moment))
+
+
+def hold(portfolio_id, ticker, quantity, last_price):
+    db.session.add(Holding(portfolio_id=portfolio_id, ticker_symbol=ticker, quantity=Decimal(quantity),
+                           average_purchase_price=Decimal('100'), last_price=Decimal(last_price)))
+
+
+def test_analytics_replays_ledger_against_daily_closes(client, test_user, auth_headers):
+    """
+    GIVEN una compra de 10 AAPL a 100 hace 3 días, cierres de 110 y 99 y un precio actual de 121.
+    WHEN se piden las métricas de la cartera.
+    THEN TWR, máxima caída, volatilidad y Sharpe salen de la serie diaria 0%, +10%, -10%, +22,2%.
+    """
+    portfolio_id = test_user.portfolio.id
+    record(portfolio_id, 'AAPL', TransactionType.BUY, '10', '100', days_ago(3))
+    hold(portfolio_id, 'AAPL', '10', '121')
+    db.session.commit()
+
+    with patch.object(MarketService, 'get_daily_closes',
+                      side_effect=fake_closes({'AAPL': {3: 100.0, 2: 110.0, 1: 99.0}})):
+        response = client.get('/api/portfolio/analytics', headers=auth_headers(test_user.id))
+    data = response.get_json()
+
+    returns = np.array([0.0, 0.1, -0.1, 121 / 99 - 1])
+    assert response.status_code == 200
+    assert data['days'] == 4
+    assert data['twr'] == pytest.approx(0.21, abs=1e-6)
+    assert data['max_drawdown'] == pytest.approx(-0.1, abs=1e-6)
+    assert data['volatility'] == pytest.approx(returns.std(ddof=1) * np.sqrt(252), abs=1e-5)
+    assert data['sharpe_ratio'] == pytest.approx(returns.mean() / returns.std(ddof=1) * np.sqrt(252), abs=1e-5)
+    assert data['invested_value'] == 1210.0
+
+
+def test_money_weighted_return_penalises_buying_high(test_app, test_user):
+    """
+    GIVEN una compra a 100, otra mayor a 200 al día siguiente y una vuelta del precio a 100.
+    WHEN se calculan las métricas.
+    THEN la TWR es nula (el precio acaba donde empezó) pero la MWR es negativa.
+    """
+    portfolio_id = test_user.portfolio.id
+    record(portfolio_id, 'AAPL', TransactionType.BUY, '10', '100', days_ago(2))
+    record(portfolio_id, 'AAPL', TransactionType.BUY, '10', '200', days_ago(1))
+    hold(portfolio_id, 'AAPL', '20', '100')
+    db.session.commit()
+
+    with patch.object(MarketService, 'get_daily_closes',
+                      side_effect=fake_closes({'AAPL': {2: 100.0, 1: 200.0}})):
+        metrics = PortfolioAnalytics.get(portfolio_id)
+
+    assert metrics['twr'] == pytest.approx(0.0, abs=1e-9)
+    # TIR diaria r con -1000 - 2000/(1+r) + 2000/(1+r)^2 = 0, acumulada en los 2 días
+    assert metrics['mwr'] == pytest.approx(4 / (1 + 3 ** 0.5) ** 2 - 1, abs=1e-6)
+    assert metrics['mwr_annualized'] is None
+
+
+def test_analytics_cache_is_reused_and_extended_incrementally(test_app, test_user):
+    """
+    GIVEN unas métricas ya calculadas.
+    WHEN se vuelven a pedir, y después tras una operación nueva.
+    THEN la segunda lectura sale de la caché; tras operar se recalcula solo el día en curso.
+    """
+    portfolio_id = test_user.portfolio.id
+    record(portfolio_id, 'AAPL', TransactionType.BUY, '10', '100', days_ago(30))
+    hold(portfolio_id, 'AAPL', '10', '100')
+    db.session.commit()
+
+    with patch.object(MarketService, 'get_daily_closes',
+                      side_effect=fake_closes({'AAPL': {ago: 100.0 + ago for ago in range(1, 31)}})) as closes:
+        first = PortfolioAnalytics.get(portfolio_id)
+        assert first['cached'] is False
+
+        calls = closes.call_count
+        assert PortfolioAnalytics.get(portfolio_id)['cached'] is True
+        assert closes.call_count == calls
+
+        TradeService.buy(portfolio_id, 'MSFT', 1, 50)
+        after_trade = PortfolioAnalytics.get(portfolio_id)
+
+    assert after_trade['cached'] is False
+    today = int(np.datetime64(utcnow().date(), 'D').astype(np.int64))
+    # Tras operar solo se leen los cierres de hoy: la historia ya reconstruida no se repite
+    assert all(call.args[1] >= today * DAY for call in closes.call_args_list[calls:])
+    assert after_trade['days'] == first['days']
+
+
+def test_late_close_replaces_the_carried_price(test_app, test_user):
+    """
+    GIVEN una compra de AAPL hace 3 días y un histórico al que aún le falta el cierre de ayer.
+    WHEN se piden las métricas, llega el cierre que faltaba y se vuelven a pedir.
+    THEN el segundo cálculo usa el cierre real de ayer, igual que una reconstrucción desde cero.
+    """
+    portfolio_id = test_user.portfolio.id
+    record(portfolio_id, 'AAPL', TransactionType.BUY, '10', '100', days_ago(3))
+    hold(portfolio_id, 'AAPL', '10', '121')
+    db.session.commit()
+
+    with patch.object(MarketService, 'get_daily_closes',
+                      side_effect=fake_closes({'AAPL': {3: 100.0, 2: 110.0}})):
+        PortfolioAnalytics.get(portfolio_id)
+
+    complete = fake_closes({'AAPL': {3: 100.0, 2: 110.0, 1: 99.0}})
+    with patch.object(MarketService, 'get_daily_closes', side_effect=complete):
+        PortfolioAnalytics.invalidate(portfolio_id)
+        after_late_close = PortfolioAnalytics.get(portfolio_id)
+        PortfolioAnalytics.clear()
+        from_scratch = PortfolioAnalytics.get(portfolio_id)
+
+    assert after_late_close == from_scratch
+    assert after_late_close['max_drawdown'] == pytest.approx(-0.1, abs=1e-6)
@@ -0,0 +1,112 @@
+import threading
+import time
+from unittest.mock import patch
+
+
+from app.services.async_quotes import AsyncQuoteEngine
+from app.services.market_service import MarketService
+
+
+# --- Tests para AsyncQuoteEngine ---
+
+def test_engine_fans_out_chunks_with_bounded_concurrency():
+    """
+    GIVEN un motor con bloques de 2 tickers y concurrencia 2.
+    WHEN se piden 8 tickers.
+    THEN se lanzan 4 bloques, nunca más de 2 a la vez.
+    """
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def fetch_chunk(chunk):
+        with lock:
+            active.append(1)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.pop()
+        return {symbol: {'symbol': symbol} for symbol in chunk}
+
+    engine = AsyncQuoteEngine(fetch_chunk, unavailable=object(), concurrency=2, chunk_size=2)
+    quotes, errors = engine.run([f'T{i}' for i in range(8)])
+
+    assert len(quotes) == 8
+    assert errors == {}
+    assert max(peak) == 2
+
+
+def test_engine_returns_partial_results_with_per_symbol_errors():
+    """
+    GIVEN un bloque que tarda demasiado y tickers desconocidos.
+    WHEN se piden todos a la vez.
+    THEN se devuelven los que se obtuvieron y un error por cada uno de los demás.
+    """
+    unavailable = object()
+
+    def fetch_chunk(chunk):
+        if 'SLOW' in chunk:
+            time.sleep(0.5)
+        return {'AAPL': {'symbol': 'AAPL'}, 'NOPE': None, 'DOWN': unavailable}
+
+    engine = AsyncQuoteEngine(fetch_chunk, unavailable=unavailable, chunk_size=3, timeout=0.1)
+    started = time.monotonic()
+    quotes, errors = engine.run(['AAPL', 'NOPE', 'DOWN', 'SLOW'])
+
+    assert time.monotonic() - started < 0.4
+    assert list(quotes) == ['AAPL']
+    assert errors == {'NOPE': 'not_found', 'DOWN': 'unavailable', 'SLOW': 'timeout'}
+
+
+def test_init_app_releases_what_the_previous_call_set_up(test_app):
+    """
+    GIVEN una aplicación ya configurada con su motor de cotizaciones y su hub del stream.
+    WHEN se vuelve a llamar a init_app.
+    THEN se cierran el pool de hilos del motor y el hub anteriores, y el hook de la
+         demanda de precios sigue registrado una sola vez.
+    """
+    previous, previous_stream = MarketService._engine, MarketService._stream
+    MarketService.init_app(test_app)
+
+    assert MarketService._engine is not previous
+    assert previous._executor._shutdown
+    assert not MarketService._engine._executor._shutdown
+    assert previous_stream._stopped.is_set()
+    assert not MarketService._stream._stopped.is_set()
+    assert test_app.after_request_funcs[None].count(MarketService._flush_price_demand) == 1
+
+
+# --- Tests para el endpoint /api/market/quotes ---
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_multi_quote_endpoint(mock_fetch, client, test_user, auth_headers):
+    """
+    GIVEN un usuario autenticado con una lista de seguimiento.
+    WHEN pide varias cotizaciones en una sola petición.
+    THEN recibe las encontradas y un error por los tickers desconocidos.
+    """
+    MarketService._cache.set('AAPL', {'symbol': 'AAPL', 'price': 150.0})
+    mock_fetch.side_effect = lambda symbols: {s: {'symbol': s, 'price': 10.0} for s in symbols if s != 'XXXX'}
+
+    response = client.get('/api/market/quotes?symbols=aapl,MSFT, xxxx,MSFT', headers=auth_headers(test_user.id))
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert set(data['quotes']) == {'AAPL', 'MSFT'}
+    assert data['errors'] == {'XXXX': 'not_found'}
+    # AAPL sale de la caché: solo se consultan los que faltan
+    fetched = sorted(symbol for call in mock_fetch.call_args_list for symbol in call.args[0])
+    assert fetched == ['MSFT', 'XXXX']
+
+
+def test_multi_quote_endpoint_validates_symbols(client, test_user, auth_headers):
+    """
+    GIVEN un usuario autenticado.
+    WHEN no indica tickers o indica demasiados.
+    THEN se devuelve un error 400.
+    """
+    headers = auth_headers(test_user.id)
+    assert client.get('/api/market/quotes', headers=headers).status_code == 400
+
+    too_many = ','.join(f'T{i}' for i in range(51))
+    assert client.get(f'/api/market/quotes?symbols={too_many}', headers=headers).status_code == 400
@@ -1,4 +1,11 @@
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from werkzeug.security import generate_password_hash
+from app import db
+from app.models import User, Portfolio
+from app.services.password_hasher import PasswordHasher, HasherBusyError
 #
 def test_register_success(client):
     """
@@ -67,4 +74,114 @@ def test_login_success(client):
     
     data = json.loads(response.data)
     assert response.status_code == 200
-    assert 'access_token' in data
\ No newline at end of file
+    assert 'access_token' in data
+
+def add_user(password_hash):
+    user = User(username='legacy', email='legacy@example.com', password_hash=password_hash)
+    user.portfolio = Portfolio()
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+def login(client, email='legacy@example.com', password='password123'):
+    return client.post('/api/auth/login', json={'email': email, 'password': password})
+
+def test_login_migrates_legacy_werkzeug_hash(client):
+    """
+    GIVEN un usuario con un hash antiguo de werkzeug (pbkdf2)
+    WHEN inicia sesión con la contraseña correcta
+    THEN entra y su hash se reemplaza por uno de bcrypt con el coste configurado
+    """
+    user = add_user(generate_password_hash('password123', method='pbkdf2:sha256:1000'))
+
+    assert login(client, password='wrong').status_code == 401
+    assert login(client).status_code == 200
+    db.session.refresh(user)
+    assert user.password_hash.startswith('$2b$04$')
+    assert login(client).status_code == 200
+
+def test_passwords_longer_than_bcrypt_allows_are_rejected(client):
+    """
+    GIVEN una contraseña de 100 bytes (bcrypt admite como mucho 72)
+    WHEN se intenta registrar con ella o iniciar sesión con ella
+    THEN el registro devuelve 400 y el inicio de sesión 401, en lugar de un error 500
+    """
+    add_user(PasswordHasher.hash('password123'))
+    too_long = 'ñ' * 50
+
+    response = client.post('/api/auth/register',
+                           json={'username': 'long', 'email': 'long@example.com', 'password': too_long})
+    assert response.status_code == 400
+    assert b"Password too long" in response.data
+    assert login(client, password=too_long).status_code == 401
+
+def test_login_rehashes_when_cost_changes(client):
+    """
+    GIVEN un usuario con un hash de bcrypt de coste 5 y la app configurada con coste 4
+    WHEN inicia sesión
+    THEN el hash se rehace con el coste actual y los siguientes inicios de sesión no lo tocan
+    """
+    PasswordHasher.ROUNDS = 5
+    user = add_user(PasswordHasher.hash('password123'))
+    PasswordHasher.ROUNDS = 4
+
+    assert login(client).status_code == 200
+    db.session.refresh(user)
+    rehashed = user.password_hash
+    assert rehashed.startswith('$2b$04$')
+    assert login(client).status_code == 200
+    db.session.refresh(user)
+    assert user.password_hash == rehashed
+
+def test_login_returns_503_when_hasher_is_saturated(client, monkeypatch):
+    """
+    GIVEN todos los huecos del servicio de hash ocupados
+    WHEN llega un inicio de sesión
+    THEN se responde 503 con Retry-After en lugar de esperar
+    """
+    add_user(PasswordHasher.hash('password123'))
+    monkeypatch.setattr(PasswordHasher, '_slots', threading.BoundedSemaphore(1))
+    PasswordHasher._slots.acquire()
+
+    response = login(client)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+def test_hashes_run_in_process_pool(test_app, monkeypatch):
+    """
+    GIVEN el servicio de hash con un pool de un proceso
+    WHEN se genera y verifica un hash
+    THEN el resultado es el mismo que en el hilo de la petición
+    """
+    monkeypatch.setattr(PasswordHasher, 'WORKERS', 1)
+    try:
+        hashed = PasswordHasher.hash('password123')
+        assert PasswordHasher._executor is not None
+        assert PasswordHasher.verify(hashed, 'password123')
+        assert not PasswordHasher.verify(hashed, 'other')
+    finally:
+        PasswordHasher.shutdown()
+
+def test_timed_out_hash_keeps_its_slot_until_it_finishes(test_app, monkeypatch):
+    """
+    GIVEN un pool de un hilo ocupado por un hash que supera el tiempo de espera
+    WHEN la petición recibe el error
+    THEN el hueco sigue ocupado hasta que el trabajo termina y la cola no crece
+    """
+    release = threading.Event()
+    executor = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(PasswordHasher, '_get_executor', classmethod(lambda cls: executor))
+    monkeypatch.setattr(PasswordHasher, '_slots', threading.BoundedSemaphore(1))
+    monkeypatch.setattr(PasswordHasher, 'TIMEOUT', 0.05)
+    try:
+        with pytest.raises(HasherBusyError):
+            PasswordHasher._run(release.wait)
+        with pytest.raises(HasherBusyError, match="Demasiadas"):
+            PasswordHasher._run(release.wait)
+
+        release.set()
+        executor.submit(lambda: None).result()
+        assert PasswordHasher._run(lambda: 'ok') == 'ok'
+    finally:
+        release.set()
+        executor.shutdown()
@@ -0,0 +1,119 @@
+import time
+
+import pytest
+
+from app.services.cache_backends import (
+    CacheEntry, MemoryCacheBackend, SQLiteCacheBackend, RedisCacheBackend, build_cache_backend
+)
+from app.services.quote_cache import QuoteCache, CacheLookup
+
+
+# --- Tests para los backends de la caché ---
+
+def test_sqlite_backend_is_shared_between_workers(tmp_path):
+    """
+    GIVEN dos cachés (dos workers) apuntando al mismo fichero SQLite.
+    WHEN una de ellas guarda una cotización.
+    THEN la otra la ve como fresca sin llamar al proveedor.
+    """
+    path = str(tmp_path / 'quotes.db')
+    worker_a = QuoteCache(backend=SQLiteCacheBackend(path))
+    worker_b = QuoteCache(backend=SQLiteCacheBackend(path))
+
+    worker_a.set('AAPL', {'symbol': 'AAPL', 'price': 150.0})
+    result = worker_b.lookup('AAPL')
+
+    assert result.state == CacheLookup.FRESH
+    assert result.value == {'symbol': 'AAPL', 'price': 150.0}
+
+    worker_b.invalidate('AAPL')
+    assert worker_a.lookup('AAPL').state == CacheLookup.MISS
+
+
+def test_sqlite_backend_prunes_expired_and_excess_entries(tmp_path):
+    """
+    GIVEN un backend SQLite limitado a 2 entradas.
+    WHEN se guardan varias entradas, una de ellas ya expirada, y se poda.
+    THEN solo quedan las 2 más recientes vigentes.
+    """
+    now = [1000.0]
+    backend = SQLiteCacheBackend(str(tmp_path / 'quotes.db'), max_entries=2, clock=lambda: now[0])
+    backend.set('OLD', CacheEntry({'price': 1}, 0, 0), expire_at=999)
+    for i, key in enumerate(['A', 'B', 'C']):
+        now[0] += 1
+        backend.set(key, CacheEntry({'price': i}, 0, 0), expire_at=5000)
+
+    backend.prune()
+
+    assert backend.stats()['entries'] == 2
+    assert 'A' not in backend
+    assert 'C' in backend
+
+
+def test_redis_backend_against_local_stand_in():
+    """
+    GIVEN un backend Redis contra un servidor local simulado (fakeredis).
+    WHEN se guarda una cotización con expiración.
+    THEN se puede leer desde otra caché, el servidor aplica el TTL y las estadísticas
+         no recorren las claves.
+    """
+    fakeredis = pytest.importorskip('fakeredis')
+    server = fakeredis.FakeServer()
+    worker_a = QuoteCache(backend=RedisCacheBackend(client=fakeredis.FakeRedis(server=server)))
+    worker_b = QuoteCache(backend=RedisCacheBackend(client=fakeredis.FakeRedis(server=server)))
+
+    worker_a.set('MSFT', {'symbol': 'MSFT', 'price': 300.0})
+
+    assert worker_b.get('MSFT') == {'symbol': 'MSFT', 'price': 300.0}
+    assert worker_b.backend.client.pttl('kran:quote:MSFT') > 0
+    worker_b.clear()
+    assert 'MSFT' not in worker_a.backend
+
+    worker_a.backend.client.scan_iter = None  # Cualquier SCAN haría fallar las estadísticas
+    assert worker_a.stats()['entries'] is None
+
+
+@pytest.mark.parametrize('kind', ['sqlite', 'redis'])
+def test_expired_lock_is_not_released_by_its_previous_owner(tmp_path, kind):
+    """
+    GIVEN un worker cuyo candado ha caducado y que ya tiene otro worker.
+    WHEN el primero termina tarde y libera su candado.
+    THEN el candado del segundo sigue en pie y nadie más puede tomarlo.
+    """
+    if kind == 'redis':
+        fakeredis = pytest.importorskip('fakeredis')
+        pytest.importorskip('lupa')  # fakeredis solo ejecuta Lua (EVAL) con lupa instalado
+        server = fakeredis.FakeServer()
+        slow, fast, third = (RedisCacheBackend(client=fakeredis.FakeRedis(server=server)) for _ in range(3))
+    else:
+        path = str(tmp_path / 'quotes.db')
+        slow, fast, third = (SQLiteCacheBackend(path) for _ in range(3))
+
+    slow_token = slow.acquire_lock('AAPL', ttl=0.05)
+    assert slow_token
+    time.sleep(0.1)
+    fast_token = fast.acquire_lock('AAPL', ttl=5)
+    assert fast_token
+
+    slow.release_lock('AAPL', slow_token)
+    assert third.acquire_lock('AAPL', ttl=5) is None
+
+    fast.release_lock('AAPL', fast_token)
+    assert third.acquire_lock('AAPL', ttl=5)
+
+
+def test_backend_is_selected_through_config(test_app, tmp_path):
+    """
+    GIVEN la configuración de la aplicación.
+    WHEN se cambia QUOTE_CACHE_BACKEND.
+    THEN se construye el backend correspondiente.
+    """
+    assert isinstance(build_cache_backend(test_app), MemoryCacheBackend)
+
+    test_app.config['QUOTE_CACHE_BACKEND'] = 'sqlite'
+    test_app.config['QUOTE_CACHE_PATH'] = str(tmp_path / 'shared.db')
+    assert isinstance(build_cache_backend(test_app), SQLiteCacheBackend)
+
+    test_app.config['QUOTE_CACHE_BACKEND'] = 'unknown'
+    with pytest.raises(ValueError):
+        build_cache_backend(test_app)
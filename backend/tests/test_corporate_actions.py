@@ -0,0 +1,214 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from collections import OrderedDict
+
+import numpy as np
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import (User, Portfolio, Holding, Transaction, TransactionType, PortfolioValuation, PriceSnapshot,
+                        Order, OrderStatus, OrderType, CorporateAction, CorporateActionType, CorporateActionStatus,
+                        utcnow)
+from app.services.analytics import PortfolioAnalytics, DAY
+from app.services.corporate_actions import CorporateActionProcessor
+from app.services.market_service import MarketService
+from app.services.price_history import PriceHistoryStore
+from app.services.valuation_service import ValuationService
+
+
+def add_holder(username, quantity, cash='1000.00'):
+    user = User(username=username, email=f'{username}@example.com', password_hash='x')
+    user.portfolio = Portfolio(cash_balance=Decimal(cash))
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(Holding(portfolio_id=user.portfolio.id, ticker_symbol='AAPL', quantity=Decimal(quantity),
+                           average_purchase_price=Decimal('100'), last_price=Decimal('120'),
+                           market_value=Decimal(quantity) * 120))
+    db.session.commit()
+    return user.portfolio.id
+
+
+def today():
+    return utcnow().date()
+
+
+def test_split_adjusts_every_holder_in_one_pass(test_app):
+    """
+    GIVEN dos titulares de AAPL, una orden abierta y un snapshot de precio.
+    WHEN se aplica un split 2x1.
+    THEN se duplican las cantidades, se dividen los precios, el valor no cambia y la orden se cancela.
+    """
+    first, second = add_holder('ana', '10'), add_holder('luis', '3')
+    db.session.add(PriceSnapshot(ticker_symbol='AAPL', price=Decimal('120'), fetched_at=utcnow()))
+    db.session.add(Order(portfolio_id=first, ticker_symbol='AAPL', side=TransactionType.SELL,
+                         order_type=OrderType.LIMIT, quantity=Decimal('5'), limit_price=Decimal('150')))
+    db.session.commit()
+
+    assert CorporateActionProcessor.schedule('aapl', CorporateActionType.SPLIT, today(), ratio=2)
+    assert CorporateActionProcessor.run() == 1
+
+    holding = Holding.query.filter_by(portfolio_id=first).one()
+    assert (holding.quantity, holding.average_purchase_price, holding.last_price) == (20, 50, 60)
+    assert holding.market_value == Decimal('1200')
+    assert Holding.query.filter_by(portfolio_id=second).one().quantity == 6
+    assert PriceSnapshot.query.filter_by(ticker_symbol='AAPL').one().price == Decimal('60')
+    assert Order.query.one().status == OrderStatus.CANCELLED
+    action = CorporateAction.query.one()
+    assert action.status == CorporateActionStatus.APPLIED and action.holders == 2
+    assert db.session.get(Portfolio, first).version == 2
+
+
+def test_split_drops_the_cached_quote(test_app):
+    """
+    GIVEN una cotización de AAPL en caché con el precio anterior al split.
+    WHEN se aplica un split 2x1.
+    THEN la entrada se descarta y no se vuelve a servir el precio sin ajustar.
+    """
+    MarketService._cache.set('AAPL', {'symbol': 'AAPL', 'price': 120.0})
+    MarketService._cache.set('MSFT', {'symbol': 'MSFT', 'price': 300.0})
+
+    CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today(), ratio=2)
+    CorporateActionProcessor.run()
+
+    assert MarketService._cache.peek('AAPL') is None
+    assert MarketService._cache.peek('MSFT') is not None
+
+
+def test_apply_command_warns_when_the_quote_cache_is_per_process(test_app):
+    """
+    GIVEN la caché de cotizaciones en memoria (una por proceso) y un split pendiente.
+    WHEN se aplica desde la consola.
+    THEN se avisa de que los workers web deben reiniciarse para descartar el precio anterior.
+    """
+    CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today(), ratio=2)
+
+    result = test_app.test_cli_runner().invoke(args=['apply-corporate-actions'])
+
+    assert '1 acciones corporativas aplicadas' in result.output
+    assert 'QUOTE_CACHE_BACKEND=memory' in result.output
+
+
+@pytest.mark.parametrize('value', ['abc', 'NaN', 'Infinity', '0', '-2', ''])
+def test_schedule_rejects_invalid_values_with_value_error(test_app, value):
+    """
+    GIVEN un ratio o importe que no es un número finito positivo.
+    WHEN se registra la acción.
+    THEN se lanza ValueError (la CLI lo convierte en BadParameter) y no se guarda nada.
+    """
+    with pytest.raises(ValueError):
+        CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today(), ratio=value)
+    with pytest.raises(ValueError):
+        CorporateActionProcessor.schedule('AAPL', CorporateActionType.DIVIDEND, today(), amount=value)
+    assert CorporateAction.query.count() == 0
+
+
+def test_dividend_credits_cash_and_records_transactions_once(test_app):
+    """
+    GIVEN dos titulares de AAPL con valoración construida.
+    WHEN se registra y se aplica dos veces un dividendo de 0,5 por acción.
+    THEN se abona una sola vez, con una transacción DIVIDEND por titular y la valoración al día.
+    """
+    first, second = add_holder('ana', '10'), add_holder('luis', '4')
+    ValuationService.recompute([first, second])
+    db.session.commit()
+
+    assert CorporateActionProcessor.schedule('AAPL', CorporateActionType.DIVIDEND, today(), amount='0.5')
+    assert not CorporateActionProcessor.schedule('AAPL', CorporateActionType.DIVIDEND, today(), amount='0.5')
+    assert CorporateActionProcessor.run() == 1
+    assert CorporateActionProcessor.run() == 0
+
+    assert db.session.get(Portfolio, first).cash_balance == Decimal('1005')
+    assert db.session.get(Portfolio, second).cash_balance == Decimal('1002')
+    assert db.session.get(PortfolioValuation, first).total_value == Decimal('1000') + 1200 + 5
+    dividends = Transaction.query.filter_by(type=TransactionType.DIVIDEND).order_by(Transaction.portfolio_id).all()
+    assert [(t.portfolio_id, t.quantity, t.price_per_share) for t in dividends] == [(first, 10, Decimal('0.5')),
+                                                                                    (second, 4, Decimal('0.5'))]
+
+
+def test_processing_resumes_in_order_after_a_failure(test_app):
+    """
+    GIVEN un dividendo y un split posterior pendientes.
+    WHEN el dividendo falla a mitad de su transacción.
+    THEN no se aplica nada de él ni del split; al relanzar se aplican ambos, en orden.
+    """
+    portfolio_id = add_holder('ana', '10')
+    CorporateActionProcessor.schedule('AAPL', CorporateActionType.DIVIDEND, today() - timedelta(days=1), amount='1')
+    CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today(), ratio=2)
+
+    with patch.object(CorporateActionProcessor, '_apply_dividend', side_effect=OperationalError('x', {}, None)):
+        assert CorporateActionProcessor.run() == 0
+    assert {action.status for action in CorporateAction.query} == {CorporateActionStatus.PENDING}
+    assert db.session.get(Portfolio, portfolio_id).cash_balance == Decimal('1000')
+
+    assert CorporateActionProcessor.run() == 2
+    # El dividendo se cobra sobre las 10 acciones anteriores al split
+    assert db.session.get(Portfolio, portfolio_id).cash_balance == Decimal('1010')
+    assert Holding.query.one().quantity == 20
+
+
+def test_analytics_restate_trades_before_a_split(test_app):
+    """
+    GIVEN una compra de 10 AAPL a 100 antes de un split 2x1 y cierres ajustados de 50.
+    WHEN se calculan las métricas de la cartera.
+    THEN el split no se confunde con una caída del 50%.
+    """
+    PortfolioAnalytics.clear()
+    portfolio_id = add_holder('ana', '0')
+    Holding.query.delete()
+    bought = utcnow() - timedelta(days=3)
+    db.session.add(Transaction(portfolio_id=portfolio_id, ticker_symbol='AAPL', type=TransactionType.BUY,
+                               quantity=Decimal('10'), price_per_share=Decimal('100'), transaction_date=bought))
+    db.session.add(Holding(portfolio_id=portfolio_id, ticker_symbol='AAPL', quantity=Decimal('10'),
+                           average_purchase_price=Decimal('100'), last_price=Decimal('100')))
+    db.session.commit()
+    CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today() - timedelta(days=1), ratio=2)
+    CorporateActionProcessor.run()
+
+    def closes(ticker, start=None, end=None):
+        days = np.arange(start // DAY, end // DAY + 1, dtype=np.int64)
+        return days * DAY, np.full(len(days), 50.0)
+
+    with patch.object(MarketService, 'get_daily_closes', side_effect=closes):
+        metrics = PortfolioAnalytics.get(portfolio_id)
+    PortfolioAnalytics.clear()
+
+    assert metrics['twr'] == 0
+    assert metrics['max_drawdown'] == 0
+
+
+def test_split_refetches_the_local_history_used_by_analytics(test_app, tmp_path):
+    """
+    GIVEN un histórico local con los cierres de AAPL a 100 y una compra de 10 AAPL a 100.
+    WHEN se aplica un split 2x1 y el proveedor devuelve ya los cierres ajustados a 50.
+    THEN el histórico se descarga de nuevo completo y las métricas no ven ninguna caída.
+    """
+    PortfolioAnalytics.clear()
+    portfolio_id = add_holder('ana', '0')
+    Holding.query.delete()
+    db.session.add(Transaction(portfolio_id=portfolio_id, ticker_symbol='AAPL', type=TransactionType.BUY,
+                               quantity=Decimal('10'), price_per_share=Decimal('100'),
+                               transaction_date=utcnow() - timedelta(days=3)))
+    db.session.add(Holding(portfolio_id=portfolio_id, ticker_symbol='AAPL', quantity=Decimal('10'),
+                           average_purchase_price=Decimal('100'), last_price=Decimal('100')))
+    db.session.commit()
+
+    def bars(close, days):
+        return [{'t': int(np.datetime64(today() - timedelta(days=ago), 'D').astype(np.int64)) * DAY,
+                 'o': close, 'h': close, 'l': close, 'c': close, 'v': 1000} for ago in days]
+
+    store = PriceHistoryStore(str(tmp_path))
+    store.append('AAPL', bars(100.0, range(5, 1, -1)))
+    with patch.object(MarketService, '_history', store), \
+         patch.object(MarketService, '_history_synced', OrderedDict()), \
+         patch.object(MarketService, '_fetch_history', return_value=bars(50.0, range(5, 0, -1))):
+        CorporateActionProcessor.schedule('AAPL', CorporateActionType.SPLIT, today() - timedelta(days=1), ratio=2)
+        CorporateActionProcessor.run()
+        metrics = PortfolioAnalytics.get(portfolio_id)
+    PortfolioAnalytics.clear()
+
+    assert store.read('AAPL')['c'].tolist() == [50.0] * 5
+    assert metrics['twr'] == pytest.approx(0, abs=1e-9)
+    assert metrics['max_drawdown'] == pytest.approx(0, abs=1e-9)
@@ -0,0 +1,174 @@
+from unittest.mock import MagicMock, patch
+import requests
+
+import pytest
+
+from app.services.http_client import UpstreamClient, CircuitBreaker, UpstreamError, CircuitOpenError
+from app.services.market_service import MarketService
+from app.services.quote_cache import QuoteCache
+
+
+class FakeClock:
+    """Reloj manual para controlar el paso del tiempo en los tests."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_response(status_code=200, payload=None):
+    response = MagicMock()
+    response.status_code = status_code
+    response.json.return_value = payload
+    if status_code >= 400:
+        response.raise_for_status.side_effect = requests.exceptions.HTTPError(str(status_code))
+    return response
+
+
+def make_client(breaker=None, max_retries=2):
+    client = UpstreamClient("https://example.test/api", max_retries=max_retries,
+                            breaker=breaker, sleep=lambda _: None)
+    client.session = MagicMock()
+    return client
+
+
+# --- Tests para UpstreamClient ---
+
+def test_client_retries_transient_errors():
+    """
+    GIVEN un proveedor que falla una vez con un 503.
+    WHEN se hace una petición.
+    THEN se reintenta y se devuelve la respuesta correcta.
+    """
+    client = make_client()
+    client.session.get.side_effect = [make_response(503), make_response(200, [{'symbol': 'AAPL'}])]
+
+    assert client.get_json('quote/AAPL') == [{'symbol': 'AAPL'}]
+    assert client.session.get.call_count == 2
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_client_does_not_retry_client_errors():
+    """
+    GIVEN un proveedor que responde con un 404.
+    WHEN se hace una petición.
+    THEN se lanza UpstreamError sin reintentar.
+    """
+    client = make_client()
+    client.session.get.return_value = make_response(404)
+
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/AAPL')
+    assert client.session.get.call_count == 1
+
+
+def test_rejected_api_key_opens_the_circuit_but_other_client_errors_do_not():
+    """
+    GIVEN un cortocircuito con umbral de 2 fallos a mitad de una racha de fallos.
+    WHEN el proveedor responde 404 a una petición y después 401 (clave revocada) a las siguientes.
+    THEN el 404 no reinicia la racha y los 401 abren el circuito.
+    """
+    client = make_client(breaker=CircuitBreaker(failure_threshold=2), max_retries=0)
+    client.session.get.side_effect = requests.exceptions.ConnectionError()
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/AAPL')
+
+    client.session.get.side_effect = None
+    client.session.get.return_value = make_response(404)
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/NOPE')
+    assert client.breaker.snapshot()['consecutive_failures'] == 1
+
+    client.session.get.return_value = make_response(401)
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/AAPL')
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert client.breaker.snapshot()['successes'] == 0
+
+
+def test_client_error_during_the_probe_lets_the_next_call_probe_again():
+    """
+    GIVEN un circuito medio abierto.
+    WHEN la llamada de prueba recibe un 404.
+    THEN el circuito sigue medio abierto y la siguiente llamada puede probar de nuevo.
+    """
+    clock = FakeClock()
+    client = make_client(breaker=CircuitBreaker(failure_threshold=1, reset_timeout=30, clock=clock),
+                         max_retries=0)
+    client.session.get.side_effect = requests.exceptions.ConnectionError()
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/AAPL')
+
+    clock.now = 31
+    client.session.get.side_effect = None
+    client.session.get.return_value = make_response(404)
+    with pytest.raises(UpstreamError):
+        client.get_json('quote/NOPE')
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+
+    client.session.get.return_value = make_response(200, [])
+    assert client.get_json('quote/AAPL') == []
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_circuit_opens_after_repeated_failures_and_fails_fast():
+    """
+    GIVEN un cortocircuito con umbral de 2 fallos.
+    WHEN el proveedor sigue caído.
+    THEN el circuito se abre y las siguientes llamadas no llegan al proveedor.
+    """
+    clock = FakeClock()
+    client = make_client(breaker=CircuitBreaker(failure_threshold=2, reset_timeout=30, clock=clock),
+                         max_retries=0)
+    client.session.get.side_effect = requests.exceptions.ConnectionError()
+
+    for _ in range(2):
+        with pytest.raises(UpstreamError):
+            client.get_json('quote/AAPL')
+    assert client.breaker.state == CircuitBreaker.OPEN
+
+    with pytest.raises(CircuitOpenError):
+        client.get_json('quote/AAPL')
+    assert client.session.get.call_count == 2
+
+    # Pasado el tiempo de espera se permite una llamada de prueba que cierra el circuito
+    clock.now = 31
+    assert client.breaker.state == CircuitBreaker.HALF_OPEN
+    client.session.get.side_effect = None
+    client.session.get.return_value = make_response(200, [])
+    assert client.get_json('quote/AAPL') == []
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+
+# --- Tests para MarketService con el proveedor caído ---
+
+def test_get_quote_serves_last_known_value_when_upstream_is_down(test_app):
+    """
+    GIVEN una cotización expirada en la caché y el circuito hacia FMP abierto.
+    WHEN se pide la cotización.
+    THEN se sirve el último valor conocido, salvo para operaciones que no admiten precios caducados.
+    """
+    clock = FakeClock()
+    MarketService._cache = QuoteCache(ttl=10, stale_ttl=10, clock=clock)
+    MarketService._cache.set('AAPL', {'symbol': 'AAPL', 'price': 100.0})
+    clock.now = 100
+
+    with patch.object(MarketService, 'API_KEY', 'test-key'), \
+            patch.object(MarketService._client.breaker, 'allow_request', return_value=False):
+        assert MarketService.get_quote('AAPL') == {'symbol': 'AAPL', 'price': 100.0}
+        assert MarketService.get_quote('AAPL', allow_stale=False) is None
+
+
+def test_market_health_endpoint(client):
+    """
+    GIVEN la aplicación recién iniciada.
+    WHEN se consulta /api/market/health.
+    THEN se devuelve el estado del circuito y de la caché.
+    """
+    response = client.get('/api/market/health')
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert data['circuit']['state'] == 'closed'
+    assert 'hits' in data['cache']
@@ -0,0 +1,177 @@
+import random
+from decimal import Decimal
+from unittest.mock import patch
+
+import fakeredis
+import pytest
+
+from app import db
+from app.models import User, Portfolio, LeagueMember
+from app.services.leaderboard import Leaderboard, IndexableSkipList, RedisLeaderboardBackend
+from app.services.valuation_service import ValuationService
+
+
+@pytest.fixture(autouse=True)
+def fresh_leaderboard():
+    Leaderboard.clear()
+    yield
+    Leaderboard.clear()
+
+
+def make_user(name, cash):
+    user = User(username=name, email=f'{name}@example.com', password_hash='x')
+    user.portfolio = Portfolio(cash_balance=Decimal(cash))
+    db.session.add(user)
+    db.session.commit()
+    ValuationService.recompute([user.portfolio.id])
+    db.session.commit()
+    return user
+
+
+def create_league(client, headers, name='Liga'):
+    response = client.post('/api/leagues/', headers=headers, json={'name': name})
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def test_skip_list_keeps_order_and_positions():
+    """
+    GIVEN una skip list con 500 claves insertadas y borradas en orden aleatorio.
+    WHEN se consulta la posición de cada clave y se recorre por tramos.
+    THEN coincide siempre con la lista ordenada equivalente.
+    """
+    rng = random.Random(7)
+    ranking, expected = IndexableSkipList(seed=1), []
+    for key in rng.sample(range(10000), 500):
+        ranking.insert(key)
+        expected.append(key)
+    for key in rng.sample(expected, 200):
+        ranking.remove(key)
+        expected.remove(key)
+    expected.sort()
+
+    assert len(ranking) == 300
+    assert [ranking.index(key) for key in expected] == list(range(300))
+    assert ranking.slice(0, 10) == expected[:10]
+    assert ranking.slice(295, 10) == expected[295:]
+    with pytest.raises(KeyError):
+        ranking.remove(-1)
+
+
+def test_league_top_and_me(client, test_user, auth_headers):
+    """
+    GIVEN una liga con tres miembros de distinto valor de cartera.
+    WHEN se piden el top 2 y la posición de cada uno.
+    THEN el orden es por valor total descendente y las posiciones empiezan en 1.
+    """
+    ValuationService.recompute([test_user.portfolio.id])
+    db.session.commit()
+    rich, poor = make_user('rich', '50000'), make_user('poor', '500')
+    league_id = create_league(client, auth_headers(test_user.id))
+    for user in (rich, poor):
+        assert client.post(f'/api/leagues/{league_id}/join', headers=auth_headers(user.id)).status_code == 201
+
+    response = client.get(f'/api/leagues/{league_id}/top?n=2', headers=auth_headers(test_user.id))
+    assert response.status_code == 200
+    assert [(row['rank'], row['username'], row['total_value']) for row in response.get_json()['top']] == \
+        [(1, 'rich', 50000.0), (2, 'testuser', 10000.0)]
+
+    me = client.get(f'/api/leagues/{league_id}/me', headers=auth_headers(poor.id)).get_json()
+    assert me == {'league_id': league_id, 'rank': 3, 'total_value': 500.0, 'members': 3}
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quote')
+def test_trade_updates_loaded_ranking_incrementally(mock_get_quote, client, test_user, auth_headers):
+    """
+    GIVEN una liga ya cargada en la que el usuario va segundo.
+    WHEN compra acciones que valen más que lo que paga y después se revaloriza el ticker.
+    THEN la clasificación refleja los nuevos valores sin recargar la liga.
+    """
+    ValuationService.recompute([test_user.portfolio.id])
+    db.session.commit()
+    rival = make_user('rival', '10500')
+    league_id = create_league(client, auth_headers(rival.id))
+    client.post(f'/api/leagues/{league_id}/join', headers=auth_headers(test_user.id))
+    headers = auth_headers(test_user.id)
+    assert client.get(f'/api/leagues/{league_id}/me', headers=headers).get_json()['rank'] == 2
+
+    mock_get_quote.return_value = {'price': 100.0}
+    assert client.post('/api/portfolio/buy', headers=headers,
+                       json={'ticker': 'AAPL', 'quantity': 10}).status_code == 200
+    ValuationService.apply_prices({'AAPL': {'price': 200.0}})
+    db.session.commit()
+
+    with patch.object(Leaderboard, '_ensure_loaded') as ensure_loaded:
+        me = client.get(f'/api/leagues/{league_id}/me', headers=headers).get_json()
+    ensure_loaded.assert_called_once()
+    assert (me['rank'], me['total_value']) == (1, 11000.0)
+
+
+def test_rolled_back_changes_do_not_reach_ranking(client, test_user, auth_headers):
+    """
+    GIVEN una liga cargada.
+    WHEN se revaloriza una cartera y la transacción se deshace.
+    THEN la clasificación conserva el valor anterior.
+    """
+    ValuationService.recompute([test_user.portfolio.id])
+    db.session.commit()
+    league_id = create_league(client, auth_headers(test_user.id))
+    client.get(f'/api/leagues/{league_id}/me', headers=auth_headers(test_user.id))
+
+    test_user.portfolio.cash_balance = Decimal('1')
+    ValuationService.recompute([test_user.portfolio.id])
+    db.session.rollback()
+    db.session.commit()
+
+    me = client.get(f'/api/leagues/{league_id}/me', headers=auth_headers(test_user.id)).get_json()
+    assert me['total_value'] == 10000.0
+
+
+def test_unknown_league_and_non_member(client, test_user, auth_headers):
+    """
+    GIVEN una liga de otro usuario.
+    WHEN se consulta una liga inexistente o la posición en una liga ajena.
+    THEN ambas respuestas son 404.
+    """
+    other = make_user('other', '100')
+    league_id = create_league(client, auth_headers(other.id))
+    headers = auth_headers(test_user.id)
+
+    assert client.get('/api/leagues/999/top', headers=headers).status_code == 404
+    assert client.get(f'/api/leagues/{league_id}/me', headers=headers).status_code == 404
+
+
+def test_member_joined_in_another_process_is_found(client, test_user, auth_headers):
+    """
+    GIVEN una liga ya cargada en la clasificación en memoria de este proceso.
+    WHEN el usuario se une desde otro proceso (solo queda escrito en la base de datos).
+    THEN su posición se carga al consultarla en lugar de responder 404.
+    """
+    owner = make_user('owner', '20000')
+    league_id = create_league(client, auth_headers(owner.id))
+    assert client.get(f'/api/leagues/{league_id}/top', headers=auth_headers(owner.id)).status_code == 200
+
+    db.session.add(LeagueMember(league_id=league_id, user_id=test_user.id))
+    db.session.commit()
+
+    response = client.get(f'/api/leagues/{league_id}/me', headers=auth_headers(test_user.id))
+    assert response.status_code == 200
+    assert (response.get_json()['rank'], response.get_json()['members']) == (2, 2)
+
+
+def test_redis_backend_ranks_with_sorted_sets():
+    """
+    GIVEN el backend de Redis sobre un servidor falso.
+    WHEN se carga una liga y se actualiza un miembro.
+    THEN top y posición salen de ZREVRANGE / ZREVRANK.
+    """
+    backend = RedisLeaderboardBackend(client=fakeredis.FakeRedis(), prefix='test:league:')
+    assert backend.loaded_at(1) is None
+    backend.replace(1, [(10, 100.0), (11, 300.0), (12, 200.0)])
+    backend.update(1, [(10, 400.0)])
+
+    assert backend.top(1, 2) == [(10, 400.0), (11, 300.0)]
+    assert backend.rank(1, 12) == (3, 200.0, 3)
+    assert backend.rank(1, 99) is None
+    backend.clear()
+    assert backend.loaded_at(1) is None
@@ -1,23 +1,16 @@
 from unittest.mock import patch
-from flask_jwt_extended import create_access_token
-
-# --- Helper ---
-def get_auth_headers(user):
-    """Genera cabeceras de autenticación para un usuario."""
-    access_token = create_access_token(identity=str(user.id))
-    return {'Authorization': f'Bearer {access_token}'}
 
 # --- Tests para Market Routes ---
 
 @patch('app.routes.market_routes.MarketService.get_quote')
-def test_get_quote_success(mock_get_quote, client, test_user):
+def test_get_quote_success(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado y un ticker válido.
     WHEN se hace una petición a /api/market/quote/{ticker}.
     THEN se debe devolver la cotización del activo.
     """
     mock_get_quote.return_value = {"symbol": "AAPL", "price": 150.75, "name": "Apple Inc."}
-    headers = get_auth_headers(test_user)
+    headers = auth_headers(test_user.id)
     response = client.get('/api/market/quote/AAPL', headers=headers)
     data = response.get_json()
 
@@ -27,14 +20,14 @@ def test_get_quote_success(mock_get_quote, client, test_user):
     mock_get_quote.assert_called_once_with('AAPL')
 
 @patch('app.routes.market_routes.MarketService.get_quote')
-def test_get_quote_not_found(mock_get_quote, client, test_user):
+def test_get_quote_not_found(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado y un ticker inválido.
     WHEN se hace una petición a /api/market/quote/{ticker}.
     THEN se debe devolver un error 404.
     """
     mock_get_quote.return_value = None
-    headers = get_auth_headers(test_user)
+    headers = auth_headers(test_user.id)
     response = client.get('/api/market/quote/INVALID', headers=headers)
     data = response.get_json()
 
@@ -51,7 +44,7 @@ def test_get_quote_unauthorized(client):
     assert response.status_code == 401
 
 @patch('app.routes.market_routes.MarketService.search_assets')
-def test_search_assets_success(mock_search_assets, client, test_user):
+def test_search_assets_success(mock_search_assets, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado y una consulta de búsqueda.
     WHEN se hace una petición a /api/market/search/{query}.
@@ -61,7 +54,7 @@ def test_search_assets_success(mock_search_assets, client, test_user):
         {"symbol": "AAPL", "name": "Apple Inc."},
         {"symbol": "APPL", "name": "Apple Hospitality REIT, Inc."}
     ]
-    headers = get_auth_headers(test_user)
+    headers = auth_headers(test_user.id)
     response = client.get('/api/market/search/Apple', headers=headers)
     data = response.get_json()
 
@@ -0,0 +1,119 @@
+from datetime import datetime
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+
+from app import db
+from app.models import Holding, MissionProgress
+from app.services.events import EventBus, TradeExecuted, PortfolioRevalued
+from app.services.missions import MissionEngine
+from app.services.price_ingestion import PriceIngestionWorker
+from app.services.valuation_service import ValuationService
+
+
+def missions_by_key(client, headers):
+    response = client.get('/api/missions/', headers=headers)
+    assert response.status_code == 200
+    return {mission['key']: mission for mission in response.get_json()['missions']}
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quote', return_value={'price': 10.0})
+def test_trades_advance_counters_and_checkpoint_in_batches(mock_get_quote, client, test_user, auth_headers):
+    """
+    GIVEN el motor de misiones con un intervalo de volcado largo.
+    WHEN el usuario hace dos compras.
+    THEN el progreso no se escribe en cada operación y al consultarlo aparece acumulado.
+    """
+    headers = auth_headers(test_user.id)
+    for _ in range(2):
+        assert client.post('/api/portfolio/buy', headers=headers,
+                           json={'ticker': 'AAPL', 'quantity': 1}).status_code == 200
+    assert MissionProgress.query.count() == 0
+
+    missions = missions_by_key(client, headers)
+    assert missions['first_trade']['completed'] is True
+    assert (missions['weekly_10_trades']['progress'], missions['weekly_10_trades']['completed']) == (2.0, False)
+    assert missions['return_5pct']['progress'] == 0.0
+
+
+def test_events_only_touch_memory_until_checkpoint(test_app, test_user, query_budget):
+    """
+    GIVEN 30 operaciones publicadas en el bus.
+    WHEN se procesan y después se vuelca el progreso.
+    THEN los eventos no ejecutan consultas y el volcado es un upsert por tipo de agregación que suma a lo guardado.
+    """
+    portfolio_id = test_user.portfolio.id
+    moment = datetime(2026, 10, 14, 12, 0)
+    trades = [TradeExecuted(portfolio_id, 'AAPL', 'buy', Decimal('1'), Decimal('10'), moment) for _ in range(30)]
+
+    with query_budget(0):
+        EventBus.publish(trades)
+    with query_budget(1):
+        assert MissionEngine.flush() == 3
+    EventBus.publish(trades[:5])
+    MissionEngine.flush()
+
+    rows = {row.mission_key: row for row in MissionProgress.query.filter_by(portfolio_id=portfolio_id)}
+    assert (rows['weekly_10_trades'].period, rows['weekly_10_trades'].progress) == ('2026-W42', Decimal('35'))
+    assert rows['daily_3_trades'].period == '2026-10-14'
+    assert rows['weekly_10_trades'].completed_at is not None
+
+
+def test_return_missions_keep_best_value(test_app, test_user):
+    """
+    GIVEN una cartera que llega a un +6% y después baja a un +1%.
+    WHEN se vuelca el progreso tras cada revalorización.
+    THEN la misión del 5% queda completada con el mejor valor alcanzado.
+    """
+    portfolio_id = test_user.portfolio.id
+    EventBus.publish([PortfolioRevalued(portfolio_id, Decimal('10600'), Decimal('10000'))])
+    MissionEngine.flush()
+    EventBus.publish([PortfolioRevalued(portfolio_id, Decimal('10100'), Decimal('10000'))])
+    MissionEngine.flush()
+
+    row = db.session.get(MissionProgress, (portfolio_id, 'return_5pct', 'all'))
+    assert float(row.progress) == pytest.approx(0.06)
+    assert row.completed_at is not None
+    assert db.session.get(MissionProgress, (portfolio_id, 'return_20pct', 'all')).completed_at is None
+
+
+def test_checkpoint_does_not_commit_the_callers_session(test_app, test_user):
+    """
+    GIVEN un cambio sin confirmar en la sesión de quien publica el evento.
+    WHEN el evento dispara el volcado del progreso.
+    THEN el progreso se guarda en su propia transacción y el cambio se puede deshacer.
+    """
+    portfolio = test_user.portfolio
+    portfolio.cash_balance = Decimal('1')
+    EventBus.publish([TradeExecuted(portfolio.id, 'AAPL', 'buy', Decimal('1'), Decimal('10'))])
+    assert MissionEngine.flush() == 3
+
+    db.session.rollback()
+    assert portfolio.cash_balance == Decimal('10000')
+    assert MissionProgress.query.filter_by(portfolio_id=portfolio.id).count() == 3
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes',
+       return_value={'AAPL': {'symbol': 'AAPL', 'price': 150.0}})
+def test_price_ingestion_publishes_revaluations(mock_fetch, test_app, test_user):
+    """
+    GIVEN una cartera con 10 AAPL compradas a 100 y 9000 de caja (capital inicial 10000).
+    WHEN la ingesta aplica un precio de 150.
+    THEN la revalorización llega a las misiones de rentabilidad (+5%).
+    """
+    portfolio = test_user.portfolio
+    portfolio.cash_balance = Decimal('9000')
+    db.session.add(Holding(portfolio_id=portfolio.id, ticker_symbol='AAPL', quantity=Decimal('10'),
+                           average_purchase_price=Decimal('100')))
+    db.session.commit()
+    ValuationService.recompute([portfolio.id])
+    db.session.commit()
+
+    PriceIngestionWorker(test_app).run_once()
+    MissionEngine.flush()
+
+    row = db.session.get(MissionProgress, (portfolio.id, 'return_5pct', 'all'))
+    assert float(row.progress) == pytest.approx(0.05)
+    assert row.completed_at is not None
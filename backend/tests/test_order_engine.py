@@ -0,0 +1,205 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.models import Holding, Order, OrderStatus, OrderType, TransactionType, Transaction
+from app.services.order_engine import OrderEngine, TriggerIndex
+
+
+def quotes(**prices):
+    return {symbol: {'symbol': symbol, 'price': price} for symbol, price in prices.items()}
+
+
+@pytest.fixture(autouse=True)
+def fresh_engine():
+    """El índice es de proceso: cada test empieza con uno vacío."""
+    OrderEngine.reset()
+    yield
+    OrderEngine.reset()
+
+
+def test_trigger_index_pops_only_crossed_orders():
+    """
+    GIVEN órdenes que se disparan al bajar (compras límite) y al subir (ventas límite).
+    WHEN llegan varios precios.
+    THEN solo se devuelven, una vez, las órdenes cuyo disparador se ha cruzado.
+    """
+    index = TriggerIndex()
+    index.add(1, 'AAPL', TriggerIndex.FALLING, Decimal('100'))
+    index.add(2, 'AAPL', TriggerIndex.FALLING, Decimal('90'))
+    index.add(3, 'AAPL', TriggerIndex.RISING, Decimal('120'))
+    index.add(4, 'MSFT', TriggerIndex.RISING, Decimal('10'))
+
+    assert index.pop_triggered('AAPL', Decimal('110')) == []
+    assert index.pop_triggered('AAPL', Decimal('100')) == [1]
+    assert index.pop_triggered('AAPL', Decimal('100')) == []
+    assert sorted(index.pop_triggered('AAPL', Decimal('85'))) == [2]
+    assert index.pop_triggered('AAPL', Decimal('125')) == [3]
+    index.remove(4)
+    assert index.pop_triggered('MSFT', Decimal('50')) == []
+    assert len(index) == 0
+
+
+def test_pending_order_endpoints_place_list_and_cancel(client, test_user, auth_headers):
+    """
+    GIVEN un usuario autenticado.
+    WHEN crea una orden límite, consulta sus órdenes y la cancela.
+    THEN la orden aparece pendiente y después cancelada; las órdenes mal formadas se rechazan.
+    """
+    headers = auth_headers(test_user.id)
+    response = client.post('/api/portfolio/pending-orders', headers=headers, json={
+        "ticker": "aapl", "side": "buy", "type": "limit", "quantity": 5, "limit_price": 90})
+    assert response.status_code == 201
+    order = response.get_json()
+    assert order['ticker'] == 'AAPL' and order['status'] == 'pending' and order['limit_price'] == 90.0
+
+    bad = client.post('/api/portfolio/pending-orders', headers=headers, json={
+        "ticker": "AAPL", "side": "buy", "type": "stop_limit", "quantity": 5, "stop_price": 90})
+    assert bad.status_code == 400
+
+    listed = client.get('/api/portfolio/pending-orders?status=open', headers=headers).get_json()
+    assert [item['id'] for item in listed] == [order['id']]
+
+    assert client.delete(f"/api/portfolio/pending-orders/{order['id']}", headers=headers).status_code == 200
+    assert client.delete(f"/api/portfolio/pending-orders/{order['id']}", headers=headers).status_code == 404
+    assert client.get('/api/portfolio/pending-orders?status=open', headers=headers).get_json() == []
+
+
+def test_price_tick_fills_triggered_orders_only(test_app, test_user):
+    """
+    GIVEN una compra límite a 90, una venta stop a 80 y una compra límite a 50.
+    WHEN el precio baja a 85 y después a 75.
+    THEN cada tick ejecuta solo las órdenes disparadas, al precio del tick.
+    """
+    portfolio_id = test_user.portfolio.id
+    db.session.add(Holding(portfolio_id=portfolio_id, ticker_symbol='AAPL',
+                           quantity=Decimal('10'), average_purchase_price=Decimal('100')))
+    limit = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 5,
+                              limit_price=Decimal('90'))
+    stop = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.SELL, OrderType.STOP, 10,
+                             stop_price=Decimal('80'))
+    far = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 1,
+                            limit_price=Decimal('50'))
+    db.session.commit()
+    assert OrderEngine.sync() == 3
+
+    assert OrderEngine.on_prices(quotes(AAPL=85)) == 1
+    assert db.session.get(Order, limit.id).status == OrderStatus.FILLED
+    assert db.session.get(Order, limit.id).fill_price == Decimal('85')
+    assert db.session.get(Order, stop.id).status == OrderStatus.PENDING
+
+    assert OrderEngine.on_prices(quotes(AAPL=75)) == 1
+    assert db.session.get(Order, stop.id).status == OrderStatus.FILLED
+    assert db.session.get(Order, far.id).status == OrderStatus.PENDING
+
+    holding = Holding.query.filter_by(portfolio_id=portfolio_id, ticker_symbol='AAPL').one()
+    assert holding.quantity == Decimal('5')
+    assert db.session.get(type(test_user.portfolio), portfolio_id).cash_balance == Decimal('10000') - 5 * 85 + 10 * 75
+    assert Transaction.query.filter_by(portfolio_id=portfolio_id).count() == 2
+
+
+def test_stop_limit_waits_for_limit_and_rejections_are_recorded(test_app, test_user):
+    """
+    GIVEN una compra stop-limit (stop 110, límite 112) y una venta límite sin acciones.
+    WHEN el precio salta a 115 y después vuelve a 111.
+    THEN la stop-limit pasa a disparada y se ejecuta a 111; la venta queda rechazada.
+    """
+    portfolio_id = test_user.portfolio.id
+    stop_limit = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.STOP_LIMIT, 2,
+                                   limit_price=Decimal('112'), stop_price=Decimal('110'))
+    naked = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.SELL, OrderType.LIMIT, 3,
+                              limit_price=Decimal('100'))
+    db.session.commit()
+    OrderEngine.sync()
+
+    assert OrderEngine.on_prices(quotes(AAPL=115)) == 0
+    assert db.session.get(Order, stop_limit.id).status == OrderStatus.TRIGGERED
+    assert db.session.get(Order, naked.id).status == OrderStatus.REJECTED
+    assert db.session.get(Order, naked.id).reject_reason
+
+    assert OrderEngine.on_prices(quotes(AAPL=111)) == 1
+    filled = db.session.get(Order, stop_limit.id)
+    assert filled.status == OrderStatus.FILLED and filled.fill_price == Decimal('111')
+
+
+def test_batch_over_budget_falls_back_to_single_orders(test_app, test_user):
+    """
+    GIVEN dos compras límite que juntas superan el saldo disponible.
+    WHEN un tick dispara ambas.
+    THEN se ejecuta la que cabe y la otra se rechaza por fondos insuficientes.
+    """
+    portfolio_id = test_user.portfolio.id
+    first = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 60,
+                              limit_price=Decimal('100'))
+    second = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 60,
+                               limit_price=Decimal('100'))
+    db.session.commit()
+    OrderEngine.sync()
+
+    assert OrderEngine.on_prices(quotes(AAPL=100)) == 1
+    statuses = sorted(db.session.get(Order, order.id).status.value for order in (first, second))
+    assert statuses == ['FILLED', 'REJECTED']
+
+
+def test_sync_picks_up_orders_committed_after_a_higher_id(test_app, test_user):
+    """
+    GIVEN una sincronización que ya ha visto la orden con id 5.
+    WHEN se confirma después una orden con un id menor (reservado antes, confirmado más tarde).
+    THEN el siguiente `sync` la indexa y no duplica las ya indexadas.
+    """
+    portfolio_id = test_user.portfolio.id
+    later = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 1,
+                              limit_price=Decimal('90'))
+    later.id = 5
+    db.session.commit()
+    assert OrderEngine.sync() == 1
+
+    late = OrderEngine.place(portfolio_id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 1,
+                             limit_price=Decimal('95'))
+    late.id = 2
+    db.session.commit()
+
+    assert OrderEngine.sync() == 1
+    assert late.id in OrderEngine._index and len(OrderEngine._index) == 2
+
+
+def test_failed_execution_puts_fired_orders_back_in_the_index(test_app, test_user):
+    """
+    GIVEN una compra límite disparada cuya ejecución falla con un error de base de datos.
+    WHEN llega el siguiente tick.
+    THEN la orden sigue en el índice y se ejecuta.
+    """
+    order = OrderEngine.place(test_user.portfolio.id, 'AAPL', TransactionType.BUY, OrderType.LIMIT, 1,
+                              limit_price=Decimal('90'))
+    db.session.commit()
+    OrderEngine.sync()
+
+    with patch('app.services.order_engine.TradeService.execute_orders',
+               side_effect=OperationalError('UPDATE', {}, Exception('database is locked'))):
+        with pytest.raises(OperationalError):
+            OrderEngine.on_prices(quotes(AAPL=85))
+    assert order.id in OrderEngine._index
+
+    assert OrderEngine.on_prices(quotes(AAPL=85)) == 1
+    assert db.session.get(Order, order.id).status == OrderStatus.FILLED
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_ingestion_cycle_prices_pending_order_tickers(mock_fetch, test_app, test_user):
+    """
+    GIVEN una orden límite sobre un ticker que nadie tiene en cartera.
+    WHEN se ejecuta un ciclo de ingesta de precios.
+    THEN el ticker entra en el universo y la orden se ejecuta con el nuevo precio.
+    """
+    from app.services.price_ingestion import PriceIngestionWorker
+    mock_fetch.return_value = quotes(NVDA=95.0)
+    order = OrderEngine.place(test_user.portfolio.id, 'NVDA', TransactionType.BUY, OrderType.LIMIT, 1,
+                              limit_price=Decimal('100'))
+    db.session.commit()
+
+    PriceIngestionWorker(test_app).run_once()
+
+    assert db.session.get(Order, order.id).status == OrderStatus.FILLED
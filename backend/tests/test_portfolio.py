@@ -1,29 +1,21 @@
 import json
 from decimal import Decimal
 from unittest.mock import patch
-from flask_jwt_extended import create_access_token
 
 from app.models import User, Portfolio, Holding, Transaction, TransactionType
 from app import db
 
-# --- Helper ---
-def get_auth_headers(user_id):
-    """Genera cabeceras de autenticación para un ID de usuario."""
-    access_token = create_access_token(identity=str(user_id))
-    return {'Authorization': f'Bearer {access_token}'}
-
-
 # --- Tests para el endpoint /buy ---
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_buy_asset_success(mock_get_quote, client, test_user):
+def test_buy_asset_success(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado con fondos suficientes.
     WHEN se envía una petición POST a /api/portfolio/buy.
     THEN se debe añadir el activo, deducir el dinero y registrar la transacción.
     """
     mock_get_quote.return_value = {'price': 150.00, 'symbol': 'AAPL'}
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "AAPL", "quantity": "10"}
 
     initial_cash = test_user.portfolio.cash_balance
@@ -55,14 +47,14 @@ def test_buy_asset_success(mock_get_quote, client, test_user):
 
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_buy_asset_insufficient_funds(mock_get_quote, client, test_user):
+def test_buy_asset_insufficient_funds(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado.
     WHEN intenta comprar un activo por un valor mayor a su saldo.
     THEN la API debe devolver un error 400.
     """
     mock_get_quote.return_value = {'price': 15000.00, 'symbol': 'AMZN'}
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "AMZN", "quantity": "10"} # Costo > 100,000
 
     response = client.post('/api/portfolio/buy', headers=headers, json=payload)
@@ -73,14 +65,14 @@ def test_buy_asset_insufficient_funds(mock_get_quote, client, test_user):
 
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_buy_asset_invalid_ticker(mock_get_quote, client, test_user):
+def test_buy_asset_invalid_ticker(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado.
     WHEN intenta comprar un activo con un ticker inválido.
     THEN la API debe devolver un error 404.
     """
     mock_get_quote.return_value = None
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "INVALIDTICKER", "quantity": "10"}
 
     response = client.post('/api/portfolio/buy', headers=headers, json=payload)
@@ -93,7 +85,7 @@ def test_buy_asset_invalid_ticker(mock_get_quote, client, test_user):
 # --- Tests para el endpoint /sell ---
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_sell_asset_success(mock_get_quote, client, test_user):
+def test_sell_asset_success(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado que posee un activo.
     WHEN envía una petición POST a /api/portfolio/sell.
@@ -110,7 +102,7 @@ def test_sell_asset_success(mock_get_quote, client, test_user):
     db.session.commit()
 
     mock_get_quote.return_value = {'price': 300.00, 'symbol': 'TSLA'}
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "TSLA", "quantity": "5"}
 
     initial_cash = test_user.portfolio.cash_balance
@@ -139,7 +131,7 @@ def test_sell_asset_success(mock_get_quote, client, test_user):
 
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_sell_all_of_asset_success(mock_get_quote, client, test_user):
+def test_sell_all_of_asset_success(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado que posee un activo.
     WHEN vende la cantidad total de ese activo.
@@ -155,7 +147,7 @@ def test_sell_all_of_asset_success(mock_get_quote, client, test_user):
     db.session.commit()
 
     mock_get_quote.return_value = {'price': 450.00, 'symbol': 'MSFT'}
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "MSFT", "quantity": "10"}
 
     response = client.post('/api/portfolio/sell', headers=headers, json=payload)
@@ -167,7 +159,7 @@ def test_sell_all_of_asset_success(mock_get_quote, client, test_user):
 
 
 @patch('app.routes.portfolio_routes.MarketService.get_quote')
-def test_sell_asset_not_enough_quantity(mock_get_quote, client, test_user):
+def test_sell_asset_not_enough_quantity(mock_get_quote, client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado que posee un activo.
     WHEN intenta vender más cantidad de la que posee.
@@ -183,7 +175,7 @@ def test_sell_asset_not_enough_quantity(mock_get_quote, client, test_user):
     db.session.commit()
 
     mock_get_quote.return_value = {'price': 900.00, 'symbol': 'NVDA'}
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "NVDA", "quantity": "10"} # Solo tiene 5
 
     response = client.post('/api/portfolio/sell', headers=headers, json=payload)
@@ -195,17 +187,221 @@ def test_sell_asset_not_enough_quantity(mock_get_quote, client, test_user):
     mock_get_quote.assert_not_called()
 
 
-def test_sell_asset_not_owned(client, test_user):
+def test_sell_asset_not_owned(client, test_user, auth_headers):
     """
     GIVEN un usuario autenticado.
     WHEN intenta vender un activo que no posee.
     THEN la API debe devolver un error 400.
     """
-    headers = get_auth_headers(test_user.id)
+    headers = auth_headers(test_user.id)
     payload = {"ticker": "GOOGL", "quantity": "10"}
 
     response = client.post('/api/portfolio/sell', headers=headers, json=payload)
     data = response.get_json()
 
     assert response.status_code == 400
-    assert data['msg'] == "No tienes suficientes acciones para vender"
\ No newline at end of file
+    assert data['msg'] == "No tienes suficientes acciones para vender"
+
+@patch('app.routes.portfolio_routes.MarketService.get_quote', return_value={'price': 10.0})
+def test_trades_without_portfolio_return_404(mock_get_quote, client, auth_headers):
+    """
+    GIVEN un usuario autenticado que no tiene cartera.
+    WHEN intenta comprar, vender o enviar un lote de órdenes.
+    THEN la API devuelve 404 en lugar de un error de fondos o acciones insuficientes.
+    """
+    user = User(username='noportfolio', email='noportfolio@example.com', password_hash='x')
+    db.session.add(user)
+    db.session.commit()
+    headers = auth_headers(user.id)
+
+    for path, payload in [('/api/portfolio/buy', {"ticker": "AAPL", "quantity": 1}),
+                          ('/api/portfolio/sell', {"ticker": "AAPL", "quantity": 1}),
+                          ('/api/portfolio/orders', {"orders": [{"ticker": "AAPL", "side": "buy", "quantity": 1}]})]:
+        response = client.post(path, headers=headers, json=payload)
+        assert response.status_code == 404
+        assert response.get_json()['msg'] == "Cartera no encontrada"
+    mock_get_quote.assert_not_called()
+
+# --- Tests para el endpoint GET / ---
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_get_portfolio_values_holdings_with_one_bulk_request(mock_fetch_quotes, client, test_user, auth_headers):
+    """
+    GIVEN un usuario con varias posiciones.
+    WHEN consulta su cartera.
+    THEN todas las posiciones se valoran con una única petición al proveedor.
+    """
+    for ticker, quantity in (("AAPL", "10"), ("MSFT", "5"), ("TSLA", "2")):
+        db.session.add(Holding(
+            portfolio_id=test_user.portfolio.id,
+            ticker_symbol=ticker,
+            quantity=Decimal(quantity),
+            average_purchase_price=Decimal("100.00")
+        ))
+    db.session.commit()
+
+    mock_fetch_quotes.return_value = {
+        'AAPL': {'symbol': 'AAPL', 'price': 200.0},
+        'MSFT': {'symbol': 'MSFT', 'price': 300.0},
+    }
+    headers = auth_headers(test_user.id)
+
+    response = client.get('/api/portfolio/', headers=headers)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    mock_fetch_quotes.assert_called_once()
+    assert sorted(mock_fetch_quotes.call_args.args[0]) == ['AAPL', 'MSFT', 'TSLA']
+    values = {h['ticker_symbol']: h['current_market_value'] for h in data['holdings']}
+    # TSLA no tiene cotización: se valora al precio medio de compra
+    assert values == {'AAPL': 2000.0, 'MSFT': 1500.0, 'TSLA': 200.0}
+    assert data['total_portfolio_value'] == 10000.0 + 3700.0
+
+
+# --- Tests para el endpoint POST /orders ---
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes')
+def test_submit_orders_executes_batch_in_one_transaction(mock_get_quotes, client, test_user, auth_headers):
+    """
+    GIVEN un usuario con una posición en MSFT.
+    WHEN envía un lote que vende MSFT y compra AAPL dos veces, con una orden inválida.
+    THEN se valora todo con una consulta, se ejecutan las válidas y se rechaza la inválida.
+    """
+    db.session.add(Holding(portfolio_id=test_user.portfolio.id, ticker_symbol="MSFT",
+                           quantity=Decimal("10"), average_purchase_price=Decimal("100.00")))
+    db.session.commit()
+    mock_get_quotes.return_value = {
+        'AAPL': {'symbol': 'AAPL', 'price': 100.0},
+        'MSFT': {'symbol': 'MSFT', 'price': 200.0},
+    }
+    headers = auth_headers(test_user.id)
+    payload = {"orders": [
+        {"ticker": "MSFT", "side": "sell", "quantity": 10},
+        {"ticker": "AAPL", "side": "buy", "quantity": 100},
+        {"ticker": "aapl", "side": "buy", "quantity": 20},
+        {"ticker": "TSLA", "side": "buy", "quantity": -1},
+    ]}
+
+    response = client.post('/api/portfolio/orders', headers=headers, json=payload)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    mock_get_quotes.assert_called_once()
+    assert data['executed'] == 3
+    assert [result['status'] for result in data['results']] == ['executed', 'executed', 'executed', 'rejected']
+
+    # Neto: +2000 por la venta, -12000 por las compras (más que el saldo inicial de 10000)
+    db.session.refresh(test_user.portfolio)
+    assert test_user.portfolio.cash_balance == Decimal("0")
+    holding = Holding.query.filter_by(portfolio_id=test_user.portfolio.id, ticker_symbol="AAPL").one()
+    assert holding.quantity == 120
+    assert Holding.query.filter_by(portfolio_id=test_user.portfolio.id, ticker_symbol="MSFT").first() is None
+    assert Transaction.query.filter_by(portfolio_id=test_user.portfolio.id).count() == 3
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes')
+def test_submit_orders_sells_shares_bought_earlier_in_the_batch(mock_get_quotes, client, test_user, auth_headers):
+    """
+    GIVEN un usuario sin posiciones.
+    WHEN envía un lote que vende AAPL, compra 10, vende 4 y vende otras 7.
+    THEN la primera y la última venta se rechazan, la del medio usa lo comprado en el lote
+         y queda una posición de 6 acciones.
+    """
+    mock_get_quotes.return_value = {'AAPL': {'symbol': 'AAPL', 'price': 100.0}}
+    headers = auth_headers(test_user.id)
+    payload = {"orders": [{"ticker": "AAPL", "side": "sell", "quantity": 1},
+                          {"ticker": "AAPL", "side": "buy", "quantity": 10},
+                          {"ticker": "AAPL", "side": "sell", "quantity": 4},
+                          {"ticker": "AAPL", "side": "sell", "quantity": 7}]}
+
+    response = client.post('/api/portfolio/orders', headers=headers, json=payload)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [result['status'] for result in data['results']] == ['rejected', 'executed', 'executed', 'rejected']
+    db.session.refresh(test_user.portfolio)
+    assert test_user.portfolio.cash_balance == Decimal("9400")
+    holding = Holding.query.filter_by(portfolio_id=test_user.portfolio.id, ticker_symbol="AAPL").one()
+    assert (holding.quantity, holding.average_purchase_price) == (6, 100)
+    assert client.get('/api/portfolio/', headers=headers).get_json()['total_portfolio_value'] == 10000.0
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes')
+def test_submit_orders_rejects_batch_when_net_cost_exceeds_cash(mock_get_quotes, client, test_user, auth_headers):
+    """
+    GIVEN un usuario con 10000 de saldo.
+    WHEN envía un lote de compras cuyo coste neto supera el saldo.
+    THEN no se ejecuta ninguna orden y la API devuelve un 400.
+    """
+    mock_get_quotes.return_value = {'AAPL': {'symbol': 'AAPL', 'price': 100.0}}
+    headers = auth_headers(test_user.id)
+    payload = {"orders": [{"ticker": "AAPL", "side": "buy", "quantity": 60},
+                          {"ticker": "AAPL", "side": "buy", "quantity": 60}]}
+
+    response = client.post('/api/portfolio/orders', headers=headers, json=payload)
+
+    assert response.status_code == 400
+    assert response.get_json()['msg'] == "Fondos insuficientes para realizar la compra"
+    assert Holding.query.filter_by(portfolio_id=test_user.portfolio.id).count() == 0
+    assert Transaction.query.filter_by(portfolio_id=test_user.portfolio.id).count() == 0
+
+
+# --- Tests para el endpoint /transactions ---
+
+def add_transactions(portfolio_id, rows):
+    """Inserta transacciones (ticker, tipo, fecha) con cantidad y precio fijos."""
+    from datetime import datetime
+    for ticker, type_, day in rows:
+        db.session.add(Transaction(portfolio_id=portfolio_id, ticker_symbol=ticker, type=type_,
+                                   quantity=Decimal('1'), price_per_share=Decimal('10'),
+                                   transaction_date=datetime.fromisoformat(day)))
+    db.session.commit()
+
+
+def test_transactions_are_paged_by_cursor_without_gaps_or_repeats(client, test_user, auth_headers):
+    """
+    GIVEN un usuario con 7 transacciones, varias con la misma fecha.
+    WHEN recorre el historial en páginas de 3 siguiendo `next_cursor`.
+    THEN recibe todas las transacciones una sola vez, de la más reciente a la más antigua.
+    """
+    headers = auth_headers(test_user.id)
+    add_transactions(test_user.portfolio.id, [('AAPL', TransactionType.BUY, f'2026-01-0{day} 10:00:00')
+                                              for day in (1, 2, 2, 2, 3, 4, 5)])
+
+    seen, cursor = [], None
+    for _ in range(5):
+        url = '/api/portfolio/transactions?limit=3' + (f'&cursor={cursor}' if cursor else '')
+        data = client.get(url, headers=headers).get_json()
+        seen += [(item['transaction_date'], item['id']) for item in data['transactions']]
+        cursor = data['next_cursor']
+        if not cursor:
+            break
+
+    assert len(seen) == 7 and len(set(seen)) == 7
+    assert seen == sorted(seen, reverse=True)
+    assert client.get('/api/portfolio/transactions?cursor=nope', headers=headers).status_code == 400
+
+
+def test_transactions_filter_by_ticker_type_and_dates(client, test_user, auth_headers):
+    """
+    GIVEN transacciones de varios tickers, tipos y fechas.
+    WHEN se filtra el historial por ticker, tipo y rango de fechas.
+    THEN solo se devuelven las transacciones que cumplen todos los filtros.
+    """
+    headers = auth_headers(test_user.id)
+    add_transactions(test_user.portfolio.id, [
+        ('AAPL', TransactionType.BUY, '2026-01-01 09:00:00'),
+        ('AAPL', TransactionType.SELL, '2026-01-02 09:00:00'),
+        ('AAPL', TransactionType.BUY, '2026-01-03 23:59:00'),
+        ('MSFT', TransactionType.BUY, '2026-01-03 09:00:00'),
+        ('AAPL', TransactionType.BUY, '2026-01-04 00:00:00'),
+    ])
+
+    response = client.get('/api/portfolio/transactions?ticker=aapl&type=buy&from=2026-01-02&to=2026-01-03',
+                          headers=headers)
+    data = response.get_json()
+
+    assert response.status_code == 200
+    assert [item['transaction_date'][:10] for item in data['transactions']] == ['2026-01-03']
+    assert data['next_cursor'] is None
+    assert client.get('/api/portfolio/transactions?type=hold', headers=headers).status_code == 400
@@ -0,0 +1,190 @@
+from collections import OrderedDict
+from unittest.mock import patch
+
+import numpy as np
+
+from app.services.market_service import MarketService
+from app.services.price_history import PriceHistoryStore, downsample_ohlc, downsample_lttb
+
+DAY = 86400
+
+
+def make_bars(count, start=0):
+    return [{'t': (start + i) * DAY, 'o': 100 + i, 'h': 101 + i, 'l': 99 + i, 'c': 100.5 + i, 'v': 1000}
+            for i in range(count)]
+
+
+# --- Tests para PriceHistoryStore ---
+
+def test_store_appends_incrementally_and_reads_ranges(tmp_path):
+    """
+    GIVEN un almacén con 10 barras.
+    WHEN se añaden barras que se solapan con las guardadas y se lee un rango.
+    THEN solo se añaden las posteriores y el rango se corta por fecha.
+    """
+    store = PriceHistoryStore(str(tmp_path))
+    assert store.append('aapl', make_bars(10)) == 10
+    assert store.append('AAPL', make_bars(5, start=8)) == 3
+
+    assert store.count('AAPL') == 13
+    assert store.last_timestamp('AAPL') == 12 * DAY
+    columns = store.read('AAPL', start=3 * DAY, end=5 * DAY)
+    assert columns['t'].tolist() == [3 * DAY, 4 * DAY, 5 * DAY]
+    assert columns['c'].tolist() == [103.5, 104.5, 105.5]
+
+
+def test_store_overwrites_last_bar_and_repairs_partial_writes(tmp_path):
+    """
+    GIVEN un almacén con una escritura interrumpida en una de las columnas.
+    WHEN llega de nuevo la última barra con otro cierre y después una barra nueva.
+    THEN se ignora la barra incompleta, se actualiza la última y se añade la nueva.
+    """
+    store = PriceHistoryStore(str(tmp_path))
+    store.append('MSFT', make_bars(3))
+    with open(tmp_path / 'MSFT' / 'c.bin', 'ab') as f:
+        f.write(np.array([999.0]).tobytes())
+    assert store.count('MSFT') == 3
+
+    updated = dict(make_bars(3)[-1], c=42.0)
+    assert store.append('MSFT', [updated, make_bars(1, start=3)[0]]) == 1
+
+    columns = store.read('MSFT')
+    assert columns['c'].tolist() == [100.5, 101.5, 42.0, 100.5]
+    assert columns['t'].tolist() == [0, DAY, 2 * DAY, 3 * DAY]
+
+
+def test_store_rejects_invalid_tickers(tmp_path):
+    """
+    GIVEN un ticker con caracteres de ruta.
+    WHEN se intenta leer su histórico.
+    THEN se lanza ValueError en lugar de tocar el sistema de ficheros.
+    """
+    store = PriceHistoryStore(str(tmp_path))
+    try:
+        store.read('../etc')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('Se esperaba ValueError')
+
+
+def test_store_replace_rewrites_the_series_without_breaking_open_reads(tmp_path):
+    """
+    GIVEN un almacén con 10 barras y una lectura ya abierta sobre ellas.
+    WHEN se reescribe la serie con cierres ajustados y después se vacía.
+    THEN las lecturas nuevas ven cada versión, la abierta conserva la suya y cambia la generación.
+    """
+    store = PriceHistoryStore(str(tmp_path))
+    store.append('AAPL', make_bars(10))
+    opened = store.read('AAPL')
+    generation = store.generation('AAPL')
+
+    adjusted = [dict(bar, c=bar['c'] / 2) for bar in make_bars(12)]
+    assert store.replace('AAPL', adjusted) == 12
+
+    assert store.read('AAPL')['c'].tolist() == [bar['c'] for bar in adjusted]
+    assert opened['c'].tolist() == [bar['c'] for bar in make_bars(10)]
+    assert store.generation('AAPL') != generation
+
+    store.truncate('AAPL')
+    assert store.count('AAPL') == 0
+    assert store.last_timestamp('AAPL') is None
+
+
+# --- Tests de reducción de puntos ---
+
+def test_downsample_ohlc_keeps_bucket_extremes():
+    """
+    GIVEN 1000 barras con un pico aislado.
+    WHEN se reducen a 100 velas.
+    THEN el pico se conserva como máximo y el volumen total no cambia.
+    """
+    bars = make_bars(1000)
+    bars[537]['h'] = 5000
+    columns = {name: np.array([bar[name] for bar in bars], dtype=float) for name in 'tohlcv'}
+
+    candles = downsample_ohlc(columns, 100)
+
+    assert len(candles['t']) == 100
+    assert candles['h'].max() == 5000
+    assert candles['v'].sum() == columns['v'].sum()
+    assert candles['o'][0] == columns['o'][0]
+    assert candles['c'][-1] == columns['c'][-1]
+
+
+def test_downsample_lttb_keeps_endpoints_and_spikes():
+    """
+    GIVEN una serie plana de 1000 cierres con un pico.
+    WHEN se reduce con LTTB a 50 puntos.
+    THEN se conservan el primer y el último punto y el pico.
+    """
+    columns = {name: np.zeros(1000) for name in 'tohlcv'}
+    columns['t'] = np.arange(1000, dtype=float)
+    columns['c'][400] = 50
+
+    sampled = downsample_lttb(columns, 50)
+
+    assert len(sampled['t']) == 50
+    assert sampled['t'][0] == 0 and sampled['t'][-1] == 999
+    assert 50 in sampled['c']
+
+
+# --- Tests de integración ---
+
+def test_history_endpoint_syncs_once_and_downsamples(client, test_user, tmp_path, auth_headers):
+    """
+    GIVEN un ticker sin histórico local.
+    WHEN se pide su histórico dos veces.
+    THEN FMP se consulta una sola vez y la respuesta viene reducida al número de puntos pedido.
+    """
+    with client.application.app_context():
+        headers = auth_headers(test_user.id)
+
+    with patch.object(MarketService, '_history', PriceHistoryStore(str(tmp_path))), \
+         patch.object(MarketService, '_history_synced', OrderedDict()), \
+         patch.object(MarketService, '_fetch_history', return_value=make_bars(900)) as mock_fetch:
+        first = client.get('/api/market/history/AAPL?points=300', headers=headers)
+        second = client.get('/api/market/history/AAPL?points=300&method=lttb', headers=headers)
+
+    assert first.status_code == 200
+    assert first.json['total'] == 900
+    assert len(first.json['t']) == 300
+    assert second.status_code == 200
+    assert len(second.json['c']) == 300
+    mock_fetch.assert_called_once()
+
+
+def test_history_endpoint_validates_parameters(client, test_user, auth_headers):
+    """
+    GIVEN un usuario autenticado.
+    WHEN pide el histórico con un método o una fecha no válidos.
+    THEN recibe un 400.
+    """
+    with client.application.app_context():
+        headers = auth_headers(test_user.id)
+
+    assert client.get('/api/market/history/AAPL?method=foo', headers=headers).status_code == 400
+    assert client.get('/api/market/history/AAPL?from=ayer', headers=headers).status_code == 400
+
+
+def test_sync_notices_a_reset_from_another_process_and_caps_its_memory(test_app, tmp_path):
+    """
+    GIVEN un ticker sincronizado hace poco y un límite de 2 tickers recordados.
+    WHEN otro proceso vacía su histórico y se sincronizan otros dos tickers.
+    THEN la siguiente lectura lo descarga de nuevo completo y solo se recuerdan los 2 últimos.
+    """
+    store = PriceHistoryStore(str(tmp_path))
+    with patch.object(MarketService, '_history', store), \
+         patch.object(MarketService, '_history_synced', OrderedDict()), \
+         patch.object(MarketService, 'HISTORY_SYNCED_MAX_ENTRIES', 2), \
+         patch.object(MarketService, '_fetch_history', return_value=make_bars(30)) as mock_fetch:
+        MarketService.get_daily_closes('AAPL')
+        PriceHistoryStore(str(tmp_path)).truncate('AAPL')
+
+        _, closes = MarketService.get_daily_closes('AAPL')
+        assert len(closes) == 30
+        assert mock_fetch.call_count == 2
+
+        MarketService.get_daily_closes('MSFT')
+        MarketService.get_daily_closes('TSLA')
+        assert list(MarketService._history_synced) == ['MSFT', 'TSLA']
@@ -0,0 +1,105 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from app import db
+from app.models import Holding, PriceSnapshot, utcnow
+from app.services.market_service import MarketService
+from app.services.price_ingestion import PriceIngestionWorker
+from app.services.price_store import PriceStore
+
+
+def fake_fetch(symbols):
+    return {symbol: {'symbol': symbol, 'price': 100.0 + len(symbol), 'name': symbol} for symbol in symbols}
+
+
+# --- Tests para la ingesta de precios ---
+
+@patch('app.services.market_service.MarketService._fetch_quotes', side_effect=fake_fetch)
+def test_ingestion_upserts_snapshots_for_live_universe(mock_fetch, test_app, test_user):
+    """
+    GIVEN un usuario con posiciones y un ticker pedido recientemente.
+    WHEN se ejecuta un ciclo de ingesta.
+    THEN se piden todos en bloque y se guardan (o actualizan) sus snapshots.
+    """
+    db.session.add(Holding(portfolio_id=test_user.portfolio.id, ticker_symbol='AAPL',
+                           quantity=Decimal('1'), average_purchase_price=Decimal('1')))
+    db.session.commit()
+    PriceStore.upsert_quotes({'MSFT': {'symbol': 'MSFT', 'price': 1.0}}, requested=True)
+    db.session.commit()
+
+    worker = PriceIngestionWorker(test_app)
+    assert worker.universe() == ['AAPL', 'MSFT']
+    assert worker.run_once() == 2
+
+    mock_fetch.assert_called_once_with(['AAPL', 'MSFT'])
+    snapshots = {s.ticker_symbol: s.price for s in PriceSnapshot.query.all()}
+    assert snapshots == {'AAPL': Decimal('104.0000'), 'MSFT': Decimal('104.0000')}
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_get_quote_reads_fresh_snapshot_instead_of_upstream(mock_fetch, test_app):
+    """
+    GIVEN un snapshot reciente de un ticker.
+    WHEN se pide su cotización.
+    THEN se sirve desde la base de datos sin llamar al proveedor.
+    """
+    PriceStore.upsert_quotes({'TSLA': {'symbol': 'TSLA', 'price': 250.5, 'name': 'Tesla'}})
+    db.session.commit()
+
+    quote = MarketService.get_quote('TSLA', allow_stale=False)
+
+    assert quote['price'] == 250.5
+    mock_fetch.assert_not_called()
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes', side_effect=fake_fetch)
+def test_trades_skip_snapshots_older_than_the_cache_ttl(mock_fetch, test_app):
+    """
+    GIVEN un snapshot de hace 40 s (válido para lecturas, más viejo que el TTL de la caché).
+    WHEN se pide la cotización para leerla y después para operar.
+    THEN la lectura usa el snapshot sin darlo por fresco en la caché y la operación pide el precio al proveedor.
+    """
+    PriceStore.upsert_quotes({'TSLA': {'symbol': 'TSLA', 'price': 250.5, 'name': 'Tesla'}})
+    PriceSnapshot.query.filter_by(ticker_symbol='TSLA').update(
+        {'fetched_at': utcnow() - timedelta(seconds=40)})
+    db.session.commit()
+
+    assert MarketService.get_quote('TSLA')['price'] == 250.5
+    mock_fetch.assert_not_called()
+
+    assert MarketService.get_quote('TSLA', allow_stale=False)['price'] == 104.0
+    mock_fetch.assert_called_once_with(['TSLA'])
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes', side_effect=fake_fetch)
+def test_quotes_fetched_inline_are_stored_as_snapshots(mock_fetch, client, test_user, auth_headers):
+    """
+    GIVEN un ticker sin snapshot.
+    WHEN un usuario pide su cotización.
+    THEN al terminar la petición se guarda el snapshot y pasa a formar parte del universo.
+    """
+    response = client.get('/api/market/quote/NVDA', headers=auth_headers(test_user.id))
+
+    assert response.status_code == 200
+    snapshot = PriceSnapshot.query.filter_by(ticker_symbol='NVDA').first()
+    assert snapshot is not None
+    assert snapshot.requested_at is not None
+    assert 'NVDA' in PriceStore.universe(recent_window=60)
+
+
+def test_price_demand_is_stored_outside_the_request_session(test_app, test_user):
+    """
+    GIVEN una petición con cotizaciones obtenidas y un cambio sin confirmar en su sesión.
+    WHEN termina la petición y se guardan los snapshots.
+    THEN se escriben en una transacción aparte y el cambio de la sesión no se confirma.
+    """
+    portfolio = test_user.portfolio
+    with test_app.test_request_context():
+        portfolio.cash_balance = Decimal('1')
+        MarketService._remember_fetched({'NVDA': {'symbol': 'NVDA', 'price': 120.0}})
+        MarketService._flush_price_demand(test_app.response_class())
+
+    db.session.rollback()
+    assert portfolio.cash_balance == Decimal('10000')
+    assert PriceSnapshot.query.filter_by(ticker_symbol='NVDA').one().requested_at is not None
@@ -0,0 +1,54 @@
+from unittest.mock import patch
+
+
+from app import db
+from app.models import User
+from app.services.principal import PrincipalLoader
+
+
+def test_principal_is_cached_between_requests(client, test_user, query_budget, auth_headers):
+    """
+    GIVEN un usuario autenticado.
+    WHEN consulta dos veces sus órdenes en espera.
+    THEN la identidad se carga con una consulta la primera vez y la segunda sale de la caché.
+    """
+    headers = auth_headers(test_user.id)
+    with query_budget(2) as first:
+        assert client.get('/api/portfolio/pending-orders', headers=headers).status_code == 200
+    with query_budget(1) as second:
+        assert client.get('/api/portfolio/pending-orders', headers=headers).status_code == 200
+
+    assert (first.count, second.count) == (2, 1)
+    principal = PrincipalLoader.load(test_user.id)
+    assert (principal.user_id, principal.portfolio_id, principal.username) == \
+        (test_user.id, test_user.portfolio.id, 'testuser')
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quote', return_value={'price': 100.0})
+def test_trade_invalidates_cached_cash_balance(mock_get_quote, client, test_user, auth_headers):
+    """
+    GIVEN la identidad del usuario en caché con su saldo inicial.
+    WHEN compra acciones.
+    THEN la siguiente carga refleja el saldo nuevo.
+    """
+    headers = auth_headers(test_user.id)
+    assert float(PrincipalLoader.load(test_user.id).cash_balance) == 10000.0
+
+    assert client.post('/api/portfolio/buy', headers=headers, json={'ticker': 'AAPL', 'quantity': 10}).status_code == 200
+
+    assert float(PrincipalLoader.load(test_user.id).cash_balance) == 9000.0
+
+
+def test_deleted_user_token_is_rejected(client, test_user, auth_headers):
+    """
+    GIVEN un token válido de un usuario que se ha borrado.
+    WHEN llama a una ruta protegida.
+    THEN recibe 401.
+    """
+    headers = auth_headers(test_user.id)
+    db.session.delete(db.session.get(User, test_user.id))
+    db.session.commit()
+    PrincipalLoader.invalidate(test_user.id)
+
+    response = client.get('/api/market/quote/AAPL', headers=headers)
+    assert response.status_code == 401
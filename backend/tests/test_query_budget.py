@@ -0,0 +1,115 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+import pytest
+
+from app import db
+from app.models import Holding, User
+from app.services.query_stats import QueryBudgetExceeded
+
+# Presupuestos de consultas por ruta. Son constantes: no deben crecer con el número
+# de posiciones u órdenes (un patrón N+1 los rompe).
+GET_PORTFOLIO_BUDGET = 2
+# La primera petición del usuario incluye además la carga de su identidad (PrincipalLoader)
+GET_PORTFOLIO_STALE_BUDGET = 8
+BUY_BUDGET = 8
+SELL_BUDGET = 8
+ORDERS_BUDGET = 10
+
+
+def fake_quotes(symbols, **kwargs):
+    return {symbol: {'symbol': symbol, 'price': 10.0} for symbol in symbols}
+
+
+def add_holdings(portfolio_id, count):
+    for number in range(count):
+        db.session.add(Holding(portfolio_id=portfolio_id, ticker_symbol=f'T{number}',
+                               quantity=Decimal('1'), average_purchase_price=Decimal('10')))
+    db.session.commit()
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes', side_effect=fake_quotes)
+def test_get_portfolio_query_count_does_not_grow_with_holdings(mock_get_quotes, client, test_user, query_budget,
+                                                               auth_headers):
+    """
+    GIVEN un usuario con 30 posiciones.
+    WHEN consulta su cartera con la valoración caducada y después al día.
+    THEN cada lectura cabe en su presupuesto fijo de consultas y lo indica en las cabeceras.
+    """
+    headers = auth_headers(test_user.id)
+    add_holdings(test_user.portfolio.id, 30)
+
+    with query_budget(GET_PORTFOLIO_STALE_BUDGET):
+        client.get('/api/portfolio/', headers=headers)
+    with query_budget(GET_PORTFOLIO_BUDGET):
+        response = client.get('/api/portfolio/', headers=headers)
+
+    assert response.status_code == 200
+    assert len(response.get_json()['holdings']) == 30
+    assert int(response.headers['X-Query-Count']) <= GET_PORTFOLIO_BUDGET
+    assert float(response.headers['X-Query-Time-Ms']) >= 0
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes', side_effect=fake_quotes)
+@patch('app.routes.portfolio_routes.MarketService.get_quote', return_value={'symbol': 'T0', 'price': 10.0})
+def test_trade_routes_stay_within_query_budget(mock_get_quote, mock_get_quotes, client, test_user, query_budget,
+                                               auth_headers):
+    """
+    GIVEN un usuario con varias posiciones.
+    WHEN compra, vende y envía un lote de 20 órdenes.
+    THEN cada ruta de operaciones cabe en su presupuesto fijo de consultas.
+    """
+    headers = auth_headers(test_user.id)
+    add_holdings(test_user.portfolio.id, 10)
+
+    with query_budget(BUY_BUDGET):
+        assert client.post('/api/portfolio/buy', headers=headers,
+                           json={"ticker": "T0", "quantity": "2"}).status_code == 200
+    with query_budget(SELL_BUDGET):
+        assert client.post('/api/portfolio/sell', headers=headers,
+                           json={"ticker": "T0", "quantity": "1"}).status_code == 200
+
+    orders = [{"ticker": f"T{number % 10}", "side": "sell" if number < 10 else "buy", "quantity": 1}
+              for number in range(20)]
+    with query_budget(ORDERS_BUDGET):
+        response = client.post('/api/portfolio/orders', headers=headers, json={"orders": orders})
+    assert response.get_json()['executed'] == 20
+
+
+def test_query_budget_fails_when_exceeded(test_app, query_budget):
+    """
+    GIVEN un presupuesto de una consulta.
+    WHEN el bloque ejecuta tres.
+    THEN falla con un error que enumera las sentencias ejecutadas.
+    """
+    with pytest.raises(QueryBudgetExceeded) as error:
+        with query_budget(1):
+            for _ in range(3):
+                db.session.execute(db.select(User.id)).all()
+
+    assert 'Se ejecutaron 3 consultas' in str(error.value)
+    assert 'SELECT users.id' in str(error.value)
+
+
+def test_query_stats_headers_are_off_outside_debug_and_tests():
+    """
+    GIVEN una app sin modo debug ni de tests y sin QUERY_STATS_HEADERS definido.
+    WHEN responde a una petición.
+    THEN no expone las cabeceras de instrumentación.
+    """
+    from app import create_app
+    from app.config import TestConfig
+
+    class ProductionLikeConfig(TestConfig):
+        TESTING = False
+
+    app = create_app(ProductionLikeConfig)
+    with app.app_context():
+        db.create_all()
+        response = app.test_client().get('/api/market/health')
+        db.session.remove()
+        db.drop_all()
+
+    assert response.status_code == 200
+    assert 'X-Query-Count' not in response.headers
+    assert 'X-Query-Time-Ms' not in response.headers
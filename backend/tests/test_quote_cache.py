@@ -0,0 +1,140 @@
+from unittest.mock import patch
+
+from app.services.quote_cache import QuoteCache, CacheLookup
+from app.services.market_service import MarketService
+
+
+class FakeClock:
+    """Reloj manual para controlar el paso del tiempo en los tests."""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+# --- Tests para QuoteCache ---
+
+def test_cache_entry_goes_from_fresh_to_stale_to_miss():
+    """
+    GIVEN una caché con TTL de 10s y ventana stale de 30s.
+    WHEN avanza el tiempo.
+    THEN la entrada pasa de fresca a caducada y finalmente desaparece.
+    """
+    clock = FakeClock()
+    cache = QuoteCache(ttl=10, stale_ttl=30, clock=clock)
+    cache.set('AAPL', {'price': 150.0})
+
+    assert cache.lookup('AAPL').state == CacheLookup.FRESH
+    clock.now = 15
+    result = cache.lookup('AAPL')
+    assert result.state == CacheLookup.STALE
+    assert result.value == {'price': 150.0}
+    clock.now = 41
+    assert cache.lookup('AAPL').state == CacheLookup.MISS
+    assert cache.stats()['expirations'] == 1
+
+
+def test_negative_entries_expire_quickly_and_are_never_stale():
+    """
+    GIVEN una búsqueda fallida guardada en la caché negativa.
+    WHEN pasa el TTL negativo.
+    THEN la entrada deja de servirse, sin pasar por el estado caducado.
+    """
+    clock = FakeClock()
+    cache = QuoteCache(ttl=10, stale_ttl=30, negative_ttl=2, clock=clock)
+    cache.set_negative('INVALID')
+
+    result = cache.lookup('INVALID')
+    assert result.state == CacheLookup.FRESH
+    assert result.value is None
+    clock.now = 3
+    assert cache.lookup('INVALID').state == CacheLookup.MISS
+    assert cache.stats()['negative_hits'] == 1
+
+
+def test_cache_evicts_least_recently_used_entries():
+    """
+    GIVEN una caché limitada a 2 entradas.
+    WHEN se inserta una tercera tras usar la primera.
+    THEN se expulsa la menos usada recientemente y se cuenta la expulsión.
+    """
+    cache = QuoteCache(max_entries=2)
+    cache.set('AAPL', {'price': 1})
+    cache.set('MSFT', {'price': 2})
+    cache.lookup('AAPL')
+    cache.set('TSLA', {'price': 3})
+
+    assert 'AAPL' in cache
+    assert 'MSFT' not in cache
+    assert cache.stats()['evictions'] == 1
+
+
+def test_cache_respects_memory_bound():
+    """
+    GIVEN una caché con un límite de bytes pequeño.
+    WHEN se insertan varias cotizaciones.
+    THEN el tamaño total nunca supera el límite.
+    """
+    cache = QuoteCache(max_bytes=100)
+    for i in range(10):
+        cache.set(f'T{i}', {'symbol': f'T{i}', 'price': 100.0 + i})
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 100
+    assert stats['evictions'] > 0
+
+
+# --- Tests para MarketService.get_quote ---
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_get_quote_uses_cache(mock_fetch, test_app):
+    """
+    GIVEN una cotización ya obtenida.
+    WHEN se vuelve a pedir dentro del TTL.
+    THEN no se llama de nuevo al proveedor.
+    """
+    mock_fetch.return_value = {'AAPL': {'symbol': 'AAPL', 'price': 150.0}}
+
+    assert MarketService.get_quote('aapl') == {'symbol': 'AAPL', 'price': 150.0}
+    assert MarketService.get_quote('AAPL') == {'symbol': 'AAPL', 'price': 150.0}
+    mock_fetch.assert_called_once_with(['AAPL'])
+    assert MarketService.cache_stats()['hits'] == 1
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_get_quote_refetches_stale_entry_when_stale_not_allowed(mock_fetch, test_app):
+    """
+    GIVEN una cotización caducada en la caché.
+    WHEN se pide con allow_stale=False (como en compras y ventas).
+    THEN se obtiene un precio nuevo de forma síncrona.
+    """
+    clock = FakeClock()
+    MarketService._cache = QuoteCache(ttl=10, stale_ttl=60, clock=clock)
+    MarketService._cache.set('AAPL', {'symbol': 'AAPL', 'price': 100.0})
+    clock.now = 20
+    mock_fetch.return_value = {'AAPL': {'symbol': 'AAPL', 'price': 110.0}}
+
+    quote = MarketService.get_quote('AAPL', allow_stale=False)
+
+    assert quote['price'] == 110.0
+    mock_fetch.assert_called_once_with(['AAPL'])
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_get_quotes_fills_from_cache_and_chunks_missing(mock_fetch, test_app):
+    """
+    GIVEN un ticker ya cacheado y un tamaño de bloque de 2 símbolos.
+    WHEN se piden cuatro cotizaciones a la vez.
+    THEN solo los tres que faltan se piden al proveedor, en dos bloques.
+    """
+    MarketService.QUOTE_BATCH_SIZE = 2
+    MarketService._cache.set('AAPL', {'symbol': 'AAPL', 'price': 150.0})
+    mock_fetch.side_effect = lambda symbols: {s: {'symbol': s, 'price': 10.0} for s in symbols if s != 'BAD'}
+
+    quotes = MarketService.get_quotes(['aapl', 'MSFT', 'TSLA', 'BAD'])
+
+    assert quotes['AAPL']['price'] == 150.0
+    assert quotes['MSFT']['price'] == 10.0
+    assert quotes['BAD'] is None
+    assert [call.args[0] for call in mock_fetch.call_args_list] == [['MSFT', 'TSLA'], ['BAD']]
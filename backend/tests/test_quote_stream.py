@@ -0,0 +1,171 @@
+import json
+from unittest.mock import patch
+
+import pytest
+
+from flask_jwt_extended import create_access_token
+
+from app.services.market_service import MarketService
+from app.services.quote_stream import QuoteStreamHub, StreamFullError
+
+
+class FakeFeed:
+    """Proveedor de precios controlado por el test; cuenta las consultas."""
+
+    def __init__(self, prices):
+        self.prices = prices
+        self.calls = []
+
+    def __call__(self, symbols):
+        self.calls.append(sorted(symbols))
+        return {symbol: {'symbol': symbol, 'price': self.prices[symbol]}
+                for symbol in symbols if symbol in self.prices}
+
+
+def make_hub(feed, max_clients=None):
+    hub = QuoteStreamHub(feed, interval=3600, max_clients=max_clients)
+    # El poller en segundo plano no se usa en los tests: se llama a poll_once a mano
+    hub._ensure_poller = lambda: None
+    return hub
+
+
+# --- Tests para QuoteStreamHub ---
+
+def test_hub_polls_each_symbol_once_and_pushes_only_changes():
+    """
+    GIVEN tres clientes suscritos a tickers que se solapan.
+    WHEN el poller hace dos ciclos y solo cambia el precio de AAPL.
+    THEN cada ciclo consulta cada ticker una vez y el segundo solo envía AAPL a sus suscriptores.
+    """
+    feed = FakeFeed({'AAPL': 100, 'MSFT': 200})
+    hub = make_hub(feed)
+    a = hub.subscribe(['AAPL'])
+    b = hub.subscribe(['AAPL', 'MSFT'])
+    c = hub.subscribe(['MSFT'])
+
+    assert hub.poll_once() == 2
+    assert set(b.next_batch(0)) == {'AAPL', 'MSFT'}
+    a.next_batch(0), c.next_batch(0)
+
+    feed.prices['AAPL'] = 101
+    assert hub.poll_once() == 1
+
+    assert feed.calls == [['AAPL', 'MSFT'], ['AAPL', 'MSFT']]
+    assert a.next_batch(0) == {'AAPL': {'symbol': 'AAPL', 'price': 101}}
+    assert b.next_batch(0) == {'AAPL': {'symbol': 'AAPL', 'price': 101}}
+    assert c.next_batch(0) == {}
+
+
+def test_slow_client_gets_conflated_latest_price():
+    """
+    GIVEN un cliente que no lee durante varios ciclos con cambios de precio.
+    WHEN por fin lee.
+    THEN recibe una sola cotización por ticker, la más reciente.
+    """
+    feed = FakeFeed({'AAPL': 100})
+    hub = make_hub(feed)
+    slow = hub.subscribe(['AAPL'])
+
+    for price in (100, 101, 102, 103):
+        feed.prices['AAPL'] = price
+        hub.poll_once()
+
+    assert slow.next_batch(0) == {'AAPL': {'symbol': 'AAPL', 'price': 103}}
+    assert slow.dropped == 3
+
+
+def test_unsubscribe_removes_idle_symbols_from_polling():
+    """
+    GIVEN un cliente suscrito que se desconecta.
+    WHEN el poller hace otro ciclo.
+    THEN no se consulta ningún ticker.
+    """
+    feed = FakeFeed({'AAPL': 100})
+    hub = make_hub(feed)
+    subscription = hub.subscribe(['AAPL'])
+    hub.unsubscribe(subscription)
+
+    assert hub.poll_once() == 0
+    assert feed.calls == []
+    assert hub.stats()['clients'] == 0
+
+
+def test_close_stops_the_poller_and_ends_open_streams():
+    """
+    GIVEN un hub con su poller en marcha y un cliente suscrito.
+    WHEN se cierra el hub (al sustituirlo por otro).
+    THEN el hilo del poller termina sin esperar al siguiente ciclo y el cliente queda cerrado.
+    """
+    hub = QuoteStreamHub(FakeFeed({'AAPL': 100}), interval=3600)
+    subscription = hub.subscribe(['AAPL'])
+    poller = hub._thread
+
+    hub.close()
+    poller.join(timeout=1)
+
+    assert not poller.is_alive()
+    assert subscription.closed
+    assert hub.stats()['clients'] == 0
+
+
+# --- Tests de integración ---
+
+def test_stream_endpoint_sends_initial_quotes(client, test_user):
+    """
+    GIVEN un usuario autenticado con el token en la query string (como EventSource).
+    WHEN abre el stream de AAPL.
+    THEN recibe un evento SSE con la cotización actual.
+    """
+    with client.application.app_context():
+        token = create_access_token(identity=str(test_user.id))
+
+    hub = make_hub(FakeFeed({}))
+    quote = {'symbol': 'AAPL', 'price': 150.0}
+    with patch.object(MarketService, '_stream', hub), \
+         patch.object(MarketService, 'get_quotes', return_value={'AAPL': quote}):
+        response = client.get(f'/api/market/stream?symbols=aapl&jwt={token}', buffered=False)
+        first_event = next(response.response)
+        assert hub.stats()['clients'] == 1
+        response.close()
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    assert json.loads(first_event.decode().split('data: ')[1]) == {'AAPL': quote}
+    assert hub.stats()['clients'] == 0
+
+
+def test_stream_endpoint_requires_symbols(client, test_user, auth_headers):
+    """
+    GIVEN un usuario autenticado.
+    WHEN abre el stream sin tickers.
+    THEN recibe un 400.
+    """
+    with client.application.app_context():
+        headers = auth_headers(test_user.id)
+
+    assert client.get('/api/market/stream', headers=headers).status_code == 400
+
+
+def test_stream_endpoint_caps_open_streams(client, test_user):
+    """
+    GIVEN un proceso que admite un único stream abierto.
+    WHEN un segundo cliente abre otro mientras el primero sigue conectado.
+    THEN recibe un 503 con Retry-After y, al cerrarse el primero, vuelve a haber hueco.
+    """
+    with client.application.app_context():
+        token = create_access_token(identity=str(test_user.id))
+
+    hub = make_hub(FakeFeed({}), max_clients=1)
+    with patch.object(MarketService, '_stream', hub), \
+         patch.object(MarketService, 'get_quotes', return_value={}):
+        first = client.get(f'/api/market/stream?symbols=AAPL&jwt={token}', buffered=False)
+        next(first.response)
+        rejected = client.get(f'/api/market/stream?symbols=MSFT&jwt={token}', buffered=False)
+        assert rejected.status_code == 503
+        assert rejected.headers['Retry-After'] == '30'
+        first.close()
+
+    assert hub.stats()['clients'] == 0
+    hub.subscribe(['AAPL'])
+    with pytest.raises(StreamFullError):
+        hub.subscribe(['MSFT'])
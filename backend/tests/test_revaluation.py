@@ -0,0 +1,65 @@
+from decimal import Decimal
+
+import numpy as np
+
+from app import db
+from app.models import User, Portfolio, Holding, PriceSnapshot, PortfolioSnapshot, utcnow
+from app.services.revaluation import PortfolioRevaluation
+
+
+def add_portfolio(username, cash, holdings):
+    user = User(username=username, email=f'{username}@example.com', password_hash='x')
+    user.portfolio = Portfolio(cash_balance=Decimal(cash))
+    db.session.add(user)
+    db.session.flush()
+    for ticker, quantity, average_price in holdings:
+        db.session.add(Holding(portfolio_id=user.portfolio.id, ticker_symbol=ticker,
+                               quantity=Decimal(quantity), average_purchase_price=Decimal(average_price)))
+    return user.portfolio
+
+
+def test_revaluation_values_every_portfolio_in_one_pass(test_app, test_user):
+    """
+    GIVEN varias carteras con posiciones en tickers compartidos y un ticker sin precio.
+    WHEN se ejecuta la revalorización en bloque.
+    THEN se inserta un snapshot por cartera con el valor correcto.
+    """
+    rich = add_portfolio('rich', '1000.00', [('AAPL', '10', '100'), ('MSFT', '2', '300'), ('XYZ', '4', '5')])
+    poor = add_portfolio('poor', '50.00', [('AAPL', '1', '90')])
+    db.session.add(PriceSnapshot(ticker_symbol='AAPL', price=Decimal('200'), fetched_at=utcnow()))
+    db.session.commit()
+
+    assert PortfolioRevaluation.run(prices={'MSFT': 400.0}) == 3
+
+    snapshots = {s.portfolio_id: s for s in PortfolioSnapshot.query.all()}
+    # XYZ no tiene precio: se valora a su precio medio de compra
+    assert snapshots[rich.id].holdings_value == Decimal('2820')
+    assert snapshots[rich.id].total_value == Decimal('3820')
+    assert snapshots[poor.id].total_value == Decimal('250')
+    assert snapshots[test_user.portfolio.id].total_value == Decimal('10000')
+    assert len({s.taken_at for s in snapshots.values()}) == 1
+
+
+def test_revaluation_appends_a_time_series(test_app, test_user):
+    """
+    GIVEN una cartera ya revalorizada una vez.
+    WHEN se ejecuta de nuevo la revalorización.
+    THEN se añade otro snapshot en lugar de sobrescribir el anterior.
+    """
+    PortfolioRevaluation.run()
+    PortfolioRevaluation.run()
+
+    assert PortfolioSnapshot.query.filter_by(portfolio_id=test_user.portfolio.id).count() == 2
+
+
+def test_holdings_of_unknown_portfolios_are_not_credited_to_others(test_app):
+    """
+    GIVEN posiciones de carteras que no están en la lista valorada (creadas después de leerla).
+    WHEN se calcula el valor de las posiciones.
+    THEN no se suman a la cartera siguiente ni desbordan el array.
+    """
+    holdings = [(1, 'AAPL', 2.0, 10.0, None), (2, 'AAPL', 5.0, 10.0, None), (9, 'AAPL', 1.0, 10.0, None)]
+
+    values = PortfolioRevaluation.compute_holdings_value(np.array([1, 3], dtype=np.int64), holdings)
+
+    assert values.tolist() == [20.0, 0.0]
@@ -0,0 +1,359 @@
+import hashlib
+import json
+import os
+from decimal import Decimal
+from pathlib import Path
+
+import pytest
+
+from app import db
+from app.models import User, Payout, PayoutStatus
+from app.services.rewards import RewardQueue, RewardDistributor
+
+ALICE = '0x' + '11' * 20
+BOB = '0x' + '22' * 20
+CAROL = '0x' + '33' * 20
+
+
+class FakeChain:
+    """
+    Nodo en memoria con la interfaz de `KrnTokenClient`: las transacciones emitidas
+    esperan en el mempool hasta `mine()`, que las mina en orden de nonce si pagan al
+    menos `min_gas_price`. Una transacción con un nonce ya en el mempool lo sustituye
+    solo si paga más gas.
+    """
+    address = '0x' + 'aa' * 20
+
+    def __init__(self, nonce=0):
+        self.nonce = nonce
+        self.mempool = {}
+        self.receipts = {}
+        self.balances = {}
+        self.reverting = set()
+        self.down = False
+        self.nonce_lookups = 0
+        self.broadcasts = []
+        self.current_gas_price = 1
+        self.min_gas_price = 1
+
+    def pending_nonce(self):
+        self.nonce_lookups += 1
+        return self.nonce + len(self.mempool)
+
+    def mined_nonce(self):
+        return self.nonce
+
+    def gas_price(self):
+        return self.current_gas_price
+
+    def sign_transfer(self, nonce, recipient, units, gas_price):
+        raw = json.dumps([nonce, recipient, units, gas_price])
+        return '0x' + hashlib.sha256(raw.encode()).hexdigest(), raw
+
+    def broadcast(self, raw_tx):
+        if self.down:
+            raise ConnectionError("node unreachable")
+        self.broadcasts.append(raw_tx)
+        tx_hash = '0x' + hashlib.sha256(raw_tx.encode()).hexdigest()
+        transaction = json.loads(raw_tx)
+        if transaction[0] < self.nonce:  # 'nonce too low': el cliente real lo ignora
+            return
+        for known_hash, known in list(self.mempool.items()):
+            if known[0] == transaction[0] and known_hash != tx_hash:
+                if transaction[3] <= known[3]:
+                    raise ValueError("replacement transaction underpriced")
+                del self.mempool[known_hash]
+        self.mempool[tx_hash] = transaction
+
+    def mine(self):
+        for tx_hash, (nonce, recipient, units, gas_price) in sorted(self.mempool.items(),
+                                                                   key=lambda item: item[1][0]):
+            if nonce != self.nonce or gas_price < self.min_gas_price:
+                break
+            success = recipient not in self.reverting
+            if success:
+                self.balances[recipient] = self.balances.get(recipient, 0) + units
+            self.receipts[tx_hash] = (1 if success else 0, 100 + nonce)
+            del self.mempool[tx_hash]
+            self.nonce += 1
+
+    def receipt(self, tx_hash):
+        return self.receipts.get(tx_hash)
+
+
+@pytest.fixture
+def recipients(test_app, test_user):
+    """El usuario de test y dos más, con su dirección de billetera."""
+    users = [test_user]
+    for name in ('bob', 'carol'):
+        user = User(username=name, email=f'{name}@example.com', password_hash='x')
+        db.session.add(user)
+        users.append(user)
+    db.session.commit()
+    return list(zip([user.id for user in users], (ALICE, BOB, CAROL)))
+
+
+def payouts():
+    db.session.expire_all()
+    return Payout.query.order_by(Payout.id).all()
+
+
+def test_enqueue_is_idempotent_per_reference(test_app, recipients):
+    """
+    GIVEN el reparto de una liga.
+    WHEN se encola dos veces (y otra vez con una referencia distinta).
+    THEN cada usuario tiene un único envío por referencia y los datos no válidos se rechazan.
+    """
+    entries = [(user_id, address, '12.5') for user_id, address in recipients]
+    assert RewardQueue.enqueue('league:1:2026-W42', entries) == 3
+    assert RewardQueue.enqueue('league:1:2026-W42', entries) == 0
+    assert RewardQueue.enqueue('league:1:2026-W43', entries[:1]) == 1
+    assert RewardQueue.summary()['PENDING'] == 4
+    assert payouts()[0].amount == Decimal('12.5')
+
+    with pytest.raises(ValueError):
+        RewardQueue.enqueue('league:1:2026-W44', [(recipients[0][0], '0x1234', '1')])
+    with pytest.raises(ValueError):
+        RewardQueue.enqueue('league:1:2026-W44', [(recipients[0][0], ALICE, '-1')])
+
+
+def test_distributor_pipelines_transfers_with_local_nonces(test_app, recipients):
+    """
+    GIVEN tres envíos encolados y una tesorería con 7 transacciones previas.
+    WHEN el distribuidor ejecuta un ciclo, se mina y ejecuta otro.
+    THEN el primer ciclo emite las tres con nonces consecutivos sin esperar recibos ni
+         volver a pedir el nonce, y el segundo las confirma con el importe en unidades mínimas.
+    """
+    chain = FakeChain(nonce=7)
+    RewardQueue.enqueue('league:1', [(user_id, address, '2') for user_id, address in recipients])
+    distributor = RewardDistributor(test_app, client=chain)
+
+    assert distributor.run_once()['submitted'] == 3
+    assert [(payout.status, payout.nonce) for payout in payouts()] == [(PayoutStatus.SUBMITTED, 7),
+                                                                      (PayoutStatus.SUBMITTED, 8),
+                                                                      (PayoutStatus.SUBMITTED, 9)]
+    assert len(chain.mempool) == 3 and not chain.receipts
+
+    RewardQueue.enqueue('league:2', [(recipients[0][0], ALICE, '1')])
+    assert distributor.run_once()['submitted'] == 1
+    assert payouts()[-1].nonce == 10
+    assert chain.nonce_lookups == 1
+
+    chain.mine()
+    report = distributor.run_once()
+    assert report['confirmed'] == 4
+    assert all(payout.status == PayoutStatus.CONFIRMED for payout in payouts())
+    assert chain.balances == {ALICE: 3 * 10 ** 18, BOB: 2 * 10 ** 18, CAROL: 2 * 10 ** 18}
+
+
+def test_failed_broadcast_is_retried_with_the_same_transaction(test_app, recipients):
+    """
+    GIVEN el nodo caído al emitir un lote.
+    WHEN vuelve, el distribuidor se reinicia y se reemite pasado el plazo.
+    THEN se reemiten las mismas transacciones firmadas (mismo nonce y hash), se paga una sola vez
+         y el nuevo proceso continúa con el nonce siguiente al último firmado.
+    """
+    chain = FakeChain()
+    RewardQueue.enqueue('league:1', [(user_id, address, '1') for user_id, address in recipients[:2]])
+    chain.down = True
+    RewardDistributor(test_app, client=chain).run_once()
+    signed = [(payout.status, payout.tx_hash) for payout in payouts()]
+    assert all(status == PayoutStatus.SUBMITTED for status, _ in signed)
+    assert all(payout.last_error for payout in payouts())
+
+    chain.down = False
+    restarted = RewardDistributor(test_app, client=chain, rebroadcast_after=0)
+    assert restarted.run_once()['rebroadcast'] == 2
+    assert restarted.run_once()['rebroadcast'] == 2  # Reemitir una transacción ya conocida es inocuo
+    chain.mine()
+    restarted.run_once()
+    assert [(payout.status, payout.tx_hash) for payout in payouts()] == [
+        (PayoutStatus.CONFIRMED, tx_hash) for _, tx_hash in signed]
+    assert chain.balances == {ALICE: 10 ** 18, BOB: 10 ** 18}
+    assert len(chain.broadcasts) == 4 and len(set(chain.broadcasts)) == 2
+
+    RewardQueue.enqueue('league:2', [(recipients[2][0], CAROL, '1')])
+    restarted.run_once()
+    assert payouts()[-1].nonce == 2
+
+
+def test_restart_keeps_nonces_of_signed_but_unsent_transfers(test_app, recipients):
+    """
+    GIVEN dos envíos firmados y guardados que nunca llegaron al nodo.
+    WHEN arranca otro distribuidor con un envío nuevo en la cola.
+    THEN no reutiliza sus nonces aunque la cadena aún no los conozca.
+    """
+    chain = FakeChain()
+    chain.down = True
+    RewardQueue.enqueue('league:1', [(user_id, address, '1') for user_id, address in recipients[:2]])
+    RewardDistributor(test_app, client=chain).run_once()
+    chain.down = False
+
+    RewardQueue.enqueue('league:2', [(recipients[2][0], CAROL, '1')])
+    RewardDistributor(test_app, client=chain).run_once()
+    assert [payout.nonce for payout in payouts()] == [0, 1, 2]
+
+
+def test_reverted_transfer_is_requeued_until_max_attempts(test_app, recipients):
+    """
+    GIVEN una transferencia que revierte en la cadena.
+    WHEN el distribuidor lee su recibo.
+    THEN vuelve a la cola con un nonce nuevo y, agotados los intentos, queda como fallida.
+    """
+    chain = FakeChain()
+    chain.reverting.add(BOB)
+    RewardQueue.enqueue('league:1', [(recipients[1][0], BOB, '1')])
+    distributor = RewardDistributor(test_app, client=chain, max_attempts=2)
+
+    distributor.run_once()
+    chain.mine()
+    report = distributor.run_once()
+    assert report['requeued'] == 1 and report['submitted'] == 1
+    assert payouts()[0].nonce == 1
+
+    chain.mine()
+    assert distributor.run_once()['failed'] == 1
+    payout = payouts()[0]
+    assert (payout.status, payout.attempts) == (PayoutStatus.FAILED, 2)
+    assert 'reverted' in payout.last_error
+    assert chain.balances == {}
+
+
+def test_in_flight_limit_holds_back_new_batches(test_app, recipients):
+    """
+    GIVEN un máximo de dos envíos sin confirmar.
+    WHEN hay tres en la cola.
+    THEN se emiten dos y el tercero espera a que se confirmen.
+    """
+    chain = FakeChain()
+    RewardQueue.enqueue('league:1', [(user_id, address, '1') for user_id, address in recipients])
+    distributor = RewardDistributor(test_app, client=chain, max_in_flight=2)
+
+    assert distributor.run_once()['submitted'] == 2
+    assert distributor.run_once()['submitted'] == 0
+    chain.mine()
+    report = distributor.run_once()
+    assert (report['confirmed'], report['submitted']) == (2, 1)
+
+
+def test_underpriced_transfer_is_replaced_with_more_gas(test_app, recipients):
+    """
+    GIVEN una transferencia emitida con un gas que la red ya no acepta y otra en la cola.
+    WHEN se ha reemitido `replace_after` veces sin minarse.
+    THEN se sustituye con el mismo nonce y más gas, se mina, se paga una sola vez y la
+         cola continúa.
+    """
+    chain = FakeChain()
+    RewardQueue.enqueue('league:1', [(recipients[0][0], ALICE, '1')])
+    distributor = RewardDistributor(test_app, client=chain, rebroadcast_after=0, max_in_flight=1,
+                                    replace_after=2, gas_bump=10)
+    distributor.run_once()
+    original = payouts()[0].tx_hash
+    RewardQueue.enqueue('league:2', [(recipients[1][0], BOB, '1')])
+    chain.min_gas_price = chain.current_gas_price = 5
+
+    for _ in range(2):
+        chain.mine()
+        report = distributor.run_once()
+        assert (report['rebroadcast'], report['replaced'], report['submitted']) == (1, 0, 0)
+    report = distributor.run_once()
+    assert (report['rebroadcast'], report['replaced']) == (1, 1)
+    payout = payouts()[0]
+    assert (payout.nonce, payout.gas_price, payout.replaced_tx_hashes) == (0, 5, original)
+    assert payout.tx_hash != original
+
+    chain.mine()
+    report = distributor.run_once()
+    assert (report['confirmed'], report['submitted']) == (1, 1)
+    chain.mine()
+    distributor.run_once()
+    assert [(payout.status, payout.nonce) for payout in payouts()] == [(PayoutStatus.CONFIRMED, 0),
+                                                                      (PayoutStatus.CONFIRMED, 1)]
+    assert chain.balances == {ALICE: 10 ** 18, BOB: 10 ** 18}
+
+
+def test_replaced_transfer_is_confirmed_by_any_of_its_versions(test_app, recipients):
+    """
+    GIVEN una transferencia sustituida por otra con más gas.
+    WHEN la que se mina es la versión original.
+    THEN el envío se confirma con el hash de esa versión.
+    """
+    chain = FakeChain()
+    RewardQueue.enqueue('league:1', [(recipients[0][0], ALICE, '1')])
+    distributor = RewardDistributor(test_app, client=chain, rebroadcast_after=0, replace_after=0)
+    distributor.run_once()
+    original = payouts()[0].tx_hash
+    original_raw = chain.broadcasts[0]
+    assert distributor.run_once()['replaced'] == 1
+
+    chain.mempool.clear()
+    chain.broadcast(original_raw)
+    chain.mine()
+    assert distributor.run_once()['confirmed'] == 1
+    payout = payouts()[0]
+    assert (payout.status, payout.tx_hash) == (PayoutStatus.CONFIRMED, original)
+
+
+def test_transfer_whose_nonce_is_taken_is_requeued(test_app, recipients):
+    """
+    GIVEN una transferencia descartada por el nodo cuyo nonce usa otra transacción de la tesorería.
+    WHEN el distribuidor comprueba los envíos en curso.
+    THEN vuelve a la cola con un nonce nuevo y, agotados los intentos, queda como fallida.
+    """
+    chain = FakeChain()
+    RewardQueue.enqueue('league:1', [(recipients[1][0], BOB, '1')])
+    distributor = RewardDistributor(test_app, client=chain, max_attempts=2)
+    distributor.run_once()
+
+    chain.mempool.clear()
+    chain.nonce += 1
+    report = distributor.run_once()
+    assert (report['requeued'], report['submitted']) == (1, 1)
+    assert payouts()[0].nonce == 1
+
+    chain.mempool.clear()
+    chain.nonce += 1
+    assert distributor.run_once()['failed'] == 1
+    payout = payouts()[0]
+    assert payout.status == PayoutStatus.FAILED and 'used by another transaction' in payout.last_error
+    assert chain.balances == {}
+
+
+HARDHAT_ACCOUNT_KEY = '0xac0974bec39a17e36ba4a6b4d238ff944bacb478cbed5efcae784d7bf4f2ff80'
+
+
+@pytest.mark.skipif(not os.environ.get('HARDHAT_RPC_URL'),
+                    reason="Requiere un nodo local: cd blockchain && npx hardhat compile && npx hardhat node")
+def test_distribution_against_hardhat_node(test_app, recipients):
+    """
+    GIVEN un KranToken recién desplegado en el nodo de Hardhat (cuenta 0 como tesorería).
+    WHEN se encolan tres envíos y el distribuidor ejecuta ciclos hasta confirmarlos.
+    THEN cada destinatario recibe su importe exacto.
+    """
+    web3 = pytest.importorskip('web3')
+    from app.services.rewards import KrnTokenClient
+
+    artifact = json.loads((Path(__file__).resolve().parents[1] / 'blockchain' / 'artifacts' / 'contracts'
+                           / 'KranToken.sol' / 'KranToken.json').read_text())
+    w3 = web3.Web3(web3.Web3.HTTPProvider(os.environ['HARDHAT_RPC_URL']))
+    treasury = w3.eth.account.from_key(HARDHAT_ACCOUNT_KEY)
+    factory = w3.eth.contract(abi=artifact['abi'], bytecode=artifact['bytecode'])
+    deployment = factory.constructor(10 ** 9 * 10 ** 18).build_transaction({
+        'from': treasury.address, 'nonce': w3.eth.get_transaction_count(treasury.address, 'pending'),
+    })
+    signed = treasury.sign_transaction(deployment)
+    tx_hash = w3.eth.send_raw_transaction(getattr(signed, 'raw_transaction', None) or signed.rawTransaction)
+    token = w3.eth.contract(address=w3.eth.wait_for_transaction_receipt(tx_hash).contractAddress,
+                            abi=artifact['abi'])
+
+    RewardQueue.enqueue('hardhat', [(user_id, address, '1.5') for user_id, address in recipients])
+    client = KrnTokenClient(os.environ['HARDHAT_RPC_URL'], token.address, HARDHAT_ACCOUNT_KEY)
+    distributor = RewardDistributor(test_app, client=client)
+    for _ in range(10):
+        distributor.run_once()
+        if RewardQueue.summary()['CONFIRMED'] == 3:
+            break
+
+    assert RewardQueue.summary()['CONFIRMED'] == 3
+    for _, address in recipients:
+        assert token.functions.balanceOf(web3.Web3.to_checksum_address(address)).call() == 15 * 10 ** 17
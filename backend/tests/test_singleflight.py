@@ -0,0 +1,80 @@
+import threading
+import time
+from unittest.mock import patch
+
+from app.services.cache_backends import SQLiteCacheBackend
+from app.services.market_service import MarketService
+from app.services.quote_cache import QuoteCache
+
+
+def slow_fetch(symbols):
+    time.sleep(0.2)
+    return {symbol: {'symbol': symbol, 'price': 100.0} for symbol in symbols}
+
+
+# --- Tests para la agrupación de peticiones concurrentes ---
+
+@patch('app.services.market_service.MarketService._fetch_quotes', side_effect=slow_fetch)
+def test_concurrent_requests_for_same_ticker_share_one_fetch(mock_fetch, test_app):
+    """
+    GIVEN un ticker sin cotización en la caché.
+    WHEN diez hilos lo piden a la vez.
+    THEN solo se hace una consulta al proveedor y todos reciben el mismo precio.
+    """
+    results = []
+
+    def worker():
+        results.append(MarketService.get_quote('AAPL', allow_stale=False))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert mock_fetch.call_count == 1
+    assert [quote['price'] for quote in results] == [100.0] * 10
+    assert MarketService._flight.stats()['coalesced'] == 9
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_waiting_for_an_in_flight_fetch_is_bounded(mock_fetch, test_app):
+    """
+    GIVEN una consulta en curso para un ticker que nunca termina.
+    WHEN otra petición pide el mismo ticker.
+    THEN deja de esperar al agotarse el tiempo máximo y no llama al proveedor.
+    """
+    MarketService.SINGLEFLIGHT_TIMEOUT = 0.1
+    MarketService._flight.claim(['MSFT'])
+
+    started = time.monotonic()
+    quote = MarketService.get_quote('MSFT', allow_stale=False)
+
+    assert quote is None
+    assert time.monotonic() - started < 1
+    mock_fetch.assert_not_called()
+
+
+@patch('app.services.market_service.MarketService._fetch_quotes')
+def test_shared_backend_coalesces_across_workers(mock_fetch, test_app, tmp_path):
+    """
+    GIVEN una caché SQLite compartida y otro worker que ya está consultando un ticker.
+    WHEN este worker pide el mismo ticker.
+    THEN espera a que el otro worker publique la cotización en lugar de consultarla él.
+    """
+    path = str(tmp_path / 'quotes.db')
+    MarketService._cache = QuoteCache(backend=SQLiteCacheBackend(path))
+    other_worker = QuoteCache(backend=SQLiteCacheBackend(path))
+    token = other_worker.acquire_lock('TSLA', ttl=5)
+    assert token
+
+    def publish():
+        time.sleep(0.1)
+        other_worker.set('TSLA', {'symbol': 'TSLA', 'price': 250.0})
+        other_worker.release_lock('TSLA', token)
+
+    threading.Thread(target=publish).start()
+    quote = MarketService.get_quote('TSLA', allow_stale=False)
+
+    assert quote == {'symbol': 'TSLA', 'price': 250.0}
+    mock_fetch.assert_not_called()
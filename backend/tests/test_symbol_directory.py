@@ -0,0 +1,118 @@
+import json
+from unittest.mock import patch
+
+
+from app.services.http_client import UpstreamError
+from app.services.market_service import MarketService
+from app.services.symbol_directory import SymbolDirectory
+
+SYMBOLS = [
+    {"symbol": "AAPL", "name": "Apple Inc.", "currency": "USD", "exchangeShortName": "NASDAQ"},
+    {"symbol": "APLE", "name": "Apple Hospitality REIT, Inc.", "currency": "USD", "exchangeShortName": "NYSE"},
+    {"symbol": "AMZN", "name": "Amazon.com, Inc.", "currency": "USD", "exchangeShortName": "NASDAQ"},
+    {"symbol": "MSFT", "name": "Microsoft Corporation", "currency": "USD", "exchangeShortName": "NASDAQ"},
+    {"symbol": "SAP", "name": "SAP SE", "currency": "EUR", "exchangeShortName": "XETRA"},
+]
+
+
+# --- Tests para SymbolDirectory ---
+
+def test_search_ranks_exact_symbol_then_prefix_then_name():
+    """
+    GIVEN un directorio con varios símbolos.
+    WHEN se busca por ticker, por prefijo o por nombre.
+    THEN primero va el ticker exacto, luego los prefijos de ticker y después los de nombre.
+    """
+    directory = SymbolDirectory()
+    directory.load(SYMBOLS)
+
+    assert [r['symbol'] for r in directory.search('aapl')] == ['AAPL']
+    assert [r['symbol'] for r in directory.search('ap')] == ['APLE', 'AAPL']
+    assert [r['symbol'] for r in directory.search('apple')] == ['AAPL', 'APLE']
+    assert [r['symbol'] for r in directory.search('micro')] == ['MSFT']
+
+
+def test_search_applies_exchange_and_currency_filters():
+    """
+    GIVEN un directorio con símbolos de varios mercados.
+    WHEN se busca con filtros de mercado o divisa.
+    THEN solo se devuelven los que cumplen el filtro.
+    """
+    directory = SymbolDirectory()
+    directory.load(SYMBOLS)
+
+    assert [r['symbol'] for r in directory.search('apple', exchange='nyse')] == ['APLE']
+    assert [r['symbol'] for r in directory.search('sap', currency='EUR')] == ['SAP']
+    assert directory.search('sap', currency='USD') == []
+
+
+def test_fuzzy_search_tolerates_typos():
+    """
+    GIVEN un directorio de símbolos.
+    WHEN se busca un nombre mal escrito.
+    THEN se encuentra por similitud de trigramas.
+    """
+    directory = SymbolDirectory()
+    directory.load(SYMBOLS)
+
+    assert directory.search('microsfot')[0]['symbol'] == 'MSFT'
+
+
+def test_directory_reloads_when_file_changes(tmp_path):
+    """
+    GIVEN un directorio cargado desde un fichero.
+    WHEN el fichero se regenera.
+    THEN el directorio se recarga en la siguiente comprobación.
+    """
+    path = tmp_path / 'symbols.json'
+    path.write_text(json.dumps(SYMBOLS[:1]))
+    directory = SymbolDirectory(str(path), reload_interval=0)
+    directory.load()
+    assert len(directory) == 1
+
+    directory.save(SYMBOLS)
+    other = SymbolDirectory(str(path), reload_interval=0)
+    assert other.maybe_reload() is True
+    assert len(other) == len(SYMBOLS)
+
+
+# --- Tests para el endpoint de búsqueda ---
+
+def test_search_endpoint_answers_locally(client, test_user, auth_headers):
+    """
+    GIVEN un directorio local cargado.
+    WHEN se llama a /api/market/search con filtros.
+    THEN se responde sin llamar al proveedor.
+    """
+    MarketService._directory.load(SYMBOLS)
+    headers = auth_headers(test_user.id)
+
+    with patch.object(MarketService._client, 'get_json') as mock_get_json:
+        response = client.get('/api/market/search/apple?exchange=NASDAQ', headers=headers)
+
+    assert response.status_code == 200
+    assert [r['symbol'] for r in response.get_json()] == ['AAPL']
+    mock_get_json.assert_not_called()
+
+
+def test_search_fallback_caches_provider_responses(client, test_user, auth_headers):
+    """
+    GIVEN ningún directorio local cargado.
+    WHEN se repite la misma búsqueda y después el proveedor deja de responder.
+    THEN FMP se consulta una sola vez y la respuesta guardada se sigue sirviendo.
+    """
+    headers = auth_headers(test_user.id)
+    found = [{"symbol": "AAPL", "name": "Apple Inc.", "currency": "USD", "stockExchange": "NASDAQ"}]
+
+    with patch.object(MarketService, '_directory', SymbolDirectory()), \
+         patch.object(MarketService, 'API_KEY', 'test-key'), \
+         patch.object(MarketService._client, 'get_json', return_value=found) as mock_get_json:
+        first = client.get('/api/market/search/apple', headers=headers)
+        second = client.get('/api/market/search/APPLE', headers=headers)
+
+        MarketService._cache.set('search:apple::10', found, ttl=0)
+        mock_get_json.side_effect = UpstreamError('caído')
+        third = client.get('/api/market/search/apple', headers=headers)
+
+    assert first.get_json() == second.get_json() == third.get_json() == found
+    assert mock_get_json.call_count == 2
@@ -0,0 +1,112 @@
+import threading
+from decimal import Decimal
+
+import pytest
+
+from app import create_app, db
+from app.config import Config
+from app.models import User, Portfolio, Holding, Transaction, PortfolioValuation
+from app.services.trade_service import TradeService, InsufficientFundsError, InsufficientSharesError
+
+
+@pytest.fixture
+def file_app(tmp_path):
+    """App con una base de datos SQLite en fichero, compartida por varios hilos."""
+    class FileConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'trades.db'}"
+
+    app = create_app(FileConfig)
+    with app.app_context():
+        db.create_all()
+        user = User(username='trader', email='trader@example.com', password_hash='x')
+        user.portfolio = Portfolio(cash_balance=Decimal('1000.00'))
+        db.session.add(user)
+        db.session.commit()
+        app.config['PORTFOLIO_ID'] = user.portfolio.id
+    yield app
+    with app.app_context():
+        db.drop_all()
+        db.engine.dispose()
+
+
+def run_concurrently(app, count, operation):
+    """Lanza `count` hilos a la vez y devuelve cuántas operaciones se aceptaron."""
+    barrier = threading.Barrier(count)
+    accepted = []
+    errors = []
+
+    def worker():
+        with app.app_context():
+            barrier.wait()
+            try:
+                operation()
+                accepted.append(1)
+            except (InsufficientFundsError, InsufficientSharesError):
+                pass
+            except Exception as e:
+                errors.append(e)
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=worker) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    return len(accepted)
+
+
+def test_concurrent_buys_never_overdraw_or_lose_updates(file_app):
+    """
+    GIVEN una cartera con saldo para exactamente 10 compras.
+    WHEN 24 hilos compran a la vez el mismo ticker.
+    THEN se aceptan exactamente 10 y saldo, posición, transacciones y valoración cuadran.
+    """
+    portfolio_id = file_app.config['PORTFOLIO_ID']
+    accepted = run_concurrently(file_app, 24, lambda: TradeService.buy(portfolio_id, 'AAPL', 1, Decimal('100')))
+
+    assert accepted == 10
+    with file_app.app_context():
+        portfolio = db.session.get(Portfolio, portfolio_id)
+        holding = Holding.query.filter_by(portfolio_id=portfolio_id, ticker_symbol='AAPL').one()
+        assert portfolio.cash_balance == Decimal('0')
+        assert portfolio.version == 11
+        assert holding.quantity == 10
+        assert holding.average_purchase_price == Decimal('100')
+        assert Transaction.query.filter_by(portfolio_id=portfolio_id).count() == 10
+        assert db.session.get(PortfolioValuation, portfolio_id).total_value == Decimal('1000')
+
+
+def test_concurrent_sells_never_oversell(file_app):
+    """
+    GIVEN una cartera con 5 acciones de MSFT.
+    WHEN 16 hilos intentan vender una acción a la vez.
+    THEN solo se venden 5, la posición desaparece y el saldo refleja exactamente esas ventas.
+    """
+    portfolio_id = file_app.config['PORTFOLIO_ID']
+    with file_app.app_context():
+        TradeService.buy(portfolio_id, 'MSFT', 5, Decimal('100'))
+
+    accepted = run_concurrently(file_app, 16, lambda: TradeService.sell(portfolio_id, 'MSFT', 1, Decimal('120')))
+
+    assert accepted == 5
+    with file_app.app_context():
+        assert db.session.get(Portfolio, portfolio_id).cash_balance == Decimal('1100')
+        assert Holding.query.filter_by(portfolio_id=portfolio_id).count() == 0
+        assert Transaction.query.filter_by(portfolio_id=portfolio_id).count() == 6
+
+
+def test_trade_does_not_commit_the_callers_pending_changes(test_app, test_user):
+    """
+    GIVEN un cambio sin confirmar en la sesión de quien llama.
+    WHEN se ejecuta una compra.
+    THEN la compra se confirma y el cambio ajeno no se guarda.
+    """
+    test_user.email = 'changed@example.com'
+    TradeService.buy(test_user.portfolio.id, 'AAPL', 1, Decimal('10'))
+
+    db.session.expire_all()
+    assert test_user.email == 'test@example.com'
+    assert Holding.query.filter_by(portfolio_id=test_user.portfolio.id).one().quantity == 1
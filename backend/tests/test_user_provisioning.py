@@ -0,0 +1,114 @@
+import io
+import json
+from decimal import Decimal
+
+import pytest
+
+from app import db
+from app.models import User, Portfolio
+from app.services.password_hasher import PasswordHasher
+from app.services.user_provisioning import UserProvisioning, ProvisioningError, read_rows
+
+
+CSV_BATCH = (
+    "username,email,password\n"
+    "alice,alice@example.com,secret1\n"
+    "bob,bob@example.com,secret2\n"
+    "alice,alice2@example.com,secret3\n"
+    "testuser,new@example.com,secret4\n"
+    "carol,,secret5\n"
+    "dave,dave@example.com,secret6\n"
+)
+
+
+def test_provisioning_reports_row_failures_without_aborting(test_app, test_user, query_budget):
+    """
+    GIVEN un CSV con altas válidas, un duplicado en el lote, un usuario existente y una fila incompleta
+    WHEN se procesa en bloques de 2 filas
+    THEN se crean las válidas con su cartera y saldo inicial y el resto se informa por línea
+    """
+    with query_budget(12):
+        report = UserProvisioning.run(read_rows(io.StringIO(CSV_BATCH), 'csv'), cash_balance='2500',
+                                      chunk_size=2)
+
+    assert report['created'] == 3
+    assert [(failure['line'], failure['error']) for failure in report['failed']] == [
+        (4, "Username duplicated in batch"),
+        (5, "Username already exists"),
+        (6, "Missing required fields"),
+    ]
+    rows = db.session.execute(
+        db.select(User.username, Portfolio.cash_balance).join(Portfolio).where(User.username != 'testuser')
+        .order_by(User.username)).all()
+    assert rows == [('alice', Decimal('2500')), ('bob', Decimal('2500')), ('dave', Decimal('2500'))]
+    alice = User.query.filter_by(username='alice').one()
+    assert PasswordHasher.verify(alice.password_hash, 'secret1')
+
+
+def test_overlong_password_fails_only_its_row(test_app, test_user):
+    """
+    GIVEN un bloque con una contraseña de más de 72 bytes (el límite de bcrypt)
+    WHEN se procesa
+    THEN esa fila se informa como error y el resto del bloque se da de alta
+    """
+    batch = ("username,email,password\n"
+             f"gina,gina@example.com,{'ñ' * 40}\n"
+             "hugo,hugo@example.com,secret\n")
+
+    report = UserProvisioning.run(read_rows(io.StringIO(batch), 'csv'))
+
+    assert report == {'created': 1, 'failed': [{'line': 2, 'username': 'gina',
+                                                 'error': "Password too long (max 72 bytes)"}]}
+
+
+@pytest.mark.parametrize('cash_balance', ['NaN', 'Infinity', 'abc', '-1'])
+def test_invalid_cash_balance_is_rejected(test_app, cash_balance):
+    """
+    GIVEN un saldo inicial que no es un número finito y positivo
+    WHEN se lanza un alta masiva
+    THEN se rechaza con ProvisioningError antes de leer el lote
+    """
+    with pytest.raises(ProvisioningError):
+        UserProvisioning.run(read_rows(io.StringIO(CSV_BATCH), 'csv'), cash_balance=cash_balance)
+
+
+def test_bulk_endpoint_requires_admin(client, test_user, auth_headers):
+    """
+    GIVEN un usuario que no está en ADMIN_USERNAMES
+    WHEN envía un lote de altas
+    THEN recibe 403 y no se crea nadie
+    """
+    response = client.post('/api/admin/users/bulk', headers=auth_headers(test_user.id),
+                           data=CSV_BATCH, content_type='text/csv')
+    assert response.status_code == 403
+    assert User.query.count() == 1
+
+
+def test_bulk_endpoint_streams_ndjson(client, test_app, test_user, auth_headers):
+    """
+    GIVEN un administrador y un lote NDJSON con una línea que no es JSON
+    WHEN lo envía a /api/admin/users/bulk
+    THEN se crean las filas válidas con el saldo por defecto y la línea rota aparece en el informe
+    """
+    test_app.config['ADMIN_USERNAMES'] = ['testuser']
+    body = '\n'.join([json.dumps({'username': 'erin', 'email': 'erin@example.com', 'password': 'x1'}),
+                      '{not json',
+                      json.dumps({'username': 'frank', 'email': 'frank@example.com', 'password': 'x2'})])
+
+    response = client.post('/api/admin/users/bulk', headers=auth_headers(test_user.id),
+                           data=body, content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    assert response.get_json() == {'created': 2, 'failed': [{'line': 2, 'username': None, 'error': 'Invalid JSON'}]}
+    assert User.query.filter_by(username='frank').one().portfolio.cash_balance == Decimal('100000')
+
+
+def test_bulk_endpoint_rejects_unknown_format(client, test_app, test_user, auth_headers):
+    """
+    GIVEN un administrador
+    WHEN envía el lote como JSON normal
+    THEN recibe 415
+    """
+    test_app.config['ADMIN_USERNAMES'] = ['testuser']
+    response = client.post('/api/admin/users/bulk', headers=auth_headers(test_user.id), json=[])
+    assert response.status_code == 415
@@ -0,0 +1,94 @@
+from decimal import Decimal
+from unittest.mock import patch
+
+
+from app import db
+from app.models import User, Portfolio, Holding, PortfolioValuation
+from app.services.valuation_service import ValuationService
+
+
+def add_user(username, cash='10000.00'):
+    user = User(username=username, email=f'{username}@example.com', password_hash='x')
+    user.portfolio = Portfolio(cash_balance=Decimal(cash))
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes')
+@patch('app.routes.portfolio_routes.MarketService.get_quote')
+def test_trades_keep_valuation_current_without_quoting_on_read(mock_get_quote, mock_get_quotes, client, test_user,
+                                                              auth_headers):
+    """
+    GIVEN un usuario que compra y después vende parte de una posición.
+    WHEN consulta su cartera justo después.
+    THEN la valoración se ha actualizado con cada operación y la lectura no pide cotizaciones.
+    """
+    headers = auth_headers(test_user.id)
+    mock_get_quote.return_value = {'price': 150.00, 'symbol': 'AAPL'}
+    client.post('/api/portfolio/buy', headers=headers, json={"ticker": "AAPL", "quantity": "10"})
+    mock_get_quote.return_value = {'price': 160.00, 'symbol': 'AAPL'}
+    client.post('/api/portfolio/sell', headers=headers, json={"ticker": "AAPL", "quantity": "4"})
+
+    response = client.get('/api/portfolio/', headers=headers)
+    data = response.get_json()
+
+    mock_get_quotes.assert_not_called()
+    assert response.status_code == 200
+    # Caja: 10000 - 1500 + 640; posición: 6 acciones al último precio operado (160)
+    assert data['cash_balance'] == 9140.0
+    assert data['holdings'][0]['current_market_value'] == 960.0
+    assert data['total_portfolio_value'] == 10100.0
+    assert data['priced_at'] is not None
+
+
+def test_price_tick_revalues_every_holder_in_bulk(test_app, test_user):
+    """
+    GIVEN dos usuarios con AAPL en cartera y valoraciones ya construidas.
+    WHEN llega un tick de precio de AAPL.
+    THEN se revalorizan ambas posiciones y ambas carteras.
+    """
+    other = add_user('otheruser', cash='500.00')
+    for portfolio, quantity in ((test_user.portfolio, '10'), (other.portfolio, '3')):
+        db.session.add(Holding(portfolio_id=portfolio.id, ticker_symbol='AAPL',
+                               quantity=Decimal(quantity), average_purchase_price=Decimal('100')))
+    db.session.commit()
+    ValuationService.recompute([test_user.portfolio.id, other.portfolio.id])
+    db.session.commit()
+    assert db.session.get(PortfolioValuation, other.portfolio.id).total_value == Decimal('800')
+
+    assert ValuationService.apply_prices({'AAPL': {'symbol': 'AAPL', 'price': 200.0}}) == 1
+    db.session.commit()
+    db.session.expire_all()
+
+    assert db.session.get(PortfolioValuation, test_user.portfolio.id).total_value == Decimal('12000')
+    assert db.session.get(PortfolioValuation, other.portfolio.id).holdings_value == Decimal('600')
+    holding = Holding.query.filter_by(portfolio_id=other.portfolio.id).one()
+    assert holding.last_price == Decimal('200')
+    assert holding.priced_at is not None
+
+
+@patch('app.routes.portfolio_routes.MarketService.get_quotes')
+def test_stale_read_reprices_only_the_callers_portfolio(mock_get_quotes, client, test_user, auth_headers):
+    """
+    GIVEN dos usuarios con AAPL y el primero también con un ticker sin cotización.
+    WHEN el primero lee su cartera con los precios caducados, dos veces.
+    THEN solo se revaloriza su cartera, la posición sin precio queda revisada y la
+         segunda lectura ya no pide cotizaciones.
+    """
+    other = add_user('otheruser', cash='500.00')
+    for portfolio, ticker in ((test_user.portfolio, 'AAPL'), (test_user.portfolio, 'DELISTED'),
+                              (other.portfolio, 'AAPL')):
+        db.session.add(Holding(portfolio_id=portfolio.id, ticker_symbol=ticker,
+                               quantity=Decimal('2'), average_purchase_price=Decimal('100')))
+    db.session.commit()
+    mock_get_quotes.return_value = {'AAPL': {'symbol': 'AAPL', 'price': 150.0}, 'DELISTED': None}
+    headers = auth_headers(test_user.id)
+
+    data = client.get('/api/portfolio/', headers=headers).get_json()
+    assert data['total_portfolio_value'] == 10000 + 300 + 200
+    client.get('/api/portfolio/', headers=headers)
+
+    assert mock_get_quotes.call_count == 1
+    other_holding = Holding.query.filter_by(portfolio_id=other.portfolio.id).one()
+    assert other_holding.last_price is None and other_holding.priced_at is None